@@ -1,6 +1,7 @@
 """DataJunction base client setup."""
 
 # pylint: disable=redefined-outer-name, import-outside-toplevel, too-many-lines
+import json
 import logging
 import platform
 import warnings
@@ -17,6 +18,10 @@ except ImportError:  # pragma: no cover
         ),
         ImportWarning,
     )
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover
+    pa = None
 import requests
 from pydantic import BaseModel, Field
 from requests.adapters import CaseInsensitiveDict, HTTPAdapter
@@ -28,6 +33,7 @@ if TYPE_CHECKING:
     from datajunction.nodes import Node  # pragma: no cover
 
 DEFAULT_NAMESPACE = "default"
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
 _logger = logging.getLogger(__name__)
 
 
@@ -177,11 +183,34 @@ class DJClient:
             )
         ]
 
+    @staticmethod
+    def read_arrow_results(payload: bytes) -> Dict[str, Any]:
+        """
+        Read a query whose results were returned as an Arrow stream. The query is
+        stored in the schema metadata, and the results of the first statement are
+        returned as an Arrow table.
+        """
+        reader = pa.ipc.open_stream(payload)
+        table = reader.read_all()
+        metadata = reader.schema.metadata or {}
+        results = json.loads(metadata[b"djqs.query"])
+        results["table"] = table if b"djqs.statement" in metadata else None
+        return results
+
     @staticmethod
     def process_results(results) -> "pd.DataFrame":
         """
         Return a pandas dataframe of the results if pandas is installed
         """
+        if results.get("table") is not None:
+            table = results["table"]
+            try:
+                return table.to_pandas()
+            except ImportError:  # pragma: no cover
+                return Results(
+                    data=list(zip(*table.to_pydict().values())),  # type: ignore
+                    columns=tuple(table.column_names),  # type: ignore
+                )
         if "results" in results and results["results"]:
             columns = results["results"][0]["columns"]
             rows = results["results"][0]["rows"]
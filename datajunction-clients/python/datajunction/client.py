@@ -227,8 +227,18 @@ class DJClient(_internal.DJClient):
                         "engine_version": engine_version or self.engine_version,
                         "async_": async_,
                     },
+                    headers=(
+                        {"Accept": f"{_internal.ARROW_STREAM}, application/json;q=0.9"}
+                        if _internal.pa
+                        else {}
+                    ),
                 )
-                results = response.json()
+                if response.headers.get("Content-Type", "").startswith(
+                    _internal.ARROW_STREAM,
+                ):
+                    results = self.read_arrow_results(response.content)
+                else:
+                    results = response.json()
 
                 # Raise errors if any
                 if not response.ok:
@@ -242,7 +252,7 @@ class DJClient(_internal.DJClient):
 
                 # Update the query state and print links if any
                 job_state = models.QueryState(results["state"])
-                if not printed_links and results["links"]:  # pragma: no cover
+                if not printed_links and results.get("links"):  # pragma: no cover
                     print(
                         "Links:\n"
                         + "\n".join([f"\t* {link}" for link in results["links"]]),
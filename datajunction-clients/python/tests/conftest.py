@@ -112,6 +112,11 @@ def query_service_client(mocker: MockerFixture) -> Iterator[QueryServiceClient]:
         "submit_query",
         mock_submit_query,
     )
+    mocker.patch.object(
+        qs_client,
+        "submit_query_as_arrow",
+        mock_submit_query,
+    )
 
     mock_materialize = MagicMock()
     mock_materialize.return_value = MaterializationInfo(
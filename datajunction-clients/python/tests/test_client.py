@@ -1,5 +1,9 @@
 """Tests DJ client"""
+import json
+from unittest.mock import MagicMock
+
 import pandas
+import pyarrow as pa
 import pytest
 
 from datajunction import DJClient
@@ -342,6 +346,38 @@ class TestDJClient:  # pylint: disable=too-many-public-methods
             )
         assert "Error response from query service" in str(exc_info)
 
+    def test_data_as_arrow(self, client, mocker):
+        """
+        Test reading data returned as an Arrow stream
+        """
+        query = {"id": "abc", "state": "FINISHED", "links": []}
+        batch = pa.RecordBatch.from_pydict(
+            {"default_DOT_avg_repair_price": [1.0, 2.0]},
+        )
+        schema = batch.schema.with_metadata(
+            {
+                b"djqs.query": json.dumps(query).encode("utf-8"),
+                b"djqs.statement": b"{}",
+            },
+        )
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, schema) as writer:
+            writer.write_batch(batch)
+        response = MagicMock()
+        response.ok = True
+        response.headers = {"Content-Type": "application/vnd.apache.arrow.stream"}
+        response.content = sink.getvalue().to_pybytes()
+        get = mocker.patch.object(client._session, "get", return_value=response)
+
+        result = client.data(metrics=["default.avg_repair_price"])
+        pandas.testing.assert_frame_equal(
+            result,
+            pandas.DataFrame({"default_DOT_avg_repair_price": [1.0, 2.0]}),
+        )
+        assert get.call_args.kwargs["headers"]["Accept"].startswith(
+            "application/vnd.apache.arrow.stream",
+        )
+
     #
     # Data Catalog and Engines
     #
@@ -13,7 +13,7 @@ from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 
 from djqs import __version__
-from djqs.api import catalogs, engines, queries, tables
+from djqs.api import catalogs, engines, queries, scheduler, tables
 from djqs.exceptions import DJException
 from djqs.utils import get_settings
 
@@ -33,6 +33,7 @@ app = FastAPI(
 app.include_router(catalogs.router)
 app.include_router(engines.router)
 app.include_router(queries.router)
+app.include_router(scheduler.router)
 app.include_router(tables.router)
 
 
@@ -1,28 +1,28 @@
 """
 Query related APIs.
 """
-import json
+import asyncio
 import logging
 import uuid
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from functools import partial
 from http import HTTPStatus
-from typing import Any, List, Optional
+from typing import Any, Dict, List, Optional
 
 import msgpack
 from accept_types import get_best_match
-from fastapi import (
-    APIRouter,
-    BackgroundTasks,
-    Body,
-    Depends,
-    Header,
-    HTTPException,
-    Request,
-    Response,
-)
+from fastapi import APIRouter, Body, Depends, Header, HTTPException
+from fastapi import Query as QueryParameter
+from fastapi import Request, Response
 from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
 
+from djqs.arrow import ARROW_STREAM, arrow_available, serialize_query_results
+from djqs.cache import get_result_cache, is_read_only
 from djqs.config import Settings
-from djqs.engine import process_query
+from djqs.engine import run_scheduled_query
+from djqs.inflight import InFlightQuery, get_in_flight_queries
 from djqs.models.query import (
     Query,
     QueryCreate,
@@ -33,11 +33,20 @@ from djqs.models.query import (
     decode_results,
     encode_results,
 )
+from djqs.results import link_results, read_results
+from djqs.scheduler import get_scheduler
+from djqs.typing import END_JOB_STATES, QueryPriority
 from djqs.utils import get_session, get_settings
 
 _logger = logging.getLogger(__name__)
 router = APIRouter(tags=["SQL Queries"])
 
+CANCELED_MESSAGE = "Query was canceled"
+NOT_SCHEDULED_MESSAGE = (
+    "Query isn't scheduled on this server, so it wasn't canceled; it may be running "
+    "on another one"
+)
+
 
 @router.post(
     "/queries/",
@@ -45,8 +54,8 @@ router = APIRouter(tags=["SQL Queries"])
     status_code=HTTPStatus.OK,
     responses={
         200: {
-            "content": {"application/msgpack": {}},
-            "description": "Return results as JSON or msgpack",
+            "content": {"application/msgpack": {}, ARROW_STREAM: {}},
+            "description": "Return results as JSON, msgpack or Arrow",
         },
     },
     openapi_extra={
@@ -73,7 +82,6 @@ async def submit_query(
     settings: Settings = Depends(get_settings),
     request: Request,
     response: Response,
-    background_tasks: BackgroundTasks,
     body: Any = Body(...),
 ) -> QueryResults:
     """
@@ -99,27 +107,31 @@ async def submit_query(
         )
     create_query = QueryCreate(**data)
 
-    query_with_results = save_query_and_run(
+    query_with_results = await save_query_and_run(
         create_query,
         session,
         settings,
         response,
-        background_tasks,
     )
 
-    return_type = get_best_match(accept, ["application/json", "application/msgpack"])
+    return_type = get_best_match(accept, get_return_types())
     if not return_type:
         raise HTTPException(
             status_code=HTTPStatus.NOT_ACCEPTABLE,
-            detail="Client MUST accept: application/json, application/msgpack",
+            detail=f"Client MUST accept: {', '.join(get_return_types())}",
         )
 
+    content = None
     if return_type == "application/msgpack":
         content = msgpack.packb(
             query_with_results.dict(by_alias=True),
             default=encode_results,
         )
-    else:
+    elif return_type == ARROW_STREAM:
+        content = serialize_query_results(query_with_results)
+    if content is None:
+        # Results that can't be serialized to Arrow are returned as JSON
+        return_type = "application/json"
         content = query_with_results.json(by_alias=True)
 
     return Response(
@@ -129,75 +141,297 @@ async def submit_query(
     )
 
 
-def save_query_and_run(
+def get_return_types() -> List[str]:
+    """
+    Content types that query results can be returned as.
+    """
+    return_types = ["application/json", "application/msgpack"]
+    if arrow_available():
+        return_types.append(ARROW_STREAM)
+    return return_types
+
+
+async def save_query_and_run(
     create_query: QueryCreate,
     session: Session,
     settings: Settings,
     response: Response,
-    background_tasks: BackgroundTasks,
 ) -> QueryResults:
     """
-    Store a new query to the DB and run it.
+    Store a new query to the DB and schedule it, unless the results of an identical
+    read-only query are cached or an identical query is already running. Synchronous queries
+    wait for their results, without holding a worker thread while they run.
     """
     query = Query(**create_query.dict(by_alias=True))
     query.state = QueryState.ACCEPTED
 
+    read_only = is_read_only(query.submitted_query)
+    cached_query_id = get_result_cache(settings).get(query) if read_only else None
+    if cached_query_id and await run_in_threadpool(
+        link_results,
+        settings.results_backend,
+        str(query.id),
+        cached_query_id,
+    ):
+        _logger.info("Reusing results of query %s", cached_query_id)
+        return await run_in_threadpool(save_cached_query, query, session, settings)
+
+    query.state = QueryState.SCHEDULED
+    query.scheduled = datetime.now(timezone.utc)
+    in_flight_queries = get_in_flight_queries(settings)
+    if settings.coalesce_queries and read_only:
+        in_flight, started = in_flight_queries.get_or_start(query)
+        if not started:
+            _logger.info("Attaching to running query %s", in_flight.query_id)
+            return await attach_to_query(in_flight, query.async_, settings, response)
+
+    try:
+        future = await run_in_threadpool(
+            schedule_query,
+            query,
+            create_query.priority,
+            session,
+            settings,
+        )
+    except Exception as exc:
+        # Release the identical queries attached to this one
+        query.state = QueryState.FAILED
+        in_flight_queries.finish(query, [str(exc)])
+        raise
+    if query.async_:
+        response.status_code = HTTPStatus.CREATED
+        return QueryResults(results=[], errors=[], **query.dict())
+
+    try:
+        return await asyncio.shield(asyncio.wrap_future(future))
+    except asyncio.CancelledError:
+        if not future.cancelled():
+            raise
+        await run_in_threadpool(session.refresh, query)
+        return QueryResults(results=[], errors=[CANCELED_MESSAGE], **query.dict())
+
+
+def schedule_query(
+    query: Query,
+    priority: QueryPriority,
+    session: Session,
+    settings: Settings,
+) -> "Future[QueryResults]":
+    """
+    Store a query to the DB and schedule it on its engine's workers.
+    """
     session.add(query)
     session.commit()
     session.refresh(query)
 
-    if query.async_:
-        background_tasks.add_task(process_query, session, settings, query)
+    future = get_scheduler(settings).submit(
+        (query.engine_name, query.engine_version),
+        str(query.id),
+        priority,
+        partial(run_scheduled_query, session.get_bind(), settings, query.id),
+    )
+    future.add_done_callback(
+        partial(release_failed_query, Query(**query.dict()), settings),
+    )
+    return future
+
+
+def release_failed_query(
+    query: Query,
+    settings: Settings,
+    future: "Future[QueryResults]",
+) -> None:
+    """
+    Release the identical queries attached to a query that failed on its worker
+    before it could be processed, e.g., when its session couldn't be opened. Queries
+    that are processed release them when they finish.
+    """
+    if future.cancelled() or future.exception() is None:
+        return
+    query.state = QueryState.FAILED
+    get_in_flight_queries(settings).finish(query, [str(future.exception())])
 
+
+async def attach_to_query(
+    in_flight: InFlightQuery,
+    async_: bool,
+    settings: Settings,
+    response: Response,
+) -> QueryResults:
+    """
+    Return a running query in place of an identical query. Asynchronous queries get
+    its id straight away, while synchronous ones wait for its results.
+    """
+    if async_:
         response.status_code = HTTPStatus.CREATED
-        return QueryResults(results=[], errors=[], **query.dict())
+        return QueryResults(results=[], errors=[], **in_flight.query)
+
+    await in_flight.wait_async()
+    results = (
+        await run_in_threadpool(load_query_results, settings, in_flight.query_id)
+        if in_flight.query["state"] == QueryState.FINISHED
+        else []
+    )
+    return QueryResults(results=results, errors=in_flight.errors, **in_flight.query)
+
+
+def save_cached_query(
+    query: Query,
+    session: Session,
+    settings: Settings,
+) -> QueryResults:
+    """
+    Store a query whose results were reused from the cache as finished.
+    """
+    query.executed_query = query.submitted_query
+    query.scheduled = query.started = query.finished = datetime.now(timezone.utc)
+    query.state = QueryState.FINISHED
+    query.progress = 1.0
 
-    return process_query(session, settings, query)
+    session.add(query)
+    session.commit()
+    session.refresh(query)
+
+    results = [] if query.async_ else load_query_results(settings, str(query.id))
+    return QueryResults(results=results, errors=[], **query.dict())
+
+
+@router.delete("/queries/cache/")
+def invalidate_cached_results(
+    catalog: Optional[str] = None,
+    schema: Optional[str] = None,
+    table: Optional[str] = None,
+    *,
+    settings: Settings = Depends(get_settings),
+) -> Dict[str, int]:
+    """
+    Drop cached results for queries that read from a table, e.g., because the table
+    has new data. All cached results are dropped if no table is given.
+    """
+    invalidated = get_result_cache(settings).invalidate(catalog, schema, table)
+    return {"invalidated": invalidated}
 
 
 def load_query_results(
     settings: Settings,
     key: str,
+    offset: int = 0,
+    limit: Optional[int] = None,
 ) -> List[StatementResults]:
     """
     Load results from backend, if available.
 
-    If ``paginate`` is true we also load the results into the cache, anticipating more
-    paginated queries.
+    Results are read as they've been written so far, so partial results are returned
+    for queries that are still running. Only the pages holding the requested rows are
+    read.
     """
-    if settings.results_backend.has(key):
-        _logger.info("Reading results from results backend")
-        cached = settings.results_backend.get(key)
-        query_results = json.loads(cached)
-    else:
-        _logger.warning("No results found")
-        query_results = []
-
-    return query_results
+    return read_results(settings.results_backend, key, offset, limit)
 
 
-@router.get("/queries/{query_id}/", response_model=QueryResults)
-def read_query(
+@router.get(
+    "/queries/{query_id}/",
+    response_model=QueryResults,
+    responses={
+        200: {
+            "content": {ARROW_STREAM: {}},
+            "description": "Return results as JSON or Arrow",
+        },
+    },
+)
+def read_query(  # pylint: disable=too-many-arguments,too-many-locals
     query_id: uuid.UUID,
+    accept: Optional[str] = Header(None),
+    limit: Optional[int] = QueryParameter(None, ge=1),
+    offset: int = QueryParameter(0, ge=0),
     *,
     session: Session = Depends(get_session),
     settings: Settings = Depends(get_settings),
+    request: Request,
 ) -> QueryResults:
     """
     Fetch information about a query.
 
-    For paginated queries we move the data from the results backend to the cache for a
-    short period, anticipating additional requests.
+    Results can be paginated with ``limit`` and ``offset``, which apply to the rows of
+    each statement; only the pages of results holding the requested rows are read
+    from the results backend, and ``next`` and ``previous`` link to the adjacent
+    pages. Results are returned as Arrow if the client prefers it.
     """
     query = session.get(Query, query_id)
     if not query:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Query not found")
 
-    query_results = load_query_results(settings, str(query_id))
+    query_results = load_query_results(settings, str(query_id), offset, limit)
 
     prev = next_ = None
+    if limit is not None:
+        row_count = max((statement.row_count for statement in query_results), default=0)
+        if offset + limit < row_count:
+            next_ = str(request.url.include_query_params(offset=offset + limit))
+        if offset > 0:
+            prev = str(
+                request.url.include_query_params(offset=max(offset - limit, 0)),
+            )
     results = Results(__root__=query_results)
 
-    return QueryResults(
+    query_with_results = QueryResults(
         results=results, next=next_, previous=prev, errors=[], **query.dict()
     )
+    if accept and arrow_available():
+        return_type = get_best_match(accept, ["application/json", ARROW_STREAM])
+        if return_type == ARROW_STREAM:
+            content = serialize_query_results(query_with_results)
+            if content is not None:
+                return Response(  # type: ignore
+                    content=content,
+                    media_type=ARROW_STREAM,
+                )
+    return query_with_results
+
+
+def check_not_completed(query: Query) -> None:
+    """
+    Raise a conflict if the query has already completed.
+    """
+    if query.state in END_JOB_STATES:
+        raise HTTPException(
+            status_code=HTTPStatus.CONFLICT,
+            detail=f"Query has already completed: {QueryState(query.state).value}",
+        )
+
+
+@router.delete("/queries/{query_id}/", response_model=QueryResults)
+def cancel_query(
+    query_id: uuid.UUID,
+    *,
+    session: Session = Depends(get_session),
+    settings: Settings = Depends(get_settings),
+) -> QueryResults:
+    """
+    Cancel a query.
+
+    Queries waiting for a worker are canceled straight away, while running queries stop
+    fetching results and are marked as canceled once they do. Queries that aren't
+    scheduled in this process, e.g., because they're running on another worker, are
+    left alone.
+    """
+    query = session.get(Query, query_id)
+    if not query:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Query not found")
+    check_not_completed(query)
+
+    canceled = get_scheduler(settings).cancel(str(query_id))
+    if canceled is None:
+        # The query may have finished since it was loaded
+        session.refresh(query)
+        check_not_completed(query)
+        return QueryResults(results=[], errors=[NOT_SCHEDULED_MESSAGE], **query.dict())
+    if not canceled:
+        return QueryResults(results=[], errors=[], **query.dict())
+
+    query.state = QueryState.CANCELED
+    query.finished = datetime.now(timezone.utc)
+    session.add(query)
+    session.commit()
+    session.refresh(query)
+    get_in_flight_queries(settings).finish(query, [CANCELED_MESSAGE])
+    return QueryResults(results=[], errors=[CANCELED_MESSAGE], **query.dict())
@@ -0,0 +1,24 @@
+"""
+Scheduler related APIs.
+"""
+
+from typing import Any, Dict
+
+from fastapi import APIRouter, Depends
+
+from djqs.config import Settings
+from djqs.scheduler import get_scheduler
+from djqs.utils import get_settings
+
+router = APIRouter(tags=["Scheduler"])
+
+
+@router.get("/scheduler/")
+def get_scheduler_metrics(
+    *,
+    settings: Settings = Depends(get_settings),
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Return the queue depth, running queries and wait times of each engine
+    """
+    return get_scheduler(settings).metrics()
@@ -0,0 +1,203 @@
+"""
+Arrow IPC serialization of query results.
+
+Results can be returned as ``application/vnd.apache.arrow.stream``, a columnar format
+that clients can load into dataframes without decoding every value. The response is
+a sequence of Arrow IPC streams, one for each statement in the query (or a single
+empty one if there are no results). The query information and the statement's SQL
+and row count are stored as JSON in the schema metadata of each stream.
+
+Results that were fetched as Arrow, e.g., from DuckDB, are written as they were
+fetched, without converting their values. Other results, e.g., those fetched through
+DB API cursors or read back from the results backend, only have their rows, which
+are converted to Arrow column by column.
+
+Each converted column gets the Arrow type matching the type declared by the engine's cursor,
+and the type is inferred from the values when there's no matching type or the values
+don't fit it, e.g., for SQLite, whose cursors don't declare types. Results with
+values that can't be converted to Arrow at all, such as columns that mix numbers and
+strings, aren't serialized, and are returned as JSON instead.
+
+Arrow support requires the optional ``pyarrow`` dependency.
+"""
+import json
+import logging
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from djqs.models.query import ColumnMetadata, QueryResults, StatementResults
+from djqs.typing import ColumnType, Row
+
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover
+    pa = None
+
+_logger = logging.getLogger(__name__)
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+QUERY_METADATA_KEY = b"djqs.query"
+STATEMENT_METADATA_KEY = b"djqs.statement"
+
+
+def arrow_available() -> bool:
+    """
+    Whether results can be serialized to Arrow.
+    """
+    return pa is not None
+
+
+def arrow_type(type_: str) -> Optional["pa.DataType"]:
+    """
+    The Arrow type for a column type declared by a cursor, if there's one. Decimals,
+    lists and dicts have their precision or element types inferred from the values,
+    and so do datetimes, to keep their time zones.
+    """
+    types = {
+        ColumnType.BYTES: pa.binary(),
+        ColumnType.STR: pa.string(),
+        ColumnType.FLOAT: pa.float64(),
+        ColumnType.INT: pa.int64(),
+        ColumnType.BOOL: pa.bool_(),
+        ColumnType.DATE: pa.date32(),
+        ColumnType.TIME: pa.time64("us"),
+        ColumnType.TIMEDELTA: pa.duration("us"),
+    }
+    return types.get(type_)  # type: ignore
+
+
+def column_to_array(values: List[Any], type_: Optional[str]) -> "pa.Array":
+    """
+    Build an array with the Arrow type for the declared column type, or the type
+    inferred from the values if there's no such type or the values don't fit it.
+    """
+    declared = arrow_type(type_) if type_ else None
+    if declared is not None:
+        try:
+            return pa.array(values, type=declared)
+        except (pa.ArrowException, OverflowError):
+            pass
+    return pa.array(values)
+
+
+def rows_to_record_batch(
+    columns: List[ColumnMetadata],
+    rows: Sequence[Row],
+) -> "pa.RecordBatch":
+    """
+    Build a record batch from rows, with the Arrow types of the declared columns.
+    """
+    width = len(rows[0]) if rows else len(columns)
+    if len(columns) == width:
+        names = [column.name for column in columns]
+        types: List[Optional[str]] = [column.type for column in columns]
+    else:
+        names = [f"_col{index}" for index in range(width)]
+        types = [None] * width
+    arrays = [
+        column_to_array([row[index] for row in rows], types[index])
+        for index in range(width)
+    ]
+    return pa.RecordBatch.from_arrays(arrays, names=names)
+
+
+class RecordBatchStream(Iterator[Row]):
+    """
+    A stream of rows read from Arrow record batches. The rows are only converted to
+    Python values to be stored as JSON, and the batches can be kept as they're read,
+    to be written to Arrow as they were fetched.
+    """
+
+    def __init__(self, reader: "pa.RecordBatchReader", keep_batches: bool = False):
+        self.schema = reader.schema
+        self.batches: List["pa.RecordBatch"] = []
+        self._rows = self._read(reader, keep_batches)
+
+    def _read(
+        self,
+        reader: "pa.RecordBatchReader",
+        keep_batches: bool,
+    ) -> Iterator[Row]:
+        for batch in reader:
+            if keep_batches:
+                self.batches.append(batch)
+            yield from zip(*(column.to_pylist() for column in batch.columns))
+
+    def __next__(self) -> Row:
+        return next(self._rows)
+
+    def to_table(self) -> "pa.Table":
+        """
+        The batches kept so far, as a table.
+        """
+        return pa.Table.from_batches(self.batches, schema=self.schema)
+
+
+def _write_stream(
+    sink: "pa.BufferOutputStream",
+    query_metadata: str,
+    statement: Optional[StatementResults] = None,
+    table: Optional["pa.Table"] = None,
+):
+    """
+    Write the results of a statement to the sink as an Arrow IPC stream, from the
+    Arrow table they were fetched as, if there's one.
+    """
+    metadata = {QUERY_METADATA_KEY: query_metadata.encode("utf-8")}
+    if statement is None:
+        table = pa.Table.from_batches([], schema=pa.schema([]))
+    else:
+        if table is None:
+            table = pa.Table.from_batches(
+                [rows_to_record_batch(statement.columns, statement.rows)],
+            )
+        metadata[STATEMENT_METADATA_KEY] = statement.json(
+            exclude={"rows"},
+        ).encode("utf-8")
+    table = table.replace_schema_metadata(metadata)
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        if table.num_rows:
+            writer.write_table(table)
+
+
+def serialize_query_results(query_results: QueryResults) -> Optional[bytes]:
+    """
+    Serialize query results as a sequence of Arrow IPC streams. Returns ``None`` if
+    the rows can't be converted to Arrow.
+    """
+    query_metadata = query_results.json(by_alias=True, exclude={"results"})
+    statements = query_results.results.__root__
+    tables = query_results.arrow_tables or [None] * len(statements)
+    sink = pa.BufferOutputStream()
+    try:
+        for statement, table in zip(statements, tables):
+            _write_stream(sink, query_metadata, statement, table)
+        if not statements:
+            _write_stream(sink, query_metadata)
+    except (pa.ArrowException, OverflowError) as exc:
+        _logger.warning(
+            "Results of query %s can't be serialized to Arrow: %s",
+            query_results.id,
+            exc,
+        )
+        return None
+    return sink.getvalue().to_pybytes()
+
+
+def deserialize_query_results(payload: bytes) -> QueryResults:
+    """
+    Load query results serialized with ``serialize_query_results``.
+    """
+    source = pa.BufferReader(payload)
+    query_metadata: Dict[str, Any] = {}
+    statements = []
+    while source.tell() < source.size():
+        reader = pa.ipc.open_stream(source)
+        table = reader.read_all()
+        metadata = reader.schema.metadata or {}
+        query_metadata = json.loads(metadata[QUERY_METADATA_KEY])
+        if STATEMENT_METADATA_KEY in metadata:
+            statement = json.loads(metadata[STATEMENT_METADATA_KEY])
+            statement["rows"] = list(zip(*table.to_pydict().values()))
+            statements.append(statement)
+    return QueryResults(results=statements, **query_metadata)
@@ -0,0 +1,191 @@
+"""
+Cache of query results.
+
+Queries are often submitted again while the results of an identical query are still
+fresh, e.g., by dashboards that refresh on a timer. Finished queries are cached by a
+normalized form of their SQL together with the catalog and engine they ran on, so
+that identical queries submitted within the TTL reuse the results already in the
+results backend instead of running again. Only queries that just read data are
+cached (see ``is_read_only``), since a query that writes has to run each time it's
+submitted.
+
+Entries expire after the TTL, and the least recently used entries are evicted once
+the cached results add up to more than a given number of rows. Entries for queries
+that read from a table are dropped when the table gets new data (see
+``DELETE /queries/cache/``).
+"""
+import hashlib
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+import sqlparse
+
+from djqs.config import Settings
+from djqs.models.query import Query
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Normalize SQL so that queries that only differ in comments, whitespace, keyword
+    case or trailing semicolons are cached together. Runs of whitespace outside of
+    string literals are collapsed into a single space, since how much ``sqlparse``
+    strips varies between its versions.
+    """
+    sql = sqlparse.format(sql, strip_comments=True, keyword_case="upper")
+    parts = []
+    for statement in sqlparse.parse(sql):
+        for token in statement.flatten():
+            if not token.is_whitespace:
+                parts.append(token.value)
+            elif parts and parts[-1] != " ":
+                parts.append(" ")
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def is_read_only(sql: str) -> bool:
+    """
+    Whether all the statements of a query only read data, so that running it again
+    while it's running is the same as waiting for its results.
+    """
+    statements = [
+        statement
+        for statement in sqlparse.parse(sql)
+        if str(statement).strip().rstrip(";").strip()
+    ]
+    return bool(statements) and all(
+        statement.get_type() == "SELECT" for statement in statements
+    )
+
+
+def cache_key(query: Query) -> str:
+    """
+    Key for the results of a query.
+    """
+    key = "\n".join(
+        [
+            query.catalog_name,
+            query.engine_name,
+            query.engine_version,
+            normalize_sql(query.submitted_query),
+        ],
+    )
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class CacheEntry(NamedTuple):
+    """
+    Cached results of a finished query.
+    """
+
+    query_id: str
+    catalog_name: str
+    sql: str
+    row_count: int
+    expires: float
+
+
+class ResultCache:
+    """
+    Maps queries to the id of a finished identical query whose results can be reused.
+    """
+
+    def __init__(self, ttl: float, max_rows: int):
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._rows = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Whether results are cached at all.
+        """
+        return self.ttl > 0 and self.max_rows > 0
+
+    def get(self, query: Query) -> Optional[str]:
+        """
+        Return the id of a query with fresh results for the given query, if any.
+        """
+        if not self.enabled:
+            return None
+        key = cache_key(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry.query_id
+
+    def add(self, query: Query, row_count: int):
+        """
+        Cache the results of a finished query.
+        """
+        if not self.enabled or row_count > self.max_rows:
+            return
+        key = cache_key(query)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = CacheEntry(
+                query_id=str(query.id),
+                catalog_name=query.catalog_name,
+                sql=normalize_sql(query.submitted_query),
+                row_count=row_count,
+                expires=time.monotonic() + self.ttl,
+            )
+            self._rows += row_count
+            while self._rows > self.max_rows:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(
+        self,
+        catalog: Optional[str] = None,
+        schema: Optional[str] = None,
+        table: Optional[str] = None,
+    ) -> int:
+        """
+        Drop the entries for queries that read from a table, or all entries if no
+        table is given. Returns the number of entries dropped.
+        """
+        if table is None:
+            pattern = None
+        else:
+            name = re.escape(f"{schema}.{table}" if schema else table)
+            pattern = re.compile(rf"(?<!\w){name}(?!\w)", re.IGNORECASE)
+        with self._lock:
+            keys = [
+                key
+                for key, entry in self._entries.items()
+                if (catalog is None or entry.catalog_name == catalog)
+                and (pattern is None or pattern.search(re.sub('["`]', "", entry.sql)))
+            ]
+            for key in keys:
+                self._remove(key)
+        return len(keys)
+
+    def _remove(self, key: str):
+        self._rows -= self._entries.pop(key).row_count
+
+
+_caches: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def get_result_cache(settings: Settings) -> ResultCache:
+    """
+    Get the cache of results stored in the settings' results backend.
+    """
+    backend = settings.results_backend
+    if backend not in _caches:
+        _caches[backend] = ResultCache(
+            settings.result_cache_ttl.total_seconds(),
+            settings.result_cache_max_rows,
+        )
+    return _caches[backend]
@@ -3,6 +3,7 @@ Configuration for the query service
 """
 
 from datetime import timedelta
+from typing import Optional
 
 from cachelib.base import BaseCache
 from cachelib.file import FileSystemCache
@@ -27,8 +28,55 @@ class Settings(BaseSettings):  # pylint: disable=too-few-public-methods
     # The default engine version to use for reflection
     default_reflection_engine_version: str = ""
 
-    # Where to store the results from queries.
-    results_backend: BaseCache = FileSystemCache("/tmp/djqs", default_timeout=0)
+    # Where to store the results from queries. Results are stored a page at a time,
+    # so the backend should hold enough entries for the pages of all of the results
+    # that are kept; expired results are pruned first when it holds more.
+    results_backend: BaseCache = FileSystemCache(
+        "/tmp/djqs",
+        default_timeout=0,
+        threshold=10000,
+    )
+
+    # How long the results of a query are kept in the results backend.
+    results_ttl: timedelta = timedelta(days=1)
+
+    # Number of rows in each page of results written to the results backend.
+    results_page_size: int = 10000
+
+    # How long the results of a read-only query are reused for identical queries;
+    # caching is disabled when zero.
+    result_cache_ttl: timedelta = timedelta(seconds=0)
+
+    # Maximum number of rows across all cached results.
+    result_cache_max_rows: int = 1000000
+
+    # Attach read-only queries to identical queries that are already running, instead
+    # of running them again. Queries with statements that write, e.g., DML or DDL,
+    # always run.
+    coalesce_queries: bool = True
+
+    # Size of the connection pool of each engine, and how many connections can be
+    # opened beyond it when the pool is exhausted.
+    engine_pool_size: int = 5
+    engine_max_overflow: int = 10
+
+    # Number of queries that can run at the same time on each engine.
+    engine_max_concurrency: int = 4
+
+    # How long pooled connections are reused before they're replaced, and how long
+    # unused engines are kept around.
+    engine_pool_recycle: timedelta = timedelta(minutes=30)
+    engine_idle_timeout: timedelta = timedelta(hours=1)
+
+    # Open the DuckDB database file read-only, so that other processes can read it
+    # while it's in use; statements that write to it fail when set.
+    duckdb_read_only: bool = False
+
+    # Maximum number of rows a Spark query may return, beyond which it fails instead
+    # of returning truncated results (unlimited if unset), and maximum size of the
+    # results sent to the Spark driver at once.
+    spark_max_result_rows: Optional[int] = None
+    spark_max_result_size: str = "1g"
 
     paginating_timeout: timedelta = timedelta(minutes=5)
 
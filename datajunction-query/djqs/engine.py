@@ -3,16 +3,40 @@ Query related functions.
 """
 
 import logging
+import re
+import threading
 from datetime import datetime, timezone
-from typing import List, Optional, Tuple
+from typing import Iterator, List, Optional, Tuple
+from uuid import UUID
 
 import duckdb
 import sqlparse
 from pyspark.sql import SparkSession  # pylint: disable=import-error
-from sqlalchemy import create_engine, text
+from pyspark.sql.types import (  # pylint: disable=import-error
+    ArrayType,
+    BinaryType,
+    BooleanType,
+    ByteType,
+    DateType,
+    DecimalType,
+    DoubleType,
+    FloatType,
+    IntegerType,
+    LongType,
+    MapType,
+    ShortType,
+    StructType,
+    TimestampType,
+)
+from sqlalchemy import text
+from sqlalchemy.engine import Engine as SQLAEngine
 from sqlmodel import Session, select
 
+from djqs.arrow import RecordBatchStream, arrow_available
+from djqs.cache import get_result_cache, is_read_only
 from djqs.config import Settings
+from djqs.exceptions import DJException
+from djqs.inflight import get_in_flight_queries
 from djqs.models.catalog import Catalog
 from djqs.models.engine import Engine
 from djqs.models.query import (
@@ -23,10 +47,15 @@ from djqs.models.query import (
     Results,
     StatementResults,
 )
+from djqs.pools import IN_MEMORY_DATABASE, get_engine_pools
+from djqs.results import ResultsWriter
+from djqs.scheduler import QueryCanceled, cancellable
 from djqs.typing import ColumnType, Description, SQLADialect, Stream, TypeEnum
 
 _logger = logging.getLogger(__name__)
 
+DUCKDB_DATABASE = "/code/docker/default.duckdb"
+
 
 def get_columns_from_description(
     description: Description,
@@ -68,13 +97,16 @@ def get_columns_from_description(
 
 def run_query(
     session: Session,
+    settings: Settings,
     query: Query,
-) -> List[Tuple[str, List[ColumnMetadata], Stream]]:
+) -> Iterator[Tuple[str, List[ColumnMetadata], Stream]]:
     """
-    Run a query and return its results.
+    Run a query and yield its results.
 
-    For each statement we return a tuple with the statement SQL, a description of the
-    columns (name and type) and a stream of rows (tuples).
+    For each statement we yield a tuple with the statement SQL, a description of the
+    columns (name and type) and a stream of rows (tuples). Statements run one at a
+    time, once the stream of the previous statement has been consumed, on a connection
+    from the engine's pool which is returned when all statements have run.
     """
     _logger.info("Running query on catalog %s", query.catalog_name)
     catalog = session.exec(
@@ -85,59 +117,146 @@ def run_query(
         .where(Engine.name == query.engine_name)
         .where(Engine.version == query.engine_version),
     ).one()
+    pools = get_engine_pools(settings)
     if engine.uri == "spark://local[*]":
-        spark = get_spark_session()
-        return run_spark_query(query, spark)
+        spark = get_spark_session(settings.spark_max_result_size)
+        yield from run_spark_query(query, spark, settings.spark_max_result_rows)
+        return
     if engine.uri == "duckdb://local[*]":
-        conn = duckdb.connect(database="/code/docker/default.duckdb", read_only=False)
-        return run_duckdb_query(query, conn)
-    sqla_engine = create_engine(engine.uri, **catalog.extra_params)
-    connection = sqla_engine.connect()
+        # catalogs of local files get an in-memory database with a view per file
+        files = catalog.extra_params.get("files")
+        cursor = pools.get_duckdb_connection(
+            IN_MEMORY_DATABASE if files else DUCKDB_DATABASE,
+            files,
+            read_only=settings.duckdb_read_only,
+        ).cursor()
+        try:
+            yield from run_duckdb_query(query, cursor, settings.results_page_size)
+        finally:
+            cursor.close()
+        return
+    sqla_engine = pools.get_engine(
+        engine.name,
+        engine.version,
+        engine.uri,
+        catalog.extra_params,
+    )
+    yield from run_sqlalchemy_query(query, sqla_engine)
 
-    output: List[Tuple[str, List[ColumnMetadata], Stream]] = []
+
+def run_sqlalchemy_query(
+    query: Query,
+    sqla_engine: SQLAEngine,
+) -> Iterator[Tuple[str, List[ColumnMetadata], Stream]]:
+    """
+    Run the statements of a query one at a time on a connection from the engine's
+    pool, yielding the results of each.
+    """
     statements = sqlparse.parse(query.executed_query)
-    for statement in statements:
-        # Druid doesn't like statements that end in a semicolon...
-        sql = str(statement).strip().rstrip(";")
+    with sqla_engine.connect() as connection:
+        for statement in statements:
+            # Druid doesn't like statements that end in a semicolon...
+            sql = str(statement).strip().rstrip(";")
+
+            results = connection.execute(text(sql))
+            if not results.returns_rows:
+                # e.g., DML or DDL
+                yield sql, [], iter([])
+                continue
+            stream = (tuple(row) for row in results)
+            columns = get_columns_from_description(
+                results.cursor.description,
+                sqla_engine.dialect,
+            )
+            yield sql, columns, stream
 
-        results = connection.execute(text(sql))
-        stream = (tuple(row) for row in results)
-        columns = get_columns_from_description(
-            results.cursor.description,
-            sqla_engine.dialect,
-        )
-        output.append((sql, columns, stream))
 
-    return output
+_spark_session: Optional[SparkSession] = None
+_spark_session_lock = threading.Lock()
 
 
-def get_spark_session():
+def get_spark_session(max_result_size: Optional[str] = None) -> SparkSession:
     """
-    Get a spark session
+    Get the spark session shared by all queries.
+
+    The session is created on first use, and again only if its context was stopped.
+    The maximum size of results sent to the driver (``spark.driver.maxResultSize``)
+    can only be set when the session is created.
     """
-    SparkSession._instantiatedContext = None  # pylint: disable=protected-access
-    spark = (
-        SparkSession.builder.master("local[*]")
-        .appName("djqs")
-        .enableHiveSupport()
-        .getOrCreate()
-    )
-    return spark
+    global _spark_session  # pylint: disable=global-statement
+    with _spark_session_lock:
+        if (
+            _spark_session is None
+            or _spark_session.sparkContext._jsc  # pylint: disable=protected-access
+            is None
+        ):
+            builder = SparkSession.builder.master("local[*]").appName("djqs")
+            if max_result_size:
+                builder = builder.config("spark.driver.maxResultSize", max_result_size)
+            _spark_session = builder.enableHiveSupport().getOrCreate()
+        return _spark_session
+
+
+def get_columns_from_spark_schema(schema: StructType) -> List[ColumnMetadata]:
+    """
+    Extract column metadata from the schema of a Spark dataframe.
+    """
+    type_map = [
+        ((ByteType, ShortType, IntegerType, LongType), ColumnType.INT),
+        ((FloatType, DoubleType), ColumnType.FLOAT),
+        ((DecimalType,), ColumnType.DECIMAL),
+        ((BooleanType,), ColumnType.BOOL),
+        ((TimestampType,), ColumnType.DATETIME),
+        ((DateType,), ColumnType.DATE),
+        ((BinaryType,), ColumnType.BYTES),
+        ((ArrayType,), ColumnType.LIST),
+        ((MapType, StructType), ColumnType.DICT),
+    ]
+
+    columns = []
+    for field in schema.fields:
+        for spark_types, type_ in type_map:
+            if isinstance(field.dataType, spark_types):
+                break
+        else:
+            # fallback to string
+            type_ = ColumnType.STR
+        columns.append(ColumnMetadata(name=field.name, type=type_))
+
+    return columns
 
 
 def run_spark_query(
     query: Query,
     spark: SparkSession,
+    max_rows: Optional[int] = None,
 ) -> List[Tuple[str, List[ColumnMetadata], Stream]]:
     """
-    Run a spark SQL query against the local warehouse
+    Run a spark SQL query against the local warehouse.
+
+    Rows are streamed to the driver one partition at a time instead of being
+    collected all at once. Queries that return more than ``max_rows`` rows fail,
+    rather than returning truncated results.
     """
-    output: List[Tuple[str, List[ColumnMetadata], Stream]] = []
     results_df = spark.sql(query.submitted_query)
-    rows = results_df.rdd.map(tuple).collect()
-    columns: List[ColumnMetadata] = []
-    output.append((query.submitted_query, columns, rows))
-    return output
+    if max_rows:
+        # one more row than allowed is enough to tell that there are too many
+        results_df = results_df.limit(max_rows + 1)
+    columns = get_columns_from_spark_schema(results_df.schema)
+    stream = (tuple(row) for row in results_df.toLocalIterator(prefetchPartitions=True))
+    return [(query.submitted_query, columns, limit_rows(stream, max_rows))]
+
+
+def limit_rows(stream: Stream, max_rows: Optional[int]) -> Stream:
+    """
+    Raise an error once a stream yields more than ``max_rows`` rows.
+    """
+    for count, row in enumerate(stream, 1):
+        if max_rows and count > max_rows:
+            raise DJException(
+                f"Query returned more than the maximum of {max_rows} rows",
+            )
+        yield row
 
 
 def describe_table_via_spark(
@@ -154,61 +273,204 @@ def describe_table_via_spark(
     return [{"name": row[0], "type": row[1]} for row in rows]
 
 
+def get_columns_from_duckdb_relation(
+    relation: duckdb.DuckDBPyRelation,
+) -> List[ColumnMetadata]:
+    """
+    Extract column metadata from the types of a DuckDB relation.
+    """
+    type_map = {
+        "TINYINT": ColumnType.INT,
+        "SMALLINT": ColumnType.INT,
+        "INTEGER": ColumnType.INT,
+        "BIGINT": ColumnType.INT,
+        "HUGEINT": ColumnType.INT,
+        "UTINYINT": ColumnType.INT,
+        "USMALLINT": ColumnType.INT,
+        "UINTEGER": ColumnType.INT,
+        "UBIGINT": ColumnType.INT,
+        "FLOAT": ColumnType.FLOAT,
+        "DOUBLE": ColumnType.FLOAT,
+        "DECIMAL": ColumnType.DECIMAL,
+        "BOOLEAN": ColumnType.BOOL,
+        "TIMESTAMP": ColumnType.DATETIME,
+        "TIMESTAMP_S": ColumnType.DATETIME,
+        "TIMESTAMP_MS": ColumnType.DATETIME,
+        "TIMESTAMP_NS": ColumnType.DATETIME,
+        "DATE": ColumnType.DATE,
+        "TIME": ColumnType.TIME,
+        "INTERVAL": ColumnType.TIMEDELTA,
+        "BLOB": ColumnType.BYTES,
+        "STRUCT": ColumnType.DICT,
+        "MAP": ColumnType.DICT,
+    }
+
+    columns = []
+    for name, type_ in zip(relation.columns, relation.types):
+        type_name = str(type_)
+        if type_name.endswith("]"):
+            columns.append(ColumnMetadata(name=name, type=ColumnType.LIST))
+            continue
+        base_type = re.split(r"[ (]", type_name, maxsplit=1)[0]
+        # fallback to string
+        columns.append(
+            ColumnMetadata(name=name, type=type_map.get(base_type, ColumnType.STR)),
+        )
+
+    return columns
+
+
+def fetch_duckdb_rows(
+    relation: duckdb.DuckDBPyRelation,
+    batch_size: int,
+    keep_batches: bool = False,
+) -> Stream:
+    """
+    Fetch the rows of a DuckDB relation a batch at a time, as Arrow record batches
+    when ``pyarrow`` is installed, which are kept if ``keep_batches`` is set.
+    """
+    if arrow_available():
+        return RecordBatchStream(
+            relation.fetch_arrow_reader(batch_size),
+            keep_batches,
+        )
+    return _fetch_duckdb_rows(relation, batch_size)
+
+
+def _fetch_duckdb_rows(relation: duckdb.DuckDBPyRelation, batch_size: int) -> Stream:
+    while True:
+        rows = relation.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+
 def run_duckdb_query(
     query: Query,
     conn: duckdb.DuckDBPyConnection,
-) -> List[Tuple[str, List[ColumnMetadata], Stream]]:
+    batch_size: int = 10000,
+) -> Iterator[Tuple[str, List[ColumnMetadata], Stream]]:
     """
-    Run a duckdb query against the local duckdb database
+    Run a duckdb query against the local duckdb database.
+
+    Each statement's rows are streamed in batches of ``batch_size`` rows, and
+    statements that don't return rows have no columns and an empty stream. The
+    Arrow batches of synchronous queries are kept, to return them as fetched.
     """
-    output: List[Tuple[str, List[ColumnMetadata], Stream]] = []
-    rows = conn.execute(query.submitted_query).fetchall()
-    columns: List[ColumnMetadata] = []
-    output.append((query.submitted_query, columns, rows))
-    return output
+    for statement in sqlparse.parse(query.submitted_query):
+        sql = str(statement).strip().rstrip(";")
+        if not sql:
+            continue
+        relation = conn.sql(sql)
+        if relation is None:
+            yield sql, [], iter([])
+            continue
+        columns = get_columns_from_duckdb_relation(relation)
+        yield sql, columns, fetch_duckdb_rows(
+            relation,
+            batch_size,
+            keep_batches=not query.async_,
+        )
 
 
-def process_query(
+def run_scheduled_query(
+    bind: SQLAEngine,
+    settings: Settings,
+    query_id: UUID,
+    canceled: Optional[threading.Event] = None,
+) -> QueryResults:
+    """
+    Process a query on a scheduler worker, with a session of its own.
+    """
+    with Session(bind, autoflush=False) as session:
+        query = session.get(Query, query_id)
+        return process_query(session, settings, query, canceled)
+
+
+def process_query(  # pylint: disable=too-many-locals
     session: Session,
     settings: Settings,
     query: Query,
+    canceled: Optional[threading.Event] = None,
 ) -> QueryResults:
     """
     Process a query.
+
+    Results are written to the results backend a page at a time while they're being
+    fetched, and are only kept in memory for queries that wait for their results,
+    along with the Arrow tables of those fetched as Arrow. Fetching stops if the query
+    is canceled. Finished queries are added to the result cache, and identical queries
+    attached to this one are released when it completes.
     """
-    query.scheduled = datetime.now(timezone.utc)
-    query.state = QueryState.SCHEDULED
+    now = datetime.now(timezone.utc)
+    if query.scheduled is None:
+        query.scheduled = now
+    query.started = now
+    query.state = QueryState.RUNNING
     query.executed_query = query.submitted_query
+    session.add(query)
+    session.commit()
 
     errors = []
-    query.started = datetime.now(timezone.utc)
+    writer = ResultsWriter(
+        settings.results_backend,
+        str(query.id),
+        settings.results_page_size,
+        settings.results_ttl,
+    )
+    arrow_tables = []
     try:
         root = []
-        for sql, columns, stream in run_query(session=session, query=query):
-            rows = list(stream)
+        for sql, columns, stream in run_query(session, settings, query):
+            rows = writer.add_statement(
+                sql,
+                columns,
+                cancellable(stream, canceled),
+                keep_rows=not query.async_,
+            )
             root.append(
                 StatementResults(
                     sql=sql,
                     columns=columns,
-                    rows=rows,
-                    row_count=len(rows),
+                    rows=rows or [],
+                    row_count=writer.statements[-1]["row_count"],
                 ),
             )
+            if isinstance(stream, RecordBatchStream) and not query.async_:
+                arrow_tables.append(stream.to_table())
+            else:
+                arrow_tables.append(None)
         results = Results(__root__=root)
 
         query.state = QueryState.FINISHED
         query.progress = 1.0
+        if is_read_only(query.submitted_query):
+            get_result_cache(settings).add(
+                query,
+                sum(statement.row_count for statement in root),
+            )
+    except QueryCanceled as ex:
+        writer.discard()
+        results = Results(__root__=[])
+        query.state = QueryState.CANCELED
+        errors = [str(ex)]
     except Exception as ex:  # pylint: disable=broad-except
+        writer.discard()
         results = Results(__root__=[])
         query.state = QueryState.FAILED
         errors = [str(ex)]
 
     query.finished = datetime.now(timezone.utc)
 
-    session.add(query)
-    session.commit()
-    session.refresh(query)
-
-    settings.results_backend.add(str(query.id), results.json())
-
-    return QueryResults(results=results, errors=errors, **query.dict())
+    try:
+        session.add(query)
+        session.commit()
+        session.refresh(query)
+    finally:
+        # Release the identical queries waiting on this one
+        get_in_flight_queries(settings).finish(query, errors)
+
+    query_results = QueryResults(results=results, errors=errors, **query.dict())
+    if results.__root__ and any(table is not None for table in arrow_tables):
+        query_results.set_arrow_tables(arrow_tables)
+    return query_results
@@ -0,0 +1,112 @@
+"""
+Coalescing of identical in-flight queries.
+
+When many clients submit the same query at once, e.g., the tiles of a dashboard
+that refresh together, only the first submission runs. Identical queries submitted
+while it's running (same normalized SQL, catalog and engine, see ``cache_key``) are
+attached to it: asynchronous submissions get its id to poll, and synchronous ones
+wait for it to finish and get its results. Only queries that just read data are
+coalesced (see ``is_read_only``), since a query that writes has to run each time
+it's submitted.
+"""
+import asyncio
+import threading
+import weakref
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional, Tuple
+
+from djqs.cache import cache_key
+from djqs.config import Settings
+from djqs.models.query import Query
+
+
+class InFlightQuery:
+    """
+    A running query that identical submissions are attached to.
+    """
+
+    def __init__(self, query: Query):
+        self.query_id = str(query.id)
+        self.query: Dict[str, Any] = query.dict()
+        self.errors: List[str] = []
+        self._done: "Future[None]" = Future()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for the query to finish. Returns false on timeout.
+        """
+        try:
+            self._done.result(timeout)
+        except FutureTimeoutError:
+            return False
+        return True
+
+    async def wait_async(self):
+        """
+        Wait for the query to finish without blocking a thread.
+        """
+        await asyncio.shield(asyncio.wrap_future(self._done))
+
+    def finish(self, query: Query, errors: List[str]):
+        """
+        Record the final state of the query and release the waiting submissions.
+        """
+        self.query = query.dict()
+        self.errors = errors
+        self._done.set_result(None)
+
+
+class InFlightQueries:
+    """
+    Registry of running queries, by cache key.
+    """
+
+    def __init__(self):
+        self._queries: Dict[str, InFlightQuery] = {}
+        self._lock = threading.Lock()
+
+    def get(self, query: Query) -> Optional[InFlightQuery]:
+        """
+        Return the running query identical to the given query, if any.
+        """
+        with self._lock:
+            return self._queries.get(cache_key(query))
+
+    def get_or_start(self, query: Query) -> Tuple[InFlightQuery, bool]:
+        """
+        Return the running query identical to the given query, or register the given
+        query as about to run if there's none. The flag is set if the query was
+        registered, in which case the caller must run it.
+        """
+        key = cache_key(query)
+        with self._lock:
+            if key in self._queries:
+                return self._queries[key], False
+            in_flight = self._queries[key] = InFlightQuery(query)
+            return in_flight, True
+
+    def finish(self, query: Query, errors: List[str]):
+        """
+        Unregister a query once it has finished or failed.
+        """
+        key = cache_key(query)
+        with self._lock:
+            in_flight = self._queries.get(key)
+            if in_flight is None or in_flight.query_id != str(query.id):
+                return
+            del self._queries[key]
+        in_flight.finish(query, errors)
+
+
+_registries: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def get_in_flight_queries(settings: Settings) -> InFlightQueries:
+    """
+    Get the registry of queries running with the settings' results backend.
+    """
+    backend = settings.results_backend
+    if backend not in _registries:
+        _registries[backend] = InFlightQueries()
+    return _registries[backend]
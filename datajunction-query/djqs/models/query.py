@@ -14,7 +14,7 @@ from sqlalchemy.sql.schema import Column as SqlaColumn
 from sqlalchemy_utils import UUIDType
 from sqlmodel import Field, SQLModel
 
-from djqs.typing import QueryState, Row
+from djqs.typing import QueryPriority, QueryState, Row
 
 
 class BaseQuery(SQLModel):
@@ -60,6 +60,7 @@ class QueryCreate(BaseQuery):
 
     submitted_query: str
     async_: bool = False
+    priority: QueryPriority = QueryPriority.INTERACTIVE
 
 
 class ColumnMetadata(SQLModel):
@@ -99,6 +100,11 @@ class QueryResults(BaseQuery):
     Model for query with results.
     """
 
+    # The results of each statement as Arrow tables, when they were fetched as Arrow,
+    # so that they can be serialized to Arrow without converting the rows back. This
+    # isn't a field, so it's never validated, copied or returned as JSON.
+    __slots__ = ("arrow_tables",)
+
     id: uuid.UUID
     engine_name: Optional[str] = None
     engine_version: Optional[str] = None
@@ -117,6 +123,16 @@ class QueryResults(BaseQuery):
     previous: Optional[AnyHttpUrl] = None
     errors: List[str]
 
+    def __init__(self, **data: Any):
+        super().__init__(**data)
+        self.set_arrow_tables(None)
+
+    def set_arrow_tables(self, arrow_tables: Optional[List[Any]]) -> None:
+        """
+        Attach the Arrow tables with the results of each statement.
+        """
+        object.__setattr__(self, "arrow_tables", arrow_tables)
+
 
 class QueryExtType(int, Enum):
     """
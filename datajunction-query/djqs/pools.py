@@ -0,0 +1,189 @@
+"""
+Pools of connections to the engines that queries run on.
+
+Setting up a connection is a large part of the latency of small queries, so engines
+are kept around and reused across queries: SQLAlchemy engines are shared per engine
+(name, version and URI) and catalog parameters, each with its own connection pool,
+and DuckDB databases have a single connection that queries get their own cursors
+from. The pooled connection to a DuckDB database file holds its lock for as long as
+it lives, which keeps other processes from writing to the file, unless it's opened
+read-only, in which case statements that write fail instead. Catalogs of local
+Parquet or CSV files get an in-memory DuckDB database with a view for each file.
+Connections are checked before they're used, and engines that haven't been used for
+a while are disposed of.
+"""
+import json
+import logging
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+
+import duckdb
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine as SQLAEngine
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+from djqs.config import Settings
+
+_logger = logging.getLogger(__name__)
+
+# Engines are shared by (engine name, engine version, URI, catalog parameters)
+EngineKey = Tuple[str, str, str, str]
+
+IN_MEMORY_DATABASE = ":memory:"
+
+
+def create_file_view(connection: duckdb.DuckDBPyConnection, name: str, path: str):
+    """
+    Create a view that reads a local Parquet or CSV file (or files, for a glob). The
+    path is passed to DuckDB's readers as is, rather than interpolated into SQL.
+    """
+    lowered = path.lower()
+    if lowered.endswith(".parquet"):
+        relation = connection.read_parquet(path)
+    elif lowered.endswith((".csv", ".csv.gz", ".tsv")):
+        relation = connection.read_csv(path)
+    else:
+        raise ValueError(f"Unsupported file format for `{name}`: {path}")
+    relation.create_view(name, replace=True)
+
+
+class EnginePools:
+    """
+    Registry of SQLAlchemy engines and DuckDB connections shared across queries.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 5,
+        max_overflow: int = 10,
+        pool_recycle: Optional[float] = None,
+        idle_timeout: Optional[float] = None,
+    ):
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_recycle = pool_recycle
+        self.idle_timeout = idle_timeout
+        self._engines: Dict[EngineKey, Tuple[SQLAEngine, float]] = {}
+        self._duckdb_connections: Dict[
+            Tuple[str, str, bool],
+            duckdb.DuckDBPyConnection,
+        ] = {}
+        self._lock = threading.Lock()
+
+    def engine_options(self, uri: str, extra_params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Options for creating an engine. Pool sizes only apply to dialects that pool
+        connections in a queue, and catalog parameters take precedence.
+        """
+        options: Dict[str, Any] = {"pool_pre_ping": True}
+        if self.pool_recycle:
+            options["pool_recycle"] = int(self.pool_recycle)
+        url = make_url(uri)
+        pool_class = extra_params.get(
+            "poolclass",
+            url.get_dialect().get_pool_class(url),
+        )
+        if issubclass(pool_class, QueuePool):
+            options["pool_size"] = self.pool_size
+            options["max_overflow"] = self.max_overflow
+        options.update(extra_params)
+        return options
+
+    def get_engine(
+        self,
+        name: str,
+        version: str,
+        uri: str,
+        extra_params: Optional[Dict[str, Any]] = None,
+    ) -> SQLAEngine:
+        """
+        Get the engine for an engine and catalog parameters, creating it if needed.
+        """
+        extra_params = extra_params or {}
+        key: EngineKey = (
+            name,
+            version,
+            uri,
+            json.dumps(extra_params, sort_keys=True, default=str),
+        )
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now, keep=key)
+            if key in self._engines:
+                engine, _ = self._engines[key]
+            else:
+                _logger.info("Creating engine %s %s", name, version)
+                engine = create_engine(uri, **self.engine_options(uri, extra_params))
+            self._engines[key] = (engine, now)
+        return engine
+
+    def get_duckdb_connection(
+        self,
+        database: str,
+        files: Optional[Dict[str, str]] = None,
+        read_only: bool = False,
+    ) -> duckdb.DuckDBPyConnection:
+        """
+        Get the connection to a DuckDB database, which queries should get their own
+        cursors from, opening database files read-only if ``read_only`` is set. Local
+        Parquet or CSV files can be exposed as views of an in-memory database, by name.
+        """
+        read_only = read_only and database != IN_MEMORY_DATABASE
+        key = (database, json.dumps(files or {}, sort_keys=True), read_only)
+        with self._lock:
+            if key not in self._duckdb_connections:
+                connection = duckdb.connect(database=database, read_only=read_only)
+                for name, path in (files or {}).items():
+                    create_file_view(connection, name, path)
+                self._duckdb_connections[key] = connection
+            return self._duckdb_connections[key]
+
+    def dispose(self):
+        """
+        Close all pooled connections.
+        """
+        with self._lock:
+            for engine, _ in self._engines.values():
+                engine.dispose()
+            self._engines.clear()
+            for connection in self._duckdb_connections.values():
+                connection.close()
+            self._duckdb_connections.clear()
+
+    def _evict_idle(self, now: float, keep: EngineKey):
+        """
+        Dispose of the engines that haven't been used within the idle timeout.
+        Connections in use when an engine is disposed of are closed when returned.
+        """
+        if not self.idle_timeout:
+            return
+        for key, (engine, last_used) in list(self._engines.items()):
+            if key != keep and now - last_used > self.idle_timeout:
+                _logger.info("Disposing of idle engine %s %s", key[0], key[1])
+                engine.dispose()
+                del self._engines[key]
+
+
+def get_engine_pools(settings: Settings) -> EnginePools:
+    """
+    Get the engine pools shared by all queries.
+    """
+    return _get_engine_pools(
+        settings.engine_pool_size,
+        settings.engine_max_overflow,
+        settings.engine_pool_recycle.total_seconds(),
+        settings.engine_idle_timeout.total_seconds(),
+    )
+
+
+@lru_cache
+def _get_engine_pools(
+    pool_size: int,
+    max_overflow: int,
+    pool_recycle: float,
+    idle_timeout: float,
+) -> EnginePools:
+    return EnginePools(pool_size, max_overflow, pool_recycle, idle_timeout)
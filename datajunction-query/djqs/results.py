@@ -0,0 +1,213 @@
+"""
+Paged storage of query results in the results backend.
+
+Results are written while they're being fetched, one page of rows at a time, so that
+a query never has to hold all of its rows in memory. The results of a query are
+stored under its id as a list of statements (SQL, columns, row count, page size and
+number of pages), which is updated as each page is written, and the rows of each
+page are stored under a key of their own. Readers can load the pages written so far
+before the query finishes, and only the pages that hold the rows they ask for.
+
+All of the entries of a query expire at the same time, a TTL after the query
+started writing them, so that the backend can prune the results of old queries
+without leaving some of their pages behind. A page that's missing when its results
+are read, e.g., because the backend evicted it early, is an error, rather than
+silently returning fewer rows than the row count.
+"""
+import json
+import logging
+import math
+import time
+from datetime import timedelta
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, TypedDict
+
+from cachelib.base import BaseCache
+from pydantic.json import pydantic_encoder
+
+from djqs.exceptions import DJException
+from djqs.models.query import ColumnMetadata, StatementResults
+from djqs.typing import Row, Stream
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 10000
+
+
+def page_key(key: str, statement: int, page: int) -> str:
+    """
+    Key for a page of results of a statement.
+    """
+    return f"{key}/{statement}/{page}"
+
+
+def expiry_timeout(expires: Optional[float]) -> int:
+    """
+    Timeout for an entry that expires at the given time, where zero means never.
+    """
+    if expires is None:
+        return 0
+    return max(math.ceil(expires - time.time()), 1)
+
+
+class StatementManifest(TypedDict):
+    """
+    What's stored about the results of a statement under the query's key, alongside
+    the pages of its rows.
+    """
+
+    sql: str
+    columns: List[Dict[str, Any]]
+    rows: List[Row]
+    row_count: int
+    page_size: int
+    pages: int
+    expires: Optional[float]
+
+
+def paginate(stream: Iterable[Sequence[Any]], page_size: int) -> Iterator[List[Row]]:
+    """
+    Split a stream of rows into pages, of tuples.
+    """
+    rows = iter(stream)
+    while page := [tuple(row) for row in islice(rows, page_size)]:
+        yield page
+
+
+class ResultsWriter:
+    """
+    Writes the results of a query to the results backend, a page at a time.
+    """
+
+    def __init__(
+        self,
+        backend: BaseCache,
+        key: str,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        ttl: Optional[timedelta] = None,
+    ):
+        self.backend = backend
+        self.key = key
+        self.page_size = page_size
+        self.expires = time.time() + ttl.total_seconds() if ttl else None
+        self.statements: List[StatementManifest] = []
+
+    def add_statement(
+        self,
+        sql: str,
+        columns: List[ColumnMetadata],
+        stream: Stream,
+        keep_rows: bool = False,
+    ) -> Optional[List[Row]]:
+        """
+        Write the results of a statement as they're fetched from the stream. The
+        rows are only kept in memory, and returned, if ``keep_rows`` is set.
+        """
+        statement: StatementManifest = {
+            "sql": sql,
+            "columns": [column.dict() for column in columns],
+            "rows": [],
+            "row_count": 0,
+            "page_size": self.page_size,
+            "pages": 0,
+            "expires": self.expires,
+        }
+        self.statements.append(statement)
+        self._write_statements()
+
+        rows: List[Row] = []
+        for page in paginate(stream, self.page_size):
+            self.backend.set(
+                page_key(self.key, len(self.statements) - 1, statement["pages"]),
+                json.dumps(page, default=pydantic_encoder),
+                timeout=expiry_timeout(self.expires),
+            )
+            statement["pages"] += 1
+            statement["row_count"] += len(page)
+            self._write_statements()
+            if keep_rows:
+                rows.extend(page)
+        return rows if keep_rows else None
+
+    def discard(self):
+        """
+        Remove all results written so far, e.g., when the query fails.
+        """
+        for index, statement in enumerate(self.statements):
+            for page in range(statement["pages"]):
+                self.backend.delete(page_key(self.key, index, page))
+        self.statements = []
+        self._write_statements()
+
+    def _write_statements(self):
+        self.backend.set(
+            self.key,
+            json.dumps(self.statements),
+            timeout=expiry_timeout(self.expires),
+        )
+
+
+def link_results(backend: BaseCache, key: str, source_key: str) -> bool:
+    """
+    Store the results of another query under a key, without copying their pages, and
+    expiring along with them. Returns false if the results are no longer in the
+    backend.
+    """
+    statements = backend.get(source_key)
+    if statements is None:
+        return False
+    statements = json.loads(statements)
+    expires = None
+    for statement in statements:
+        statement.setdefault("source", source_key)
+        expires = statement.get("expires")
+    if expires is not None and expires <= time.time():
+        return False
+    backend.set(key, json.dumps(statements), timeout=expiry_timeout(expires))
+    return True
+
+
+def read_results(
+    backend: BaseCache,
+    key: str,
+    offset: int = 0,
+    limit: Optional[int] = None,
+) -> List[StatementResults]:
+    """
+    Read the results of a query written so far, if available. Only the rows from
+    ``offset`` up to ``limit`` rows of each statement are read, and the row counts
+    are those of the complete results.
+    """
+    if not backend.has(key):
+        _logger.warning("No results found")
+        return []
+
+    _logger.info("Reading results from results backend")
+    statements = json.loads(backend.get(key))
+    end = None if limit is None else offset + limit
+    for index, statement in enumerate(statements):
+        source = statement.pop("source", key)
+        pages = statement.pop("pages", 0)
+        statement.pop("expires", None)
+        page_size = statement.pop("page_size", None)
+        if not page_size:
+            # Results written before paging have their rows inline, and results
+            # written without a page size have to be read in full
+            page_size, first_page = None, 0
+        else:
+            first_page = offset // page_size
+            if end is not None:
+                pages = min(pages, (end + page_size - 1) // page_size)
+        for page in range(first_page, pages):
+            rows = backend.get(page_key(source, index, page))
+            if rows is None:
+                raise DJException(
+                    f"Page {page} of the results of statement {index} for {key} is "
+                    "missing from the results backend",
+                )
+            statement["rows"].extend(json.loads(rows))
+        start = offset - first_page * (page_size or 0)
+        statement["rows"] = statement["rows"][
+            start : None if limit is None else start + limit
+        ]
+    return [StatementResults(**statement) for statement in statements]
@@ -0,0 +1,249 @@
+"""
+Scheduling of queries on bounded worker pools.
+
+Each engine has a fixed number of worker threads that run its queries, so that a
+burst of queries can't overload the engine or the query service. Queries wait in a
+priority queue for a worker: interactive queries are run before batch queries, which
+only run when no interactive queries are waiting, and queries with the same priority
+run in the order they were submitted.
+
+Queued queries can be canceled before they start, while running queries are asked
+to stop, which they do the next time they fetch a row. The queue depth, number of
+running queries and time spent waiting for a worker are tracked per engine.
+"""
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from functools import lru_cache
+from queue import PriorityQueue
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple, TypeVar
+
+from djqs.config import Settings
+from djqs.typing import QueryPriority
+
+_logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+EngineKey = Tuple[str, str]
+
+PRIORITY_ORDER = {QueryPriority.INTERACTIVE: 0, QueryPriority.BATCH: 1}
+
+
+class QueryCanceled(Exception):
+    """
+    Raised in a running query when it's canceled.
+    """
+
+
+def cancellable(
+    stream: Iterator[T], canceled: Optional[threading.Event]
+) -> Iterator[T]:
+    """
+    Stop consuming a stream once the query is canceled.
+    """
+    for item in stream:
+        if canceled is not None and canceled.is_set():
+            raise QueryCanceled("Query was canceled")
+        yield item
+
+
+class ScheduledQuery:  # pylint: disable=too-few-public-methods
+    """
+    A query waiting for, or running on, a worker.
+    """
+
+    def __init__(
+        self,
+        query_id: str,
+        priority: QueryPriority,
+        run: Callable[[threading.Event], Any],
+    ):
+        self.query_id = query_id
+        self.priority = priority
+        self.run = run
+        self.enqueued = time.monotonic()
+        self.canceled = threading.Event()
+        self.future: Future = Future()
+
+
+@dataclass
+class WorkerStats:
+    """
+    Counts of the queries of an engine and the time they waited for a worker.
+    """
+
+    queued: Dict[QueryPriority, int] = field(
+        default_factory=lambda: {priority: 0 for priority in QueryPriority},
+    )
+    running: int = 0
+    completed: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+
+class EngineWorkers:
+    """
+    The worker pool and queue of an engine.
+    """
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.queue: "PriorityQueue[Tuple[int, int, ScheduledQuery]]" = PriorityQueue()
+        self.stats = WorkerStats()
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(
+                target=self._work,
+                name=f"djqs-{name}-{index}",
+                daemon=True,
+            )
+            for index in range(max_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def put(self, scheduled_query: ScheduledQuery):
+        """
+        Queue a query for the next available worker.
+        """
+        with self._lock:
+            self.stats.queued[scheduled_query.priority] += 1
+        self.queue.put(
+            (
+                PRIORITY_ORDER[scheduled_query.priority],
+                next(self._counter),
+                scheduled_query,
+            ),
+        )
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Queue depth, running queries and wait times of the engine.
+        """
+        with self._lock:
+            stats = self.stats
+            started = stats.completed + stats.running
+            return {
+                "workers": self.max_workers,
+                "queued": {
+                    priority.value: count for priority, count in stats.queued.items()
+                },
+                "running": stats.running,
+                "completed": stats.completed,
+                "wait_time": {
+                    "mean": stats.total_wait / started if started else 0.0,
+                    "max": stats.max_wait,
+                },
+            }
+
+    def _work(self):
+        while True:
+            _, _, scheduled_query = self.queue.get()
+            with self._lock:
+                self.stats.queued[scheduled_query.priority] -= 1
+            if not scheduled_query.future.set_running_or_notify_cancel():
+                continue
+
+            wait = time.monotonic() - scheduled_query.enqueued
+            with self._lock:
+                self.stats.running += 1
+                self.stats.total_wait += wait
+                self.stats.max_wait = max(self.stats.max_wait, wait)
+            _logger.info(
+                "Running query %s after waiting %.3fs",
+                scheduled_query.query_id,
+                wait,
+            )
+            try:
+                result = scheduled_query.run(scheduled_query.canceled)
+            except Exception as exc:  # pylint: disable=broad-except
+                scheduled_query.future.set_exception(exc)
+            else:
+                scheduled_query.future.set_result(result)
+            finally:
+                with self._lock:
+                    self.stats.running -= 1
+                    self.stats.completed += 1
+
+
+class QueryScheduler:
+    """
+    Runs queries on the worker pool of their engine.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._engines: Dict[EngineKey, EngineWorkers] = {}
+        self._queries: Dict[str, ScheduledQuery] = {}
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        engine: EngineKey,
+        query_id: str,
+        priority: QueryPriority,
+        run: Callable[[threading.Event], T],
+    ) -> "Future[T]":
+        """
+        Schedule a query. ``run`` is called on a worker with an event that's set if
+        the query is canceled while running.
+        """
+        scheduled_query = ScheduledQuery(query_id, priority, run)
+        with self._lock:
+            if engine not in self._engines:
+                self._engines[engine] = EngineWorkers(
+                    "/".join(engine),
+                    self.max_workers,
+                )
+            workers = self._engines[engine]
+            self._queries[query_id] = scheduled_query
+        scheduled_query.future.add_done_callback(
+            lambda _: self._forget(query_id, scheduled_query),
+        )
+        workers.put(scheduled_query)
+        return scheduled_query.future
+
+    def cancel(self, query_id: str) -> Optional[bool]:
+        """
+        Cancel a query. Returns true if it was still queued and won't run, false if
+        it's running and was asked to stop, and ``None`` if it isn't scheduled.
+        """
+        with self._lock:
+            scheduled_query = self._queries.get(query_id)
+        if scheduled_query is None:
+            return None
+        if scheduled_query.future.cancel():
+            return True
+        scheduled_query.canceled.set()
+        return False
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Metrics of each engine's queue and workers.
+        """
+        with self._lock:
+            engines = dict(self._engines)
+        return {workers.name: workers.metrics() for workers in engines.values()}
+
+    def _forget(self, query_id: str, scheduled_query: ScheduledQuery):
+        with self._lock:
+            if self._queries.get(query_id) is scheduled_query:
+                del self._queries[query_id]
+
+
+def get_scheduler(settings: Settings) -> QueryScheduler:
+    """
+    Get the scheduler shared by all queries.
+    """
+    return _get_scheduler(settings.engine_max_concurrency)
+
+
+@lru_cache
+def _get_scheduler(max_workers: int) -> QueryScheduler:
+    return QueryScheduler(max_workers)
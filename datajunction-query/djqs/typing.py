@@ -97,6 +97,18 @@ class QueryState(str, Enum):
     FAILED = "FAILED"
 
 
+END_JOB_STATES = [QueryState.FINISHED, QueryState.CANCELED, QueryState.FAILED]
+
+
+class QueryPriority(str, Enum):
+    """
+    Priority of a query: interactive queries run before batch queries.
+    """
+
+    INTERACTIVE = "interactive"
+    BATCH = "batch"
+
+
 # sqloxide type hints
 # Reference: https://github.com/sqlparser-rs/sqlparser-rs/blob/main/src/ast/query.rs
 
@@ -3,21 +3,29 @@ Tests for the queries API.
 """
 
 import datetime
+import decimal
 import json
+import threading
+import time
+import uuid
 from http import HTTPStatus
 from unittest import mock
 
 import msgpack
+import pyarrow as pa
 from fastapi.testclient import TestClient
 from freezegun import freeze_time
 from pytest_mock import MockerFixture
 from sqlmodel import Session
 
+import djqs.engine
+from djqs.arrow import ARROW_STREAM, deserialize_query_results
 from djqs.config import Settings
-from djqs.engine import describe_table_via_spark, process_query
+from djqs.engine import describe_table_via_spark, process_query, run_scheduled_query
 from djqs.models.catalog import Catalog
 from djqs.models.engine import Engine
 from djqs.models.query import (
+    ColumnMetadata,
     Query,
     QueryCreate,
     QueryState,
@@ -26,6 +34,8 @@ from djqs.models.query import (
     decode_results,
     encode_results,
 )
+from djqs.results import ResultsWriter
+from djqs.typing import QueryPriority
 
 
 def test_submit_query(session: Session, client: TestClient) -> None:
@@ -52,6 +62,7 @@ def test_submit_query(session: Session, client: TestClient) -> None:
             "engine_version": "1.0",
             "submitted_query": "SELECT 1 AS col",
             "async_": False,
+            "priority": "interactive",
         },
     )
 
@@ -179,7 +190,10 @@ def test_submit_query_errors(
     )
     assert response.status_code == 406
     assert response.json() == {
-        "detail": "Client MUST accept: application/json, application/msgpack",
+        "detail": (
+            "Client MUST accept: application/json, application/msgpack, "
+            f"{ARROW_STREAM}"
+        ),
     }
 
 
@@ -281,15 +295,23 @@ def test_submit_query_results_backend(
         "previous": None,
         "errors": [],
     }
-    cached = settings.results_backend.get(data["id"])
-    assert json.loads(cached) == [
+    cached = json.loads(settings.results_backend.get(data["id"]))
+    expires = cached[0].pop("expires")
+    assert cached == [
         {
             "sql": "SELECT 1 AS col",
             "columns": [{"name": "col", "type": "STR"}],
-            "rows": [[1]],
+            "rows": [],
             "row_count": 1,
+            "page_size": 10000,
+            "pages": 1,
         },
     ]
+    assert 0 < expires - time.time() <= settings.results_ttl.total_seconds()
+    assert json.loads(settings.results_backend.get(f"{data['id']}/0/0")) == [[1]]
+
+    response = client.get(f"/queries/{data['id']}/")
+    assert response.json()["results"] == data["results"]
 
 
 def test_submit_query_async(
@@ -300,7 +322,7 @@ def test_submit_query_async(
     """
     Test ``POST /queries/`` on an async database.
     """
-    add_task = mocker.patch("fastapi.BackgroundTasks.add_task")
+    submit = mocker.patch("djqs.scheduler.QueryScheduler.submit")
 
     engine = Engine(name="test_engine", version="1.0", uri="sqlite://")
     catalog = Catalog(name="test_catalog", engines=[engine])
@@ -330,21 +352,24 @@ def test_submit_query_async(
     assert data["engine_version"] == "1.0"
     assert data["submitted_query"] == "SELECT 1 AS col"
     assert data["executed_query"] is None
-    assert data["scheduled"] is None
+    assert data["scheduled"] is not None
     assert data["started"] is None
     assert data["finished"] is None
-    assert data["state"] == "ACCEPTED"
+    assert data["state"] == "SCHEDULED"
     assert data["progress"] == 0.0
     assert data["results"] == []
     assert data["errors"] == []
 
-    # check that ``BackgroundTasks.add_task`` was called
-    add_task.assert_called()
-    arguments = add_task.mock_calls[0].args
-    assert arguments[0] == process_query  # pylint: disable=comparison-with-callable
-    assert arguments[1] == session
-    assert isinstance(arguments[2], Settings)
-    assert isinstance(arguments[3], Query)
+    # check that the query was scheduled on a worker of its engine
+    submit.assert_called()
+    engine_key, query_id, priority, run = submit.call_args.args
+    assert engine_key == ("test_engine", "1.0")
+    assert query_id == data["id"]
+    assert priority == QueryPriority.INTERACTIVE
+    assert run.func == run_scheduled_query  # pylint: disable=comparison-with-callable
+    assert run.args[0] == session.get_bind()
+    assert isinstance(run.args[1], Settings)
+    assert str(run.args[2]) == data["id"]
 
 
 def test_submit_query_error(session: Session, client: TestClient) -> None:
@@ -515,6 +540,7 @@ def test_submit_spark_query(session: Session, client: TestClient) -> None:
             "engine_version": "3.3.2",
             "submitted_query": "SELECT 1 AS int_col, 'a' as str_col",
             "async_": False,
+            "priority": "interactive",
         },
     )
 
@@ -539,7 +565,10 @@ def test_submit_spark_query(session: Session, client: TestClient) -> None:
     assert data["progress"] == 1.0
     assert len(data["results"]) == 1
     assert data["results"][0]["sql"] == "SELECT 1 AS int_col, 'a' as str_col"
-    assert data["results"][0]["columns"] == []
+    assert data["results"][0]["columns"] == [
+        {"name": "int_col", "type": "INT"},
+        {"name": "str_col", "type": "STR"},
+    ]
     assert data["results"][0]["rows"] == [[1, "a"]]
     assert data["errors"] == []
 
@@ -640,6 +669,7 @@ def test_submit_duckdb_query(
             "engine_version": "0.7.1",
             "submitted_query": "SELECT 1 AS int_col, 'a' as str_col",
             "async_": False,
+            "priority": "interactive",
         },
     )
 
@@ -664,6 +694,300 @@ def test_submit_duckdb_query(
     assert data["progress"] == 1.0
     assert len(data["results"]) == 1
     assert data["results"][0]["sql"] == "SELECT 1 AS int_col, 'a' as str_col"
-    assert data["results"][0]["columns"] == []
+    assert data["results"][0]["columns"] == [
+        {"name": "int_col", "type": "INT"},
+        {"name": "str_col", "type": "STR"},
+    ]
     assert data["results"][0]["rows"] == [[1, "a"]]
     assert data["errors"] == []
+
+
+@mock.patch("djqs.engine.duckdb.connect")
+def test_submit_duckdb_query_arrow(
+    mock_duckdb_connect,
+    session: Session,
+    client: TestClient,
+    duckdb_conn,
+) -> None:
+    """
+    Test that the results of DuckDB queries are returned as the Arrow batches they
+    were fetched as.
+    """
+    mock_duckdb_connect.return_value = duckdb_conn
+    engine = Engine(name="test_duckdb_engine", version="0.7.1", uri="duckdb://local[*]")
+    catalog = Catalog(name="test_catalog", engines=[engine])
+    session.add(catalog)
+    session.commit()
+
+    query_create = QueryCreate(
+        catalog_name=catalog.name,
+        engine_name=engine.name,
+        engine_version=engine.version,
+        submitted_query="SELECT 1.5 AS dec_col, 'a' AS str_col",
+    )
+    response = client.post(
+        "/queries/",
+        data=query_create.json(by_alias=True),
+        headers={"Content-Type": "application/json", "Accept": ARROW_STREAM},
+    )
+    assert response.headers.get("content-type") == ARROW_STREAM
+    assert pa.ipc.open_stream(response.content).schema.types == [
+        pa.decimal128(2, 1),
+        pa.string(),
+    ]
+    results = deserialize_query_results(response.content)
+    assert results.results.__root__[0].rows == [(decimal.Decimal("1.5"), "a")]
+
+
+def test_submit_and_read_query_arrow(session: Session, client: TestClient) -> None:
+    """
+    Test ``POST /queries/`` and ``GET /queries/{query_id}`` returning Arrow.
+    """
+    engine = Engine(name="test_engine", version="1.0", uri="sqlite://")
+    catalog = Catalog(name="test_catalog", engines=[engine])
+    session.add(catalog)
+    session.commit()
+    session.refresh(catalog)
+
+    query_create = QueryCreate(
+        catalog_name=catalog.name,
+        engine_name=engine.name,
+        engine_version=engine.version,
+        submitted_query="SELECT 1 AS col, 'a' AS another_col",
+    )
+    response = client.post(
+        "/queries/",
+        data=query_create.json(),
+        headers={
+            "Content-Type": "application/json",
+            "Accept": f"{ARROW_STREAM}, application/json; q=0.5",
+        },
+    )
+    assert response.headers.get("content-type") == ARROW_STREAM
+    results = deserialize_query_results(response.content)
+    assert results.state == QueryState.FINISHED
+    assert results.results.__root__[0].rows == [(1, "a")]
+    assert [column.name for column in results.results.__root__[0].columns] == [
+        "col",
+        "another_col",
+    ]
+
+    response = client.get(
+        f"/queries/{results.id}/",
+        headers={"Accept": ARROW_STREAM},
+    )
+    assert response.headers.get("content-type") == ARROW_STREAM
+    assert deserialize_query_results(response.content) == results
+
+    response = client.get(f"/queries/{results.id}/")
+    assert response.json()["results"][0]["rows"] == [[1, "a"]]
+
+
+def test_submit_and_read_query_arrow_mixed_types(
+    session: Session,
+    client: TestClient,
+) -> None:
+    """
+    Test that results that can't be converted to Arrow are returned as JSON.
+    """
+    engine = Engine(name="test_engine", version="1.0", uri="sqlite://")
+    catalog = Catalog(name="test_catalog", engines=[engine])
+    session.add(catalog)
+    session.commit()
+    session.refresh(catalog)
+
+    query_create = QueryCreate(
+        catalog_name=catalog.name,
+        engine_name=engine.name,
+        engine_version=engine.version,
+        submitted_query="SELECT 1 AS col UNION ALL SELECT 'a' AS col",
+    )
+    response = client.post(
+        "/queries/",
+        data=query_create.json(),
+        headers={"Content-Type": "application/json", "Accept": ARROW_STREAM},
+    )
+    assert response.headers.get("content-type") == "application/json"
+    data = response.json()
+    assert data["results"][0]["rows"] == [[1], ["a"]]
+
+    response = client.get(
+        f"/queries/{data['id']}/",
+        headers={"Accept": ARROW_STREAM},
+    )
+    assert response.headers.get("content-type") == "application/json"
+    assert response.json()["results"][0]["rows"] == [[1], ["a"]]
+
+
+def test_submit_query_result_cache(
+    session: Session,
+    settings: Settings,
+    client: TestClient,
+    mocker: MockerFixture,
+) -> None:
+    """
+    Test that identical queries reuse cached results until they're invalidated.
+    """
+    settings.result_cache_ttl = datetime.timedelta(minutes=5)
+    engine = Engine(name="test_engine", version="1.0", uri="sqlite://")
+    catalog = Catalog(name="test_catalog", engines=[engine])
+    session.add(catalog)
+    session.commit()
+
+    run_query = mocker.spy(djqs.engine, "run_query")
+
+    def submit(sql: str) -> dict:
+        query_create = QueryCreate(
+            catalog_name=catalog.name,
+            engine_name=engine.name,
+            engine_version=engine.version,
+            submitted_query=sql,
+        )
+        response = client.post(
+            "/queries/",
+            data=query_create.json(by_alias=True),
+            headers={"Content-Type": "application/json", "Accept": "application/json"},
+        )
+        assert response.status_code == 200
+        return response.json()
+
+    first = submit("SELECT 1 AS col FROM (SELECT 1) AS orders")
+    second = submit("select 1 as col\n  from (select 1) as orders;")
+    assert run_query.call_count == 1
+    assert second["id"] != first["id"]
+    assert second["state"] == "FINISHED"
+    assert second["results"] == first["results"]
+    response = client.get(f"/queries/{second['id']}/")
+    assert response.json()["results"] == first["results"]
+
+    # Queries on other tables are unaffected
+    response = client.delete("/queries/cache/", params={"table": "customers"})
+    assert response.json() == {"invalidated": 0}
+    submit("SELECT 1 AS col FROM (SELECT 1) AS orders")
+    assert run_query.call_count == 1
+
+    response = client.delete(
+        "/queries/cache/",
+        params={"catalog": "test_catalog", "table": "orders"},
+    )
+    assert response.json() == {"invalidated": 1}
+    submit("SELECT 1 AS col FROM (SELECT 1) AS orders")
+    assert run_query.call_count == 2
+
+
+def test_cancel_query(
+    mocker: MockerFixture,
+    session: Session,
+    settings: Settings,
+    client: TestClient,
+) -> None:
+    """
+    Test ``DELETE /queries/{query_id}/``.
+    """
+    submit = mocker.patch("djqs.scheduler.QueryScheduler.submit")
+    engine = Engine(name="test_engine", version="1.0", uri="sqlite://")
+    catalog = Catalog(name="test_catalog", engines=[engine])
+    session.add(catalog)
+    session.commit()
+
+    query_create = QueryCreate(
+        catalog_name=catalog.name,
+        engine_name=engine.name,
+        engine_version=engine.version,
+        submitted_query="SELECT 1 AS col",
+        async_=True,
+        priority=QueryPriority.BATCH,
+    )
+    response = client.post(
+        "/queries/",
+        data=query_create.json(),
+        headers={"Content-Type": "application/json", "Accept": "application/json"},
+    )
+    query_id = response.json()["id"]
+    assert submit.call_args.args[2] == QueryPriority.BATCH
+
+    cancel = mocker.patch("djqs.scheduler.QueryScheduler.cancel", return_value=True)
+    response = client.delete(f"/queries/{query_id}/")
+    assert response.status_code == 200
+    assert response.json()["state"] == "CANCELED"
+    assert response.json()["errors"] == ["Query was canceled"]
+    cancel.assert_called_with(query_id)
+
+    response = client.delete(f"/queries/{query_id}/")
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Query has already completed: CANCELED"
+
+    response = client.delete("/queries/27289db6-a75c-47fc-b451-da59a743a168/")
+    assert response.status_code == 404
+
+    # Running queries are asked to stop, and are marked as canceled when they do
+    query = session.get(Query, uuid.UUID(query_id))
+    query.state = QueryState.RUNNING
+    session.add(query)
+    session.commit()
+    cancel.return_value = False
+    response = client.delete(f"/queries/{query_id}/")
+    assert response.json()["state"] == "RUNNING"
+
+    canceled = threading.Event()
+    canceled.set()
+    results = process_query(session, settings, query, canceled)
+    assert results.state == QueryState.CANCELED
+    assert results.errors == ["Query was canceled"]
+
+
+def test_scheduler_metrics(client: TestClient) -> None:
+    """
+    Test ``GET /scheduler/``.
+    """
+    engine = Engine(name="metrics_engine", version="1.0", uri="sqlite://")
+    with mock.patch(
+        "djqs.scheduler.QueryScheduler.metrics",
+        return_value={"metrics_engine/1.0": {"running": 1}},
+    ):
+        response = client.get("/scheduler/")
+    assert response.json() == {f"{engine.name}/{engine.version}": {"running": 1}}
+
+
+def test_read_query_paginated(
+    session: Session,
+    settings: Settings,
+    client: TestClient,
+) -> None:
+    """
+    Test ``GET /queries/{query_id}`` with ``limit`` and ``offset``.
+    """
+    query = Query(
+        catalog_name="test_catalog",
+        engine_name="test_engine",
+        engine_version="1.0",
+        submitted_query="SELECT col FROM t",
+        state=QueryState.FINISHED,
+        async_=True,
+    )
+    session.add(query)
+    session.commit()
+    session.refresh(query)
+    writer = ResultsWriter(settings.results_backend, str(query.id), page_size=2)
+    writer.add_statement(
+        "SELECT col FROM t",
+        [ColumnMetadata(name="col", type="INT")],
+        iter([(row,) for row in range(5)]),
+    )
+
+    response = client.get(f"/queries/{query.id}/", params={"limit": 2, "offset": 1})
+    data = response.json()
+    assert data["results"][0]["rows"] == [[1], [2]]
+    assert data["results"][0]["row_count"] == 5
+    assert data["next"] == f"http://testserver/queries/{query.id}/?limit=2&offset=3"
+    assert data["previous"] == (
+        f"http://testserver/queries/{query.id}/?limit=2&offset=0"
+    )
+
+    response = client.get(data["next"])
+    data = response.json()
+    assert data["results"][0]["rows"] == [[3], [4]]
+    assert data["next"] is None
+
+    response = client.get(f"/queries/{query.id}/", params={"limit": 0})
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
@@ -0,0 +1,134 @@
+"""
+Tests for ``djqs.arrow``.
+"""
+import datetime
+import decimal
+import uuid
+
+import pyarrow as pa
+
+from djqs.arrow import (
+    deserialize_query_results,
+    rows_to_record_batch,
+    serialize_query_results,
+)
+from djqs.models.query import ColumnMetadata, QueryResults, QueryState
+
+
+def test_serialize_query_results() -> None:
+    """
+    Test that query results round trip through Arrow, including queries with several
+    statements or without results.
+    """
+    query_results = QueryResults(
+        id=uuid.uuid4(),
+        catalog_name="test_catalog",
+        submitted_query="SELECT 1 AS a, 'x' AS b; SELECT 2",
+        state=QueryState.FINISHED,
+        results=[
+            {
+                "sql": "SELECT 1 AS a, 'x' AS b",
+                "columns": [{"name": "a", "type": "INT"}, {"name": "b", "type": "STR"}],
+                "rows": [(1, "x"), (2, None)],
+                "row_count": 2,
+            },
+            {"sql": "SELECT 2", "columns": [], "rows": [(2,)], "row_count": 1},
+        ],
+        errors=[],
+    )
+    payload = serialize_query_results(query_results)
+    assert payload is not None
+    results = deserialize_query_results(payload)
+    assert results.results.__root__[0] == query_results.results.__root__[0]
+    assert results.results.__root__[1].rows == [(2,)]
+    assert results.results.__root__[1].row_count == 1
+
+    query_results = QueryResults(
+        id=uuid.uuid4(),
+        catalog_name="test_catalog",
+        submitted_query="SELECT 1",
+        state=QueryState.ACCEPTED,
+        results=[],
+        errors=[],
+    )
+    payload = serialize_query_results(query_results)
+    assert payload is not None
+    assert deserialize_query_results(payload) == query_results
+
+
+def test_serialize_query_results_arrow_tables() -> None:
+    """
+    Test that results fetched as Arrow are written from their tables, keeping the
+    fetched types, rather than converted from their rows.
+    """
+    query_results = QueryResults(
+        id=uuid.uuid4(),
+        catalog_name="test_catalog",
+        submitted_query="SELECT 1.5 AS a",
+        state=QueryState.FINISHED,
+        results=[
+            {
+                "sql": "SELECT 1.5 AS a",
+                "columns": [{"name": "a", "type": "DECIMAL"}],
+                "rows": [(decimal.Decimal("1.5"),)],
+                "row_count": 1,
+            },
+        ],
+        errors=[],
+    )
+    query_results.set_arrow_tables(
+        [pa.table({"a": pa.array([decimal.Decimal("1.5")], pa.decimal128(2, 1))})],
+    )
+    payload = serialize_query_results(query_results)
+    assert payload is not None
+    reader = pa.ipc.open_stream(payload)
+    assert reader.schema.types == [pa.decimal128(2, 1)]
+    assert deserialize_query_results(payload).results == query_results.results
+
+
+def test_rows_to_record_batch() -> None:
+    """
+    Test that columns get the Arrow types declared by the cursor, and that types are
+    inferred when the values don't fit the declared type.
+    """
+    columns = [
+        ColumnMetadata(name="num", type="FLOAT"),
+        ColumnMetadata(name="name", type="STR"),
+        ColumnMetadata(name="day", type="DATE"),
+        ColumnMetadata(name="count", type="STR"),
+        ColumnMetadata(name="price", type="DECIMAL"),
+    ]
+    batch = rows_to_record_batch(
+        columns,
+        [(1, None, datetime.date(2023, 1, 1), 1, 1.5), (2, None, None, 2, None)],
+    )
+    assert batch.schema.types == [
+        pa.float64(),
+        pa.string(),
+        pa.date32(),
+        pa.int64(),
+        pa.float64(),
+    ]
+    assert batch.column(0).to_pylist() == [1.0, 2.0]
+
+
+def test_serialize_query_results_mixed_types() -> None:
+    """
+    Test that results with values that can't be converted to Arrow aren't serialized.
+    """
+    query_results = QueryResults(
+        id=uuid.uuid4(),
+        catalog_name="test_catalog",
+        submitted_query="SELECT 1 UNION ALL SELECT 'a'",
+        state=QueryState.FINISHED,
+        results=[
+            {
+                "sql": "SELECT 1 UNION ALL SELECT 'a'",
+                "columns": [{"name": "col", "type": "STR"}],
+                "rows": [(1,), ("a",)],
+                "row_count": 2,
+            },
+        ],
+        errors=[],
+    )
+    assert serialize_query_results(query_results) is None
@@ -0,0 +1,168 @@
+"""
+Tests for ``djqs.cache``.
+"""
+import datetime
+import sqlite3
+import time
+from pathlib import Path
+
+from cachelib.simple import SimpleCache
+from fastapi.testclient import TestClient
+from pytest_mock import MockerFixture
+from sqlmodel import Session
+
+import djqs.engine
+from djqs.cache import (
+    ResultCache,
+    cache_key,
+    get_result_cache,
+    is_read_only,
+    normalize_sql,
+)
+from djqs.config import Settings
+from djqs.models.catalog import Catalog
+from djqs.models.engine import Engine
+from djqs.models.query import Query, QueryCreate
+
+
+def make_query(sql: str, catalog_name: str = "warehouse") -> Query:
+    """
+    Build a query on a test engine.
+    """
+    return Query(
+        catalog_name=catalog_name,
+        engine_name="trino",
+        engine_version="1.0",
+        submitted_query=sql,
+        async_=False,
+    )
+
+
+def test_normalize_sql() -> None:
+    """
+    Test that queries only differing in formatting are cached together.
+    """
+    assert normalize_sql("select a -- comment\n  from  t;") == "SELECT a FROM t"
+    assert cache_key(make_query("select a from t")) == cache_key(
+        make_query("SELECT a\nFROM t;"),
+    )
+    assert cache_key(make_query("select a from t")) != cache_key(
+        make_query("select a from t", catalog_name="other"),
+    )
+    assert cache_key(make_query("select 'a' from t")) != cache_key(
+        make_query("select 'A' from t"),
+    )
+    assert normalize_sql("select 'a  b'\n\tfrom t ;") == "SELECT 'a  b' FROM t"
+
+
+def test_is_read_only() -> None:
+    """
+    Test that only queries whose statements all read data are read-only.
+    """
+    assert is_read_only("SELECT 1; WITH a AS (SELECT 1) SELECT * FROM a;")
+    assert not is_read_only("SELECT 1; INSERT INTO t VALUES (1)")
+    assert not is_read_only("WITH a AS (SELECT 1) INSERT INTO t SELECT * FROM a")
+    assert not is_read_only("CREATE TABLE t AS SELECT 1")
+    assert not is_read_only("SHOW TABLES")
+    assert not is_read_only(";")
+
+
+def test_result_cache_ttl() -> None:
+    """
+    Test that entries expire after the TTL.
+    """
+    cache = ResultCache(ttl=0.05, max_rows=100)
+    query = make_query("SELECT a FROM t")
+    cache.add(query, 10)
+    assert cache.get(make_query("select a from t")) == str(query.id)
+    time.sleep(0.1)
+    assert cache.get(query) is None
+
+    disabled = ResultCache(ttl=0, max_rows=100)
+    disabled.add(query, 10)
+    assert disabled.get(query) is None
+
+
+def test_result_cache_eviction() -> None:
+    """
+    Test that the least recently used entries are evicted to stay under the size.
+    """
+    cache = ResultCache(ttl=60, max_rows=100)
+    first, second, third = (make_query(f"SELECT {i} FROM t") for i in range(3))
+    cache.add(first, 40)
+    cache.add(second, 40)
+    assert cache.get(first)
+    cache.add(third, 40)
+    assert cache.get(first) and cache.get(third)
+    assert cache.get(second) is None
+
+    # Results larger than the cache aren't cached
+    cache.add(make_query("SELECT * FROM t"), 101)
+    assert cache.get(make_query("SELECT * FROM t")) is None
+
+
+def test_result_cache_invalidate() -> None:
+    """
+    Test dropping the entries for queries that read from a table.
+    """
+    cache = ResultCache(ttl=60, max_rows=100)
+    orders = make_query('SELECT * FROM "warehouse"."sales"."orders"')
+    customers = make_query("SELECT * FROM sales.customers")
+    cache.add(orders, 1)
+    cache.add(customers, 1)
+
+    assert cache.invalidate("other", "sales", "orders") == 0
+    assert cache.invalidate("warehouse", "sales", "order") == 0
+    assert cache.invalidate("warehouse", "sales", "orders") == 1
+    assert cache.get(orders) is None
+    assert cache.get(customers)
+    assert cache.invalidate() == 1
+    assert cache.get(customers) is None
+
+
+def test_get_result_cache() -> None:
+    """
+    Test that caches are shared by settings with the same results backend.
+    """
+    backend = SimpleCache()
+    cache = get_result_cache(Settings(results_backend=backend))
+    assert get_result_cache(Settings(results_backend=backend)) is cache
+    assert get_result_cache(Settings(results_backend=SimpleCache())) is not cache
+
+
+def test_submit_query_result_cache_writes(
+    session: Session,
+    settings: Settings,
+    client: TestClient,
+    mocker: MockerFixture,
+    tmp_path: Path,
+) -> None:
+    """
+    Test that queries that write are never cached, and run each time.
+    """
+    settings.result_cache_ttl = datetime.timedelta(minutes=5)
+    database = tmp_path / "test.db"
+    with sqlite3.connect(database) as connection:
+        connection.execute("CREATE TABLE t (a INT)")
+    engine = Engine(name="test_engine", version="1.0", uri=f"sqlite:///{database}")
+    catalog = Catalog(name="test_catalog", engines=[engine])
+    session.add(catalog)
+    session.commit()
+
+    run_query = mocker.spy(djqs.engine, "run_query")
+    query_create = QueryCreate(
+        catalog_name=catalog.name,
+        engine_name=engine.name,
+        engine_version=engine.version,
+        submitted_query="INSERT INTO t VALUES (1)",
+    )
+    for _ in range(2):
+        response = client.post(
+            "/queries/",
+            data=query_create.json(by_alias=True),
+            headers={"Content-Type": "application/json", "Accept": "application/json"},
+        )
+        assert response.json()["state"] == "FINISHED"
+    assert run_query.call_count == 2
+    with sqlite3.connect(database) as connection:
+        assert connection.execute("SELECT COUNT(*) FROM t").fetchone() == (2,)
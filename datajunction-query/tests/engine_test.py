@@ -0,0 +1,194 @@
+"""
+Tests for ``djqs.engine``.
+"""
+
+from unittest import mock
+
+import duckdb
+import pytest
+from pyspark.sql.types import (
+    ArrayType,
+    DecimalType,
+    DoubleType,
+    IntegerType,
+    LongType,
+    MapType,
+    Row,
+    StringType,
+    StructField,
+    StructType,
+    TimestampType,
+)
+from pytest_mock import MockerFixture
+
+from djqs import engine
+from djqs.engine import (
+    get_columns_from_duckdb_relation,
+    get_columns_from_spark_schema,
+    get_spark_session,
+    run_duckdb_query,
+    run_spark_query,
+)
+from djqs.exceptions import DJException
+from djqs.models.query import ColumnMetadata, Query
+from djqs.typing import ColumnType
+
+
+def test_get_columns_from_spark_schema() -> None:
+    """
+    Test mapping a Spark schema to column metadata.
+    """
+    schema = StructType(
+        [
+            StructField("id", LongType()),
+            StructField("count", IntegerType()),
+            StructField("ratio", DoubleType()),
+            StructField("price", DecimalType(10, 2)),
+            StructField("name", StringType()),
+            StructField("ts", TimestampType()),
+            StructField("tags", ArrayType(StringType())),
+            StructField("attrs", MapType(StringType(), StringType())),
+        ],
+    )
+    assert get_columns_from_spark_schema(schema) == [
+        ColumnMetadata(name="id", type=ColumnType.INT),
+        ColumnMetadata(name="count", type=ColumnType.INT),
+        ColumnMetadata(name="ratio", type=ColumnType.FLOAT),
+        ColumnMetadata(name="price", type=ColumnType.DECIMAL),
+        ColumnMetadata(name="name", type=ColumnType.STR),
+        ColumnMetadata(name="ts", type=ColumnType.DATETIME),
+        ColumnMetadata(name="tags", type=ColumnType.LIST),
+        ColumnMetadata(name="attrs", type=ColumnType.DICT),
+    ]
+
+
+def test_run_spark_query() -> None:
+    """
+    Test that Spark results are streamed instead of collected, and that queries
+    returning too many rows fail instead of being truncated.
+    """
+    results_df = mock.MagicMock()
+    results_df.limit.return_value = results_df
+    results_df.schema = StructType([StructField("int_col", IntegerType())])
+    results_df.toLocalIterator.return_value = iter([Row(int_col=1), Row(int_col=2)])
+    spark = mock.MagicMock()
+    spark.sql.return_value = results_df
+
+    query = Query(
+        catalog_name="test_catalog",
+        engine_name="test_spark_engine",
+        engine_version="3.3.2",
+        submitted_query="SELECT int_col FROM t",
+    )
+    [(sql, columns, stream)] = run_spark_query(query, spark, max_rows=10)
+
+    assert sql == "SELECT int_col FROM t"
+    assert columns == [ColumnMetadata(name="int_col", type=ColumnType.INT)]
+    results_df.limit.assert_called_with(11)
+    results_df.toLocalIterator.assert_called_with(prefetchPartitions=True)
+    results_df.collect.assert_not_called()
+    assert list(stream) == [(1,), (2,)]
+
+    results_df.toLocalIterator.return_value = iter([Row(int_col=1), Row(int_col=2)])
+    [(_, _, stream)] = run_spark_query(query, spark, max_rows=1)
+    with pytest.raises(DJException) as excinfo:
+        list(stream)
+    assert str(excinfo.value) == "Query returned more than the maximum of 1 rows"
+
+    # Results aren't limited by default
+    results_df.reset_mock()
+    results_df.toLocalIterator.return_value = iter([Row(int_col=1), Row(int_col=2)])
+    [(_, _, stream)] = run_spark_query(query, spark)
+    results_df.limit.assert_not_called()
+    assert list(stream) == [(1,), (2,)]
+
+
+def test_get_spark_session(mocker: MockerFixture) -> None:
+    """
+    Test that the Spark session is reused until its context is stopped.
+    """
+    mocker.patch.object(engine, "_spark_session", None)
+    builder = mocker.patch("djqs.engine.SparkSession").builder
+    builder.master.return_value = builder
+    builder.appName.return_value = builder
+    builder.config.return_value = builder
+    builder.enableHiveSupport.return_value = builder
+
+    spark = get_spark_session("1g")
+    assert get_spark_session("1g") is spark
+    builder.config.assert_called_once_with("spark.driver.maxResultSize", "1g")
+    assert builder.getOrCreate.call_count == 1
+
+    spark.sparkContext._jsc = None  # pylint: disable=protected-access
+    get_spark_session("1g")
+    assert builder.getOrCreate.call_count == 2
+
+
+def test_get_columns_from_duckdb_relation() -> None:
+    """
+    Test mapping the types of a DuckDB relation to column metadata.
+    """
+    relation = duckdb.connect().sql(
+        """
+        SELECT
+            1::BIGINT AS id,
+            1.5::DOUBLE AS ratio,
+            1.5::DECIMAL(4, 2) AS price,
+            'a' AS name,
+            TRUE AS flag,
+            NOW() AS ts,
+            DATE '2021-01-01' AS dt,
+            INTERVAL 1 DAY AS duration,
+            [1, 2] AS tags,
+            {'a': 1} AS attrs
+        """,
+    )
+    assert get_columns_from_duckdb_relation(relation) == [
+        ColumnMetadata(name="id", type=ColumnType.INT),
+        ColumnMetadata(name="ratio", type=ColumnType.FLOAT),
+        ColumnMetadata(name="price", type=ColumnType.DECIMAL),
+        ColumnMetadata(name="name", type=ColumnType.STR),
+        ColumnMetadata(name="flag", type=ColumnType.BOOL),
+        ColumnMetadata(name="ts", type=ColumnType.DATETIME),
+        ColumnMetadata(name="dt", type=ColumnType.DATE),
+        ColumnMetadata(name="duration", type=ColumnType.TIMEDELTA),
+        ColumnMetadata(name="tags", type=ColumnType.LIST),
+        ColumnMetadata(name="attrs", type=ColumnType.DICT),
+    ]
+
+
+@pytest.mark.parametrize("arrow", [True, False])
+def test_run_duckdb_query(mocker: MockerFixture, arrow: bool) -> None:
+    """
+    Test streaming the results of each statement of a DuckDB query in batches.
+    """
+    mocker.patch("djqs.engine.arrow_available", return_value=arrow)
+    query = Query(
+        catalog_name="test_catalog",
+        engine_name="test_duckdb_engine",
+        engine_version="0.7.1",
+        submitted_query=(
+            "CREATE TABLE t AS SELECT range AS id FROM range(5); "
+            "SELECT id, id * 2 AS double_id FROM t ORDER BY id;"
+        ),
+    )
+    results = [
+        (sql, columns, list(stream))
+        for sql, columns, stream in run_duckdb_query(
+            query,
+            duckdb.connect(),
+            batch_size=2,
+        )
+    ]
+
+    assert results == [
+        ("CREATE TABLE t AS SELECT range AS id FROM range(5)", [], []),
+        (
+            "SELECT id, id * 2 AS double_id FROM t ORDER BY id",
+            [
+                ColumnMetadata(name="id", type=ColumnType.INT),
+                ColumnMetadata(name="double_id", type=ColumnType.INT),
+            ],
+            [(0, 0), (1, 2), (2, 4), (3, 6), (4, 8)],
+        ),
+    ]
@@ -0,0 +1,323 @@
+"""
+Tests for ``djqs.inflight``.
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+from cachelib.simple import SimpleCache
+from fastapi.testclient import TestClient
+from pytest_mock import MockerFixture
+from sqlmodel import Session
+
+import djqs.engine
+from djqs.api.queries import NOT_SCHEDULED_MESSAGE
+from djqs.config import Settings
+from djqs.engine import process_query
+from djqs.inflight import InFlightQueries, get_in_flight_queries
+from djqs.models.catalog import Catalog
+from djqs.models.engine import Engine
+from djqs.models.query import Query, QueryCreate, QueryState
+
+
+def make_query(sql: str) -> Query:
+    """
+    Build a query on a test engine.
+    """
+    return Query(
+        catalog_name="warehouse",
+        engine_name="trino",
+        engine_version="1.0",
+        submitted_query=sql,
+        async_=False,
+    )
+
+
+def test_in_flight_queries() -> None:
+    """
+    Test that identical queries are attached to the running query until it finishes.
+    """
+    in_flight_queries = InFlightQueries()
+    leader = make_query("SELECT a FROM t")
+    assert in_flight_queries.get(leader) is None
+
+    in_flight, started = in_flight_queries.get_or_start(leader)
+    assert started
+    assert in_flight_queries.get(make_query("select a\nfrom t;")) is in_flight
+    assert in_flight_queries.get(make_query("SELECT b FROM t")) is None
+
+    # A query that raced the leader is attached to it, and doesn't take over its
+    # submissions
+    other = make_query("SELECT a FROM t")
+    assert in_flight_queries.get_or_start(other) == (in_flight, False)
+    in_flight_queries.finish(other, [])
+    assert in_flight_queries.get(leader) is in_flight
+    assert not in_flight.wait(timeout=0)
+
+    waited = []
+    waiter = threading.Thread(target=lambda: waited.append(in_flight.wait()))
+    waiter.start()
+    leader.state = QueryState.FAILED
+    in_flight_queries.finish(leader, ["Timed out"])
+    waiter.join()
+    assert waited == [True]
+    assert in_flight.query["state"] == QueryState.FAILED
+    assert in_flight.errors == ["Timed out"]
+    assert in_flight_queries.get(leader) is None
+
+
+def test_get_in_flight_queries() -> None:
+    """
+    Test that registries are shared by settings with the same results backend.
+    """
+    backend = SimpleCache()
+    registry = get_in_flight_queries(Settings(results_backend=backend))
+    assert get_in_flight_queries(Settings(results_backend=backend)) is registry
+    assert get_in_flight_queries(Settings(results_backend=SimpleCache())) is not (
+        registry
+    )
+
+
+@pytest.mark.asyncio
+async def test_in_flight_query_wait_async() -> None:
+    """
+    Test waiting for a query to finish from the event loop, while it finishes on
+    another thread.
+    """
+    in_flight_queries = InFlightQueries()
+    leader = make_query("SELECT a FROM t")
+    in_flight, _ = in_flight_queries.get_or_start(leader)
+
+    waiter = asyncio.create_task(in_flight.wait_async())
+    await asyncio.sleep(0)
+    assert not waiter.done()
+
+    # Waiters that give up don't affect the others
+    canceled = asyncio.create_task(in_flight.wait_async())
+    await asyncio.sleep(0)
+    canceled.cancel()
+
+    leader.state = QueryState.FINISHED
+    finisher = threading.Thread(target=in_flight_queries.finish, args=(leader, []))
+    finisher.start()
+    await asyncio.wait_for(waiter, timeout=5)
+    finisher.join()
+    assert in_flight.query["state"] == QueryState.FINISHED
+
+
+def test_submit_query_coalescing(
+    session: Session,
+    settings: Settings,
+    client: TestClient,
+    mocker: MockerFixture,
+) -> None:
+    """
+    Test that identical queries are attached to a running query instead of running.
+    """
+    engine = Engine(name="test_engine", version="1.0", uri="sqlite://")
+    catalog = Catalog(name="test_catalog", engines=[engine])
+    session.add(catalog)
+    leader = Query(
+        catalog_name=catalog.name,
+        engine_name=engine.name,
+        engine_version=engine.version,
+        submitted_query="SELECT 1 AS col",
+        async_=True,
+        state=QueryState.ACCEPTED,
+    )
+    session.add(leader)
+    session.commit()
+    session.refresh(leader)
+    in_flight, _ = get_in_flight_queries(settings).get_or_start(leader)
+
+    run_query = mocker.spy(djqs.engine, "run_query")
+    wait = mocker.spy(in_flight, "wait_async")
+
+    def submit(async_: bool):
+        query_create = QueryCreate(
+            catalog_name=catalog.name,
+            engine_name=engine.name,
+            engine_version=engine.version,
+            submitted_query="select 1 as col",
+            async_=async_,
+        )
+        return client.post(
+            "/queries/",
+            data=query_create.json(by_alias=True),
+            headers={"Content-Type": "application/json", "Accept": "application/json"},
+        )
+
+    response = submit(async_=True)
+    assert response.status_code == 201
+    assert response.json()["id"] == str(leader.id)
+    assert response.json()["state"] == "ACCEPTED"
+
+    # Synchronous queries wait for the running query's results
+    responses = []
+    follower = threading.Thread(target=lambda: responses.append(submit(async_=False)))
+    follower.start()
+    while not wait.called:
+        time.sleep(0.01)
+    process_query(session, settings, leader)
+    follower.join()
+    data = responses[0].json()
+    assert data["id"] == str(leader.id)
+    assert data["state"] == "FINISHED"
+    assert data["results"][0]["rows"] == [[1]]
+    assert run_query.call_count == 1
+
+    # Once it's done, identical queries run again
+    response = submit(async_=False)
+    assert response.json()["id"] != str(leader.id)
+    assert run_query.call_count == 2
+
+
+def test_submit_query_coalescing_writes(
+    session: Session,
+    settings: Settings,
+    client: TestClient,
+) -> None:
+    """
+    Test that queries that write are never attached to a running query.
+    """
+    engine = Engine(name="test_engine", version="1.0", uri="sqlite://")
+    catalog = Catalog(name="test_catalog", engines=[engine])
+    session.add(catalog)
+    session.commit()
+
+    query_create = QueryCreate(
+        catalog_name=catalog.name,
+        engine_name=engine.name,
+        engine_version=engine.version,
+        submitted_query="CREATE TABLE t (a INT)",
+        async_=True,
+    )
+    leader = Query(**query_create.dict(by_alias=True))
+    in_flight, _ = get_in_flight_queries(settings).get_or_start(leader)
+
+    response = client.post(
+        "/queries/",
+        data=query_create.json(by_alias=True),
+        headers={"Content-Type": "application/json", "Accept": "application/json"},
+    )
+    assert response.status_code == 201
+    assert response.json()["id"] != in_flight.query_id
+
+
+def test_submit_query_coalescing_schedule_error(
+    session: Session,
+    settings: Settings,
+    client: TestClient,
+    mocker: MockerFixture,
+) -> None:
+    """
+    Test that queries attached to a query that can't be scheduled are released.
+    """
+    mocker.patch(
+        "djqs.scheduler.QueryScheduler.submit",
+        side_effect=RuntimeError("No workers"),
+    )
+    engine = Engine(name="test_engine", version="1.0", uri="sqlite://")
+    catalog = Catalog(name="test_catalog", engines=[engine])
+    session.add(catalog)
+    session.commit()
+
+    query_create = QueryCreate(
+        catalog_name=catalog.name,
+        engine_name=engine.name,
+        engine_version=engine.version,
+        submitted_query="SELECT 1 AS col",
+    )
+    with pytest.raises(RuntimeError):
+        client.post(
+            "/queries/",
+            data=query_create.json(by_alias=True),
+            headers={"Content-Type": "application/json", "Accept": "application/json"},
+        )
+    query = Query(**query_create.dict(by_alias=True))
+    assert get_in_flight_queries(settings).get(query) is None
+
+
+def test_submit_query_coalescing_worker_error(
+    session: Session,
+    settings: Settings,
+    client: TestClient,
+    mocker: MockerFixture,
+) -> None:
+    """
+    Test that queries attached to a query that fails on its worker before it's
+    processed are released.
+    """
+    release = threading.Event()
+
+    def fail(*args, **kwargs):  # pylint: disable=unused-argument
+        release.wait(timeout=5)
+        raise RuntimeError("Database is down")
+
+    mocker.patch("djqs.api.queries.run_scheduled_query", side_effect=fail)
+    engine = Engine(name="test_engine", version="1.0", uri="sqlite://")
+    catalog = Catalog(name="test_catalog", engines=[engine])
+    session.add(catalog)
+    session.commit()
+
+    query_create = QueryCreate(
+        catalog_name=catalog.name,
+        engine_name=engine.name,
+        engine_version=engine.version,
+        submitted_query="SELECT 1 AS col",
+        async_=True,
+    )
+    response = client.post(
+        "/queries/",
+        data=query_create.json(by_alias=True),
+        headers={"Content-Type": "application/json", "Accept": "application/json"},
+    )
+    assert response.status_code == 201
+    query = Query(**query_create.dict(by_alias=True))
+    in_flight = get_in_flight_queries(settings).get(query)
+    assert in_flight is not None
+    release.set()
+
+    assert in_flight.wait(timeout=5)
+    assert in_flight.query["state"] == QueryState.FAILED
+    assert in_flight.errors == ["Database is down"]
+    assert get_in_flight_queries(settings).get(query) is None
+
+
+def test_cancel_query_not_scheduled(
+    session: Session,
+    settings: Settings,
+    client: TestClient,
+    mocker: MockerFixture,
+) -> None:
+    """
+    Test that canceling a query that isn't scheduled in this process, e.g., because
+    it's running on another worker, leaves it and the queries attached to it alone,
+    unless it completed in the meantime.
+    """
+    query = make_query("SELECT 1 AS col")
+    query.state = QueryState.RUNNING
+    session.add(query)
+    session.commit()
+    session.refresh(query)
+    in_flight, _ = get_in_flight_queries(settings).get_or_start(query)
+
+    cancel = mocker.patch("djqs.scheduler.QueryScheduler.cancel", return_value=None)
+    response = client.delete(f"/queries/{query.id}/")
+    assert response.status_code == 200
+    assert response.json()["state"] == "RUNNING"
+    assert response.json()["errors"] == [NOT_SCHEDULED_MESSAGE]
+    session.refresh(query)
+    assert query.state == QueryState.RUNNING
+    assert not in_flight.wait(timeout=0)
+
+    def finish(query_id: str) -> None:  # pylint: disable=unused-argument
+        query.state = QueryState.FINISHED
+        session.add(query)
+        session.commit()
+
+    cancel.side_effect = finish
+    response = client.delete(f"/queries/{query.id}/")
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Query has already completed: FINISHED"
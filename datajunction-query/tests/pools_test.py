@@ -0,0 +1,144 @@
+"""
+Tests for ``djqs.pools``.
+"""
+import time
+from unittest import mock
+
+import duckdb
+import pytest
+from sqlalchemy import text
+from sqlalchemy.pool import StaticPool
+
+from djqs.config import Settings
+from djqs.pools import EnginePools, get_engine_pools
+
+
+def test_engine_options() -> None:
+    """
+    Test that pool sizes only apply to queue pools, and catalog parameters win.
+    """
+    pools = EnginePools(pool_size=3, max_overflow=1, pool_recycle=60)
+    assert pools.engine_options("postgresql://user@host/db", {}) == {
+        "pool_pre_ping": True,
+        "pool_recycle": 60,
+        "pool_size": 3,
+        "max_overflow": 1,
+    }
+    assert pools.engine_options(
+        "postgresql://user@host/db",
+        {"pool_size": 10, "connect_args": {"sslmode": "require"}},
+    ) == {
+        "pool_pre_ping": True,
+        "pool_recycle": 60,
+        "pool_size": 10,
+        "max_overflow": 1,
+        "connect_args": {"sslmode": "require"},
+    }
+    assert pools.engine_options("sqlite://", {}) == {
+        "pool_pre_ping": True,
+        "pool_recycle": 60,
+    }
+    assert pools.engine_options("sqlite://", {"poolclass": StaticPool}) == {
+        "pool_pre_ping": True,
+        "pool_recycle": 60,
+        "poolclass": StaticPool,
+    }
+
+
+def test_get_engine() -> None:
+    """
+    Test that engines are shared by engine and catalog parameters.
+    """
+    pools = EnginePools()
+    engine = pools.get_engine("sqlite", "1.0", "sqlite://")
+    assert pools.get_engine("sqlite", "1.0", "sqlite://", {}) is engine
+    assert pools.get_engine("sqlite", "2.0", "sqlite://") is not engine
+    assert pools.get_engine("sqlite", "1.0", "sqlite://", {"echo": False}) is not engine
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT 1")).scalar() == 1
+
+    pools.dispose()
+    assert pools.get_engine("sqlite", "1.0", "sqlite://") is not engine
+
+
+def test_idle_eviction() -> None:
+    """
+    Test that engines that haven't been used within the idle timeout are disposed of.
+    """
+    pools = EnginePools(idle_timeout=0.05)
+    idle = pools.get_engine("sqlite", "1.0", "sqlite://")
+    active = pools.get_engine("sqlite", "2.0", "sqlite://")
+    with mock.patch.object(idle, "dispose") as dispose:
+        time.sleep(0.1)
+        assert pools.get_engine("sqlite", "2.0", "sqlite://") is active
+        dispose.assert_called_once()
+    assert pools.get_engine("sqlite", "1.0", "sqlite://") is not idle
+
+
+def test_duckdb_connection() -> None:
+    """
+    Test that DuckDB databases have a single shared connection.
+    """
+    pools = EnginePools()
+    connection = pools.get_duckdb_connection(":memory:")
+    assert pools.get_duckdb_connection(":memory:") is connection
+    assert connection.cursor().execute("SELECT 1").fetchall() == [(1,)]
+    pools.dispose()
+
+
+def test_duckdb_database_file(tmp_path) -> None:
+    """
+    Test that DuckDB database files are writable, unless they're opened read-only.
+    """
+    database = str(tmp_path / "test.duckdb")
+    with duckdb.connect(database) as connection:
+        connection.execute("CREATE TABLE numbers AS SELECT 1 AS number")
+
+    pools = EnginePools()
+    cursor = pools.get_duckdb_connection(database).cursor()
+    cursor.execute("INSERT INTO numbers VALUES (2)")
+    assert cursor.execute("SELECT number FROM numbers").fetchall() == [(1,), (2,)]
+    pools.dispose()
+
+    cursor = pools.get_duckdb_connection(database, read_only=True).cursor()
+    assert cursor.execute("SELECT COUNT(*) FROM numbers").fetchall() == [(2,)]
+    with pytest.raises(duckdb.Error):
+        cursor.execute("INSERT INTO numbers VALUES (3)")
+    pools.dispose()
+
+
+def test_duckdb_file_views(tmp_path) -> None:
+    """
+    Test that local Parquet and CSV files are exposed as views.
+    """
+    (tmp_path / "cities.csv").write_text("id,name\n1,Springfield\n2,Shelbyville\n")
+    files = {
+        "us_states": "tests/resources/us_states.parquet",
+        "cities": str(tmp_path / "cities.csv"),
+    }
+    pools = EnginePools()
+    connection = pools.get_duckdb_connection(":memory:", files)
+    assert pools.get_duckdb_connection(":memory:", files) is connection
+    assert pools.get_duckdb_connection(":memory:") is not connection
+
+    cursor = connection.cursor()
+    assert cursor.execute("SELECT COUNT(*) FROM us_states").fetchall() == [(51,)]
+    assert cursor.execute("SELECT name FROM cities ORDER BY id").fetchall() == [
+        ("Springfield",),
+        ("Shelbyville",),
+    ]
+
+    with pytest.raises(ValueError) as excinfo:
+        pools.get_duckdb_connection(":memory:", {"bad": "data.json"})
+    assert str(excinfo.value) == "Unsupported file format for `bad`: data.json"
+    pools.dispose()
+
+
+def test_get_engine_pools() -> None:
+    """
+    Test that the pools are shared by settings with the same pool configuration.
+    """
+    pools = get_engine_pools(Settings())
+    assert get_engine_pools(Settings()) is pools
+    assert get_engine_pools(Settings(engine_pool_size=1)) is not pools
+    assert get_engine_pools(Settings(engine_pool_size=1)).pool_size == 1
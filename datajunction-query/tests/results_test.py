@@ -0,0 +1,154 @@
+"""
+Tests for ``djqs.results``.
+"""
+from datetime import timedelta
+from pathlib import Path
+from typing import Iterator
+from unittest import mock
+
+import pytest
+from cachelib.file import FileSystemCache
+from cachelib.simple import SimpleCache
+
+from djqs.config import Settings
+from djqs.exceptions import DJException
+from djqs.models.query import ColumnMetadata
+from djqs.results import ResultsWriter, link_results, paginate, read_results
+from djqs.typing import Row
+
+
+def test_paginate() -> None:
+    """
+    Test splitting streams of rows into pages.
+    """
+    assert list(paginate(iter([(1,), (2,), (3,)]), 2)) == [[(1,), (2,)], [(3,)]]
+    assert list(paginate([[1], [2]], 2)) == [[(1,), (2,)]]
+    assert not list(paginate(iter([]), 2))
+
+
+def test_results_writer() -> None:
+    """
+    Test that results are written a page at a time, and can be read while they're
+    being written.
+    """
+    backend = SimpleCache(default_timeout=0)
+    writer = ResultsWriter(backend, "query", page_size=2)
+    columns = [ColumnMetadata(name="col", type="INT")]
+
+    def stream() -> Iterator[Row]:
+        for value in range(3):
+            if value == 0:
+                assert read_results(backend, "query")[0].rows == []
+            if value == 2:
+                # The first page has been written
+                assert read_results(backend, "query")[0].rows == [(0,), (1,)]
+            yield (value,)
+
+    assert writer.add_statement("SELECT col", columns, stream()) is None
+    assert writer.add_statement("SELECT 1", [], iter([(1,)]), keep_rows=True) == [
+        (1,),
+    ]
+    results = read_results(backend, "query")
+    assert [result.rows for result in results] == [[(0,), (1,), (2,)], [(1,)]]
+    assert [result.row_count for result in results] == [3, 1]
+    assert backend.has("query/0/1")
+
+    writer.discard()
+    assert read_results(backend, "query") == []
+    assert not backend.has("query/0/1")
+    assert read_results(backend, "missing") == []
+
+
+def test_read_results_page() -> None:
+    """
+    Test that reading a range of rows only reads the pages that hold them.
+    """
+    backend = SimpleCache(default_timeout=0)
+    writer = ResultsWriter(backend, "query", page_size=2)
+    writer.add_statement("SELECT col", [], iter([(row,) for row in range(5)]))
+
+    get = mock.patch.object(backend, "get", wraps=backend.get)
+    with get as spy:
+        results = read_results(backend, "query", offset=1, limit=2)
+    assert results[0].rows == [(1,), (2,)]
+    assert results[0].row_count == 5
+    assert [call.args[0] for call in spy.call_args_list] == [
+        "query",
+        "query/0/0",
+        "query/0/1",
+    ]
+
+    assert read_results(backend, "query", offset=4)[0].rows == [(4,)]
+    assert read_results(backend, "query", offset=4, limit=10)[0].rows == [(4,)]
+    assert read_results(backend, "query", offset=6, limit=2)[0].rows == []
+
+
+def test_read_results_many_pages(tmp_path: Path) -> None:
+    """
+    Test that results with more pages than the backend's default threshold are kept
+    in full by a backend configured like the default one.
+    """
+    default = Settings().results_backend
+    backend = FileSystemCache(
+        str(tmp_path),
+        default_timeout=0,
+        threshold=default._threshold,  # pylint: disable=protected-access
+    )
+    writer = ResultsWriter(backend, "query", page_size=10)
+    writer.add_statement("SELECT col", [], iter([(row,) for row in range(6000)]))
+
+    [results] = read_results(backend, "query")
+    assert results.row_count == 6000
+    assert results.rows == [(row,) for row in range(6000)]
+
+
+def test_read_results_missing_page() -> None:
+    """
+    Test that a page missing from the backend is an error, rather than fewer rows
+    than the row count.
+    """
+    backend = SimpleCache(default_timeout=0)
+    writer = ResultsWriter(backend, "query", page_size=2)
+    writer.add_statement("SELECT col", [], iter([(row,) for row in range(5)]))
+    backend.delete("query/0/1")
+
+    assert read_results(backend, "query", limit=2)[0].rows == [(0,), (1,)]
+    with pytest.raises(DJException) as excinfo:
+        read_results(backend, "query")
+    assert "Page 1 of the results of statement 0 for query is missing" in str(
+        excinfo.value,
+    )
+
+
+def test_results_ttl() -> None:
+    """
+    Test that all of the entries of a query, and of queries linked to its results,
+    expire at the same time.
+    """
+    backend = SimpleCache(default_timeout=0)
+    set_ = mock.patch.object(backend, "set", wraps=backend.set)
+    with mock.patch("djqs.results.time.time", return_value=1000.0):
+        writer = ResultsWriter(backend, "query", page_size=2, ttl=timedelta(hours=1))
+    with mock.patch("djqs.results.time.time", return_value=1100.0), set_ as spy:
+        writer.add_statement("SELECT col", [], iter([(row,) for row in range(3)]))
+        assert link_results(backend, "linked", "query")
+    assert [call.args[0] for call in spy.call_args_list] == [
+        "query",
+        "query/0/0",
+        "query",
+        "query/0/1",
+        "query",
+        "linked",
+    ]
+    assert {call.kwargs["timeout"] for call in spy.call_args_list} == {3500}
+    assert read_results(backend, "linked")[0].rows == [(0,), (1,), (2,)]
+
+    # Expired results can't be linked
+    with mock.patch("djqs.results.time.time", return_value=4600.0):
+        assert not link_results(backend, "expired", "query")
+
+    # Results written without a TTL don't expire
+    writer = ResultsWriter(backend, "forever")
+    with set_ as spy:
+        writer.add_statement("SELECT 1", [], iter([(1,)]))
+    assert {call.kwargs["timeout"] for call in spy.call_args_list} == {0}
@@ -0,0 +1,105 @@
+"""
+Tests for ``djqs.scheduler``.
+"""
+import threading
+from concurrent.futures import CancelledError
+from typing import List
+
+import pytest
+
+from djqs.config import Settings
+from djqs.scheduler import QueryCanceled, QueryScheduler, cancellable, get_scheduler
+from djqs.typing import QueryPriority
+
+
+def test_priority_queue() -> None:
+    """
+    Test that interactive queries run before batch queries, in submission order.
+    """
+    scheduler = QueryScheduler(max_workers=1)
+    engine = ("trino", "1.0")
+    blocking, release = threading.Event(), threading.Event()
+    order: List[str] = []
+
+    def run(name: str):
+        def _run(canceled: threading.Event):  # pylint: disable=unused-argument
+            if name == "blocker":
+                blocking.set()
+                release.wait()
+            order.append(name)
+            return name
+
+        return _run
+
+    blocker = scheduler.submit(engine, "blocker", QueryPriority.BATCH, run("blocker"))
+    blocking.wait()
+    futures = [
+        scheduler.submit(engine, name, priority, run(name))
+        for name, priority in [
+            ("batch-1", QueryPriority.BATCH),
+            ("interactive-1", QueryPriority.INTERACTIVE),
+            ("batch-2", QueryPriority.BATCH),
+            ("interactive-2", QueryPriority.INTERACTIVE),
+        ]
+    ]
+    assert scheduler.metrics()["trino/1.0"]["queued"] == {
+        "interactive": 2,
+        "batch": 2,
+    }
+
+    release.set()
+    assert blocker.result() == "blocker"
+    assert [future.result() for future in futures]
+    assert order == ["blocker", "interactive-1", "interactive-2", "batch-1", "batch-2"]
+
+    metrics = scheduler.metrics()["trino/1.0"]
+    assert metrics["workers"] == 1
+    assert metrics["queued"] == {"interactive": 0, "batch": 0}
+    assert metrics["running"] == 0
+    assert metrics["completed"] == 5
+    assert 0 < metrics["wait_time"]["mean"] <= metrics["wait_time"]["max"]
+
+
+def test_cancel() -> None:
+    """
+    Test canceling queued and running queries.
+    """
+    scheduler = QueryScheduler(max_workers=1)
+    engine = ("trino", "1.0")
+    started = threading.Event()
+
+    def run_until_canceled(canceled: threading.Event):
+        started.set()
+        rows = cancellable(iter(range(10**9)), canceled)
+        for row in rows:
+            if row == 0:
+                canceled.wait()
+        return "done"  # pragma: no cover
+
+    running = scheduler.submit(
+        engine,
+        "running",
+        QueryPriority.INTERACTIVE,
+        run_until_canceled,
+    )
+    queued = scheduler.submit(engine, "queued", QueryPriority.INTERACTIVE, str)
+    started.wait()
+
+    assert scheduler.cancel("queued") is True
+    with pytest.raises(CancelledError):
+        queued.result()
+
+    assert scheduler.cancel("running") is False
+    with pytest.raises(QueryCanceled):
+        running.result()
+    assert scheduler.cancel("running") is None
+    assert scheduler.cancel("unknown") is None
+
+
+def test_get_scheduler() -> None:
+    """
+    Test that the scheduler is shared by settings with the same concurrency.
+    """
+    scheduler = get_scheduler(Settings())
+    assert get_scheduler(Settings()) is scheduler
+    assert get_scheduler(Settings(engine_max_concurrency=1)).max_workers == 1
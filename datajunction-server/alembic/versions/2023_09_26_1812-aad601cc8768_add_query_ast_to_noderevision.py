@@ -0,0 +1,29 @@
+"""Add query_ast to noderevision
+
+Revision ID: aad601cc8768
+Revises: b75e5163b09d
+Create Date: 2023-09-26 18:12:04.118201+00:00
+
+"""
+# pylint: disable=no-member, invalid-name, missing-function-docstring, unused-import, no-name-in-module
+
+import sqlalchemy as sa
+import sqlmodel
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "aad601cc8768"
+down_revision = "b75e5163b09d"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("noderevision", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("query_ast", sa.LargeBinary(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table("noderevision", schema=None) as batch_op:
+        batch_op.drop_column("query_ast")
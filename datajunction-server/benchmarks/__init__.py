@@ -0,0 +1,13 @@
+"""
+Benchmarks for the hot paths of SQL generation.
+
+The benchmarks build a synthetic DAG of a configurable size (see ``DAGShape``) in an
+in-memory SQLite database, and measure the latency and memory use of parsing,
+compiling, building and rendering queries on it. Results can be stored and compared
+against a baseline to catch regressions, e.g., before upgrading DJ:
+
+    python -m benchmarks --output baseline.json
+    python -m benchmarks --compare baseline.json --threshold 0.1
+
+Run ``python -m benchmarks --help`` for the options.
+"""
@@ -0,0 +1,110 @@
+"""
+Run the benchmarks from the command line.
+"""
+import argparse
+import logging
+import sys
+from typing import List, Optional
+
+from .dag import DAGShape, synthetic_dag
+from .runner import compare, load, run_benchmarks, save
+from .stages import get_stages
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """
+    Parse the command line arguments.
+    """
+    defaults = DAGShape()
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Benchmark SQL generation on a synthetic DAG.",
+    )
+    for field, help_ in (
+        ("sources", "number of fact sources"),
+        ("transforms", "number of transforms stacked on each fact source"),
+        ("dimension_chains", "number of dimension chains linked to each fact"),
+        ("dimension_depth", "number of dimensions in each chain"),
+        ("metrics", "number of metrics on each fact"),
+    ):
+        parser.add_argument(
+            f"--{field.replace('_', '-')}",
+            type=int,
+            default=getattr(defaults, field),
+            help=f"{help_} (default: %(default)s)",
+        )
+    parser.add_argument(
+        "--rounds",
+        type=int,
+        default=20,
+        help="timed rounds per stage (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--stage",
+        action="append",
+        dest="stages",
+        help="only run this stage; can be repeated",
+    )
+    parser.add_argument("--output", help="store the results as JSON in this file")
+    parser.add_argument(
+        "--compare",
+        help="compare against the results stored in this file, and exit with an "
+        "error if any stage regressed",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="fraction of the baseline by which a stage can regress "
+        "(default: %(default)s)",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Run the benchmarks, print a summary and compare against a baseline.
+    """
+    args = parse_args(argv)
+    logging.getLogger("datajunction_server").setLevel(logging.WARNING)
+    shape = DAGShape(
+        sources=args.sources,
+        transforms=args.transforms,
+        dimension_chains=args.dimension_chains,
+        dimension_depth=args.dimension_depth,
+        metrics=args.metrics,
+    )
+    with synthetic_dag(shape) as (_, session):
+        stages = [
+            stage
+            for stage in get_stages(session, shape)
+            if not args.stages or stage.name in args.stages
+        ]
+        results = run_benchmarks(stages, shape, args.rounds)
+
+    print(f"{'stage':<20}{'median (ms)':>14}{'min (ms)':>12}{'peak (KiB)':>14}")
+    for name, stage_results in results["stages"].items():
+        print(
+            f"{name:<20}"
+            f"{stage_results['median'] * 1000:>14.2f}"
+            f"{stage_results['min'] * 1000:>12.2f}"
+            f"{stage_results['peak_memory'] / 1024:>14.1f}",
+        )
+
+    if args.output:
+        save(results, args.output)
+    if args.compare:
+        regressions = compare(load(args.compare), results, args.threshold)
+        for regression in regressions:
+            print(
+                f"{regression.stage}: {regression.metric} regressed "
+                f"{regression.ratio:.2f}x ({regression.baseline:.6g} -> "
+                f"{regression.current:.6g})",
+            )
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
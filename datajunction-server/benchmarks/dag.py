@@ -0,0 +1,235 @@
+"""
+Synthetic DAGs for benchmarking.
+
+A DAG is built through the API, so that nodes go through the same validation and
+column inference as in production, on an in-memory SQLite database:
+
+* ``sources`` fact source nodes, each with an ``id``, a ``value``, a ``ts`` and a
+  foreign key to the first dimension of every dimension chain;
+* ``transforms`` transforms stacked on top of each source, each selecting from the
+  previous one;
+* ``dimension_chains`` chains of ``dimension_depth`` dimensions, where each dimension
+  links to the next one in its chain, and the top transform of every source links to
+  the first dimension of every chain;
+* ``metrics`` metrics on the top transform of each source.
+"""
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Tuple, Union
+
+from cachelib.simple import SimpleCache
+from fastapi.testclient import TestClient
+from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.pool import StaticPool
+
+from datajunction_server.api.main import app
+from datajunction_server.config import Settings
+from datajunction_server.internal.authentication.tokens import create_token
+from datajunction_server.models.user import OAuthProvider, User
+from datajunction_server.utils import get_session, get_settings
+
+NAMESPACE = "bench"
+CATALOG = "warehouse"
+USERNAME = "bench"
+
+# The JSON body of a request, which is a list for endpoints that create several
+# objects at once
+Payload = Union[Dict[str, Any], List[Dict[str, Any]]]
+
+
+@dataclass
+class DAGShape:
+    """
+    Size of a synthetic DAG.
+    """
+
+    sources: int = 5
+    transforms: int = 2
+    dimension_chains: int = 3
+    dimension_depth: int = 3
+    metrics: int = 4
+
+    def source(self, source: int) -> str:
+        """
+        Name of a fact source node.
+        """
+        return f"{NAMESPACE}.source_{source}"
+
+    def transform(self, source: int, level: int) -> str:
+        """
+        Name of a transform on a fact source, ``level`` transforms up.
+        """
+        return f"{NAMESPACE}.transform_{source}_{level}"
+
+    def fact(self, source: int) -> str:
+        """
+        Name of the node that the metrics on a source select from.
+        """
+        if self.transforms:
+            return self.transform(source, self.transforms - 1)
+        return self.source(source)
+
+    def dimension(self, chain: int, depth: int) -> str:
+        """
+        Name of a dimension node.
+        """
+        return f"{NAMESPACE}.dim_{chain}_{depth}"
+
+    def metric(self, source: int, metric: int) -> str:
+        """
+        Name of a metric node.
+        """
+        return f"{NAMESPACE}.metric_{source}_{metric}"
+
+    @property
+    def metric_names(self) -> List[str]:
+        """
+        Names of all metric nodes.
+        """
+        return [
+            self.metric(source, metric)
+            for source in range(self.sources)
+            for metric in range(self.metrics)
+        ]
+
+    @property
+    def dimension_attributes(self) -> List[str]:
+        """
+        The deepest dimension attribute of each chain, which is the most expensive to
+        join in.
+        """
+        return [
+            f"{self.dimension(chain, self.dimension_depth - 1)}.name"
+            for chain in range(self.dimension_chains)
+        ]
+
+    def requests(self) -> Iterator[Tuple[str, Payload]]:
+        """
+        The API requests that create the DAG, in order.
+        """
+        yield "/catalogs/", {"name": CATALOG}
+        yield "/engines/", {"name": "spark", "version": "3.1.1", "dialect": "spark"}
+        yield f"/catalogs/{CATALOG}/engines/", [
+            {"name": "spark", "version": "3.1.1", "dialect": "spark"},
+        ]
+        yield f"/namespaces/{NAMESPACE}/", {}
+
+        for chain in range(self.dimension_chains):
+            for depth in range(self.dimension_depth):
+                yield from self._dimension_requests(chain, depth)
+
+        for source in range(self.sources):
+            yield "/nodes/source/", {
+                "name": self.source(source),
+                "description": f"Fact source {source}",
+                "catalog": CATALOG,
+                "schema_": "facts",
+                "table": f"source_{source}",
+                "columns": [
+                    {"name": "id", "type": "int"},
+                    {"name": "value", "type": "double"},
+                    {"name": "ts", "type": "timestamp"},
+                ]
+                + [
+                    {"name": f"dim_{chain}_id", "type": "int"}
+                    for chain in range(self.dimension_chains)
+                ],
+                "mode": "published",
+            }
+            columns = ", ".join(
+                ["id", "value", "ts"]
+                + [f"dim_{chain}_id" for chain in range(self.dimension_chains)],
+            )
+            parent = self.source(source)
+            for level in range(self.transforms):
+                yield "/nodes/transform/", {
+                    "name": self.transform(source, level),
+                    "description": f"Transform {level} on fact source {source}",
+                    "query": (f"SELECT {columns} FROM {parent} WHERE value > {level}"),
+                    "mode": "published",
+                }
+                parent = self.transform(source, level)
+            for chain in range(self.dimension_chains):
+                yield (
+                    f"/nodes/{self.fact(source)}/columns/dim_{chain}_id/"
+                    f"?dimension={self.dimension(chain, 0)}&dimension_column=id"
+                ), {}
+            for metric in range(self.metrics):
+                yield "/nodes/metric/", {
+                    "name": self.metric(source, metric),
+                    "description": f"Metric {metric} on fact source {source}",
+                    "query": (
+                        f"SELECT SUM(value * {metric + 1}) FROM {self.fact(source)}"
+                    ),
+                    "mode": "published",
+                }
+
+    def _dimension_requests(
+        self,
+        chain: int,
+        depth: int,
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        source = f"{NAMESPACE}.dim_source_{chain}_{depth}"
+        yield "/nodes/source/", {
+            "name": source,
+            "description": f"Source of dimension {chain}.{depth}",
+            "catalog": CATALOG,
+            "schema_": "dimensions",
+            "table": f"dim_{chain}_{depth}",
+            "columns": [
+                {"name": "id", "type": "int"},
+                {"name": "name", "type": "string"},
+                {"name": "parent_id", "type": "int"},
+            ],
+            "mode": "published",
+        }
+        yield "/nodes/dimension/", {
+            "name": self.dimension(chain, depth),
+            "description": f"Dimension {chain}.{depth}",
+            "query": f"SELECT id, name, parent_id FROM {source}",
+            "primary_key": ["id"],
+            "mode": "published",
+        }
+        if depth:
+            yield (
+                f"/nodes/{self.dimension(chain, depth - 1)}/columns/parent_id/"
+                f"?dimension={self.dimension(chain, depth)}&dimension_column=id"
+            ), {}
+
+
+@contextmanager
+def synthetic_dag(shape: DAGShape) -> Iterator[Tuple[TestClient, Session]]:
+    """
+    Create a DAG of the given shape in an in-memory SQLite database, and yield a
+    client for the API and a session on the database.
+    """
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    SQLModel.metadata.create_all(engine)
+    settings = Settings(
+        index="sqlite://",
+        results_backend=SimpleCache(default_timeout=0),
+        celery_broker=None,
+        redis_cache=None,
+        query_service=None,
+    )
+    with Session(engine, autoflush=False) as session:
+        session.add(User(username=USERNAME, oauth_provider=OAuthProvider.BASIC))
+        session.commit()
+        app.dependency_overrides[get_session] = lambda: session
+        app.dependency_overrides[get_settings] = lambda: settings
+        try:
+            with TestClient(app) as client:
+                client.headers.update(
+                    {"Authorization": f"Bearer {create_token({'username': USERNAME})}"},
+                )
+                for endpoint, payload in shape.requests():
+                    response = client.post(endpoint, json=payload)
+                    if not response.ok:
+                        raise RuntimeError(f"{endpoint} failed: {response.text}")
+                yield client, session
+        finally:
+            app.dependency_overrides.clear()
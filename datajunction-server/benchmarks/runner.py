@@ -0,0 +1,146 @@
+"""
+Timing, memory measurement and comparison of benchmark results.
+"""
+import json
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from dataclasses import asdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from .dag import DAGShape
+from .stages import Stage
+
+
+def measure(stage: Stage, rounds: int, warmup: int = 1) -> Dict[str, Any]:
+    """
+    Time a stage over a number of rounds, after warming up, and measure the memory
+    it allocates in one more round.
+    """
+    timings: List[float] = []
+    for index in range(warmup + rounds):
+        args = stage.setup() if stage.setup else ()
+        start = time.perf_counter()
+        stage.run(*args)
+        elapsed = time.perf_counter() - start
+        if index >= warmup:
+            timings.append(elapsed)
+
+    args = stage.setup() if stage.setup else ()
+    tracemalloc.start()
+    try:
+        stage.run(*args)
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "rounds": rounds,
+        "min": min(timings),
+        "max": max(timings),
+        "mean": statistics.mean(timings),
+        "median": statistics.median(timings),
+        "stddev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        "retained_memory": retained,
+        "peak_memory": peak,
+    }
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(
+    stages: List[Stage],
+    shape: DAGShape,
+    rounds: int,
+    warmup: int = 1,
+) -> Dict[str, Any]:
+    """
+    Run the stages and collect their results, together with what's needed to tell
+    whether two runs are comparable.
+    """
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "shape": asdict(shape),
+        "stages": {stage.name: measure(stage, rounds, warmup) for stage in stages},
+    }
+
+
+class Regression(NamedTuple):
+    """
+    A stage that got slower, or allocates more memory, than in the baseline.
+    """
+
+    stage: str
+    metric: str
+    baseline: float
+    current: float
+
+    @property
+    def ratio(self) -> float:
+        """
+        How many times the baseline the current value is.
+        """
+        return self.current / self.baseline if self.baseline else float("inf")
+
+
+def compare(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    threshold: float = 0.1,
+) -> List[Regression]:
+    """
+    Compare results against a baseline, returning the stages whose median time or
+    peak memory grew by more than ``threshold`` (a fraction of the baseline). Stages
+    that are missing from either run are skipped.
+    """
+    if baseline["shape"] != current["shape"]:
+        raise ValueError(
+            "Cannot compare benchmarks of different DAG shapes: "
+            f"{baseline['shape']} != {current['shape']}",
+        )
+    regressions = []
+    for name, results in current["stages"].items():
+        if name not in baseline["stages"]:
+            continue
+        for metric in ("median", "peak_memory"):
+            regression = Regression(
+                name,
+                metric,
+                baseline["stages"][name][metric],
+                results[metric],
+            )
+            if regression.ratio > 1 + threshold:
+                regressions.append(regression)
+    return regressions
+
+
+def save(results: Dict[str, Any], path: str):
+    """
+    Store results, e.g., as a baseline for later runs.
+    """
+    with open(path, "w", encoding="utf-8") as output:
+        json.dump(results, output, indent=2, sort_keys=True)
+
+
+def load(path: str) -> Dict[str, Any]:
+    """
+    Load results stored with ``save``.
+    """
+    with open(path, encoding="utf-8") as input_:
+        return json.load(input_)
@@ -0,0 +1,106 @@
+"""
+The stages of SQL generation that are benchmarked.
+"""
+from typing import Any, Callable, List, NamedTuple, Optional, Tuple
+
+from sqlmodel import Session
+
+from datajunction_server.api.helpers import get_node_by_name
+from datajunction_server.construction.build import build_metric_nodes, build_node
+from datajunction_server.construction.dj_query import build_dj_query
+from datajunction_server.errors import DJException
+from datajunction_server.models import Column
+from datajunction_server.sql.dag import get_dimensions
+from datajunction_server.sql.parsing import ast
+from datajunction_server.sql.parsing.backends.antlr4 import _parse_rule, parse
+from datajunction_server.sql.parsing.cache import parse_cache
+from datajunction_server.sql.parsing.type_parser import (
+    TypeStringParser,
+    parse_column_type,
+)
+
+from .dag import DAGShape
+
+
+class Stage(NamedTuple):
+    """
+    A benchmarked stage. ``setup`` runs before every round, outside of the timings,
+    and returns the arguments to ``run``.
+    """
+
+    name: str
+    run: Callable[..., Any]
+    setup: Optional[Callable[[], Tuple[Any, ...]]] = None
+
+
+def get_stages(  # pylint: disable=too-many-locals
+    session: Session,
+    shape: DAGShape,
+) -> List[Stage]:
+    """
+    The stages to benchmark on a synthetic DAG.
+    """
+    dimensions = shape.dimension_attributes
+    metric = get_node_by_name(session, shape.metric(0, 0))
+    # metrics on two facts, so that the metrics query joins them together
+    metric_names = (
+        shape.metric_names[: shape.metrics]
+        + shape.metric_names[shape.metrics : shape.metrics + 1]
+    )
+    metric_nodes = [get_node_by_name(session, name) for name in metric_names]
+    fact_query = get_node_by_name(session, shape.fact(0)).current.query
+
+    metrics_query = build_metric_nodes(session, metric_nodes, [], dimensions, [])
+    metrics_sql = str(metrics_query)
+
+    dj_query = (
+        f"SELECT {', '.join(metric_names + dimensions)} FROM metrics "
+        f"GROUP BY {', '.join(dimensions)}"
+    )
+
+    # a node's worth of column types, as they're read from the database
+    type_strings = [str(column.type) for column in session.query(Column)]
+    type_strings += [
+        "decimal(38,18)",
+        "array<struct<id:bigint,name:string,tags:map<string,string>>>",
+        "map<string,array<decimal(10,2)>>",
+    ]
+
+    def parse_uncached() -> Tuple[Any, ...]:
+        parse_cache.clear()
+        return (metrics_sql,)
+
+    def parse_fact_query() -> Tuple[Any, ...]:
+        return (
+            parse(fact_query),
+            ast.CompileContext(session=session, exception=DJException()),
+        )
+
+    return [
+        Stage("parse", parse, parse_uncached),
+        Stage("parse_cached", parse, lambda: (metrics_sql,)),
+        Stage(
+            "parse_types_antlr",
+            lambda: [_parse_rule(type_, "dataType") for type_ in type_strings],
+        ),
+        Stage(
+            "parse_types",
+            lambda: [TypeStringParser(type_).parse() for type_ in type_strings],
+        ),
+        Stage(
+            "parse_types_cached",
+            lambda: [parse_column_type(type_) for type_ in type_strings],
+        ),
+        Stage("compile", lambda query, ctx: query.compile(ctx), parse_fact_query),
+        Stage(
+            "build_node",
+            lambda: build_node(session, metric.current, dimensions=dimensions),
+        ),
+        Stage(
+            "build_metric_nodes",
+            lambda: build_metric_nodes(session, metric_nodes, [], dimensions, []),
+        ),
+        Stage("build_dj_query", lambda: build_dj_query(session, dj_query)),
+        Stage("get_dimensions", lambda: get_dimensions(metric)),
+        Stage("render", lambda: str(metrics_query)),
+    ]
@@ -1,11 +1,13 @@
 """
 Data related APIs.
 """
+import logging
 from http import HTTPStatus
 from typing import List, Optional
 
-from fastapi import Depends, Query, Request
-from fastapi.responses import JSONResponse
+from fastapi import Depends, Header, Query, Request
+from fastapi.responses import JSONResponse, Response
+from requests.exceptions import RequestException
 from sqlmodel import Session
 from sse_starlette.sse import EventSourceResponse
 
@@ -36,7 +38,7 @@ from datajunction_server.models.query import (
     QueryCreate,
     QueryWithResults,
 )
-from datajunction_server.service_clients import QueryServiceClient
+from datajunction_server.service_clients import ARROW_STREAM, QueryServiceClient
 from datajunction_server.utils import (
     get_current_user,
     get_query_service_client,
@@ -44,10 +46,48 @@ from datajunction_server.utils import (
     get_settings,
 )
 
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover
+    # without pyarrow, Arrow streams are passed through without DJ column metadata
+    pa = None
+
+_logger = logging.getLogger(__name__)
 settings = get_settings()
 router = SecureAPIRouter(tags=["data"])
 
 
+def with_column_metadata(
+    stream: bytes,
+    columns: Optional[List[ColumnMetadata]],
+) -> bytes:
+    """
+    Name the fields of an Arrow stream from the query service after the DJ columns,
+    and add their DJ types to the field metadata, as in JSON results. The stream is
+    returned as is if pyarrow isn't installed, or if its fields don't match the
+    columns.
+    """
+    if pa is None or not columns:
+        return stream  # pragma: no cover
+    reader = pa.ipc.open_stream(stream)
+    if len(reader.schema) != len(columns):
+        return stream
+    schema = pa.schema(
+        [
+            field.with_name(column.name).with_metadata(
+                {**(field.metadata or {}), b"dj.type": column.type.encode()},
+            )
+            for field, column in zip(reader.schema, columns)
+        ],
+        metadata=reader.schema.metadata,
+    )
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for batch in reader:
+            writer.write_batch(pa.RecordBatch.from_arrays(batch.columns, schema=schema))
+    return sink.getvalue().to_pybytes()
+
+
 @router.post("/data/{node_name}/availability/", name="Add Availability State to Node")
 def add_availability_state(
     node_name: str,
@@ -55,9 +95,11 @@ def add_availability_state(
     *,
     session: Session = Depends(get_session),
     current_user: Optional[User] = Depends(get_current_user),
+    query_service_client: QueryServiceClient = Depends(get_query_service_client),
 ) -> JSONResponse:
     """
-    Add an availability state to a node.
+    Add an availability state to a node. Results cached by the query service for
+    queries on the table are dropped, since the table has new data.
     """
     node = get_node_by_name(session, node_name)
 
@@ -112,6 +154,20 @@ def add_availability_state(
         ),
     )
     session.commit()
+
+    if query_service_client:
+        try:
+            query_service_client.invalidate_cached_results(
+                data.catalog,
+                data.schema_,
+                data.table,
+            )
+        except (DJQueryServiceClientException, RequestException) as exc:
+            _logger.warning(
+                "Failed to invalidate cached results for %s: %s",
+                node_name,
+                exc,
+            )
     return JSONResponse(
         status_code=200,
         content={"message": "Availability state successfully posted"},
@@ -209,7 +265,20 @@ def get_data_for_query(
         ) from exc
 
 
-@router.get("/data/", response_model=QueryWithResults, name="Get Data For Metrics")
+@router.get(
+    "/data/",
+    response_model=QueryWithResults,
+    name="Get Data For Metrics",
+    responses={
+        200: {
+            "content": {ARROW_STREAM: {}},
+            "description": (
+                "Return results as JSON, or as an Arrow stream if requested in the "
+                "Accept header and supported by the query service"
+            ),
+        },
+    },
+)
 def get_data_for_metrics(  # pylint: disable=R0914, R0913
     metrics: List[str] = Query([]),
     dimensions: List[str] = Query([]),
@@ -222,9 +291,12 @@ def get_data_for_metrics(  # pylint: disable=R0914, R0913
     query_service_client: QueryServiceClient = Depends(get_query_service_client),
     engine_name: Optional[str] = None,
     engine_version: Optional[str] = None,
+    accept: Optional[str] = Header(None),
 ) -> QueryWithResults:
     """
-    Return data for a set of metrics with dimensions and filters
+    Return data for a set of metrics with dimensions and filters. Arrow streams
+    from the query service are passed through, with the DJ column names and types
+    attached to their schema.
     """
     translated_sql, engine, catalog = build_sql_for_multiple_metrics(
         session,
@@ -244,7 +316,15 @@ def get_data_for_metrics(  # pylint: disable=R0914, R0913
         submitted_query=translated_sql.sql,
         async_=async_,
     )
-    result = query_service_client.submit_query(query_create)
+    if accept and ARROW_STREAM in accept:
+        result = query_service_client.submit_query_as_arrow(query_create)
+        if isinstance(result, bytes):
+            return Response(  # type: ignore
+                with_column_metadata(result, translated_sql.columns),
+                media_type=ARROW_STREAM,
+            )
+    else:
+        result = query_service_client.submit_query(query_create)
 
     # Inject column info if there are results
     if result.results.__root__:  # pragma: no cover
@@ -288,7 +368,7 @@ async def get_data_stream_for_metrics(  # pylint: disable=R0914, R0913
         async_=True,
     )
     # Submits the query, equivalent to calling POST /data/ directly
-    initial_query_info = query_service_client.submit_query(query_create)
+    initial_query_info = await query_service_client.submit_query_async(query_create)
     return EventSourceResponse(
         query_event_stream(
             query=initial_query_info,
@@ -87,7 +87,7 @@ async def get_data_stream_for_djsql(  # pragma: no cover
         async_=True,
     )
     # Submits the query, equivalent to calling POST /data/ directly
-    initial_query_info = query_service_client.submit_query(query_create)
+    initial_query_info = await query_service_client.submit_query_async(query_create)
     return EventSourceResponse(
         query_event_stream(
             query=initial_query_info,
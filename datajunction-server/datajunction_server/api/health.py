@@ -6,9 +6,11 @@ import enum
 from typing import List
 
 from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
 from sqlalchemy import select
 from sqlmodel import Session, SQLModel
 
+from datajunction_server.instrumentation import metrics_registry
 from datajunction_server.utils import get_session, get_settings
 
 settings = get_settings()
@@ -59,3 +61,11 @@ async def health_check(session: Session = Depends(get_session)) -> List[HealthCh
             status=await database_health(session),
         ),
     ]
+
+
+@router.get("/health/metrics/", response_class=PlainTextResponse)
+def prometheus_metrics() -> str:
+    """
+    Request and stage durations, in the Prometheus text format.
+    """
+    return metrics_registry.render()
@@ -25,6 +25,12 @@ from datajunction_server.construction.build import (
     build_metric_nodes,
     build_node,
 )
+from datajunction_server.construction.cache import (
+    BuiltSQL,
+    dag_version_vector,
+    sql_build_cache,
+    sql_build_cache_key,
+)
 from datajunction_server.construction.dj_query import build_dj_query
 from datajunction_server.errors import (
     DJError,
@@ -33,6 +39,8 @@ from datajunction_server.errors import (
     DJNodeNotFound,
     ErrorCode,
 )
+from datajunction_server.instrumentation import timed
+from datajunction_server.internal.query_watcher import get_query_watcher
 from datajunction_server.models import AttributeType, Catalog, Column, Engine, User
 from datajunction_server.models.attribute import RESERVED_ATTRIBUTE_NAMESPACE
 from datajunction_server.models.engine import Dialect
@@ -59,7 +67,7 @@ from datajunction_server.models.query import ColumnMetadata, QueryWithResults
 from datajunction_server.service_clients import QueryServiceClient
 from datajunction_server.sql.dag import get_nodes_with_dimension
 from datajunction_server.sql.parsing import ast
-from datajunction_server.sql.parsing.backends.antlr4 import SqlSyntaxError, parse
+from datajunction_server.sql.parsing.backends.antlr4 import SqlSyntaxError
 from datajunction_server.sql.parsing.backends.exceptions import DJParseException
 from datajunction_server.typing import END_JOB_STATES, UTCDatetime
 from datajunction_server.utils import LOOKUP_CHARS, SEPARATOR
@@ -415,7 +423,7 @@ def validate_node_data(  # pylint: disable=too-many-locals
     # Try to parse the node's query, extract dependencies and missing parents
     # dependencies_map = missing_parents_map = {}
     try:
-        query_ast = parse(validated_node.query)  # type: ignore
+        query_ast = validated_node.parse_query()
         dependencies_map, missing_parents_map = query_ast.extract_dependencies(ctx)
         node_validator.dependencies_map = dependencies_map
         node_validator.missing_parents_map = missing_parents_map
@@ -784,6 +792,7 @@ def find_existing_cube(
     return None
 
 
+@timed("build_sql")
 def build_sql_for_multiple_metrics(  # pylint: disable=too-many-arguments,too-many-locals
     session: Session,
     metrics: List[str],
@@ -802,11 +811,12 @@ def build_sql_for_multiple_metrics(  # pylint: disable=too-many-arguments,too-ma
     if not orderby:
         orderby = []
 
-    metric_columns, metric_nodes, _, dimension_columns, _ = validate_cube(
-        session,
-        metrics,
-        dimensions,
-    )
+    with timed("validate"):
+        metric_columns, metric_nodes, _, dimension_columns, _ = validate_cube(
+            session,
+            metrics,
+            dimensions,
+        )
     leading_metric_node = get_node_by_name(session, metrics[0])
     available_engines = leading_metric_node.current.catalog.engines
 
@@ -873,22 +883,38 @@ def build_sql_for_multiple_metrics(  # pylint: disable=too-many-arguments,too-ma
             cube.catalog,
         )
 
-    query_ast = build_metric_nodes(
-        session,
-        metric_nodes,
-        filters=filters or [],
-        dimensions=dimensions or [],
-        orderby=orderby or [],
-        limit=limit,
-    )
-    columns = [
-        ColumnMetadata(name=col.alias_or_name.name, type=str(col.type))  # type: ignore
-        for col in query_ast.select.projection
-    ]
+    # Reuse previously built SQL if none of the nodes it was built from changed
+    cache_key = sql_build_cache_key(metrics, dimensions, filters, orderby, limit)
+    dag_nodes, version_vector = dag_version_vector(session, metrics)
+    built = sql_build_cache.get(cache_key, version_vector)
+    if not built:
+        query_ast = build_metric_nodes(
+            session,
+            metric_nodes,
+            filters=filters or [],
+            dimensions=dimensions or [],
+            orderby=orderby or [],
+            limit=limit,
+        )
+        with timed("render"):
+            sql = str(query_ast)
+        built = BuiltSQL(
+            sql=sql,
+            columns=[
+                ColumnMetadata(
+                    name=col.alias_or_name.name,  # type: ignore
+                    type=str(col.type),  # type: ignore
+                )
+                for col in query_ast.select.projection
+            ],
+            nodes=dag_nodes,
+            version_vector=version_vector,
+        )
+        sql_build_cache.set(cache_key, built)
     return (
         TranslatedSQL(
-            sql=str(query_ast),
-            columns=columns,
+            sql=built.sql,
+            columns=built.columns,
             dialect=engine.dialect if engine else None,
         ),
         engine,
@@ -906,7 +932,9 @@ async def query_event_stream(  # pylint: disable=too-many-arguments
     retry_timeout: int = 5000,
 ):
     """
-    A generator of events from a query submitted to the query service
+    A generator of events from a query submitted to the query service. Changes to
+    the query are received from the shared query watcher, and the connection is
+    checked every ``stream_delay`` seconds.
     """
     starting_time = time.time()
     # Start with query and query_next as the initial state of the query
@@ -919,43 +947,54 @@ async def query_event_stream(  # pylint: disable=too-many-arguments
         "retry": retry_timeout,
         "data": json.dumps(query.json()),
     }
-    # Continuously check the query until it's complete
-    while not timeout or (time.time() - starting_time < timeout):
-        # Check if the client closed the connection
-        if await request.is_disconnected():  # pragma: no cover
-            _logger.error("connection closed by the client")
-            break
-
-        # Check the current state of the query
-        query_next = query_service_client.get_query(query_id=query_id)  # type: ignore
-        if query_next.state in END_JOB_STATES:
-            _logger.info(
-                "query end state detected (%s), sending final event to the client",
-                query_next.state,
-            )
-            if query_next.results.__root__:  # pragma: no cover
-                query_next.results.__root__[0].columns = columns or []
-            yield {
-                "event": "message",
-                "id": uuid.uuid4(),
-                "retry": retry_timeout,
-                "data": json.dumps(query_next.json()),
-            }
-            _logger.info("connection closed by the server")
-            break
-        if query_prev != query_next:  # pragma: no cover
-            _logger.info(
-                "query information has changed, sending an event to the client",
-            )
-            yield {
-                "event": "message",
-                "id": uuid.uuid4(),
-                "retry": retry_timeout,
-                "data": json.dumps(query_next.json()),
-            }
-
-            query = query_next
-        await asyncio.sleep(stream_delay)  # pragma: no cover
+    watcher = get_query_watcher(query_service_client)
+    updates = watcher.subscribe(query_id)
+    try:
+        # Wait for changes to the query until it's complete
+        while not timeout or (time.time() - starting_time < timeout):
+            # Check if the client closed the connection
+            if await request.is_disconnected():  # pragma: no cover
+                _logger.error("connection closed by the client")
+                break
+
+            try:
+                update = await asyncio.wait_for(updates.get(), timeout=stream_delay)
+            except asyncio.TimeoutError:  # pragma: no cover
+                continue
+            if isinstance(update, Exception):  # pragma: no cover
+                raise update
+            query_next = update
+            if query_next.state in END_JOB_STATES:
+                _logger.info(
+                    "query end state detected (%s), sending final event to the client",
+                    query_next.state,
+                )
+                if query_next.results.__root__:  # pragma: no cover
+                    # The update is shared with other subscribers to the query
+                    query_next = query_next.copy(deep=True)
+                    query_next.results.__root__[0].columns = columns or []
+                yield {
+                    "event": "message",
+                    "id": uuid.uuid4(),
+                    "retry": retry_timeout,
+                    "data": json.dumps(query_next.json()),
+                }
+                _logger.info("connection closed by the server")
+                break
+            if query_prev != query_next:  # pragma: no cover
+                _logger.info(
+                    "query information has changed, sending an event to the client",
+                )
+                yield {
+                    "event": "message",
+                    "id": uuid.uuid4(),
+                    "retry": retry_timeout,
+                    "data": json.dumps(query_next.json()),
+                }
+
+                query = query_next
+    finally:
+        watcher.unsubscribe(query_id, updates)
 
 
 def build_sql_for_dj_query(  # pylint: disable=too-many-arguments,too-many-locals
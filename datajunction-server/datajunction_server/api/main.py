@@ -44,20 +44,25 @@ from datajunction_server.api.attributes import default_attribute_types
 from datajunction_server.api.authentication import whoami
 from datajunction_server.api.graphql.main import graphql_app
 from datajunction_server.constants import AUTH_COOKIE, LOGGED_IN_FLAG_COOKIE
+from datajunction_server.construction.cache import sql_build_cache
 from datajunction_server.errors import DJException
+from datajunction_server.instrumentation import instrument_request
 from datajunction_server.models.catalog import Catalog
 from datajunction_server.models.column import Column
 from datajunction_server.models.engine import Engine
 from datajunction_server.models.node import NodeRevision
 from datajunction_server.models.table import Table
 from datajunction_server.models.user import User
-from datajunction_server.utils import get_settings
+from datajunction_server.sql.parsing.cache import parse_cache
+from datajunction_server.utils import close_query_service_clients, get_settings
 
 if TYPE_CHECKING:  # pragma: no cover
     from opentelemetry import trace
 
 _logger = logging.getLogger(__name__)
 settings = get_settings()
+parse_cache.resize(settings.parse_cache_max_bytes)
+sql_build_cache.resize(settings.sql_build_cache_size)
 
 config.fileConfig(
     path.join(path.dirname(path.abspath(__file__)), "logging.conf"),
@@ -84,6 +89,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.middleware("http")(instrument_request)
+app.on_event("shutdown")(close_query_service_clients)
+
 app.include_router(catalogs.router)
 app.include_router(engines.router)
 app.include_router(metrics.router)
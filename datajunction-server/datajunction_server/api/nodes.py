@@ -71,7 +71,6 @@ from datajunction_server.models.node import (
 )
 from datajunction_server.service_clients import QueryServiceClient
 from datajunction_server.sql.dag import get_dimensions, get_nodes_with_dimension
-from datajunction_server.sql.parsing.backends.antlr4 import parse
 from datajunction_server.utils import (
     Version,
     get_current_user,
@@ -832,8 +831,8 @@ def calculate_node_similarity(
             message="Cannot determine similarity of source nodes",
             http_status_code=HTTPStatus.CONFLICT,
         )
-    node1_ast = parse(node1.current.query)  # type: ignore
-    node2_ast = parse(node2.current.query)  # type: ignore
+    node1_ast = node1.current.parse_query()
+    node2_ast = node2.current.parse_query()
     similarity = node1_ast.similarity_score(node2_ast)
     return JSONResponse(status_code=200, content={"similarity": similarity})
 
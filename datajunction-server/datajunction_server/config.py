@@ -12,6 +12,14 @@ from cachelib.redis import RedisCache
 from celery import Celery
 from pydantic import BaseSettings
 
+# The default maximum number of concurrent requests to the query service per process
+QUERY_SERVICE_MAX_CONNECTIONS = 20
+
+# The default timeouts, in seconds, for requests to the query service, and for waiting
+# for the results of queries submitted to it
+QUERY_SERVICE_TIMEOUT = 30.0
+QUERY_SERVICE_QUERY_TIMEOUT = 600.0
+
 
 class Settings(
     BaseSettings,
@@ -48,9 +56,24 @@ class Settings(
     # How long to wait when pinging databases to find out the fastest online database.
     do_ping_timeout: timedelta = timedelta(seconds=5)
 
+    # Upper bound, in bytes, on the memory used by the process-wide cache of parsed
+    # SQL ASTs. Set to 0 to disable the cache.
+    parse_cache_max_bytes: int = 64 * 1024 * 1024
+
+    # Maximum number of built metrics SQL queries to keep in the process-wide SQL
+    # build cache. Set to 0 to disable the cache.
+    sql_build_cache_size: int = 1024
+
     # Query service
     query_service: Optional[str] = None
 
+    # Timeout, in seconds, for requests to the query service, and for waiting for the
+    # results of queries submitted to it, which may run for longer, and the maximum
+    # number of concurrent requests (and pooled connections) to it per process
+    query_service_timeout: float = QUERY_SERVICE_TIMEOUT
+    query_service_query_timeout: float = QUERY_SERVICE_QUERY_TIMEOUT
+    query_service_max_connections: int = QUERY_SERVICE_MAX_CONNECTIONS
+
     # The namespace where source nodes for registered tables should exist
     source_node_namespace: Optional[str] = "source"
 
@@ -70,6 +93,9 @@ class Settings(
     # DJ secret, used to encrypt passwords and JSON web tokens
     secret: Optional[str] = None
 
+    # Whether authenticated users can profile GET requests with ``?profile=true``
+    profiling_enabled: bool = False
+
     # GitHub OAuth application client ID
     github_oauth_client_id: Optional[str] = None
 
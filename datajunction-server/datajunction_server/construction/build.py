@@ -4,12 +4,14 @@ import logging
 import time
 
 # pylint: disable=too-many-arguments,too-many-locals,too-many-nested-blocks,too-many-branches,R0401
-from typing import DefaultDict, Deque, Dict, List, Optional, Set, Tuple, Union, cast
+from typing import DefaultDict, Dict, List, Optional, Set, Union, cast
 
 from sqlmodel import Session
 
+from datajunction_server.construction.join_planner import JoinPathPlanner
 from datajunction_server.construction.utils import to_namespaced_name
 from datajunction_server.errors import DJException, DJInvalidInputException
+from datajunction_server.instrumentation import timed
 from datajunction_server.models.column import Column
 from datajunction_server.models.engine import Dialect
 from datajunction_server.models.materialization import GenericCubeConfig
@@ -38,60 +40,6 @@ def _get_tables_from_select(
     return tables
 
 
-def _join_path(
-    dimension_node: NodeRevision,
-    initial_nodes: Set[NodeRevision],
-) -> Tuple[NodeRevision, Dict[Tuple[NodeRevision, NodeRevision], List[Column]]]:
-    """
-    For a dimension node, we want to find a possible join path between it
-    and any of the nodes that are directly referenced in the original query. If
-    no join path exists, returns an empty dict.
-    """
-    processed = set()
-
-    to_process: Deque[
-        Tuple[NodeRevision, Dict[Tuple[NodeRevision], List[Column]]]
-    ] = collections.deque([])
-    join_info: Dict[Tuple[NodeRevision], List[Column]] = {}
-    to_process.extend([(node, join_info.copy()) for node in initial_nodes])
-    possible_join_paths = []
-
-    while to_process:
-        current_node, path = to_process.popleft()
-        processed.add(current_node)
-        dimensions_to_columns = collections.defaultdict(list)
-
-        # From the columns on the current node, find the next layer of
-        # dimension nodes that can be joined in
-        for col in current_node.columns:
-            if col.dimension and col.dimension.type == NodeType.DIMENSION:
-                dimensions_to_columns[col.dimension.current].append(col)
-
-        # Go through all potential dimensions and their join columns
-        for joinable_dim, join_cols in dimensions_to_columns.items():
-            next_join_path = {**path, **{(current_node, joinable_dim): join_cols}}
-            full_join_path = (joinable_dim, next_join_path)
-            if joinable_dim == dimension_node:
-                for col in join_cols:
-                    dim_pk = dimension_node.primary_key()
-                    if not col.dimension_column:
-                        if len(dim_pk) != 1:
-                            raise DJException(  # pragma: no cover
-                                f"Node {current_node.name} specifying dimension "
-                                f"{joinable_dim.name} on column {col.name} does not"
-                                f" specify a dimension column, and {dimension_node.name} "
-                                f"has a compound primary key.",
-                            )
-                        col.dimension_column = dim_pk[0].name
-
-                possible_join_paths.append(full_join_path)  # type: ignore
-            if joinable_dim not in processed:  # pragma: no cover
-                to_process.append(full_join_path)
-                for parent in joinable_dim.parents:
-                    to_process.append((parent.current, next_join_path))
-    return min(possible_join_paths, key=len)  # type: ignore
-
-
 def _get_or_build_join_table(
     session: Session,
     table_node: NodeRevision,
@@ -107,7 +55,7 @@ def _get_or_build_join_table(
         _get_node_table(table_node, build_criteria),
     )
     if not join_table:  # pragma: no cover
-        join_query = parse(cast(str, table_node.query))
+        join_query = table_node.parse_query()
         join_table = build_ast(session, join_query)  # type: ignore
         join_table.parenthesized = True  # type: ignore
 
@@ -127,6 +75,7 @@ def _get_or_build_join_table(
 
 def _build_joins_for_dimension(
     session: Session,
+    planner: JoinPathPlanner,
     dim_node: NodeRevision,
     initial_nodes: Set[NodeRevision],
     tables: DefaultDict[NodeRevision, List[ast.Table]],
@@ -137,7 +86,7 @@ def _build_joins_for_dimension(
     Returns the join ASTs needed to bring in the dimension node from
     the set of initial nodes.
     """
-    _, paths = _join_path(dim_node, initial_nodes)
+    paths = planner.join_path(dim_node, initial_nodes)
     asts = []
     for connecting_nodes, join_columns in paths.items():
         start_node, table_node = connecting_nodes  # type: ignore
@@ -242,6 +191,7 @@ def join_tables_for_dimensions(
     the select, it will traverse through available linked tables (via dimension
     nodes) and join them in.
     """
+    planner = JoinPathPlanner(session)
     for dim_node, required_dimension_columns in sorted(
         dimension_nodes_to_columns.items(),
         key=lambda x: x[0].name,
@@ -259,6 +209,7 @@ def join_tables_for_dimensions(
             if dim_node not in initial_nodes:  # need to join dimension
                 join_asts = _build_joins_for_dimension(
                     session,
+                    planner,
                     dim_node,
                     initial_nodes,
                     tables,
@@ -287,7 +238,7 @@ def _build_tables_on_select(
             _get_node_table(node, build_criteria),
         )  # got a materialization
         if node_table is None:  # no materialization - recurse to node first
-            node_query = parse(cast(str, node.query))
+            node_query = node.parse_query()
             if hash(node_query) in memoized_queries:  # pragma: no cover
                 node_table = memoized_queries[hash(node_query)].select  # type: ignore
             else:
@@ -481,6 +432,7 @@ def _get_node_table(
     return table
 
 
+@timed("build")
 def build_node(  # pylint: disable=too-many-arguments
     session: Session,
     node: NodeRevision,
@@ -525,9 +477,9 @@ def build_node(  # pylint: disable=too-many-arguments
             return ast.Query(select=select)  # pragma: no cover
 
     if node.query and node.type == NodeType.METRIC:
-        query = parse(node.query)
+        query = node.parse_query()
     elif node.query and node.type != NodeType.METRIC:
-        node_query = parse(node.query)
+        node_query = node.parse_query()
         node_query.select.add_aliases_to_unnamed_columns()
         query = parse(f"select * from {node.name}")
         query.select.projection = []
@@ -567,6 +519,7 @@ def group_metrics_by_parent(
     return common_parents
 
 
+@timed("build")
 def build_metric_nodes(
     session: Session,
     metric_nodes: List[Node],
@@ -667,7 +620,7 @@ def build_metric_nodes(
 
         # Add the metric expression into the parent node query
         for metric_node in metrics:
-            metric_query = parse(metric_node.query)
+            metric_query = metric_node.parse_query()
             metric_query.compile(context)
             metric_query.build(session, {})
             parent_ast.select.projection.extend(metric_query.select.projection)
@@ -925,7 +878,8 @@ def build_ast(  # pylint: disable=too-many-arguments
     _logger.info("Finished compiling query %s in %s", str(query)[-100:], end - start)
 
     start = time.time()
-    query.build(session, memoized_queries, build_criteria)
+    with timed("build"):
+        query.build(session, memoized_queries, build_criteria)
     end = time.time()
     _logger.info("Finished building query in %s", end - start)
     return query
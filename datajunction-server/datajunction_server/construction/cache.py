@@ -0,0 +1,366 @@
+"""
+Process-wide cache of built metrics SQL.
+
+Building SQL for a set of metrics and dimensions (compiling node queries, finding
+join paths, assembling CTEs and rendering the final query) is expensive, yet the
+same metric and dimension combinations are requested over and over again, e.g., by
+dashboards. Built SQL is cached per request, together with the DAG version vector
+it was built against: the current version of every node the build could have read,
+along with the dimension links, column attributes and availability states of those
+nodes, which can change without a new node revision. An entry is only served if the
+version vector it was built against still matches the DAG.
+
+Entries are also dropped eagerly whenever one of the nodes they depend on is
+updated, so that stale SQL doesn't hold on to memory until it's evicted.
+"""
+import threading
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import and_
+from sqlmodel import Session, select
+
+from datajunction_server.models.attribute import ColumnAttribute
+from datajunction_server.models.base import NodeColumns
+from datajunction_server.models.column import Column
+from datajunction_server.models.node import (
+    Node,
+    NodeAvailabilityState,
+    NodeRelationship,
+    NodeRevision,
+)
+from datajunction_server.models.query import ColumnMetadata
+
+DEFAULT_SQL_BUILD_CACHE_SIZE = 1024
+
+VersionVector = Tuple[Tuple[Hashable, ...], ...]
+
+
+@dataclass
+class SQLBuildCacheStats:
+    """
+    Counters describing the SQL build cache's effectiveness.
+    """
+
+    hits: int
+    misses: int
+    entries: int
+    max_entries: int
+
+
+@dataclass
+class BuiltSQL:
+    """
+    A cached SQL build result.
+    """
+
+    sql: str
+    columns: List[ColumnMetadata]
+    nodes: Set[str]
+    version_vector: VersionVector
+
+
+def sql_build_cache_key(  # pylint: disable=too-many-arguments
+    metrics: Iterable[str],
+    dimensions: Iterable[str],
+    filters: Iterable[str],
+    orderby: Iterable[str],
+    limit: Optional[int],
+) -> Tuple[Hashable, ...]:
+    """
+    Cache key for the request parameters of a metrics SQL build.
+    """
+    return (
+        tuple(metrics),
+        tuple(dimensions),
+        tuple(filters),
+        tuple(orderby),
+        limit,
+    )
+
+
+def _current_revisions(session: Session, names: Set[str]) -> List[Tuple]:
+    """
+    The name, current version, deactivation time, current revision id and revision
+    update time of each of the named nodes.
+    """
+    return session.exec(
+        select(
+            Node.name,
+            Node.current_version,
+            Node.deactivated_at,
+            NodeRevision.id,
+            NodeRevision.updated_at,
+        )
+        .join(
+            NodeRevision,
+            and_(
+                NodeRevision.node_id == Node.id,
+                NodeRevision.version == Node.current_version,
+            ),
+        )
+        .where(Node.name.in_(names)),  # type: ignore  # pylint: disable=no-member
+    ).all()
+
+
+def _parent_names(session: Session, revision_ids: List[int]) -> List[str]:
+    """
+    The names of the parents of the node revisions.
+    """
+    return session.exec(
+        select(Node.name)
+        .join(NodeRelationship, NodeRelationship.parent_id == Node.id)
+        .where(
+            NodeRelationship.child_id.in_(  # type: ignore  # pylint: disable=no-member
+                revision_ids,
+            ),
+        ),
+    ).all()
+
+
+def _dimension_links(session: Session, revision_ids: List[int]) -> List[Tuple]:
+    """
+    The revision id, column, dimension node and dimension column of every dimension
+    link on the node revisions' columns.
+    """
+    return session.exec(
+        select(
+            NodeColumns.node_id,
+            Column.name,
+            Node.name,
+            Column.dimension_column,
+        )
+        .join(Column, Column.id == NodeColumns.column_id)
+        .join(Node, Node.id == Column.dimension_id)
+        .where(
+            NodeColumns.node_id.in_(  # type: ignore  # pylint: disable=no-member
+                revision_ids,
+            ),
+        ),
+    ).all()
+
+
+def _column_attributes(
+    session: Session,
+    revision_ids: Dict[int, str],
+) -> Dict[str, Set[Tuple[Hashable, ...]]]:
+    """
+    The (column, attribute type) pairs set on each node's columns, by node name.
+    """
+    attributes: Dict[str, Set[Tuple[Hashable, ...]]] = defaultdict(set)
+    for revision_id, column, attribute_type_id in session.exec(
+        select(NodeColumns.node_id, Column.name, ColumnAttribute.attribute_type_id)
+        .join(Column, Column.id == NodeColumns.column_id)
+        .join(ColumnAttribute, ColumnAttribute.column_id == Column.id)
+        .where(
+            NodeColumns.node_id.in_(  # type: ignore  # pylint: disable=no-member
+                list(revision_ids),
+            ),
+        ),
+    ).all():
+        attributes[revision_ids[revision_id]].add((column, attribute_type_id))
+    return attributes
+
+
+def _availability_states(
+    session: Session,
+    revision_ids: Dict[int, str],
+) -> Dict[str, Set[int]]:
+    """
+    The ids of the availability states of each node, by node name.
+    """
+    availability: Dict[str, Set[int]] = defaultdict(set)
+    for revision_id, availability_id in session.exec(
+        select(
+            NodeAvailabilityState.node_id, NodeAvailabilityState.availability_id
+        ).where(
+            NodeAvailabilityState.node_id.in_(  # type: ignore  # pylint: disable=no-member
+                list(revision_ids),
+            ),
+        ),
+    ).all():
+        availability[revision_ids[revision_id]].add(availability_id)
+    return availability
+
+
+def _reachable_nodes(
+    session: Session,
+    node_names: Iterable[str],
+) -> Tuple[
+    Dict[str, Tuple[Hashable, ...]],
+    Dict[int, str],
+    Dict[str, Set[Tuple[Hashable, ...]]],
+]:
+    """
+    Walk from ``node_names`` to their upstreams and to the dimension nodes linked
+    to them, returning the version of each node reached, the node names by current
+    revision id, and the dimension links of each node.
+    """
+    nodes: Dict[str, Tuple[Hashable, ...]] = {}
+    revision_ids: Dict[int, str] = {}
+    links: Dict[str, Set[Tuple[Hashable, ...]]] = defaultdict(set)
+    frontier = set(node_names)
+
+    while frontier:
+        rows = _current_revisions(session, frontier)
+        for name, version, deactivated_at, revision_id, updated_at in rows:
+            # Versions restart when a node is deleted and recreated, so the revision's
+            # timestamp is needed to tell revisions with the same version apart
+            nodes[name] = (name, version, str(updated_at), str(deactivated_at))
+            revision_ids[revision_id] = name
+        frontier_revisions = [row[3] for row in rows]
+
+        dimension_links = _dimension_links(session, frontier_revisions)
+        for link in dimension_links:
+            # (column, dimension node, dimension column)
+            links[revision_ids[link[0]]].add(tuple(link[1:]))
+
+        frontier = (
+            set(_parent_names(session, frontier_revisions))
+            | {link[2] for link in dimension_links}
+        ) - nodes.keys()
+    return nodes, revision_ids, links
+
+
+def dag_version_vector(
+    session: Session,
+    node_names: Iterable[str],
+) -> Tuple[Set[str], VersionVector]:
+    """
+    Find every node that a SQL build starting from ``node_names`` may read, i.e., the
+    nodes themselves, their upstreams and all dimension nodes reachable through
+    dimension links (along with their upstreams), and return them together with
+    the version vector of those nodes.
+    """
+    nodes, revision_ids, links = _reachable_nodes(session, node_names)
+
+    # Column attributes (e.g., primary keys) and availability states can change
+    # without a new node revision being created
+    attributes = _column_attributes(session, revision_ids)
+    availability = _availability_states(session, revision_ids)
+
+    version_vector = tuple(
+        nodes[name]
+        + (
+            tuple(sorted(links[name], key=str)),
+            tuple(sorted(attributes[name], key=str)),
+            tuple(sorted(availability[name])),
+        )
+        for name in sorted(nodes)
+    )
+    return set(nodes), version_vector
+
+
+class SQLBuildCache:
+    """
+    A thread-safe LRU cache of built metrics SQL, bounded by the number of entries.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_SQL_BUILD_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, BuiltSQL]" = OrderedDict()
+        self._keys_by_node: Dict[str, Set[Hashable]] = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, version_vector: VersionVector) -> Optional[BuiltSQL]:
+        """
+        Return the SQL built for ``key``, provided it was built against the DAG
+        described by ``version_vector``.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version_vector != version_vector:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return BuiltSQL(
+                sql=entry.sql,
+                columns=[column.copy() for column in entry.columns],
+                nodes=entry.nodes,
+                version_vector=entry.version_vector,
+            )
+
+    def set(self, key: Hashable, entry: BuiltSQL):
+        """
+        Store the SQL built for ``key``, evicting the least recently used entries to
+        stay under the cap.
+        """
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            for node_name in entry.nodes:
+                self._keys_by_node[node_name].add(key)
+            self._evict()
+
+    def _remove(self, key: Hashable):
+        """
+        Remove an entry. Must be called with the lock held.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for node_name in entry.nodes:
+            keys = self._keys_by_node.get(node_name)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_node[node_name]
+
+    def _evict(self):
+        """
+        Evict least recently used entries until the cache fits within `max_entries`.
+        Must be called with the lock held.
+        """
+        while len(self._entries) > max(self.max_entries, 0):
+            self._remove(next(iter(self._entries)))
+
+    def invalidate(self, node_names: Iterable[str]):
+        """
+        Drop every entry that depends on any of the given nodes.
+        """
+        with self._lock:
+            for node_name in node_names:
+                for key in list(self._keys_by_node.get(node_name, ())):
+                    self._remove(key)
+
+    def resize(self, max_entries: int):
+        """
+        Change the size cap of the cache, evicting entries if needed.
+        """
+        with self._lock:
+            self.max_entries = max_entries
+            self._evict()
+
+    def clear(self):
+        """
+        Drop all entries and reset the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_node.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> SQLBuildCacheStats:
+        """
+        Snapshot of the cache's counters.
+        """
+        with self._lock:
+            return SQLBuildCacheStats(
+                hits=self.hits,
+                misses=self.misses,
+                entries=len(self._entries),
+                max_entries=self.max_entries,
+            )
+
+
+sql_build_cache = SQLBuildCache()
@@ -0,0 +1,207 @@
+"""
+Planning of the join paths between nodes and the dimension nodes they're joined to
+"""
+import collections
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from sqlmodel import Session
+
+from datajunction_server.errors import DJException
+from datajunction_server.instrumentation import timed
+from datajunction_server.models.column import Column
+from datajunction_server.models.node import NodeRevision, NodeType
+from datajunction_server.sql.dag_snapshot import (
+    DAGSnapshot,
+    get_dag_snapshot,
+    has_uncommitted_writes,
+)
+
+# A planned join path, as (start node name, dimension node name, join column names)
+# for each join in the path
+PlannedJoinPath = Tuple[Tuple[str, str, Tuple[str, ...]], ...]
+
+
+class JoinPathPlanner:  # pylint: disable=too-few-public-methods
+    """
+    Plans the join paths between the nodes referenced in a query and the dimension
+    nodes it needs.
+
+    A join path is found with a breadth-first search from the referenced nodes,
+    through dimension links and the parents of linked dimensions, which stops at the
+    first path that reaches the dimension node. Planned paths are kept in the DAG
+    snapshot's reachability index, keyed by the revisions they start from and the
+    dimension node's revision, and are dropped whenever any node that the search
+    visited or pruned a branch on changes, e.g., when a dimension link is added or
+    removed. While the session has writes that aren't committed yet, which the
+    snapshot doesn't include, every branch is searched and paths aren't kept.
+    """
+
+    def __init__(self, session: Session):
+        self.session = session
+        self._snapshot: Optional[DAGSnapshot] = None
+
+    @property
+    def snapshot(self) -> Optional[DAGSnapshot]:
+        """
+        The snapshot to prune branches with and keep planned paths in, if the
+        session has no writes that aren't committed yet.
+        """
+        if has_uncommitted_writes(self.session):
+            return None
+        if self._snapshot is None:
+            self._snapshot = get_dag_snapshot(self.session)
+        return self._snapshot
+
+    def join_path(
+        self,
+        dimension_node: NodeRevision,
+        initial_nodes: Set[NodeRevision],
+    ) -> Dict[Tuple[NodeRevision, NodeRevision], List[Column]]:
+        """
+        Find the shortest join path between the dimension node and any of the
+        initial nodes, as the join columns for each pair of nodes to join.
+        """
+        # Search from the nodes in a fixed order, so that the same set of nodes
+        # always has the same key and the same path
+        initial_nodes_list = sorted(initial_nodes, key=lambda node: node.name)
+        revision_ids = tuple(
+            node.id for node in initial_nodes_list if node.id is not None
+        )
+        with timed("join_paths"):
+            snapshot = self.snapshot
+            if (
+                snapshot is None
+                or dimension_node.id is None
+                or len(revision_ids) < len(initial_nodes_list)
+            ):
+                path, _ = self._search(dimension_node, initial_nodes_list, snapshot)
+            else:
+                path = snapshot.join_path(
+                    (revision_ids, dimension_node.id),
+                    lambda _: self._search(
+                        dimension_node,
+                        initial_nodes_list,
+                        snapshot,
+                    ),
+                )
+            if path is None:
+                raise DJException(
+                    f"No join path found for dimension {dimension_node.name}",
+                )
+            return self._materialize(path, dimension_node, initial_nodes_list)
+
+    @staticmethod
+    def _leads_to_dimension(
+        snapshot: Optional[DAGSnapshot],
+        node: NodeRevision,
+        dimension_name: str,
+        visited: Set[str],
+    ) -> bool:
+        """
+        Whether the dimension node can be joined in starting from the given node,
+        according to the snapshot, if there's one. The names of the nodes that the
+        answer depends on are added to ``visited``, so that a branch that was pruned
+        is searched again once it may lead to the dimension node.
+        """
+        return (
+            snapshot is None
+            or node.name not in snapshot.nodes
+            or dimension_name in snapshot.joinable_nodes(node.name, visited)
+        )
+
+    def _search(  # pylint: disable=too-many-locals
+        self,
+        dimension_node: NodeRevision,
+        initial_nodes: List[NodeRevision],
+        snapshot: Optional[DAGSnapshot],
+    ) -> Tuple[Optional[PlannedJoinPath], Set[str]]:
+        """
+        Breadth-first search for a join path to the dimension node, which prunes the
+        branches that the snapshot, if given, says don't lead to it. Returns the path
+        and the names of all nodes visited. Nodes are only queued once, as any path
+        through a node that's queued again can't be shorter than the first one.
+        Nodes are told apart by name, as they may not have been flushed yet.
+        """
+        to_process: Deque[Tuple[NodeRevision, PlannedJoinPath]] = collections.deque(
+            [(node, ()) for node in initial_nodes]
+        )
+        enqueued = {node.name for node in initial_nodes}
+        processed: Set[str] = set()
+        visited = {node.name for node in initial_nodes} | {dimension_node.name}
+
+        while to_process:
+            current_node, path = to_process.popleft()
+            processed.add(current_node.name)
+            dimensions_to_columns: Dict[
+                NodeRevision,
+                List[Column],
+            ] = collections.defaultdict(list)
+
+            # From the columns on the current node, find the next layer of
+            # dimension nodes that can be joined in
+            for col in current_node.columns:
+                if col.dimension and col.dimension.type == NodeType.DIMENSION:
+                    dimensions_to_columns[col.dimension.current].append(col)
+
+            # Go through all potential dimensions and their join columns
+            for joinable_dim, join_cols in dimensions_to_columns.items():
+                visited.add(joinable_dim.name)
+                next_path = path + (
+                    (
+                        current_node.name,
+                        joinable_dim.name,
+                        tuple(col.name for col in join_cols),
+                    ),
+                )
+                if joinable_dim.name == dimension_node.name:
+                    return next_path, visited
+                if joinable_dim.name in processed:
+                    continue
+                for next_node in [joinable_dim] + [
+                    parent.current for parent in joinable_dim.parents
+                ]:
+                    visited.add(next_node.name)
+                    if next_node.name not in enqueued and self._leads_to_dimension(
+                        snapshot,
+                        next_node,
+                        dimension_node.name,
+                        visited,
+                    ):
+                        enqueued.add(next_node.name)
+                        to_process.append((next_node, next_path))
+        return None, visited
+
+    @staticmethod
+    def _materialize(
+        path: PlannedJoinPath,
+        dimension_node: NodeRevision,
+        initial_nodes: List[NodeRevision],
+    ) -> Dict[Tuple[NodeRevision, NodeRevision], List[Column]]:
+        """
+        Resolve a planned join path to the node revisions and columns it joins.
+        """
+        nodes = {node.name: node for node in initial_nodes}
+        join_path: Dict[Tuple[NodeRevision, NodeRevision], List[Column]] = {}
+        for start_node_name, _, column_names in path:
+            start_node = nodes[start_node_name]
+            join_cols = [col for col in start_node.columns if col.name in column_names]
+            joinable_dim = join_cols[0].dimension.current
+            nodes[joinable_dim.name] = joinable_dim
+            for parent in joinable_dim.parents:
+                nodes[parent.current.name] = parent.current
+            join_path[(start_node, joinable_dim)] = join_cols
+
+        # Join on the dimension's primary key when no dimension column is specified
+        for (start_node, _), join_cols in list(join_path.items())[-1:]:
+            for col in join_cols:
+                dim_pk = dimension_node.primary_key()
+                if not col.dimension_column:
+                    if len(dim_pk) != 1:
+                        raise DJException(  # pragma: no cover
+                            f"Node {start_node.name} specifying dimension "
+                            f"{dimension_node.name} on column {col.name} does not"
+                            f" specify a dimension column, and {dimension_node.name} "
+                            f"has a compound primary key.",
+                        )
+                    col.dimension_column = dim_pk[0].name
+        return join_path
@@ -2,40 +2,83 @@
 Utilities used around construction
 """
 
-from typing import TYPE_CHECKING, Optional, Set
+from typing import TYPE_CHECKING, Dict, Iterable, Optional, Set, cast
 
+from sqlalchemy.orm import joinedload
 from sqlalchemy.orm.exc import NoResultFound
 from sqlmodel import Session, select
 
 from datajunction_server.errors import DJError, DJErrorException, ErrorCode
+from datajunction_server.models.column import Column
 from datajunction_server.models.node import Node, NodeRevision, NodeType
 
 if TYPE_CHECKING:
     from datajunction_server.sql.parsing.ast import Name
 
 
+def get_dj_nodes(session: Session, node_names: Iterable[str]) -> Dict[str, Node]:
+    """
+    Load the DJ nodes with the given names in a single query, along with their current
+    revisions and columns, and the current revisions and columns of the dimensions
+    those columns link to.
+    """
+    node_names = set(node_names)
+    if not node_names:
+        return {}
+    columns = joinedload(Node.current).selectinload(NodeRevision.columns)
+    nodes = (
+        session.exec(
+            select(Node)
+            .where(Node.name.in_(node_names))  # type: ignore  # pylint: disable=no-member
+            .options(
+                columns,
+                columns.joinedload(Column.dimension)
+                .joinedload(Node.current)
+                .selectinload(NodeRevision.columns),
+            ),
+        )
+        .unique()
+        .all()
+    )
+    return {node.name: node for node in nodes}
+
+
 def get_dj_node(
     session: Session,
     node_name: str,
     kinds: Optional[Set[NodeType]] = None,
     current: bool = True,
+    nodes: Optional[Dict[str, Optional[Node]]] = None,
 ) -> NodeRevision:
-    """Return the DJ Node with a given name from a set of node types"""
-    query = select(Node).filter(Node.name == node_name)
-    if kinds:
-        query = query.filter(Node.type.in_(kinds))  # type: ignore  # pylint: disable=no-member
-    match = None
-    try:
-        match = session.exec(query).one()
-    except NoResultFound as no_result_exc:
+    """
+    Return the DJ Node with a given name from a set of node types. Nodes are looked up
+    in and added to ``nodes`` when it's given, e.g., to share them across a compile.
+    """
+    match: Optional[Node] = None
+    if nodes is not None:
+        if node_name not in nodes:
+            nodes[node_name] = get_dj_nodes(session, [node_name]).get(node_name)
+        match = nodes[node_name]
+        if match and kinds and match.type not in kinds:
+            match = None
+    else:
+        query = select(Node).filter(Node.name == node_name)
+        if kinds:
+            query = query.filter(Node.type.in_(kinds))  # type: ignore  # pylint: disable=no-member
+        try:
+            match = session.exec(query).one()
+        except NoResultFound:
+            pass
+    if match is None:
         kind_msg = " or ".join(str(k) for k in kinds) if kinds else ""
         raise DJErrorException(
             DJError(
                 code=ErrorCode.UNKNOWN_NODE,
                 message=f"No node `{node_name}` exists of kind {kind_msg}.",
             ),
-        ) from no_result_exc
-    return match.current if match and current else match
+        )
+    # the node itself is returned when ``current`` is False
+    return match.current if current else cast(NodeRevision, match)
 
 
 def to_namespaced_name(name: str) -> "Name":
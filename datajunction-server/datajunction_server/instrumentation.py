@@ -0,0 +1,555 @@
+"""
+Instrumentation of how long requests and their stages take.
+
+Stages of building SQL (parsing, compiling, join path search, building, rendering,
+database statements...) are timed with ``timed``, either as a context manager or as a
+decorator. Each request collects the time spent in every stage, which is returned in
+a ``Server-Timing`` header and logged as JSON, and all timings are aggregated into
+histograms that are exposed in the Prometheus text format (see ``/health/metrics/``).
+
+Every SQL statement sent to the database is counted for the request that ran it,
+by its shape (the statement with its parameters and lists of parameters collapsed).
+The number of statements is returned in an ``X-DJ-Query-Count`` header, and shapes
+that run many times in a single request, which usually means that a relationship
+is loaded lazily once per node or column (an N+1 pattern), are logged and counted.
+Tests can pin the number of statements run by a block of code with ``count_queries``.
+
+When ``profiling_enabled`` is set, GET requests with ``?profile=true`` by
+authenticated users are also profiled with cProfile, and the response body is replaced
+with a summary of the profile. Only the timed stages of a request are profiled, as
+they run in worker threads, and only one request is profiled at a time, since the
+interpreter only supports one active profiler (from Python 3.12 on, enabling a second
+one raises).
+"""
+import cProfile
+import io
+import json
+import logging
+import pstats
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, FrozenSet, Iterator, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import PlainTextResponse, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from datajunction_server.utils import get_settings
+
+_logger = logging.getLogger(__name__)
+
+HISTOGRAM_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+STATEMENT_COUNT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+# Number of times a statement shape can run in a request before it's flagged
+REPEATED_STATEMENT_THRESHOLD = 10
+
+PROFILE_STATS_LIMIT = 50
+
+
+def statement_shape(statement: str) -> str:
+    """
+    The shape of a SQL statement: its text with parameters replaced by ``?``, lists
+    of parameters collapsed into one, and whitespace normalized.
+    """
+    shape = re.sub(r"%\(\w+\)s|(?<!:):\w+|\$\d+", "?", statement)
+    shape = re.sub(r"\?(?:\s*,\s*\?)+", "?", shape)
+    return " ".join(shape.split())
+
+
+class Histogram:
+    """
+    A Prometheus-style histogram of durations, in seconds.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = HISTOGRAM_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        """
+        Record a duration.
+        """
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+    def render(self, name: str, labels: str) -> List[str]:
+        """
+        The lines of the histogram in the Prometheus text format.
+        """
+        prefix = f"{labels}," if labels else ""
+        lines = [
+            f'{name}_bucket{{{prefix}le="{bound}"}} {count}'
+            for bound, count in zip(self.buckets, self.counts)
+        ]
+        lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {self.count}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Process-wide histograms of request and stage durations, and of the number of
+    statements run by requests.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, Histogram] = {}
+        self.requests: Dict[Tuple[str, str, int], Histogram] = {}
+        self.statements: Dict[Tuple[str, str], Histogram] = {}
+        self.repeated_statements: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def observe_stage(self, stage: str, seconds: float):
+        """
+        Record how long a stage took.
+        """
+        with self._lock:
+            self.stages.setdefault(stage, Histogram()).observe(seconds)
+
+    def observe_request(
+        self,
+        method: str,
+        endpoint: str,
+        status_code: int,
+        seconds: float,
+    ):
+        """
+        Record how long a request took.
+        """
+        with self._lock:
+            key = (method, endpoint, status_code)
+            self.requests.setdefault(key, Histogram()).observe(seconds)
+
+    def observe_statements(
+        self,
+        method: str,
+        endpoint: str,
+        count: int,
+        repeated: int,
+    ):
+        """
+        Record how many statements a request ran, and how many statement shapes it
+        ran more than ``REPEATED_STATEMENT_THRESHOLD`` times.
+        """
+        with self._lock:
+            key = (method, endpoint)
+            self.statements.setdefault(
+                key,
+                Histogram(STATEMENT_COUNT_BUCKETS),
+            ).observe(count)
+            if repeated:
+                self.repeated_statements[key] = (
+                    self.repeated_statements.get(key, 0) + repeated
+                )
+
+    def render(self) -> str:
+        """
+        All metrics in the Prometheus text format.
+        """
+        lines = [
+            "# HELP dj_request_duration_seconds Duration of HTTP requests.",
+            "# TYPE dj_request_duration_seconds histogram",
+        ]
+        with self._lock:
+            for (method, endpoint, status_code), histogram in sorted(
+                self.requests.items(),
+            ):
+                lines += histogram.render(
+                    "dj_request_duration_seconds",
+                    f'method="{method}",endpoint="{endpoint}",status="{status_code}"',
+                )
+            lines += [
+                "# HELP dj_stage_duration_seconds Duration of the stages of requests.",
+                "# TYPE dj_stage_duration_seconds histogram",
+            ]
+            for stage, histogram in sorted(self.stages.items()):
+                lines += histogram.render(
+                    "dj_stage_duration_seconds",
+                    f'stage="{stage}"',
+                )
+            lines += [
+                "# HELP dj_request_db_statements Database statements run by requests.",
+                "# TYPE dj_request_db_statements histogram",
+            ]
+            for (method, endpoint), histogram in sorted(self.statements.items()):
+                lines += histogram.render(
+                    "dj_request_db_statements",
+                    f'method="{method}",endpoint="{endpoint}"',
+                )
+            lines += [
+                "# HELP dj_repeated_db_statements_total Statement shapes that a "
+                "request ran many times, a sign of N+1 queries.",
+                "# TYPE dj_repeated_db_statements_total counter",
+            ]
+            for (method, endpoint), count in sorted(
+                self.repeated_statements.items(),
+            ):
+                lines.append(
+                    "dj_repeated_db_statements_total"
+                    f'{{method="{method}",endpoint="{endpoint}"}} {count}',
+                )
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        """
+        Drop all recorded metrics.
+        """
+        with self._lock:
+            self.stages.clear()
+            self.requests.clear()
+            self.statements.clear()
+            self.repeated_statements.clear()
+
+
+metrics_registry = MetricsRegistry()
+
+
+class RequestTimings:
+    """
+    Time spent in each stage of a request, and the statements it ran.
+    """
+
+    def __init__(self, profiler: Optional[cProfile.Profile] = None):
+        self.stages: Dict[str, List[float]] = {}
+        self.statements: Counter = Counter()
+        self.profiler = profiler
+        self._profiled_stages = 0
+        self._lock = threading.Lock()
+
+    def start_profiling(self):
+        """
+        Enable the profiler, if the request is profiled and no other stage of it is
+        being profiled already.
+        """
+        with self._lock:
+            if self.profiler is None:
+                return
+            if self._profiled_stages == 0:
+                try:
+                    self.profiler.enable()
+                except ValueError:
+                    # another profiler is active, e.g., a debugger's
+                    _logger.warning("Unable to profile request", exc_info=True)
+                    self.profiler = None
+                    return
+            self._profiled_stages += 1
+
+    def stop_profiling(self):
+        """
+        Disable the profiler once no stage of the request is being profiled.
+        """
+        with self._lock:
+            if self.profiler is None or self._profiled_stages == 0:
+                return
+            self._profiled_stages -= 1
+            if self._profiled_stages == 0:
+                self.profiler.disable()
+
+    def add_statement(self, shape: str):
+        """
+        Count a statement run by the request.
+        """
+        with self._lock:
+            self.statements[shape] += 1
+
+    def repeated_statements(
+        self,
+        threshold: int = REPEATED_STATEMENT_THRESHOLD,
+    ) -> Dict[str, int]:
+        """
+        The statement shapes that ran more than ``threshold`` times.
+        """
+        with self._lock:
+            return {
+                shape: count
+                for shape, count in self.statements.most_common()
+                if count > threshold
+            }
+
+    def add(self, stage: str, seconds: float):
+        """
+        Add time spent in a stage.
+        """
+        with self._lock:
+            totals = self.stages.setdefault(stage, [0.0, 0])
+            totals[0] += seconds
+            totals[1] += 1
+
+    def server_timing(self) -> str:
+        """
+        The timings as a ``Server-Timing`` header.
+        """
+        with self._lock:
+            return ", ".join(
+                f'{stage};dur={seconds * 1000:.1f};desc="{count}x"'
+                for stage, (seconds, count) in self.stages.items()
+            )
+
+    def as_dict(self) -> Dict[str, Dict[str, float]]:
+        """
+        The timings in milliseconds, with the number of times each stage ran.
+        """
+        with self._lock:
+            return {
+                stage: {"duration_ms": round(seconds * 1000, 3), "count": count}
+                for stage, (seconds, count) in self.stages.items()
+            }
+
+
+class QueryCounter:
+    """
+    The statements run while counting, in any thread.
+    """
+
+    def __init__(self):
+        self.statements: List[str] = []
+        self._lock = threading.Lock()
+
+    def add(self, shape: str):
+        """
+        Count a statement.
+        """
+        with self._lock:
+            self.statements.append(shape)
+
+    @property
+    def count(self) -> int:
+        """
+        The number of statements run.
+        """
+        return len(self.statements)
+
+    def repeated(self, threshold: int = REPEATED_STATEMENT_THRESHOLD) -> Dict[str, int]:
+        """
+        The statement shapes that ran more than ``threshold`` times.
+        """
+        return {
+            shape: count
+            for shape, count in Counter(self.statements).most_common()
+            if count > threshold
+        }
+
+
+_query_counters: List[QueryCounter] = []
+_query_counters_lock = threading.Lock()
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryCounter]:
+    """
+    Count the statements run in the block, e.g., to pin the number of statements run
+    by an endpoint in tests.
+    """
+    counter = QueryCounter()
+    with _query_counters_lock:
+        _query_counters.append(counter)
+    try:
+        yield counter
+    finally:
+        with _query_counters_lock:
+            _query_counters.remove(counter)
+
+
+_request_timings: ContextVar[Optional[RequestTimings]] = ContextVar(
+    "request_timings",
+    default=None,
+)
+_active_stages: ContextVar[FrozenSet[str]] = ContextVar(
+    "active_stages",
+    default=frozenset(),
+)
+
+
+def record(stage: str, seconds: float):
+    """
+    Record time spent in a stage that was timed separately.
+    """
+    metrics_registry.observe_stage(stage, seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """
+    Time a stage. Stages that are entered again while they're running, e.g., when
+    compiling subqueries, are only timed once.
+    """
+    active = _active_stages.get()
+    if stage in active:
+        yield
+        return
+    # only the outermost stages start and stop profiling
+    timings = None if active else _request_timings.get()
+    token = _active_stages.set(active | {stage})
+    if timings is not None:
+        timings.start_profiling()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if timings is not None:
+            timings.stop_profiling()
+        _active_stages.reset(token)
+        record(stage, elapsed)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(  # pylint: disable=too-many-arguments
+    conn,
+    cursor,  # pylint: disable=unused-argument
+    statement,
+    parameters,  # pylint: disable=unused-argument
+    context,  # pylint: disable=unused-argument
+    executemany,  # pylint: disable=unused-argument
+):
+    shape = statement_shape(statement)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.add_statement(shape)
+    if _query_counters:
+        with _query_counters_lock:
+            for counter in _query_counters:
+                counter.add(shape)
+    conn.info.setdefault("statement_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(  # pylint: disable=too-many-arguments
+    conn,
+    cursor,  # pylint: disable=unused-argument
+    statement,  # pylint: disable=unused-argument
+    parameters,  # pylint: disable=unused-argument
+    context,  # pylint: disable=unused-argument
+    executemany,  # pylint: disable=unused-argument
+):
+    record("db", time.perf_counter() - conn.info["statement_start"].pop())
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    starts = (
+        context.connection.info.get("statement_start") if context.connection else None
+    )
+    if starts:
+        record("db", time.perf_counter() - starts.pop())
+
+
+def profile_summary(profiler: cProfile.Profile) -> str:
+    """
+    The functions that took the most cumulative time in a profile.
+    """
+    output = io.StringIO()
+    stats = pstats.Stats(profiler, stream=output)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_STATS_LIMIT)
+    return output.getvalue()
+
+
+# Held while a request is profiled
+_profiling_lock = threading.Lock()
+
+
+def _profile_requested(request: Request) -> bool:
+    """
+    Whether a request asks to be profiled, and is allowed to be.
+    """
+    return (
+        request.method == "GET"
+        and request.query_params.get("profile", "").lower() == "true"
+        and get_settings().profiling_enabled
+    )
+
+
+async def instrument_request(request: Request, call_next) -> Response:
+    """
+    Middleware that times a request and its stages, and profiles it if asked to.
+    """
+    profiling = _profile_requested(request)
+    if profiling:
+        # released once the response is ready, or not profiled if already held
+        profiling = _profiling_lock.acquire(  # pylint: disable=consider-using-with
+            blocking=False,
+        )
+    timings = RequestTimings(cProfile.Profile() if profiling else None)
+    token = _request_timings.set(timings)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        _request_timings.reset(token)
+        if profiling:
+            _profiling_lock.release()
+    elapsed = time.perf_counter() - start
+
+    endpoint = request.scope.get("endpoint")
+    endpoint_name = getattr(endpoint, "__name__", "unknown")
+    metrics_registry.observe_request(
+        request.method,
+        endpoint_name,
+        response.status_code,
+        elapsed,
+    )
+    statement_count = sum(timings.statements.values())
+    repeated = timings.repeated_statements()
+    metrics_registry.observe_statements(
+        request.method,
+        endpoint_name,
+        statement_count,
+        len(repeated),
+    )
+    _logger.info(
+        json.dumps(
+            {
+                "method": request.method,
+                "path": request.url.path,
+                "endpoint": endpoint_name,
+                "status": response.status_code,
+                "duration_ms": round(elapsed * 1000, 3),
+                "statements": statement_count,
+                "stages": timings.as_dict(),
+            },
+        ),
+    )
+    if repeated:
+        _logger.warning(
+            "Possible N+1 queries in %s %s, statements run more than %s times: %s",
+            request.method,
+            request.url.path,
+            REPEATED_STATEMENT_THRESHOLD,
+            json.dumps(repeated),
+        )
+
+    server_timing = ", ".join(
+        filter(None, [timings.server_timing(), f"total;dur={elapsed * 1000:.1f}"]),
+    )
+    headers = {
+        "Server-Timing": server_timing,
+        "X-DJ-Query-Count": str(statement_count),
+        "X-DJ-Repeated-Queries": str(len(repeated)),
+    }
+    # The profile is only returned to authenticated users, which is only known once
+    # the endpoint's dependencies have run
+    if timings.profiler is not None and getattr(request.state, "user", None):
+        return PlainTextResponse(
+            profile_summary(timings.profiler),
+            status_code=response.status_code,
+            headers=headers,
+        )
+    response.headers.update(headers)
+    return response
@@ -0,0 +1,239 @@
+"""
+Column-level lineage.
+
+The lineage of a node's column is the tree of upstream columns that it's derived
+from, down to source nodes. It's stored on each node revision when the revision is
+created, so that serving it is a lookup.
+
+Computing it naively parses and compiles a node's query once per column, and again
+for every upstream node at every level of every column's tree. ``LineageBuilder``
+instead compiles each node revision at most once, and memoizes the lineage of each
+(revision, column), so that subtrees are shared between the columns of a node and
+between all of the nodes whose lineage is computed with the same builder. Lineage
+that's already stored on an upstream revision is used as is, rather than recomputed.
+
+When a node is updated, ``changed_lineage_columns`` tells which of its columns have
+different lineage, and ``stale_lineage_columns`` which entries of a downstream
+node's stored lineage go through one of those, so that only they are recomputed.
+"""
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from sqlmodel import Session
+
+from datajunction_server.errors import DJException
+from datajunction_server.models import NodeRevision
+from datajunction_server.models.node import LineageColumn, NodeStatus, NodeType
+from datajunction_server.sql.parsing import ast
+from datajunction_server.sql.parsing.ast import CompileContext
+
+# A node revision, by node name and version, and a column of it
+RevisionKey = Tuple[str, str]
+ColumnKey = Tuple[str, str, str]
+
+
+def _revision_key(node_revision: NodeRevision) -> RevisionKey:
+    """
+    The key of a node revision. Revisions always have a version, which defaults to
+    the draft version.
+    """
+    assert node_revision.version is not None
+    return node_revision.name, node_revision.version
+
+
+def has_lineage(node_revision: NodeRevision) -> bool:
+    """
+    Whether the node revision has column-level lineage of its own.
+    """
+    return node_revision.status == NodeStatus.VALID and node_revision.type not in (
+        NodeType.SOURCE,
+        NodeType.CUBE,
+    )
+
+
+class LineageBuilder:
+    """
+    Computes column-level lineage, compiling each node revision at most once and
+    memoizing the lineage of every (revision, column).
+    """
+
+    def __init__(self, session: Session):
+        self.session = session
+        self._projections: Dict[RevisionKey, Dict[str, ast.Expression]] = {}
+        self._lineage: Dict[ColumnKey, LineageColumn] = {}
+
+    def node_lineage(
+        self,
+        node_revision: NodeRevision,
+        columns: Optional[Iterable[str]] = None,
+    ) -> List[LineageColumn]:
+        """
+        The lineage of the node revision's columns, or of the given ones only.
+        """
+        if not has_lineage(node_revision):
+            return []
+        names = set(columns) if columns is not None else None
+        return [
+            self.column_lineage(node_revision, col.name)
+            for col in node_revision.columns
+            if names is None or col.name in names
+        ]
+
+    def column_lineage(
+        self,
+        node_revision: NodeRevision,
+        column_name: str,
+    ) -> LineageColumn:
+        """
+        The lineage of a column on the node revision.
+        """
+        key = (*_revision_key(node_revision), column_name)
+        if key not in self._lineage:
+            self._lineage[key] = self._column_lineage(node_revision, column_name)
+        return self._lineage[key]
+
+    def _upstream_lineage(
+        self,
+        node_revision: NodeRevision,
+        column_name: str,
+    ) -> LineageColumn:
+        """
+        The lineage of a column on an upstream node revision, taken from the lineage
+        stored on the revision if there is any.
+        """
+        key = (*_revision_key(node_revision), column_name)
+        if key not in self._lineage:
+            for entry in node_revision.lineage or []:
+                if entry["column_name"] == column_name:
+                    self._lineage[key] = LineageColumn.parse_obj(entry)
+                    break
+        return self.column_lineage(node_revision, column_name)
+
+    def _projection(self, node_revision: NodeRevision) -> Dict[str, ast.Expression]:
+        """
+        The compiled expressions of the node revision's query, by column name.
+        """
+        key = _revision_key(node_revision)
+        if key not in self._projections:
+            ctx = CompileContext(self.session, DJException())
+            query_ast = node_revision.parse_query()
+            query_ast.compile(ctx)
+            query_ast.select.add_aliases_to_unnamed_columns()
+            projection: Dict[str, ast.Expression] = {}
+            for col in query_ast.select.projection:
+                if col != ast.Null():
+                    projection.setdefault(
+                        col.alias_or_name.name,  # type: ignore
+                        col,  # type: ignore
+                    )
+            self._projections[key] = projection
+        return self._projections[key]
+
+    def _column_lineage(
+        self,
+        node_revision: NodeRevision,
+        column_name: str,
+    ) -> LineageColumn:
+        lineage_column = LineageColumn(
+            column_name=column_name,
+            node_name=node_revision.name,
+            node_type=node_revision.type,
+            display_name=node_revision.display_name,
+            lineage=[],
+        )
+        if node_revision.type == NodeType.SOURCE:
+            return lineage_column
+
+        # Find the expression AST for the column on the node
+        column = self._projection(node_revision)[column_name]
+        column_or_child = column.child if isinstance(column, ast.Alias) else column  # type: ignore
+        column_expr = (
+            column_or_child.expression  # type: ignore
+            if hasattr(column_or_child, "expression")
+            else column_or_child
+        )
+
+        # At every layer, expand the lineage search tree with all columns referenced
+        # by the current column's expression. If we reach an actual table with a DJ
+        # node attached, save this to the lineage record. Otherwise, continue the search
+        processed = list(column_expr.find_all(ast.Column))
+        seen = set()
+        while processed:
+            current = processed.pop()
+            if current in seen:
+                continue
+            if (
+                hasattr(current, "table")
+                and isinstance(current.table, ast.Table)
+                and current.table.dj_node
+            ):
+                lineage_column.lineage.append(  # type: ignore
+                    self._upstream_lineage(
+                        current.table.dj_node,
+                        current.name.name
+                        if not current.is_struct_ref
+                        else current.struct_column_name,
+                    ),
+                )
+            else:
+                expr_column_deps = list(
+                    current.expression.find_all(ast.Column),
+                )
+                for col_dep in expr_column_deps:
+                    processed.append(col_dep)
+            seen.update({current})
+        return lineage_column
+
+
+def _lineage_entries(node_revision: NodeRevision) -> Dict[str, Dict]:
+    """
+    The lineage of each of the node revision's columns, as seen by downstream nodes.
+    """
+    if node_revision.type == NodeType.SOURCE:
+        return {
+            col.name: LineageColumn(
+                column_name=col.name,
+                node_name=node_revision.name,
+                node_type=node_revision.type,
+                display_name=node_revision.display_name,
+                lineage=[],
+            ).dict()
+            for col in node_revision.columns
+        }
+    return {entry["column_name"]: entry for entry in node_revision.lineage or []}
+
+
+def changed_lineage_columns(old: NodeRevision, new: NodeRevision) -> Set[str]:
+    """
+    The names of the columns whose lineage differs between two revisions of a node.
+    """
+    old_entries = _lineage_entries(old)
+    new_entries = _lineage_entries(new)
+    return {
+        name
+        for name in old_entries.keys() | new_entries.keys()
+        if old_entries.get(name) != new_entries.get(name)
+    }
+
+
+def _upstream_columns(entry: Dict) -> Iterator[Tuple[str, str]]:
+    """
+    The (node, column) pairs anywhere upstream in a column's lineage.
+    """
+    for upstream in entry.get("lineage") or []:
+        yield upstream["node_name"], upstream["column_name"]
+        yield from _upstream_columns(upstream)
+
+
+def stale_lineage_columns(
+    node_revision: NodeRevision,
+    changed: Set[Tuple[str, str]],
+) -> Set[str]:
+    """
+    The names of the columns whose stored lineage goes through any of the changed
+    (node, column) pairs, and so needs to be recomputed.
+    """
+    return {
+        entry["column_name"]
+        for entry in node_revision.lineage or []
+        if any(upstream in changed for upstream in _upstream_columns(entry))
+    }
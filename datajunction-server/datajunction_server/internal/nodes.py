@@ -2,8 +2,9 @@
 """Nodes endpoint helper functions"""
 import logging
 from collections import defaultdict, deque
+from functools import partial
 from http import HTTPStatus
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 
 from fastapi import Depends
 from sqlmodel import Session, select
@@ -11,6 +12,7 @@ from sqlmodel import Session, select
 from datajunction_server.api.helpers import (
     activate_node,
     get_attribute_type,
+    get_downstream_nodes,
     get_engine,
     get_node_by_name,
     propagate_valid_status,
@@ -19,7 +21,13 @@ from datajunction_server.api.helpers import (
     validate_node_data,
 )
 from datajunction_server.construction.build import build_metric_nodes
+from datajunction_server.construction.cache import sql_build_cache
 from datajunction_server.errors import DJDoesNotExistException, DJException
+from datajunction_server.internal.lineage import (
+    LineageBuilder,
+    changed_lineage_columns,
+    stale_lineage_columns,
+)
 from datajunction_server.internal.materializations import (
     build_cube_config,
     create_new_materialization,
@@ -62,15 +70,16 @@ from datajunction_server.models.node import (
     LineageColumn,
     MissingParent,
     NodeMode,
+    NodeRelationship,
     NodeStatus,
     NodeType,
     UpdateNode,
 )
 from datajunction_server.service_clients import QueryServiceClient
 from datajunction_server.sql.parsing import ast
-from datajunction_server.sql.parsing.ast import CompileContext
-from datajunction_server.sql.parsing.backends.antlr4 import parse
+from datajunction_server.sql.parsing.backends.antlr4 import SqlSyntaxError
 from datajunction_server.sql.parsing.backends.exceptions import DJParseException
+from datajunction_server.sql.parsing.serialization import deserialize_query_ast
 from datajunction_server.utils import (
     LOOKUP_CHARS,
     SEPARATOR,
@@ -268,6 +277,7 @@ def create_node_revision(
     )
     node_revision.columns = node_validator.columns or []
     node_revision.catalog_id = catalog_id
+    node_revision.refresh_query_ast()
     return node_revision
 
 
@@ -452,7 +462,7 @@ def update_any_node(
     )
 
 
-def update_node_with_query(
+def update_node_with_query(  # pylint: disable=too-many-locals
     name: str,
     data: UpdateNode,
     session: Session,
@@ -538,12 +548,24 @@ def update_node_with_query(
             if col.name not in old_columns_map or old_columns_map[col.name] != col.type
         ],
     }
+    new_columns_map = {col.name: col.type for col in new_revision.columns}
+    changed_columns = (
+        {
+            name
+            for name in old_columns_map.keys() | new_columns_map.keys()
+            if old_columns_map.get(name) != new_columns_map.get(name)
+        }
+        if new_revision.status == old_revision.status
+        else None
+    )
     propagate_update_downstream(
         session,
         node,
         history_events,
         query_service_client=query_service_client,
         current_user=current_user,
+        changed_columns=changed_columns,
+        changed_lineage=changed_lineage_columns(old_revision, new_revision),
     )
 
     session.refresh(node.current)
@@ -581,15 +603,17 @@ def node_update_history_event(new_revision: NodeRevision, current_user: Optional
     )
 
 
-def update_cube_node(
+def update_cube_node(  # pylint: disable=too-many-arguments
     session: Session,
     node_revision: NodeRevision,
     data: UpdateNode,
     query_service_client: Optional[QueryServiceClient],
     current_user: Optional[User] = None,
+    commit: bool = True,
 ) -> Optional[NodeRevision]:
     """
-    Update cube node based on changes
+    Update cube node based on changes. Without ``commit``, the new revision is only
+    flushed, for the caller to commit along with its other changes.
     """
     minor_changes = has_minor_changes(node_revision, data)
     old_metrics = [m.name for m in node_revision.cube_metrics()]
@@ -657,6 +681,9 @@ def update_cube_node(
             )
     session.add(new_cube_revision)
     session.add(new_cube_revision.node)
+    if not commit:
+        session.flush()
+        return new_cube_revision
     session.commit()
 
     session.refresh(new_cube_revision)
@@ -665,12 +692,143 @@ def update_cube_node(
     return new_cube_revision
 
 
-def propagate_update_downstream(
+def _referenced_column_names(node_revision: NodeRevision) -> Optional[Set[str]]:
+    """
+    The (lowercased) names that the node's query refers to columns by, or None if
+    the columns it uses from its parents can't be told from its query, i.e., if it
+    selects ``*`` (other than in a function call like ``COUNT(*)``) or doesn't parse.
+    """
+    if not node_revision.query:
+        return None
+    try:
+        query_ast = node_revision.parse_query()
+    except (DJParseException, ValueError, SqlSyntaxError):
+        return None
+    if any(
+        not isinstance(wildcard.parent, ast.Function)
+        for wildcard in query_ast.find_all(ast.Wildcard)
+    ):
+        return None
+    return {
+        name.name.lower()
+        for column in query_ast.find_all(ast.Column)
+        for name in column.names
+    }
+
+
+def _is_affected(
+    node_revision: NodeRevision,
+    changed_parents: List[Node],
+    changes: Dict[str, Optional[Set[str]]],
+) -> bool:
+    """
+    Whether a downstream node has to be revalidated, given the changes to those of
+    its parents that changed. A parent's changes are the names of its columns that
+    were added, removed or changed type, or None if its status changed.
+    """
+    if node_revision.type == NodeType.CUBE or any(
+        changes[parent.name] is None or parent.type == NodeType.METRIC
+        for parent in changed_parents
+    ):
+        return True
+    referenced = _referenced_column_names(node_revision)
+    if referenced is None:
+        return True
+    return any(
+        column.lower() in referenced
+        for parent in changed_parents
+        for column in changes[parent.name]  # type: ignore
+    )
+
+
+def _downstream_graph(  # pylint: disable=too-many-locals
+    session: Session,
+    node: Node,
+) -> Tuple[List[Node], Dict[str, List[Node]]]:
+    """
+    All of the nodes whose current revisions are downstream from the node, in
+    topological order, i.e., every node comes after all of its parents, together with
+    the parents of each downstream node that are either the node itself or downstream
+    from it.
+    """
+    downstreams = {
+        downstream.name: downstream
+        for downstream in get_downstream_nodes(session, node.name)
+        if downstream.current and downstream.name != node.name
+    }
+    nodes_by_id = {node.id: node, **{dn.id: dn for dn in downstreams.values()}}
+    names_by_revision = {dn.current.id: dn.name for dn in downstreams.values()}
+    parents: Dict[str, List[Node]] = defaultdict(list)
+    children: Dict[str, List[str]] = defaultdict(list)
+    if names_by_revision:
+        for parent_id, child_id in session.exec(
+            select(NodeRelationship.parent_id, NodeRelationship.child_id).where(
+                NodeRelationship.child_id.in_(  # type: ignore  # pylint: disable=no-member
+                    names_by_revision,
+                ),
+            ),
+        ):
+            if parent_id in nodes_by_id:
+                parent = nodes_by_id[parent_id]
+                parents[names_by_revision[child_id]].append(parent)
+                children[parent.name].append(names_by_revision[child_id])
+
+    # Some of the downstream nodes may only have been downstream through one of
+    # their older revisions, so keep only those that the current revisions still
+    # connect to the node
+    reachable = {node.name}
+    pending = deque([node.name])
+    while pending:
+        for child in children[pending.popleft()]:
+            if child not in reachable:
+                reachable.add(child)
+                pending.append(child)
+    reachable.remove(node.name)
+    reachable_parents: Dict[str, List[Node]] = defaultdict(list)
+    for name in reachable:
+        reachable_parents[name] = [
+            parent
+            for parent in parents[name]
+            if parent.name == node.name or parent.name in reachable
+        ]
+
+    # Kahn's algorithm starting from the node itself, with ties broken by name so
+    # that the order is stable
+    in_degree = {name: len(reachable_parents[name]) for name in reachable}
+    ready = deque([node.name])
+    ordered = []
+    while ready:
+        name = ready.popleft()
+        if name != node.name:
+            ordered.append(downstreams[name])
+        for child in sorted(children[name]):
+            if child not in reachable:
+                continue
+            in_degree[child] -= 1
+            if in_degree[child] == 0:
+                ready.append(child)
+    assert len(ordered) == len(reachable), "The downstream nodes form a cycle"
+    return ordered, reachable_parents
+
+
+def _log_propagation_progress(name: str, done: int, total: int):
+    _logger.info(
+        "Propagating update of `%s`: %s/%s downstream nodes processed",
+        name,
+        done,
+        total,
+    )
+
+
+def propagate_update_downstream(  # pylint: disable=too-many-arguments,too-many-locals
     session: Session,
     node: Node,
     history_events: Dict[str, Any],
     query_service_client: QueryServiceClient = None,
     current_user: Optional[User] = None,
+    changed_columns: Optional[Set[str]] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+    changed_lineage: Optional[Set[str]] = None,
 ):
     """
     Propagate the updated node's changes to all of its downstream children.
@@ -678,95 +836,224 @@ def propagate_update_downstream(
     - altered column names: may invalidate downstream nodes
     - altered column types: may invalidate downstream nodes
     - new columns: won't affect downstream nodes
+
+    ``changed_columns`` are the names of the updated node's columns that were added,
+    removed or changed type, or None if all of its children should be revalidated
+    (e.g., because its status changed). Downstream nodes are processed in topological
+    order, and only revalidated if one of their parents changed in a way that they
+    can see, so that changes that don't affect a node's columns or status stop there.
+    All of the changes are committed together at the end, in the caller's session, so
+    the update is propagated before responding to the request that made it; running
+    it in a background worker that reports progress to clients isn't supported yet.
+    ``progress`` is called with the number of downstream nodes processed so far and
+    the total.
+
+    ``changed_lineage`` are the names of the updated node's columns whose lineage
+    changed, or None if that's unknown. The stored lineage of downstream nodes that
+    aren't revalidated is recomputed only where it goes through one of those columns,
+    or through a column of another downstream node whose lineage changed.
     """
-    processed = set()
+    progress = progress or partial(_log_propagation_progress, node.name)
+    ordered, parents = _downstream_graph(session, node)
+    builder = LineageBuilder(session)
+    lineage_changes = {
+        (node.name, column)
+        for column in (
+            changed_lineage
+            if changed_lineage is not None
+            else {col.name for col in node.current.columns}
+        )
+    }
 
-    # Each entry being processed is a list that represents the changelog of affected nodes
-    # The last entry in the list is the current node that's being processed
-    to_process = deque([[node.current, child.node.current] for child in node.children])
+    # The changes to each node that changed, and the changelog of affected nodes that
+    # led to it, ending with the node itself
+    changes: Dict[str, Optional[Set[str]]] = {node.name: changed_columns}
+    changelogs = {node.name: [node.name]}
 
-    while to_process:
-        changelog = to_process.popleft()
-        child = changelog[-1]
+    for done, downstream in enumerate(ordered, start=1):
+        child = downstream.current
+        changed_parents = [
+            parent for parent in parents[child.name] if parent.name in changes
+        ]
+        new_revision = None
+        if changed_parents and _is_affected(child, changed_parents, changes):
+            changelog = changelogs[changed_parents[0].name] + [child.name]
+            new_revision = _revalidate_downstream(
+                session,
+                node,
+                child,
+                changelog,
+                history_events,
+                builder,
+                query_service_client=query_service_client,
+                current_user=current_user,
+            )
+            if new_revision:
+                changes[child.name] = (
+                    None
+                    if new_revision.status != child.status
+                    else set(history_events[child.name]["updated_columns"])
+                )
+                changelogs[child.name] = changelog
+        updated_lineage = (
+            changed_lineage_columns(child, new_revision)
+            if new_revision
+            else _refresh_lineage(
+                session,
+                builder,
+                child,
+                lineage_changes,
+                node,
+                current_user,
+            )
+        )
+        lineage_changes.update((child.name, column) for column in updated_lineage)
+        progress(done, len(ordered))
 
-        # Only process if it hasn't already been processed before
-        if child.name not in processed:
-            processed.add(child.name)
+    session.commit()
 
-            if child.type == NodeType.CUBE:
-                update_cube_node(
-                    session,
-                    child,
-                    UpdateNode(
-                        metrics=[metric.name for metric in child.cube_metrics()],
-                        dimensions=child.cube_dimensions(),
-                    ),
-                    query_service_client=query_service_client,
-                )
-                continue
+    # Drop any SQL that was built from the updated node or its downstreams
+    sql_build_cache.invalidate({node.name} | {dn.name for dn in ordered})
 
-            node_validator = validate_node_data(
-                data=child,
-                session=session,
-            )
 
-            # Update the child with a new node revision if its columns or status have changed
-            if node_validator.differs_from(child):
-                new_revision = copy_existing_node_revision(child)
-                new_revision.version = str(
-                    Version.parse(child.version).next_major_version(),
-                )
+def _refresh_lineage(  # pylint: disable=too-many-arguments
+    session: Session,
+    builder: LineageBuilder,
+    node_revision: NodeRevision,
+    changed: Set[Tuple[str, str]],
+    node: Node,
+    current_user: Optional[User] = None,
+) -> Set[str]:
+    """
+    Recompute the entries of the node revision's stored lineage that go through any
+    of the changed (node, column) pairs. Returns the names of the columns whose
+    lineage changed.
 
-                new_revision.status = node_validator.status
-                new_revision.lineage = [
-                    lineage.dict()
-                    for lineage in get_column_level_lineage(session, new_revision)
-                ]
-
-                # Save which columns were modified and update the columns with the changes
-                updated_columns = node_validator.modified_columns(new_revision)
-                new_revision.columns = node_validator.columns
-
-                # Save the new revision of the child
-                new_revision.node = child.node
-                new_revision.node.current_version = new_revision.version
-                session.add(new_revision)
-                session.add(new_revision.node)
-
-                # Add grandchildren for processing
-                for grandchild in child.node.children:
-                    new_changelog = changelog + [grandchild]
-                    to_process.append(new_changelog)
-
-                # Record history event
-                history_events[child.name] = {
-                    "name": child.name,
-                    "current_version": new_revision.version,
-                    "previous_version": child.version,
-                    "updated_columns": sorted(list(updated_columns)),
-                }
-                event = History(
-                    entity_type=EntityType.NODE,
-                    entity_name=child.name,
-                    node=child.name,
-                    activity_type=ActivityType.STATUS_CHANGE,
-                    details={
-                        "upstreams": [
-                            history_events[entry.name]
-                            for entry in changelog
-                            if entry.name in history_events
-                        ],
-                        "reason": f"Caused by update of `{node.name}` to "
-                        f"{node.current_version}",
-                    },
-                    pre={"status": child.status},
-                    post={"status": node_validator.status},
-                    user=current_user.username if current_user else None,
-                )
-                session.add(event)
-                session.commit()
-                session.refresh(new_revision)
-                session.refresh(new_revision.node)
+    Lineage is derived from the revision's query and its upstreams, so it's updated
+    in place rather than with a new revision, and the update is recorded in the
+    node's history instead.
+    """
+    stale = stale_lineage_columns(node_revision, changed)
+    if not stale:
+        return set()
+    refreshed = {
+        lineage.column_name: lineage.dict()
+        for lineage in builder.node_lineage(node_revision, stale)
+    }
+    lineage = [
+        refreshed.get(entry["column_name"], entry) for entry in node_revision.lineage
+    ]
+    updated = {
+        old["column_name"]
+        for old, new in zip(node_revision.lineage, lineage)
+        if old != new
+    }
+    if updated:
+        node_revision.lineage = lineage
+        session.add(node_revision)
+        session.add(
+            History(
+                entity_type=EntityType.NODE,
+                entity_name=node_revision.name,
+                node=node_revision.name,
+                activity_type=ActivityType.UPDATE,
+                details={
+                    "version": node_revision.version,
+                    "lineage_columns": sorted(updated),
+                    "reason": f"Caused by update of `{node.name}` to "
+                    f"{node.current_version}",
+                },
+                user=current_user.username if current_user else None,
+            ),
+        )
+    return updated
+
+
+def _revalidate_downstream(  # pylint: disable=too-many-arguments
+    session: Session,
+    node: Node,
+    child: NodeRevision,
+    changelog: List[str],
+    history_events: Dict[str, Any],
+    builder: LineageBuilder,
+    query_service_client: QueryServiceClient = None,
+    current_user: Optional[User] = None,
+) -> Optional[NodeRevision]:
+    """
+    Revalidate a node downstream from the updated node, and create a new revision of
+    it if its columns or status have changed. Returns the new revision, if any.
+    """
+    if child.type == NodeType.CUBE:
+        update_cube_node(
+            session,
+            child,
+            UpdateNode(
+                metrics=[metric.name for metric in child.cube_metrics()],
+                dimensions=child.cube_dimensions(),
+            ),
+            query_service_client=query_service_client,
+            commit=False,
+        )
+        return None
+
+    node_validator = validate_node_data(
+        data=child,
+        session=session,
+    )
+    if not node_validator.differs_from(child):
+        return None
+
+    new_revision = copy_existing_node_revision(child)
+    new_revision.version = str(
+        Version.parse(child.version).next_major_version(),
+    )
+
+    new_revision.status = node_validator.status
+
+    # Save which columns were modified and update the columns with the changes
+    updated_columns = node_validator.modified_columns(new_revision)
+    new_revision.columns = node_validator.columns
+    new_revision.lineage = [
+        lineage.dict()
+        for lineage in get_column_level_lineage(session, new_revision, builder)
+    ]
+
+    # Save the new revision of the child
+    new_revision.node = child.node
+    new_revision.node.current_version = new_revision.version
+    session.add(new_revision)
+    session.add(new_revision.node)
+
+    # Record history event
+    history_events[child.name] = {
+        "name": child.name,
+        "current_version": new_revision.version,
+        "previous_version": child.version,
+        "updated_columns": sorted(list(updated_columns)),
+    }
+    event = History(
+        entity_type=EntityType.NODE,
+        entity_name=child.name,
+        node=child.name,
+        activity_type=ActivityType.STATUS_CHANGE,
+        details={
+            "upstreams": [
+                history_events[name] for name in changelog if name in history_events
+            ],
+            "reason": f"Caused by update of `{node.name}` to "
+            f"{node.current_version}",
+        },
+        pre={"status": child.status},
+        post={"status": node_validator.status},
+        user=current_user.username if current_user else None,
+    )
+    session.add(event)
+
+    # Write the new revision without committing, so that nodes further downstream
+    # are validated against it, and drop the stale current revision of the node
+    session.flush()
+    session.expire(new_revision.node, ["current"])
+    return new_revision
 
 
 def copy_existing_node_revision(old_revision: NodeRevision):
@@ -779,6 +1066,7 @@ def copy_existing_node_revision(old_revision: NodeRevision):
         display_name=old_revision.display_name,
         description=old_revision.description,
         query=old_revision.query,
+        query_ast=old_revision.query_ast,
         type=old_revision.type,
         columns=old_revision.columns,
         catalog=old_revision.catalog,
@@ -927,6 +1215,7 @@ def create_new_revision_from_existing(  # pylint: disable=too-many-locals,too-ma
         materializations=[],
         status=old_revision.status,
     )
+    new_revision.refresh_query_ast()
 
     # Link the new revision to its parents if a new revision was created and update its status
     if new_revision.type != NodeType.SOURCE:
@@ -996,98 +1285,43 @@ def create_new_revision_from_existing(  # pylint: disable=too-many-locals,too-ma
 def get_column_level_lineage(
     session: Session,
     node_revision: NodeRevision,
+    builder: Optional[LineageBuilder] = None,
 ) -> List[LineageColumn]:
     """
-    Gets the column-level lineage for the node
+    Gets the column-level lineage for the node. Pass a ``builder`` to share what's
+    computed between calls.
     """
-    if node_revision.status == NodeStatus.VALID and node_revision.type not in (
-        NodeType.SOURCE,
-        NodeType.CUBE,
-    ):
-        return [
-            column_lineage(
-                session,
-                node_revision,
-                col.name,
-            )
-            for col in node_revision.columns
-        ]
-    return []
+    return (builder or LineageBuilder(session)).node_lineage(node_revision)
 
 
-def column_lineage(
-    session: Session,
-    node_rev: NodeRevision,
-    column_name: str,
-) -> LineageColumn:
+def refresh_query_asts(session: Session, batch_size: int = 100) -> int:
     """
-    Helper function to determine the lineage for a column on a node.
+    Persist the pre-parsed AST of every node revision whose stored AST is missing or
+    stale, e.g., for revisions created by an older DJ version. This is a maintenance
+    job (see ``scripts/refresh-query-asts.py``), since reads never write ASTs back.
+    Returns the number of revisions that were updated.
     """
-    if node_rev.type == NodeType.SOURCE:
-        return LineageColumn(
-            node_name=node_rev.name,
-            node_type=node_rev.type,
-            display_name=node_rev.display_name,
-            column_name=column_name,
-            lineage=[],
-        )
-
-    ctx = CompileContext(session, DJException())
-    query_ast = parse(node_rev.query)
-    query_ast.compile(ctx)
-    query_ast.select.add_aliases_to_unnamed_columns()
-
-    lineage_column = LineageColumn(
-        column_name=column_name,
-        node_name=node_rev.name,
-        node_type=node_rev.type,
-        display_name=node_rev.display_name,
-        lineage=[],
-    )
-
-    # Find the expression AST for the column on the node
-    column = [
-        col
-        for col in query_ast.select.projection
-        if (  # pragma: no cover
-            col != ast.Null() and col.alias_or_name.name == column_name  # type: ignore
-        )
-    ][0]
-    column_or_child = column.child if isinstance(column, ast.Alias) else column  # type: ignore
-    column_expr = (
-        column_or_child.expression  # type: ignore
-        if hasattr(column_or_child, "expression")
-        else column_or_child
-    )
-
-    # At every layer, expand the lineage search tree with all columns referenced
-    # by the current column's expression. If we reach an actual table with a DJ
-    # node attached, save this to the lineage record. Otherwise, continue the search
-    processed = list(column_expr.find_all(ast.Column))
-    seen = set()
-    while processed:
-        current = processed.pop()
-        if current in seen:
-            continue
-        if (
-            hasattr(current, "table")
-            and isinstance(current.table, ast.Table)
-            and current.table.dj_node
-        ):
-            lineage_column.lineage.append(  # type: ignore
-                column_lineage(
-                    session,
-                    current.table.dj_node,
-                    current.name.name
-                    if not current.is_struct_ref
-                    else current.struct_column_name,
-                ),
+    refreshed = 0
+    last_id = 0
+    while True:
+        revisions = (
+            session.exec(
+                select(NodeRevision)
+                .where(NodeRevision.query.isnot(None))  # type: ignore  # pylint: disable=no-member
+                .where(NodeRevision.id > last_id)  # type: ignore
+                .order_by(NodeRevision.id)
+                .limit(batch_size),
             )
-        else:
-            expr_column_deps = list(
-                current.expression.find_all(ast.Column),
-            )
-            for col_dep in expr_column_deps:
-                processed.append(col_dep)
-        seen.update({current})
-    return lineage_column
+            .unique()
+            .all()
+        )
+        if not revisions:
+            return refreshed
+        for revision in revisions:
+            if deserialize_query_ast(revision.query, revision.query_ast) is None:
+                revision.refresh_query_ast()
+                if revision.query_ast is not None:
+                    session.add(revision)
+                    refreshed += 1
+        session.commit()
+        last_id = revisions[-1].id or last_id
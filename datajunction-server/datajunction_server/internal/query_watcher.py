@@ -0,0 +1,116 @@
+"""
+Shared watcher for queries submitted to the query service.
+
+Server-sent event streams report the progress of a query until it completes. Rather
+than having every stream poll the query service on its own, streams subscribe to
+the watcher, which checks each in-flight query once per interval, no matter how many
+streams are watching it, and fans out state changes to the subscribed streams. The
+load on the query service is bounded by the number of distinct in-flight queries,
+and the number of concurrent checks by the query service client's worker pool.
+"""
+import asyncio
+import logging
+import weakref
+from collections import defaultdict
+from typing import Dict, Optional, Set, Union
+
+from datajunction_server.models.query import QueryWithResults
+from datajunction_server.service_clients import QueryServiceClient
+from datajunction_server.typing import END_JOB_STATES
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_INTERVAL = 0.5
+
+QueryUpdate = Union[QueryWithResults, Exception]
+
+
+class QueryWatcher:
+    """
+    Watches in-flight queries on behalf of all the streams subscribed to them.
+    """
+
+    def __init__(
+        self,
+        query_service_client: QueryServiceClient,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+    ):
+        self.query_service_client = query_service_client
+        self.poll_interval = poll_interval
+        self._subscribers: Dict[str, Set["asyncio.Queue[QueryUpdate]"]] = defaultdict(
+            set,
+        )
+        self._latest: Dict[str, QueryWithResults] = {}
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    def subscribe(self, query_id: str) -> "asyncio.Queue[QueryUpdate]":
+        """
+        Subscribe to changes to a query. The returned queue receives the query each
+        time its state changes, or the exception raised when checking on it.
+        """
+        updates: "asyncio.Queue[QueryUpdate]" = asyncio.Queue()
+        self._subscribers[query_id].add(updates)
+        if query_id in self._latest:
+            updates.put_nowait(self._latest[query_id])
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._watch())
+        return updates
+
+    def unsubscribe(self, query_id: str, updates: "asyncio.Queue[QueryUpdate]"):
+        """
+        Stop receiving changes to a query. Queries are no longer checked on once
+        nothing is subscribed to them.
+        """
+        subscribers = self._subscribers.get(query_id)
+        if subscribers is None:
+            return
+        subscribers.discard(updates)
+        if not subscribers:
+            del self._subscribers[query_id]
+            self._latest.pop(query_id, None)
+
+    async def _watch(self):
+        """
+        Check on all subscribed queries that haven't completed yet, until there are
+        no subscribers left.
+        """
+        while self._subscribers:
+            query_ids = [
+                query_id
+                for query_id in self._subscribers
+                if query_id not in self._latest
+                or self._latest[query_id].state not in END_JOB_STATES
+            ]
+            results = await asyncio.gather(
+                *(
+                    self.query_service_client.get_query_async(query_id=query_id)
+                    for query_id in query_ids
+                ),
+                return_exceptions=True,
+            )
+            for query_id, result in zip(query_ids, results):
+                if query_id not in self._subscribers:
+                    continue  # pragma: no cover
+                if isinstance(result, QueryWithResults):
+                    if self._latest.get(query_id) == result:
+                        continue
+                    self._latest[query_id] = result
+                else:
+                    _logger.error("checking on query %s failed: %s", query_id, result)
+                for updates in self._subscribers[query_id]:
+                    updates.put_nowait(result)
+            await asyncio.sleep(self.poll_interval)
+
+
+_watchers: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def get_query_watcher(query_service_client: QueryServiceClient) -> QueryWatcher:
+    """
+    Get the watcher for queries submitted through the given client, shared by all
+    streams running on the current event loop.
+    """
+    watchers = _watchers.setdefault(asyncio.get_running_loop(), {})
+    if query_service_client not in watchers:
+        watchers[query_service_client] = QueryWatcher(query_service_client)
+    return watchers[query_service_client]
@@ -43,13 +43,13 @@ class ColumnTypeDecorator(TypeDecorator):  # pylint: disable=abstract-method
         return str(value)
 
     def process_result_value(self, value, dialect):
-        from datajunction_server.sql.parsing.backends.antlr4 import (  # pylint: disable=import-outside-toplevel
-            parse_rule,
+        from datajunction_server.sql.parsing.type_parser import (  # pylint: disable=import-outside-toplevel
+            parse_column_type,
         )
 
         if not value:
             return value
-        return parse_rule(value, "dataType")
+        return parse_column_type(value)
 
 
 class Column(BaseSQLModel, table=True):  # type: ignore
@@ -3,17 +3,19 @@
 Model for nodes.
 """
 import enum
+import logging
+import pickle
 import sys
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from functools import partial
 from http import HTTPStatus
-from typing import Dict, List, Optional, Tuple
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
 from pydantic import BaseModel, Extra
 from pydantic import Field as PydanticField
 from pydantic import root_validator, validator
-from sqlalchemy import JSON, DateTime, String
+from sqlalchemy import JSON, DateTime, LargeBinary, String
 from sqlalchemy.sql.schema import Column as SqlaColumn
 from sqlalchemy.sql.schema import UniqueConstraint
 from sqlalchemy.types import Enum
@@ -39,6 +41,11 @@ from datajunction_server.sql.parsing.types import ColumnType
 from datajunction_server.typing import UTCDatetime
 from datajunction_server.utils import SEPARATOR, Version, amenable_name
 
+if TYPE_CHECKING:
+    from datajunction_server.sql.parsing import ast
+
+_logger = logging.getLogger(__name__)
+
 DEFAULT_DRAFT_VERSION = Version(major=0, minor=1)
 DEFAULT_PUBLISHED_VERSION = Version(major=1, minor=0)
 MIN_VALID_THROUGH_TS = -sys.maxsize - 1
@@ -694,9 +701,71 @@ class NodeRevision(NodeRevisionBase, table=True):  # type: ignore
         sa_column=SqlaColumn(JSON),
     )
 
+    # The node's query in pre-parsed form, so that building SQL doesn't need to
+    # re-parse the query text. See `datajunction_server.sql.parsing.serialization`.
+    query_ast: Optional[bytes] = Field(
+        default=None,
+        sa_column=SqlaColumn(LargeBinary),
+    )
+
     def __hash__(self) -> int:
         return hash(self.id)
 
+    def parse_query(self) -> "ast.Query":
+        """
+        Returns the parsed query of this node revision. The persisted pre-parsed AST is
+        used if it is up to date, otherwise the query text is parsed. Missing or stale
+        ASTs are not written back here, see ``refresh_query_ast``.
+        """
+        from datajunction_server.sql.parsing.backends.antlr4 import (  # pylint: disable=import-outside-toplevel
+            parse,
+        )
+        from datajunction_server.sql.parsing.serialization import (  # pylint: disable=import-outside-toplevel
+            deserialize_query_ast,
+        )
+
+        if self.query and (tree := deserialize_query_ast(self.query, self.query_ast)):
+            return tree
+        return parse(self.query)
+
+    def _serialize_query_ast(self, tree: "ast.Query") -> Optional[bytes]:
+        """
+        Serializes the AST of the node revision's query, if possible.
+        """
+        from datajunction_server.sql.parsing.serialization import (  # pylint: disable=import-outside-toplevel
+            serialize_query_ast,
+        )
+
+        try:
+            return serialize_query_ast(self.query, tree)  # type: ignore
+        except (pickle.PicklingError, RecursionError) as exc:
+            _logger.warning("Failed to serialize the AST of `%s`: %s", self.name, exc)
+            return None
+
+    def refresh_query_ast(self) -> None:
+        """
+        Persists the parsed form of the node revision's query. This should be called
+        whenever the query changes.
+        """
+        from datajunction_server.sql.parsing.backends.antlr4 import (  # pylint: disable=import-outside-toplevel
+            SqlSyntaxError,
+            parse,
+        )
+        from datajunction_server.sql.parsing.backends.exceptions import (  # pylint: disable=import-outside-toplevel
+            DJParseException,
+        )
+
+        self.query_ast = None
+        if not self.query:
+            return
+        try:
+            tree = parse(self.query)
+        except (DJParseException, SqlSyntaxError, ValueError) as exc:
+            # Queries that fail to parse (e.g., on invalid draft nodes) are not stored
+            _logger.debug("Not storing the AST of `%s`: %s", self.name, exc)
+            return
+        self.query_ast = self._serialize_query_ast(tree)
+
     def primary_key(self) -> List[Column]:
         """
         Returns the primary key columns of this node.
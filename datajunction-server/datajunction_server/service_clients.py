@@ -1,11 +1,19 @@
 """Clients for various configurable services."""
-from typing import TYPE_CHECKING, List, Optional, Union
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import TYPE_CHECKING, Any, Callable, List, Optional, TypeVar, Union
 from urllib.parse import urljoin
 
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3 import Retry
 
+from datajunction_server.config import (
+    QUERY_SERVICE_MAX_CONNECTIONS,
+    QUERY_SERVICE_QUERY_TIMEOUT,
+    QUERY_SERVICE_TIMEOUT,
+)
 from datajunction_server.errors import DJQueryServiceClientException
 from datajunction_server.models.column import Column
 from datajunction_server.models.materialization import (
@@ -19,6 +27,10 @@ from datajunction_server.sql.parsing.types import ColumnType
 if TYPE_CHECKING:
     from datajunction_server.models.engine import Engine
 
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+T = TypeVar("T")
+
 
 class RequestsSessionWithEndpoint(requests.Session):
     """
@@ -26,11 +38,19 @@ class RequestsSessionWithEndpoint(requests.Session):
     subsequent requests will use as a prefix.
     """
 
-    def __init__(self, endpoint: str = None, retry_strategy: Retry = None):
+    def __init__(
+        self,
+        endpoint: str = None,
+        retry_strategy: Retry = None,
+        pool_maxsize: int = QUERY_SERVICE_MAX_CONNECTIONS,
+    ):
         super().__init__()
         self.endpoint = endpoint
-        self.mount("http://", HTTPAdapter(max_retries=retry_strategy))
-        self.mount("https://", HTTPAdapter(max_retries=retry_strategy))
+        for prefix in ("http://", "https://"):
+            self.mount(
+                prefix,
+                HTTPAdapter(max_retries=retry_strategy, pool_maxsize=pool_maxsize),
+            )
 
     def request(self, method, url, *args, **kwargs):
         """
@@ -60,10 +80,33 @@ class RequestsSessionWithEndpoint(requests.Session):
 class QueryServiceClient:  # pylint: disable=too-few-public-methods
     """
     Client for the query service.
+
+    Requests go through a pooled session with keep-alive connections. The ``*_async``
+    methods can be awaited from async handlers without blocking the event loop: they
+    run the request on a worker pool with ``max_connections`` threads, which also
+    caps the number of concurrent requests made through the client. Call ``close``
+    once the client is no longer needed, to shut the worker pool down.
+
+    Requests time out after ``timeout`` seconds, except for reading the response to a
+    submitted query, which may run synchronously for up to ``query_timeout`` seconds.
     """
 
-    def __init__(self, uri: str, retries: int = 0):
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        uri: str,
+        retries: int = 0,
+        timeout: float = QUERY_SERVICE_TIMEOUT,
+        query_timeout: float = QUERY_SERVICE_QUERY_TIMEOUT,
+        max_connections: int = QUERY_SERVICE_MAX_CONNECTIONS,
+    ):
         self.uri = uri
+        self.timeout = timeout
+        self.submit_timeout = (timeout, query_timeout)
+        self.max_connections = max_connections
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_connections,
+            thread_name_prefix="query-service-client",
+        )
         retry_strategy = Retry(
             total=retries,
             backoff_factor=1.5,
@@ -73,6 +116,27 @@ class QueryServiceClient:  # pylint: disable=too-few-public-methods
         self.requests_session = RequestsSessionWithEndpoint(
             endpoint=self.uri,
             retry_strategy=retry_strategy,
+            pool_maxsize=max_connections,
+        )
+
+    def close(self):
+        """
+        Shut down the worker pool and close the pooled connections. Requests that
+        are running are left to finish.
+        """
+        self._executor.shutdown(wait=False)
+        self.requests_session.close()
+
+    async def _run_in_pool(
+        self, func: Callable[..., T], *args: Any, **kwargs: Any
+    ) -> T:
+        """
+        Run a blocking request on the client's worker pool.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor,
+            partial(func, *args, **kwargs),
         )
 
     def get_columns_for_table(
@@ -93,6 +157,7 @@ class QueryServiceClient:  # pylint: disable=too-few-public-methods
             }
             if engine
             else {},
+            timeout=self.timeout,
         )
         table_columns = response.json()["columns"]
         return [
@@ -110,6 +175,7 @@ class QueryServiceClient:  # pylint: disable=too-few-public-methods
         response = self.requests_session.post(
             "/queries/",
             json=query_create.dict(),
+            timeout=self.submit_timeout,
         )
         response_data = response.json()
         if not response.ok:
@@ -119,6 +185,29 @@ class QueryServiceClient:  # pylint: disable=too-few-public-methods
         query_info = response.json()
         return QueryWithResults(**query_info)
 
+    def submit_query_as_arrow(
+        self,
+        query_create: QueryCreate,
+    ) -> Union[bytes, QueryWithResults]:
+        """
+        Submit a query to the query service, asking for the results as an Arrow
+        stream. Query services that can't serialize to Arrow return the query as
+        usual instead.
+        """
+        response = self.requests_session.post(
+            "/queries/",
+            json=query_create.dict(),
+            headers={"Accept": f"{ARROW_STREAM}, application/json;q=0.9"},
+            timeout=self.submit_timeout,
+        )
+        if not response.ok:
+            raise DJQueryServiceClientException(
+                message=f"Error response from query service: {response.text}",
+            )
+        if response.headers.get("Content-Type", "").startswith(ARROW_STREAM):
+            return response.content
+        return QueryWithResults(**response.json())
+
     def get_query(
         self,
         query_id: str,
@@ -126,7 +215,10 @@ class QueryServiceClient:  # pylint: disable=too-few-public-methods
         """
         Get a previously submitted query
         """
-        response = self.requests_session.get(f"/queries/{query_id}/")
+        response = self.requests_session.get(
+            f"/queries/{query_id}/",
+            timeout=self.timeout,
+        )
         if not response.ok:
             raise DJQueryServiceClientException(
                 message=f"Error response from query service: {response.text}",
@@ -134,6 +226,24 @@ class QueryServiceClient:  # pylint: disable=too-few-public-methods
         query_info = response.json()
         return QueryWithResults(**query_info)
 
+    async def submit_query_async(
+        self,
+        query_create: QueryCreate,
+    ) -> QueryWithResults:
+        """
+        Submit a query to the query service without blocking the event loop
+        """
+        return await self._run_in_pool(self.submit_query, query_create)
+
+    async def get_query_async(
+        self,
+        query_id: str,
+    ) -> QueryWithResults:
+        """
+        Get a previously submitted query without blocking the event loop
+        """
+        return await self._run_in_pool(self.get_query, query_id=query_id)
+
     def materialize(  # pylint: disable=too-many-arguments
         self,
         materialization_input: Union[
@@ -149,6 +259,7 @@ class QueryServiceClient:  # pylint: disable=too-few-public-methods
         response = self.requests_session.post(
             "/materialization/",
             json=materialization_input.dict(),
+            timeout=self.timeout,
         )
         if not response.ok:  # pragma: no cover
             return MaterializationInfo(urls=[], output_tables=[])
@@ -169,12 +280,34 @@ class QueryServiceClient:  # pylint: disable=too-few-public-methods
                 "node_name": node_name,
                 "materialization_name": materialization_name,
             },
+            timeout=self.timeout,
         )
         if not response.ok:  # pragma: no cover
             return MaterializationInfo(urls=[], output_tables=[])
         result = response.json()
         return MaterializationInfo(**result)
 
+    def invalidate_cached_results(
+        self,
+        catalog: str,
+        schema_: Optional[str],
+        table: str,
+    ) -> int:
+        """
+        Drop the query service's cached results for queries that read from a table.
+        Returns the number of cached results dropped.
+        """
+        response = self.requests_session.delete(
+            "/queries/cache/",
+            params={"catalog": catalog, "schema": schema_, "table": table},
+            timeout=self.timeout,
+        )
+        if not response.ok:
+            raise DJQueryServiceClientException(
+                message=f"Error response from query service: {response.text}",
+            )
+        return response.json()["invalidated"]
+
     def get_materialization_info(
         self,
         node_name: str,
@@ -3,23 +3,88 @@ DAG related functions.
 """
 import collections
 import itertools
-from typing import Deque, Dict, List, Optional, Set, Tuple, Union
+from typing import AbstractSet, Dict, List, Optional, Sequence, Tuple, Union
 
+from sqlalchemy.orm import joinedload
 from sqlmodel import Session, select
 
-from datajunction_server.models import Column
-from datajunction_server.models.base import NodeColumns
 from datajunction_server.models.node import (
     DimensionAttributeOutput,
     Node,
     NodeRevision,
     NodeType,
 )
+from datajunction_server.sql.dag_snapshot import (
+    DAGSnapshot,
+    DimensionAttributes,
+    get_dag_snapshot,
+    has_uncommitted_writes,
+)
+from datajunction_server.sql.parsing.types import ColumnType
 from datajunction_server.utils import get_settings
 
 settings = get_settings()
 
 
+def _find_dimension_attributes(
+    node: Node,
+    snapshot: Optional[DAGSnapshot] = None,
+) -> Tuple[DimensionAttributes, DAGSnapshot]:
+    """
+    Find the dimension attributes available to the node, along with the snapshot
+    they were found in: the given one or else the shared snapshot of the node's
+    database, if it includes the node. Nodes that aren't attached to a session, or
+    whose session has writes that aren't committed yet, get a snapshot built from
+    their relationships.
+    """
+    if snapshot is None:
+        session = Session.object_session(node)
+        if session is not None and not has_uncommitted_writes(session):
+            snapshot = get_dag_snapshot(session)
+    if snapshot is not None:
+        dimensions = snapshot.dimension_attributes(node.name)
+        if dimensions is not None:
+            return dimensions, snapshot
+    snapshot = DAGSnapshot.from_nodes([node])
+    dimensions = snapshot.dimension_attributes(node.name)
+    assert dimensions is not None
+    return dimensions, snapshot
+
+
+def _load_nodes(session: Session, names: AbstractSet[str]) -> List[Node]:
+    """
+    Load the nodes with the given names.
+    """
+    if not names:
+        return []
+    return (
+        session.exec(
+            select(Node)
+            .where(Node.name.in_(names))  # type: ignore  # pylint: disable=no-member
+            .options(joinedload(Node.current)),
+        )
+        .unique()
+        .all()
+    )
+
+
+def _dimension_attributes(
+    node: Node,
+    snapshot: Optional[DAGSnapshot] = None,
+) -> List[DimensionAttributeOutput]:
+    """
+    Dimension attributes available to the node, see ``_find_dimension_attributes``.
+    """
+    (dimensions, _), _ = _find_dimension_attributes(node, snapshot)
+    return sorted(
+        [
+            DimensionAttributeOutput(name=name, type=type_, path=list(path))
+            for name, type_, path in dimensions
+        ],
+        key=lambda x: x.name,
+    )
+
+
 def get_dimensions(
     node: Node,
     attributes: bool = True,
@@ -29,59 +94,17 @@ def get_dimensions(
     * Setting `attributes` to True will return a list of dimension attributes,
     * Setting `attributes` to False will return a list of dimension nodes
     """
-    dimensions = []
-
-    # Start with the node itself or the node's immediate parent if it's a metric node
-    StateTrackingType = Tuple[Node, List[Column]]
-    node_starting_state: StateTrackingType = (node, [])
-    immediate_parent_starting_state: List[StateTrackingType] = [
-        (parent, [])
-        for parent in (node.current.parents if node.type == NodeType.METRIC else [])
-    ]
-    to_process: Deque[StateTrackingType] = collections.deque(
-        [node_starting_state, *immediate_parent_starting_state],
-    )
-    processed: Set[Node] = set()
-
-    while to_process:
-        current_node, join_path = to_process.popleft()
-
-        # Don't include attributes from deactivated dimensions
-        if current_node.deactivated_at:
-            continue
-        processed.add(current_node)
-
-        for column in current_node.current.columns:
-            # Include the dimension if it's a column belonging to a dimension node
-            # or if it's tagged with the dimension column attribute
-            if current_node.type == NodeType.DIMENSION or column.is_dimensional():
-                join_path_str = [
-                    (
-                        (
-                            link_column.node_revisions[0].name + "."
-                            if link_column.node_revisions
-                            else ""
-                        )
-                        + link_column.name
-                    )
-                    for link_column in join_path
-                    if link_column is not None and link_column.dimension
-                ]
-                dimensions.append(
-                    DimensionAttributeOutput(
-                        name=f"{current_node.name}.{column.name}",
-                        type=column.type,
-                        path=join_path_str,
-                    ),
-                )
-            if column.dimension and column.dimension not in processed:
-                to_process.append((column.dimension, join_path + [column]))
     if attributes:
-        return sorted(dimensions, key=lambda x: x.name)
-    return sorted(list(processed), key=lambda x: x.name)
+        return _dimension_attributes(node)  # type: ignore
+    (_, processed), snapshot = _find_dimension_attributes(node)
+    if snapshot.orm_nodes:
+        dimension_nodes = [snapshot.orm_nodes[name] for name in processed]
+    else:
+        dimension_nodes = _load_nodes(Session.object_session(node), processed)
+    return sorted(dimension_nodes, key=lambda x: x.name)  # type: ignore
 
 
-def check_convergence(path1: List[str], path2: List[str]) -> bool:
+def check_convergence(path1: Sequence[str], path2: Sequence[str]) -> bool:
     """
     Determines whether two join paths converge before we reach the
     final element, the dimension attribute.
@@ -101,38 +124,56 @@ def check_convergence(path1: List[str], path2: List[str]) -> bool:
     return False
 
 
-def group_dimensions_by_name(node: Node) -> Dict[str, List[DimensionAttributeOutput]]:
+def group_dimensions_by_name(
+    node: Node,
+    snapshot: Optional[DAGSnapshot] = None,
+) -> Dict[str, List[DimensionAttributeOutput]]:
     """
     Group the dimensions for the node by the dimension attribute name
     """
     return {
         k: list(v)
         for k, v in itertools.groupby(
-            get_dimensions(node),
+            _dimension_attributes(node, snapshot),
             key=lambda dim: dim.name,
         )
     }
 
 
+def _paths_by_dimension(
+    node: Node,
+    snapshot: Optional[DAGSnapshot] = None,
+) -> Tuple[Dict[str, List[Tuple[ColumnType, Tuple[str, ...]]]], DAGSnapshot]:
+    """
+    Group the join paths to each dimension attribute available to the node by the
+    dimension attribute name, along with the snapshot they were found in.
+    """
+    (dimensions, _), snapshot = _find_dimension_attributes(node, snapshot)
+    paths = collections.defaultdict(list)
+    for name, type_, path in dimensions:
+        paths[name].append((type_, path))
+    return paths, snapshot
+
+
 def get_shared_dimensions(
     metric_nodes: List[Node],
 ) -> List[DimensionAttributeOutput]:
     """
     Return a list of dimensions that are common between the nodes.
     """
-    common = group_dimensions_by_name(metric_nodes[0])
+    common, snapshot = _paths_by_dimension(metric_nodes[0])
     for node in set(metric_nodes[1:]):
-        node_dimensions = group_dimensions_by_name(node)
+        node_dimensions, _ = _paths_by_dimension(node, snapshot)
 
         # Merge each set of dimensions based on the name and path
         to_delete = set()
-        common_dim_keys = common.keys() & list(node_dimensions.keys())
+        common_dim_keys = common.keys() & node_dimensions.keys()
         if not common_dim_keys:
             return []
         for common_dim in common_dim_keys:
-            for existing_attr in common[common_dim]:
-                for new_attr in node_dimensions[common_dim]:
-                    converged = check_convergence(existing_attr.path, new_attr.path)
+            for _, existing_path in common[common_dim]:
+                for _, new_path in node_dimensions[common_dim]:
+                    converged = check_convergence(existing_path, new_path)
                     if not converged:
                         to_delete.add(common_dim)
 
@@ -140,11 +181,38 @@ def get_shared_dimensions(
             del common[dim_key]
 
     return sorted(
-        [y for x in common.values() for y in x],
+        [
+            DimensionAttributeOutput(name=name, type=type_, path=list(path))
+            for name, paths in common.items()
+            for type_, path in paths
+        ],
         key=lambda x: (x.name, x.path),
     )
 
 
+def _load_current_revisions(
+    session: Session,
+    names: AbstractSet[str],
+) -> List[NodeRevision]:
+    """
+    Load the current revisions of the nodes with the given names.
+    """
+    if not names:
+        return []
+    statement = (
+        select(NodeRevision)
+        .join(
+            Node,
+            onclause=(
+                (NodeRevision.node_id == Node.id)
+                & (Node.current_version == NodeRevision.version)
+            ),  # pylint: disable=superfluous-parens
+        )
+        .where(Node.name.in_(names))  # type: ignore  # pylint: disable=no-member
+    )
+    return list(set(session.exec(statement).unique().all()))
+
+
 def get_nodes_with_dimension(
     session: Session,
     dimension_node: Node,
@@ -153,55 +221,11 @@ def get_nodes_with_dimension(
     """
     Find all nodes that can be joined to a given dimension
     """
-    to_process = [dimension_node]
-    processed: Set[str] = set()
-    final_set: Set[NodeRevision] = set()
-    while to_process:
-        current_node = to_process.pop()
-        processed.add(current_node.name)
-
-        # Dimension nodes are used to expand the searchable graph by finding
-        # the next layer of nodes that are linked to this dimension
-        if current_node.type == NodeType.DIMENSION:
-            statement = (
-                select(NodeRevision)
-                .join(
-                    Node,
-                    onclause=(
-                        (NodeRevision.node_id == Node.id)
-                        & (Node.current_version == NodeRevision.version)
-                    ),  # pylint: disable=superfluous-parens
-                )
-                .join(
-                    NodeColumns,
-                    onclause=(
-                        NodeRevision.id == NodeColumns.node_id
-                    ),  # pylint: disable=superfluous-parens
-                )
-                .join(
-                    Column,
-                    onclause=(
-                        NodeColumns.column_id == Column.id
-                    ),  # pylint: disable=superfluous-parens
-                )
-                .where(
-                    Column.dimension_id.in_(  # type: ignore  # pylint: disable=no-member
-                        [current_node.id],
-                    ),
-                )
-            )
-            node_revisions = session.exec(statement).unique().all()
-            for node_rev in node_revisions:
-                to_process.append(node_rev.node)
-        else:
-            # All other nodes are added to the result set
-            final_set.add(current_node.current)
-            for child in current_node.children:
-                if child.name not in processed:
-                    to_process.append(child.node)
-    if node_types:
-        return [node for node in final_set if node.type in node_types]
-    return list(final_set)
+    snapshot = get_dag_snapshot(session)
+    return _load_current_revisions(
+        session,
+        snapshot.nodes_with_dimension(dimension_node.name, node_types),
+    )
 
 
 def get_nodes_with_common_dimensions(
@@ -212,17 +236,16 @@ def get_nodes_with_common_dimensions(
     """
     Find all nodes that share a list of common dimensions
     """
-    nodes_that_share_dimensions = set()
+    snapshot = get_dag_snapshot(session)
+    nodes_that_share_dimensions: AbstractSet[str] = set()
     first = True
     for dimension in common_dimensions:
-        new_nodes = get_nodes_with_dimension(session, dimension, node_types)
+        new_nodes = snapshot.nodes_with_dimension(dimension.name, node_types)
         if first:
-            nodes_that_share_dimensions = set(new_nodes)
+            nodes_that_share_dimensions = new_nodes
             first = False
         else:
-            nodes_that_share_dimensions = nodes_that_share_dimensions.intersection(
-                set(new_nodes),
-            )
+            nodes_that_share_dimensions = nodes_that_share_dimensions & new_nodes
             if not nodes_that_share_dimensions:
                 break
-    return list(nodes_that_share_dimensions)
+    return _load_current_revisions(session, nodes_that_share_dimensions)
@@ -0,0 +1,776 @@
+"""
+In-memory, read-only snapshot of the DAG used for dimension discovery.
+
+Walking the DAG through ORM relationships (node -> current revision -> columns ->
+dimension node -> ...) issues at least one SELECT per hop, which adds up quickly on
+large graphs. A snapshot holds just enough of the graph to discover dimensions:
+nodes, their current revisions' columns, dimension links and parents. It's loaded
+with a handful of bulk queries and kept in sync with the database incrementally.
+
+Every write to a node is recorded in the history table, so on each use the snapshot
+looks for history events it hasn't seen yet and reloads only the nodes named in
+them. Writes that bypass the history table (e.g., loading nodes directly through
+the ORM) are caught by comparing a cheap fingerprint of the node, revision and
+column tables, in which case the snapshot is reloaded in full.
+"""
+import threading
+import weakref
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    Callable,
+    Collection,
+    Deque,
+    Dict,
+    FrozenSet,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from sqlalchemy import event, func, inspect
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session as OrmSession
+from sqlalchemy.orm import aliased, selectinload
+from sqlalchemy.pool import QueuePool, SingletonThreadPool, StaticPool
+from sqlmodel import Session, col, create_engine, select
+
+from datajunction_server.models.attribute import AttributeType, ColumnAttribute
+from datajunction_server.models.base import NodeColumns
+from datajunction_server.models.column import Column
+from datajunction_server.models.history import History
+from datajunction_server.models.node import (
+    Node,
+    NodeRelationship,
+    NodeRevision,
+    NodeType,
+)
+from datajunction_server.sql.parsing.types import ColumnType
+
+# Reload the whole snapshot rather than individual nodes past this many changes
+MAX_INCREMENTAL_REFRESH = 500
+
+# History ids are not guaranteed to be committed in order, so recent ids that were
+# seen are tracked and this many ids below the latest one are re-checked
+HISTORY_RESCAN_WINDOW = 100
+
+# The dimension attributes available to a node as (name, type, join path) tuples,
+# and the names of the dimension nodes they're on
+DimensionAttributes = Tuple[
+    Tuple[Tuple[str, ColumnType, Tuple[str, ...]], ...],
+    FrozenSet[str],
+]
+
+
+@dataclass
+class SnapshotColumn:
+    """
+    A column on a node's current revision.
+    """
+
+    name: str
+    type: ColumnType
+    dimension: Optional[str]
+    attributes: Set[str]
+    path_name: str
+
+    def is_dimensional(self) -> bool:
+        """
+        Whether this column is considered dimensional
+        """
+        return bool(
+            {"dimension", "primary_key"} & self.attributes or self.dimension,
+        )
+
+
+@dataclass
+class SnapshotNode:
+    """
+    A node along with the parts of its current revision needed for dimension
+    discovery.
+    """
+
+    name: str
+    type: NodeType
+    deactivated: bool
+    columns: List[SnapshotColumn] = field(default_factory=list)
+    parents: List[str] = field(default_factory=list)
+
+    # Parents of any of the node's revisions, not just the current one
+    revision_parents: Set[str] = field(default_factory=set)
+
+
+class ReachabilityIndex:
+    """
+    Results of traversals of a snapshot keyed by (kind, start), along with, for each
+    node, the entries whose traversal visited it.
+    """
+
+    def __init__(self):
+        self.entries: Dict[Tuple[str, Hashable], Any] = {}
+        self.visited: Dict[Tuple[str, Hashable], FrozenSet[str]] = {}
+        self.dependents: Dict[str, Set[Tuple[str, Hashable]]] = defaultdict(set)
+
+        # Bumped whenever nodes change, so that traversals that run without holding
+        # the snapshot's lock can tell whether what they read is still current
+        self.generation = 0
+
+    def lookup(
+        self,
+        kind: str,
+        start: Hashable,
+        traverse: Callable[[Any], Tuple[Any, Set[str]]],
+        visited: Optional[Set[str]] = None,
+    ) -> Any:
+        """
+        Look up the result of a traversal, running the traversal if it isn't indexed
+        yet. ``traverse`` returns the result and the names of all nodes it visited,
+        including the ones it started from. Pass ``visited`` to add those names to
+        it, for traversals that depend on this one.
+        """
+        key = (kind, start)
+        if key not in self.entries:
+            self.store(kind, start, *traverse(start))
+        if visited is not None:
+            visited.update(self.visited[key])
+        return self.entries[key]
+
+    def store(self, kind: str, start: Hashable, result: Any, visited: Set[str]):
+        """
+        Index the result of a traversal and the names of all nodes it visited.
+        """
+        key = (kind, start)
+        self.entries[key] = result
+        self.visited[key] = frozenset(visited)
+        for visited_name in visited:
+            self.dependents[visited_name].add(key)
+
+    def invalidate(self, names: Iterable[str]):
+        """
+        Drop the entries whose traversals visited any of the named nodes.
+        """
+        self.generation += 1
+        for name in names:
+            for key in self.dependents.pop(name, set()):
+                self.entries.pop(key, None)
+                self.visited.pop(key, None)
+
+    def clear(self):
+        """
+        Drop all entries.
+        """
+        self.generation += 1
+        self.entries.clear()
+        self.visited.clear()
+        self.dependents.clear()
+
+
+@dataclass
+class SyncState:
+    """
+    What a snapshot has seen of the database, to tell what changed since.
+    """
+
+    history_id: int = 0
+    fingerprint: Optional[Tuple] = None
+
+    # Recently seen history ids, see ``HISTORY_RESCAN_WINDOW``
+    seen_history: Set[int] = field(default_factory=set)
+
+
+@event.listens_for(OrmSession, "after_flush")
+def _track_flush(session: OrmSession, _):
+    session.info["uncommitted_writes"] = True
+
+
+@event.listens_for(OrmSession, "after_commit")
+@event.listens_for(OrmSession, "after_rollback")
+def _track_transaction_end(session: OrmSession):
+    session.info.pop("uncommitted_writes", None)
+
+
+def has_uncommitted_writes(session: Session) -> bool:
+    """
+    Whether the session has writes, flushed or not, that a snapshot of committed data
+    doesn't include.
+    """
+    return bool(
+        session.info.get("uncommitted_writes")
+        or session.new
+        or session.dirty
+        or session.deleted,
+    )
+
+
+class DAGSnapshot:  # pylint: disable=too-many-instance-attributes
+    """
+    A read-only view of the DAG, indexed for traversal in both directions.
+    """
+
+    def __init__(self):
+        self.nodes: Dict[str, SnapshotNode] = {}
+        self.children: Dict[str, Set[str]] = defaultdict(set)
+        self.linked_nodes: Dict[str, Set[str]] = defaultdict(set)
+        self.sync = SyncState()
+
+        # The ORM nodes a snapshot was built from, if it was built with ``from_nodes``
+        self.orm_nodes: Dict[str, Node] = {}
+
+        self.index = ReachabilityIndex()
+        self._lock = threading.RLock()
+
+        # Engine with a single connection of its own that refreshes read through
+        self._reader: Optional[Engine] = None
+
+    def _invalidate(self, node: SnapshotNode):
+        """
+        Drop the index entries whose traversals may be affected by a change to the
+        given node: those that visited it, its parents or its linked dimensions.
+        """
+        names = {node.name} | node.revision_parents
+        names.update(column.dimension for column in node.columns if column.dimension)
+        self.index.invalidate(names)
+
+    def add(self, node: SnapshotNode):
+        """
+        Add a node to the snapshot, replacing any existing node of the same name.
+        """
+        self.remove(node.name)
+        self._invalidate(node)
+        self.nodes[node.name] = node
+        for parent in node.revision_parents:
+            self.children[parent].add(node.name)
+        for column in node.columns:
+            if column.dimension:
+                self.linked_nodes[column.dimension].add(node.name)
+
+    def remove(self, name: str):
+        """
+        Remove a node from the snapshot.
+        """
+        node = self.nodes.pop(name, None)
+        if not node:
+            return
+        self._invalidate(node)
+        for parent in node.revision_parents:
+            self.children[parent].discard(name)
+        for column in node.columns:
+            if column.dimension:
+                self.linked_nodes[column.dimension].discard(name)
+
+    def dimension_attributes(self, name: str) -> Optional[DimensionAttributes]:
+        """
+        Find the dimension attributes available to a node, along with the join path
+        to each of them. Returns the attributes as (name, type, path) tuples, with
+        shorter join paths first, and the names of the dimension nodes they're on,
+        or None if the node isn't in the snapshot.
+        """
+        with self._lock:
+            if name not in self.nodes:
+                return None
+            return self.index.lookup("dimensions", name, self._find_dimensions)
+
+    def _find_dimensions(self, name: str):
+        """
+        Breadth-first search for the dimension attributes available to a node.
+        """
+        node = self.nodes[name]
+        dimensions = []
+        to_process: Deque[Tuple[SnapshotNode, List[SnapshotColumn]]] = deque(
+            [(node, [])],
+        )
+        visited = {name}
+        if node.type == NodeType.METRIC:
+            visited.update(node.parents)
+            to_process.extend(
+                (self.nodes[parent], [])
+                for parent in node.parents
+                if parent in self.nodes
+            )
+        processed: Set[str] = set()
+
+        while to_process:
+            current_node, join_path = to_process.popleft()
+
+            # Don't include attributes from deactivated dimensions
+            if current_node.deactivated:
+                continue
+            processed.add(current_node.name)
+
+            for column in current_node.columns:
+                if current_node.type == NodeType.DIMENSION or column.is_dimensional():
+                    dimensions.append(
+                        (
+                            f"{current_node.name}.{column.name}",
+                            column.type,
+                            tuple(link.path_name for link in join_path),
+                        ),
+                    )
+                if column.dimension and column.dimension not in processed:
+                    visited.add(column.dimension)
+                    if column.dimension in self.nodes:
+                        to_process.append(
+                            (self.nodes[column.dimension], join_path + [column]),
+                        )
+        return (tuple(dimensions), frozenset(processed)), visited
+
+    def nodes_with_dimension(
+        self,
+        name: str,
+        node_types: Optional[Collection[NodeType]] = None,
+    ) -> FrozenSet[str]:
+        """
+        Find the names of all nodes that can be joined to the given dimension,
+        optionally only those of the given types.
+        """
+        with self._lock:
+            names = self.index.lookup(
+                "linked",
+                name,
+                self._find_nodes_with_dimension,
+            )
+            if node_types:
+                names = frozenset(
+                    linked for linked in names if self.nodes[linked].type in node_types
+                )
+            return names
+
+    def _find_nodes_with_dimension(self, name: str):
+        """
+        Search downstream of a dimension, through dimension links and children.
+        """
+        to_process = [name]
+        processed: Set[str] = set()
+        final_set: Set[str] = set()
+        while to_process:
+            current = to_process.pop()
+            processed.add(current)
+            node = self.nodes.get(current)
+            if not node:
+                continue
+
+            # Dimension nodes are used to expand the searchable graph by finding
+            # the next layer of nodes that are linked to this dimension
+            if node.type == NodeType.DIMENSION:
+                to_process.extend(self.linked_nodes[current] - processed)
+            else:
+                # All other nodes are added to the result set
+                final_set.add(current)
+                to_process.extend(self.children[current] - processed)
+        return frozenset(final_set), processed
+
+    def joinable_nodes(
+        self,
+        name: str,
+        visited: Optional[Set[str]] = None,
+    ) -> FrozenSet[str]:
+        """
+        Find the names of all nodes that can be joined in starting from the given
+        node, by following dimension links and the parents of linked dimensions.
+        Pass ``visited`` to add the names of all nodes the answer depends on to it.
+        """
+        with self._lock:
+            return self.index.lookup(
+                "joinable",
+                name,
+                self._find_joinable_nodes,
+                visited,
+            )
+
+    def _find_joinable_nodes(self, name: str):
+        """
+        Search for the nodes that can be joined in starting from the given node.
+        """
+        to_process = [name]
+        reachable: Set[str] = set()
+        referenced: Set[str] = set()
+        while to_process:
+            current = to_process.pop()
+            if current in reachable:
+                continue
+            reachable.add(current)
+            node = self.nodes.get(current)
+            if not node:
+                continue
+            for column in node.columns:
+                if not column.dimension:
+                    continue
+                referenced.add(column.dimension)
+                dimension = self.nodes.get(column.dimension)
+                if dimension and dimension.type == NodeType.DIMENSION:
+                    to_process.append(dimension.name)
+                    to_process.extend(dimension.parents)
+        return frozenset(reachable), reachable | referenced
+
+    def join_path(
+        self,
+        start: Hashable,
+        search: Callable[[Any], Tuple[Any, Set[str]]],
+    ) -> Any:
+        """
+        Look up a join path in the reachability index, running ``search`` to find it
+        if it isn't indexed yet. Join paths are planned against the ORM, so callers
+        provide the search, which returns the path and the names of all nodes it
+        visited, so that the path is dropped when any of them change.
+
+        The search may load from the database, so it runs without holding the lock,
+        and its path is only indexed if no node changed while it ran.
+        """
+        key = ("join_path", start)
+        with self._lock:
+            if key in self.index.entries:
+                return self.index.entries[key]
+            generation = self.index.generation
+        path, visited = search(start)
+        with self._lock:
+            if self.index.generation == generation:
+                self.index.store("join_path", start, path, visited)
+        return path
+
+    @classmethod
+    def from_nodes(cls, nodes: Iterable[Node]) -> "DAGSnapshot":
+        """
+        Build a snapshot of the part of the DAG reachable from the given nodes, by
+        following their ORM relationships. Used for nodes that aren't attached to
+        a session.
+        """
+        snapshot = cls()
+        layer = list(nodes)
+        while layer:
+            layer = list(
+                {
+                    node.name: node for node in layer if node.name not in snapshot.nodes
+                }.values(),
+            )
+            _load_relationships(layer)
+            next_layer: List[Node] = []
+            for node in layer:
+                snapshot.orm_nodes[node.name] = node
+                revision = node.current
+                columns = [
+                    SnapshotColumn(
+                        name=column.name,
+                        type=column.type,
+                        dimension=column.dimension.name if column.dimension else None,
+                        attributes={
+                            attribute.attribute_type.name
+                            for attribute in column.attributes
+                        },
+                        path_name=_path_name(revision, column),
+                    )
+                    for column in revision.columns
+                ]
+                snapshot.add(
+                    SnapshotNode(
+                        name=node.name,
+                        type=node.type,
+                        deactivated=bool(node.deactivated_at),
+                        columns=columns,
+                        parents=[parent.name for parent in revision.parents],
+                        revision_parents={parent.name for parent in revision.parents},
+                    ),
+                )
+                next_layer.extend(revision.parents)
+                next_layer.extend(
+                    column.dimension for column in revision.columns if column.dimension
+                )
+            layer = next_layer
+        return snapshot
+
+    @contextmanager
+    def _committed_session(self, session: Session) -> Iterator[Session]:
+        """
+        A session on the same database as ``session`` that only reads committed data,
+        so that the snapshot never holds writes that are later rolled back. It reads
+        through a connection of its own, so that refreshes never wait on or take up
+        connections from the pool that requests use. Databases that only have a
+        single connection (e.g., in-memory SQLite) can't be read in isolation, so
+        ``session`` itself is used for them.
+        """
+        bind = session.get_bind()
+        engine = bind.engine if isinstance(bind, Connection) else bind
+        if isinstance(engine.pool, (StaticPool, SingletonThreadPool)):
+            yield session
+            return
+        if self._reader is None:
+            self._reader = create_engine(
+                engine.url,
+                poolclass=QueuePool,
+                pool_size=1,
+                max_overflow=0,
+                pool_pre_ping=True,
+                # Refreshes are serialized by the snapshot's lock, but may run on
+                # any thread
+                connect_args=(
+                    {"check_same_thread": False}
+                    if engine.dialect.name == "sqlite"
+                    else {}
+                ),
+            )
+        with Session(self._reader, autoflush=False) as reader:
+            yield reader
+
+    def refresh(self, session: Session):
+        """
+        Bring the snapshot up to date with the data committed to the database.
+        """
+        with self._lock, self._committed_session(session) as reader:
+            self._refresh(reader)
+
+    def _refresh(self, session: Session):
+        """
+        Refresh the snapshot, reading from a session that only sees committed data.
+        """
+        latest_history_id = session.exec(select(func.max(History.id))).one() or 0
+        fingerprint = (
+            *session.exec(
+                select(
+                    func.count(Node.id),  # pylint: disable=not-callable
+                    func.max(Node.id),
+                ),
+            ).one(),
+            session.exec(select(func.max(NodeRevision.id))).one(),
+            session.exec(select(func.max(Column.id))).one(),
+        )
+
+        if self.sync.fingerprint is None:
+            self._load(session, latest_history_id)
+        elif latest_history_id != self.sync.history_id:
+            changed = self._changed_nodes(session)
+            if changed is None:
+                self._load(session, latest_history_id)
+            else:
+                self._load(session, latest_history_id, changed)
+        elif fingerprint != self.sync.fingerprint:
+            self._load(session, latest_history_id)
+        self.sync.history_id = latest_history_id
+        self.sync.fingerprint = fingerprint
+
+    def _changed_nodes(self, session: Session) -> Optional[Set[str]]:
+        """
+        Names of the nodes that changed since the snapshot was last refreshed, based
+        on the history events that haven't been seen yet. Returns None if there are
+        too many changes for an incremental refresh.
+        """
+        events = session.exec(
+            select(History.id, History.node, History.entity_name).where(
+                History.id > self.sync.history_id - HISTORY_RESCAN_WINDOW,
+            ),
+        ).all()
+        changed: Set[str] = set()
+        for history_id, node_name, entity_name in events:
+            if history_id in self.sync.seen_history:
+                continue
+            self.sync.seen_history.add(history_id)
+            changed.update(name for name in (node_name, entity_name) if name)
+        if self.sync.seen_history:
+            oldest = max(self.sync.seen_history) - HISTORY_RESCAN_WINDOW
+            self.sync.seen_history = {
+                history_id
+                for history_id in self.sync.seen_history
+                if history_id > oldest
+            }
+        if len(changed) > MAX_INCREMENTAL_REFRESH:
+            return None
+        return changed
+
+    def _load(
+        self,
+        session: Session,
+        latest_history_id: int,
+        names: Optional[Set[str]] = None,
+    ):
+        """
+        Load the given nodes, or all nodes if no names are given, with a handful of
+        bulk queries.
+        """
+        if names is None:
+            self._clear(session, latest_history_id)
+        else:
+            for name in names:
+                self.remove(name)
+
+        statement = select(
+            Node.name,
+            Node.type,
+            Node.deactivated_at,
+            NodeRevision.id,
+        ).join(
+            NodeRevision,
+            (NodeRevision.node_id == Node.id)
+            & (NodeRevision.version == Node.current_version),
+        )
+        if names is not None:
+            statement = statement.where(
+                Node.name.in_(names),  # type: ignore  # pylint: disable=no-member
+            )
+        revisions = {
+            revision_id: SnapshotNode(
+                name=name,
+                type=node_type,
+                deactivated=bool(deactivated_at),
+            )
+            for name, node_type, deactivated_at, revision_id in session.exec(
+                statement,
+            ).all()
+        }
+        self._load_columns(session, revisions)
+        for node in self._load_parents(session, names, revisions):
+            self.add(node)
+
+    def _clear(self, session: Session, latest_history_id: int):
+        """
+        Empty the snapshot before reloading it in full.
+        """
+        self.nodes.clear()
+        self.children.clear()
+        self.linked_nodes.clear()
+        self.index.clear()
+        oldest = latest_history_id - HISTORY_RESCAN_WINDOW
+        self.sync.seen_history = {
+            history_id
+            for history_id in session.exec(
+                select(History.id).where(col(History.id) > oldest),
+            ).all()
+            if history_id is not None
+        }
+
+    @staticmethod
+    def _load_columns(session: Session, revisions: Dict[int, SnapshotNode]):
+        """
+        Load the columns of the nodes, keyed by their current revision ids.
+        """
+        dimension_node = aliased(Node)
+        columns = session.exec(
+            select(
+                NodeColumns.node_id,
+                Column.id,
+                Column.name,
+                Column.type,
+                dimension_node.name,
+            )
+            .join(Column, Column.id == NodeColumns.column_id)
+            .outerjoin(dimension_node, dimension_node.id == Column.dimension_id)
+            .where(
+                NodeColumns.node_id.in_(  # type: ignore  # pylint: disable=no-member
+                    list(revisions),
+                ),
+            )
+            .order_by(Column.id),
+        ).all()
+        attributes: Dict[int, Set[str]] = defaultdict(set)
+        for column_id, attribute_name in session.exec(
+            select(ColumnAttribute.column_id, AttributeType.name)
+            .join(AttributeType, AttributeType.id == ColumnAttribute.attribute_type_id)
+            .where(
+                ColumnAttribute.column_id.in_(  # type: ignore  # pylint: disable=no-member
+                    [column[1] for column in columns],
+                ),
+            ),
+        ).all():
+            attributes[column_id].add(attribute_name)
+        for revision_id, column_id, name, column_type, dimension in columns:
+            node = revisions[revision_id]
+            node.columns.append(
+                SnapshotColumn(
+                    name=name,
+                    type=column_type,
+                    dimension=dimension,
+                    attributes=attributes[column_id],
+                    path_name=f"{node.name}.{name}",
+                ),
+            )
+
+    @staticmethod
+    def _load_parents(
+        session: Session,
+        names: Optional[Set[str]],
+        revisions: Dict[int, SnapshotNode],
+    ) -> Iterable[SnapshotNode]:
+        """
+        Load the parents of the nodes, keyed by their current revision ids, and of
+        all of their other revisions.
+        """
+        parent_node = aliased(Node)
+        statement = (
+            select(Node.name, NodeRevision.id, parent_node.name)
+            .select_from(NodeRelationship)
+            .join(NodeRevision, NodeRevision.id == NodeRelationship.child_id)
+            .join(Node, Node.id == NodeRevision.node_id)
+            .join(parent_node, parent_node.id == NodeRelationship.parent_id)
+            .order_by(parent_node.id)
+        )
+        if names is not None:
+            statement = statement.where(
+                Node.name.in_(names),  # type: ignore  # pylint: disable=no-member
+            )
+        nodes = {node.name: node for node in revisions.values()}
+        for name, revision_id, parent in session.exec(statement).all():
+            if name not in nodes:
+                continue
+            nodes[name].revision_parents.add(parent)
+            if revision_id in revisions:
+                revisions[revision_id].parents.append(parent)
+        return nodes.values()
+
+
+def _path_name(revision: NodeRevision, column: Column) -> str:
+    """
+    The name of a column in join paths, prefixed by the name of a node revision that
+    it's on. Persisted columns are only ever on revisions of one node, so the one they
+    were loaded through is used, rather than loading all of them.
+    """
+    if inspect(column).persistent:
+        return f"{revision.name}.{column.name}"
+    return (
+        column.node_revisions[0].name + "." if column.node_revisions else ""
+    ) + column.name
+
+
+def _load_relationships(nodes: List[Node]):
+    """
+    Load the current revisions of the nodes, along with their columns and parents,
+    with a query per relationship rather than per node. Relationships that are
+    already loaded, including those with writes that aren't flushed yet, are kept.
+    """
+    sessions: Dict[Session, List[int]] = defaultdict(list)
+    for node in nodes:
+        session = Session.object_session(node)
+        if session is not None and node.id is not None:
+            sessions[session].append(node.id)
+    for session, node_ids in sessions.items():
+        session.exec(
+            select(Node)
+            .where(Node.id.in_(node_ids))  # type: ignore  # pylint: disable=no-member
+            .options(
+                selectinload(Node.current).options(
+                    selectinload(NodeRevision.columns)
+                    .joinedload(Column.attributes)
+                    .joinedload(ColumnAttribute.attribute_type),
+                    selectinload(NodeRevision.parents),
+                ),
+            ),
+        ).unique().all()
+
+
+_snapshots: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_snapshots_lock = threading.Lock()
+
+
+def get_dag_snapshot(session: Session) -> DAGSnapshot:
+    """
+    Get an up-to-date snapshot of the DAG stored in the session's database.
+    """
+    bind = session.get_bind()
+    with _snapshots_lock:
+        snapshot = _snapshots.get(bind)
+        if snapshot is None:
+            snapshot = _snapshots[bind] = DAGSnapshot()
+    snapshot.refresh(session)
+    return snapshot
@@ -4,6 +4,7 @@
 import collections
 import decimal
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
 from copy import deepcopy
 from dataclasses import dataclass, field, fields
 from enum import Enum
@@ -14,6 +15,7 @@ from typing import (
     Callable,
     Dict,
     Generic,
+    Iterable,
     Iterator,
     List,
     Optional,
@@ -27,9 +29,15 @@ from typing import (
 
 from sqlmodel import Session
 
-from datajunction_server.construction.utils import get_dj_node, to_namespaced_name
+from datajunction_server.construction.utils import (
+    get_dj_node,
+    get_dj_nodes,
+    to_namespaced_name,
+)
 from datajunction_server.errors import DJError, DJErrorException, DJException, ErrorCode
+from datajunction_server.instrumentation import timed
 from datajunction_server.models.node import BuildCriteria
+from datajunction_server.models.node import Node as DJNodeRecord
 from datajunction_server.models.node import NodeRevision
 from datajunction_server.models.node import NodeRevision as DJNode
 from datajunction_server.models.node import NodeType
@@ -73,10 +81,150 @@ def flatten(maybe_iterables: Any) -> Iterator:
     )
 
 
+class ScopeIndex:
+    """
+    Lookups for resolving columns while a query is compiled, so that each column
+    doesn't scan the whole AST: the table expressions in the FROM and LATERAL VIEW
+    clauses of each query scope, which of them are compiled, and the columns of each
+    of those tables by name.
+
+    The AST isn't restructured while it's compiled, so the index is only kept for
+    the duration of the outermost ``Query.compile``.
+    """
+
+    def __init__(self):
+        self._tables: Dict[int, Tuple["Query", List["TableExpression"]]] = {}
+        self._compiled: Dict[int, "TableExpression"] = {}
+        self._columns: Dict[int, "_ColumnIndex"] = {}
+
+    def tables(self, query: "Query") -> List["TableExpression"]:
+        """
+        The table expressions that columns directly in the query's scope can
+        come from.
+        """
+        entry = self._tables.get(id(query))
+        if entry is None or entry[0] is not query:
+            entry = (query, list(query.scope_tables()))
+            self._tables[id(query)] = entry
+        return entry[1]
+
+    def is_compiled(self, table: "TableExpression") -> bool:
+        """
+        Whether a table expression is compiled. Compiled tables stay compiled, so
+        subqueries aren't scanned again once they are.
+        """
+        if self._compiled.get(id(table)) is table:
+            return True
+        if table.is_compiled():
+            self._compiled[id(table)] = table
+            return True
+        return False
+
+    def columns(
+        self,
+        table: "TableExpression",
+        name: str,
+    ) -> List["Expression"]:
+        """
+        The columns of a table that a column named ``name`` could refer to.
+        """
+        return self._column_index(table).candidates(name)
+
+    def count(self, table: "TableExpression", name: str) -> int:
+        """
+        The number of columns of a table named ``name``.
+        """
+        return self._column_index(table).counts[name]
+
+    def _column_index(self, table: "TableExpression") -> "_ColumnIndex":
+        index = self._columns.get(id(table))
+        if index is None or not index.is_valid(table):
+            index = _ColumnIndex(table)
+            self._columns[id(table)] = index
+        return index
+
+
+class _ColumnIndex:
+    """
+    The columns of a table by name, along with which of them are structs. Columns
+    are checked in order, and the type of a column is only looked at once the
+    columns before it have been checked, as when scanning them.
+    """
+
+    def __init__(self, table: "TableExpression"):
+        self.table = table
+        self.key = (len(table._columns), len(table.column_list))
+        self.columns = [
+            col for col in table.columns if isinstance(col, (Aliasable, Named))
+        ]
+        self.positions: Dict[str, int] = {}
+        self.counts: Dict[str, int] = collections.Counter()
+        for position, col in enumerate(self.columns):
+            self.positions.setdefault(col.alias_or_name.name, position)
+            self.counts[col.alias_or_name.name] += 1
+        self.structs: List[int] = []
+        self._typed = 0
+
+    def is_valid(self, table: "TableExpression") -> bool:
+        """
+        Whether the table's columns are the same as when the index was built.
+        """
+        return self.table is table and self.key == (
+            len(table._columns),
+            len(table.column_list),
+        )
+
+    def candidates(self, name: str) -> List["Expression"]:
+        """
+        The struct columns before the first column named ``name``, followed by that
+        column, in order.
+        """
+        position = self.positions.get(name, len(self.columns))
+        while self._typed < position:
+            if isinstance(self.columns[self._typed].type, StructType):
+                self.structs.append(self._typed)
+            self._typed += 1
+        candidates = [
+            self.columns[struct] for struct in self.structs if struct < position
+        ]
+        if position < len(self.columns):
+            candidates.append(self.columns[position])
+        return candidates
+
+
 @dataclass
 class CompileContext:
     session: Session
     exception: DJException
+    scopes: Optional[ScopeIndex] = field(default=None, repr=False)
+    # DJ nodes by name, shared by everything compiled with this context
+    nodes: Dict[str, Optional[DJNodeRecord]] = field(default_factory=dict, repr=False)
+
+    def load_nodes(self, node_names: Iterable[str]):
+        """
+        Load the DJ nodes that haven't been loaded yet in a single query, recording
+        those that don't exist.
+        """
+        node_names = {name for name in node_names if name not in self.nodes}
+        if node_names:
+            loaded = get_dj_nodes(self.session, node_names)
+            for name in node_names:
+                self.nodes[name] = loaded.get(name)
+
+    @contextmanager
+    def scope_index(self) -> Iterator[ScopeIndex]:
+        """
+        Index the query scopes while compiling, unless they're already indexed by a
+        compilation that's in progress.
+        """
+        if self.scopes is not None:
+            yield self.scopes
+            return
+        self.scopes = ScopeIndex()
+        try:
+            yield self.scopes
+        finally:
+            self.scopes = None
 
 
 # typevar used for node methods that return self
@@ -149,8 +297,10 @@ class Node(ABC):
             return
 
         object.__setattr__(self, key, value)
+        if key.startswith("_"):
+            return
         for child in flatten(value):
-            if isinstance(child, Node) and not key.startswith("_"):
+            if isinstance(child, Node):
                 child.set_parent(self, key)
 
     def swap(self: TNode, other: "Node") -> TNode:
@@ -807,15 +957,18 @@ class Column(Aliasable, Named, Expression):
             Query,
             self.get_nearest_parent_of_type(Query),
         )
-        direct_tables = list(
-            filter(
-                lambda tbl: tbl.in_from_or_lateral()
-                and tbl.get_nearest_parent_of_type(Query) is query,
-                query.find_all(TableExpression),
-            ),
+        direct_tables = (
+            ctx.scopes.tables(query)
+            if ctx.scopes is not None
+            else list(query.scope_tables())
         )
         for table in direct_tables:
-            if not table.is_compiled():
+            compiled = (
+                ctx.scopes.is_compiled(table)
+                if ctx.scopes is not None
+                else table.is_compiled()
+            )
+            if not compiled:
                 table.compile(ctx)
 
         namespace = (
@@ -834,9 +987,14 @@ class Column(Aliasable, Named, Expression):
             # The column's namespace may match the name of a column on the table, which
             # implies that the column on the table is likely a struct and the dereferencing
             # will happen on the struct object
-            for col in table.columns:
-                if col.alias_or_name.name == namespace:
-                    table.add_ref_column(self, ctx)
+            if ctx.scopes is not None:
+                matches = ctx.scopes.count(table, namespace)
+            else:
+                matches = sum(
+                    1 for col in table.columns if col.alias_or_name.name == namespace
+                )
+            for _ in range(matches):
+                table.add_ref_column(self, ctx)
 
         if found:
             return found
@@ -887,6 +1045,7 @@ class Column(Aliasable, Named, Expression):
             if isinstance(current_table, Table) and current_table.dj_node:
                 for dj_col in current_table.dj_node.columns:
                     if dj_col.dimension:
+                        ctx.nodes.setdefault(dj_col.dimension.name, dj_col.dimension)
                         new_table = Table(
                             name=to_namespaced_name(dj_col.dimension.name),
                             _dj_node=dj_col.dimension.current,
@@ -1074,7 +1233,12 @@ class TableExpression(Aliasable, Expression):
                         column.add_type(col.type)
                         return True
 
-        for col in self.columns:
+        columns = (
+            ctx.scopes.columns(self, column.name.name)
+            if ctx is not None and ctx.scopes is not None
+            else self.columns
+        )
+        for col in columns:
             if isinstance(col, (Aliasable, Named)):
                 if column.name.name == col.alias_or_name.name:
                     self._ref_columns.append(column)
@@ -1169,6 +1333,7 @@ class Table(TableExpression, Named):
                     ctx.session,
                     self.identifier(quotes=False),
                     {DJNodeType.SOURCE, DJNodeType.TRANSFORM, DJNodeType.DIMENSION},
+                    nodes=ctx.nodes,
                 )
                 self.set_dj_node(dj_node)
             self._columns = [
@@ -2315,17 +2480,39 @@ class Query(TableExpression, UnNamed):
             self.filter(lambda node: node is not self and not node.is_compiled()),
         )
 
+    def scope_tables(self) -> Iterator[TableExpression]:
+        """
+        The table expressions in the FROM and LATERAL VIEW clauses of this query,
+        not counting those of nested queries.
+        """
+
+        def scope_tables(node: Node) -> Iterator[TableExpression]:
+            for child in node.children:
+                if isinstance(child, TableExpression) and child.in_from_or_lateral():
+                    yield child
+                if not isinstance(child, Query):
+                    yield from scope_tables(child)
+
+        return scope_tables(self)
+
     def compile(self, ctx: CompileContext):
         if self._is_compiled:
             return
-        self.apply(
-            lambda node: node is not self
-            and not node.is_compiled()
-            and node.compile(ctx),
-        )
-        for expr in self.select.projection:
-            self._columns += expr.columns
-        self._is_compiled = True
+        with timed("compile"), ctx.scope_index():
+            # resolve all the tables in the query at once, instead of one by one
+            ctx.load_nodes(
+                table.identifier(quotes=False)
+                for table in self.find_all(Table)
+                if table.dj_node is None
+            )
+            self.apply(
+                lambda node: node is not self
+                and not node.is_compiled()
+                and node.compile(ctx),
+            )
+            for expr in self.select.projection:
+                self._columns += expr.columns
+            self._is_compiled = True
 
     def bake_ctes(self) -> "Query":
         """
@@ -11,6 +11,7 @@ from antlr4.error.Errors import ParseCancellationException
 from antlr4.error.ErrorStrategy import BailErrorStrategy
 
 import datajunction_server.sql.parsing.types as ct
+from datajunction_server.instrumentation import timed
 from datajunction_server.sql.parsing import ast
 from datajunction_server.sql.parsing.ast import UnaryOpKind
 from datajunction_server.sql.parsing.backends.exceptions import DJParseException
@@ -23,6 +24,7 @@ from datajunction_server.sql.parsing.backends.grammar.generated.SqlBaseParser im
 from datajunction_server.sql.parsing.backends.grammar.generated.SqlBaseParser import (
     SqlBaseParser as sbp,
 )
+from datajunction_server.sql.parsing.cache import parse_cache
 
 if TYPE_CHECKING:
     from datajunction_server.sql.parsing.types import ColumnType
@@ -172,7 +174,16 @@ def tree_to_strings(tree, indent=0):
 
 def parse_rule(sql: str, rule: str) -> Union[ast.Node, "ColumnType"]:
     """
-    Parse a string into a DJ ast using the ANTLR4 backend.
+    Parse a string into a DJ ast using the ANTLR4 backend. Results are served
+    from the process-wide parse cache when the same SQL was parsed before.
+    """
+    with timed("parse"):
+        return parse_cache.get_or_parse(sql, rule, lambda: _parse_rule(sql, rule))
+
+
+def _parse_rule(sql: str, rule: str) -> Union[ast.Node, "ColumnType"]:
+    """
+    Parse a string into a DJ ast using the ANTLR4 backend, bypassing the cache.
     """
     antlr_tree = parse_sql(sql, rule)
     ast_tree = visit(antlr_tree)
@@ -1059,30 +1070,12 @@ def _(ctx: sbp.LambdaContext) -> ast.Lambda:
 
 @visit.register
 def _(ctx: sbp.PrimitiveDataTypeContext) -> ast.Value:
-    column_type = ctx.getText().strip()
-    decimal_match = ct.DECIMAL_REGEX.match(column_type)
-    if decimal_match:
-        precision = int(decimal_match.group("precision"))
-        scale = int(decimal_match.group("scale"))
-        return ct.DecimalType(precision, scale)
-
-    fixed_match = ct.FIXED_PARSER.match(column_type)
-    if fixed_match:
-        length = int(fixed_match.group("length"))
-        return ct.FixedType(length)
-
-    varchar_match = ct.VARCHAR_PARSER.match(column_type)
-    if varchar_match:
-        length = varchar_match.group("length")
-        return ct.VarcharType(length) if length else ct.VarcharType()
-
-    column_type = column_type.lower().strip("()")
-    try:
-        return ct.PRIMITIVE_TYPES[column_type]
-    except KeyError as exc:
+    column_type = ct.primitive_type(ctx.getText().strip())
+    if column_type is None:
         raise DJParseException(
             f"DJ does not recognize the type `{ctx.getText()}`.",
-        ) from exc
+        )
+    return column_type
 
 
 @visit.register
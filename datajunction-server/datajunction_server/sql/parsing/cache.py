@@ -0,0 +1,229 @@
+"""
+Process-wide cache of parsed DJ ASTs.
+
+Parsing with the pure-Python ANTLR4 runtime is by far the most expensive part of
+turning a SQL string into a DJ AST, and the same node queries are parsed over and
+over while building SQL. This cache is content-addressed: entries are keyed by a
+hash of the rule name and SQL text, so it never needs to be invalidated when nodes
+change -- new query text simply hashes to a new key.
+
+Callers freely mutate the trees they get back (compilation, swapping in CTEs, etc),
+so cached trees are never handed out directly. Each entry is kept as a pickled
+snapshot and every lookup unpickles a fresh, fully independent copy, which is much
+cheaper than re-parsing (and than ``deepcopy``, which shares ``Function`` subtrees).
+Column types are immutable and interned, so they are kept by reference rather than
+being pickled, except for struct fields and types with structs in them: struct
+fields hold AST names, which are mutable, so those are pickled along with the rest
+of the tree.
+"""
+import hashlib
+import io
+import pickle
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, List, Tuple
+
+from datajunction_server.sql.parsing import ast
+from datajunction_server.sql.parsing.type_parser import STRUCT_REGEX
+from datajunction_server.sql.parsing.types import ColumnType, NestedField
+
+DEFAULT_PARSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+@dataclass
+class ParseCacheStats:
+    """
+    Counters describing the parse cache's effectiveness.
+    """
+
+    hits: int
+    misses: int
+    entries: int
+    size_bytes: int
+    max_bytes: int
+
+
+def _new_node(cls):
+    """
+    Create an empty AST node or column type, bypassing any custom ``__new__``.
+    """
+    return object.__new__(cls)
+
+
+def _has_struct(column_type: ColumnType) -> bool:
+    """
+    Whether a column type is a struct field, or has a struct type in it.
+    """
+    return (
+        isinstance(column_type, NestedField)
+        or STRUCT_REGEX.search(str(column_type)) is not None
+    )
+
+
+class ASTPickler(pickle.Pickler):
+    """
+    Pickles DJ ASTs. Column types are stored out-of-band as persistent references
+    in ``refs`` instead of being pickled, unless they have structs in them.
+    """
+
+    def __init__(self, file, refs: List[Any]):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.refs = refs
+
+    def reducer_override(self, obj):
+        """
+        Reduce functions to plain AST nodes: ``Function.__new__`` dispatches on the
+        function name, which isn't available yet when the name is part of a
+        reference cycle being unpickled. Column types with structs are reduced the
+        same way, so that unpickling them doesn't go through their interning.
+        """
+        if isinstance(obj, ast.Function):
+            return _new_node, (type(obj),), obj.__dict__
+        if isinstance(obj, ColumnType) and _has_struct(obj):
+            return _new_node, (type(obj),), obj.__getstate__()
+        return NotImplemented
+
+    def persistent_id(self, obj):  # pylint: disable=method-hidden
+        if isinstance(obj, ColumnType) and not _has_struct(obj):
+            self.refs.append(obj)
+            return len(self.refs) - 1
+        return None
+
+
+class ASTUnpickler(pickle.Unpickler):
+    """
+    Unpickles DJ ASTs pickled with ``ASTPickler``.
+    """
+
+    def __init__(self, file, refs: List[Any]):
+        super().__init__(file)
+        self.refs = refs
+
+    def persistent_load(self, pid):  # pylint: disable=method-hidden
+        return self.refs[pid]
+
+
+def snapshot(value: Any) -> Tuple[bytes, List[Any]]:
+    """
+    Take a snapshot of a parsed value that can be restored any number of times.
+    """
+    buffer = io.BytesIO()
+    refs: List[Any] = []
+    ASTPickler(buffer, refs).dump(value)
+    return buffer.getvalue(), refs
+
+
+def restore(payload: bytes, refs: List[Any]) -> Any:
+    """
+    Restore an independent copy of a snapshotted value.
+    """
+    return ASTUnpickler(io.BytesIO(payload), refs).load()
+
+
+def cache_key(sql: str, rule: str) -> str:
+    """
+    Content-addressed key for a given SQL string parsed with a given grammar rule.
+    """
+    digest = hashlib.sha256()
+    digest.update(rule.encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update(sql.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ParseCache:
+    """
+    A thread-safe LRU cache of parsed ASTs, bounded by the total size in bytes of
+    the pickled snapshots it holds rather than by the number of entries.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_PARSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.size_bytes = 0
+        self._entries: "OrderedDict[str, Tuple[bytes, List[Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_or_parse(self, sql: str, rule: str, parser: Callable[[], Any]) -> Any:
+        """
+        Return a fresh copy of the parsed value for `sql` under `rule`, calling
+        `parser` to produce it on a cache miss. Parse errors are never cached.
+        """
+        if self.max_bytes <= 0:
+            return parser()
+
+        key = cache_key(sql, rule)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if entry is not None:
+            return restore(*entry)
+
+        value = parser()
+        self._store(key, snapshot(value))
+        return value
+
+    def _store(self, key: str, entry: Tuple[bytes, List[Any]]):
+        """
+        Add an entry, evicting the least recently used entries to stay under the cap.
+        """
+        if len(entry[0]) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = entry
+            self.size_bytes += len(entry[0])
+            self._evict()
+
+    def _evict(self):
+        """
+        Evict least recently used entries until the cache fits within `max_bytes`.
+        Must be called with the lock held.
+        """
+        while self.size_bytes > self.max_bytes and self._entries:
+            _, (payload, _) = self._entries.popitem(last=False)
+            self.size_bytes -= len(payload)
+
+    def resize(self, max_bytes: int):
+        """
+        Change the size cap of the cache, evicting entries if needed.
+        """
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        """
+        Drop all entries and reset the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> ParseCacheStats:
+        """
+        Snapshot of the cache's counters.
+        """
+        with self._lock:
+            return ParseCacheStats(
+                hits=self.hits,
+                misses=self.misses,
+                entries=len(self._entries),
+                size_bytes=self.size_bytes,
+                max_bytes=self.max_bytes,
+            )
+
+
+parse_cache = ParseCache()
@@ -0,0 +1,180 @@
+"""
+Compact binary serialization of parsed DJ ASTs.
+
+Node revisions store their parsed query alongside the raw query text so that SQL
+builds can load the AST instead of running the ANTLR4 parser. A serialized AST has
+the layout:
+
+    MAGIC | schema version length (1 byte) | schema version | sha256(query)
+          | HMAC-SHA256(key=DJ secret, header + body) | zlib(pickle)
+
+The schema version ties the payload to the parser and AST definitions that produced
+it, and the query digest ties it to the exact query text. A payload that doesn't
+match either is considered stale and callers fall back to parsing the query.
+
+Payloads are read back from the metadata database, and unpickling can run code, so
+they are signed with the DJ secret and the signature is checked before anything is
+unpickled. Without a secret, ASTs are neither stored nor loaded.
+"""
+import hashlib
+import hmac
+import io
+import logging
+import pickle
+import zlib
+from typing import Optional
+
+from datajunction_server.__about__ import __version__
+from datajunction_server.sql.parsing import ast
+from datajunction_server.sql.parsing.cache import ASTPickler
+from datajunction_server.sql.parsing.types import ColumnType, Singleton
+from datajunction_server.utils import get_settings
+
+_logger = logging.getLogger(__name__)
+
+# Bump this whenever a change to the grammar, the ANTLR4 visitor or the AST node
+# definitions would make previously serialized ASTs invalid.
+AST_FORMAT_VERSION = 1
+AST_SCHEMA_VERSION = f"{__version__}+{AST_FORMAT_VERSION}".encode("ascii")
+
+MAGIC = b"DJAST"
+QUERY_DIGEST_SIZE = 32
+SIGNATURE_SIZE = 32
+
+# Only classes from the parsing package may be loaded from a serialized AST
+ALLOWED_MODULE_PREFIX = "datajunction_server.sql.parsing."
+ALLOWED_MODULES = {"decimal"}
+
+
+def _new_column_type(cls):
+    """
+    Create an empty column type, to be populated from its pickled state.
+    """
+    return object.__new__(cls)
+
+
+def _singleton_column_type(cls):
+    """
+    Look up the shared instance of a singleton column type.
+    """
+    return cls.shared_instance()
+
+
+class PersistedASTPickler(ASTPickler):
+    """
+    Pickles DJ ASTs for storage outside of this process. Unlike ``ASTPickler``,
+    column types are pickled along with the rest of the tree.
+    """
+
+    def __init__(self, file):
+        super().__init__(file, refs=[])
+
+    def reducer_override(self, obj):
+        if isinstance(obj, Singleton):
+            return _singleton_column_type, (type(obj),)
+        if isinstance(obj, ColumnType):
+            return _new_column_type, (type(obj),), obj.__getstate__()
+        return super().reducer_override(obj)
+
+    def persistent_id(self, obj):  # pylint: disable=method-hidden
+        return None
+
+
+class PersistedASTUnpickler(pickle.Unpickler):
+    """
+    Unpickles DJ ASTs pickled with ``PersistedASTPickler``, refusing to load any
+    class that doesn't belong to the parsing package.
+    """
+
+    def find_class(self, module, name):
+        if module.startswith(ALLOWED_MODULE_PREFIX) or module in ALLOWED_MODULES:
+            return super().find_class(module, name)
+        raise pickle.UnpicklingError(f"Cannot load {module}.{name} from a DJ AST")
+
+
+def query_digest(query: str) -> bytes:
+    """
+    Digest of the query text that a serialized AST was parsed from.
+    """
+    return hashlib.sha256(query.encode("utf-8")).digest()
+
+
+def _signing_key() -> Optional[bytes]:
+    """
+    The key that payloads are signed with, if a DJ secret is configured.
+    """
+    secret = get_settings().secret
+    return secret.encode("utf-8") if secret else None
+
+
+def _sign(key: bytes, header: bytes, body: bytes) -> bytes:
+    """
+    Signature of a payload's header and pickled body.
+    """
+    return hmac.new(key, header + body, hashlib.sha256).digest()
+
+
+def serialize_query_ast(query: str, tree: ast.Query) -> Optional[bytes]:
+    """
+    Serialize the parsed AST of ``query`` into a compact binary payload. Returns
+    None if there is no secret to sign it with.
+    """
+    key = _signing_key()
+    if key is None:
+        return None
+    buffer = io.BytesIO()
+    PersistedASTPickler(buffer).dump(tree)
+    header = b"".join(
+        [
+            MAGIC,
+            bytes([len(AST_SCHEMA_VERSION)]),
+            AST_SCHEMA_VERSION,
+            query_digest(query),
+        ],
+    )
+    body = zlib.compress(buffer.getvalue())
+    return header + _sign(key, header, body) + body
+
+
+def _header_size(query: str, payload: bytes) -> Optional[int]:
+    """
+    Size of the header of a payload, i.e., the offset of its signature, or None if
+    it isn't a serialized AST of ``query`` with the current AST schema version.
+    """
+    if len(payload) <= len(MAGIC) or not payload.startswith(MAGIC):
+        return None
+    offset = len(MAGIC)
+    version_size = payload[offset]
+    offset += 1
+    if payload[offset : offset + version_size] != AST_SCHEMA_VERSION:
+        return None
+    offset += version_size
+    if payload[offset : offset + QUERY_DIGEST_SIZE] != query_digest(query):
+        return None
+    return offset + QUERY_DIGEST_SIZE
+
+
+def deserialize_query_ast(query: str, payload: Optional[bytes]) -> Optional[ast.Query]:
+    """
+    Load the AST for ``query`` from a serialized payload. Returns None if there is
+    no payload, if it is stale, i.e., it was produced by a different AST schema
+    version or from different query text, or if its signature doesn't match.
+    """
+    key = _signing_key()
+    if key is None or not payload:
+        return None
+    offset = _header_size(query, payload)
+    if offset is None:
+        return None
+    header = payload[:offset]
+    signature = payload[offset : offset + SIGNATURE_SIZE]
+    body = payload[offset + SIGNATURE_SIZE :]
+    if not hmac.compare_digest(signature, _sign(key, header, body)):
+        _logger.warning("Ignoring serialized AST with an invalid signature")
+        return None
+    try:
+        tree = PersistedASTUnpickler(io.BytesIO(zlib.decompress(body))).load()
+    except Exception:  # pylint: disable=broad-except
+        _logger.warning("Unable to load serialized AST, will re-parse", exc_info=True)
+        return None
+    return tree if isinstance(tree, ast.Query) else None
@@ -0,0 +1,223 @@
+"""
+Fast parsing of column type strings.
+
+Every column read from the database, and every column type that's validated, is
+turned from a string like ``bigint`` or ``struct<a:int,b:array<string>>`` into a
+``ColumnType``. Running the ANTLR parser for that is far more expensive than the
+strings warrant, so the ``dataType`` grammar is parsed here by recursive descent
+instead. The results are memoized, except for types with structs in them: struct
+fields hold AST names, which are mutable, so those are only ever shared through the
+interning done by the types themselves.
+
+Anything outside of the common subset of the grammar -- comments on struct fields,
+year-month or open-ended intervals, trailing input, or a type string that isn't
+valid -- falls back to the ANTLR parser, so both always return the same types and
+raise the same errors.
+"""
+import re
+from functools import lru_cache
+from typing import List, Optional, cast
+
+from datajunction_server.sql.parsing import ast
+from datajunction_server.sql.parsing import types as ct
+
+TYPE_CACHE_SIZE = 4096
+
+TOKEN_REGEX = re.compile(
+    r"\s*(?:(?P<word>\w+)|`(?P<quoted>[^`]*)`|(?P<symbol>[<>,():]))",
+)
+
+STRUCT_REGEX = re.compile(r"struct\s*<", re.IGNORECASE)
+
+DAY_TIME_UNITS = ("DAY", "HOUR", "MINUTE", "SECOND")
+
+
+class UnsupportedTypeString(Exception):
+    """
+    Raised when a type string needs the ANTLR parser.
+    """
+
+
+class TypeStringParser:
+    """
+    A recursive descent parser for the ``dataType`` rule of the grammar.
+    """
+
+    def __init__(self, type_string: str):
+        self.tokens: List[str] = []
+        self.quoted: List[bool] = []
+        position = 0
+        type_string = type_string.rstrip()
+        while position < len(type_string):
+            match = TOKEN_REGEX.match(type_string, position)
+            if not match:
+                raise UnsupportedTypeString(type_string)
+            if match.group("quoted") is not None:
+                self.tokens.append(match.group("quoted"))
+                self.quoted.append(True)
+            else:
+                self.tokens.append(match.group("word") or match.group("symbol"))
+                self.quoted.append(False)
+            position = match.end()
+        self.position = 0
+
+    def parse(self) -> ct.ColumnType:
+        """
+        Parse the whole type string.
+        """
+        column_type = self.data_type()
+        if self.peek() is not None:
+            raise UnsupportedTypeString(self.tokens[self.position])
+        return column_type
+
+    def peek(self) -> Optional[str]:
+        """
+        The next token, if any.
+        """
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def next(self) -> str:
+        """
+        Consume the next token.
+        """
+        token = self.peek()
+        if token is None:
+            raise UnsupportedTypeString("Unexpected end of type string")
+        self.position += 1
+        return token
+
+    def expect(self, token: str):
+        """
+        Consume the next token, which has to be ``token``.
+        """
+        if self.next() != token:
+            raise UnsupportedTypeString(f"Expected `{token}`")
+
+    def is_quoted(self) -> bool:
+        """
+        Whether the next token is a backquoted identifier.
+        """
+        return self.position < len(self.quoted) and self.quoted[self.position]
+
+    def word(self) -> str:
+        """
+        Consume an unquoted identifier or keyword.
+        """
+        quoted = self.is_quoted()
+        token = self.next()
+        if quoted or not re.match(r"\w", token):
+            raise UnsupportedTypeString(token)
+        return token
+
+    def data_type(self) -> ct.ColumnType:
+        """
+        ``dataType``: a complex type, an interval or a primitive type.
+        """
+        name = self.word()
+        keyword = name.upper()
+        if keyword in ("ARRAY", "MAP", "STRUCT") and self.peek() == "<":
+            self.next()
+            if keyword == "ARRAY":
+                column_type: ct.ColumnType = ct.ListType(self.data_type())
+            elif keyword == "MAP":
+                key_type = self.data_type()
+                self.expect(",")
+                column_type = ct.MapType(key_type, self.data_type())
+            else:
+                column_type = self.struct_type()
+            self.expect(">")
+            return column_type
+        if keyword == "INTERVAL":
+            return self.interval_type()
+        return self.primitive_type(name)
+
+    def struct_type(self) -> ct.StructType:
+        """
+        The fields of a struct, up to its closing ``>``.
+        """
+        fields: List[ct.NestedField] = []
+        while self.peek() != ">":
+            if fields:
+                self.expect(",")
+            fields.append(self.struct_field())
+        return ct.StructType(*fields)
+
+    def struct_field(self) -> ct.NestedField:
+        """
+        ``complexColType``, without a comment.
+        """
+        if self.is_quoted():
+            name = ast.Name(self.next(), quote_style="`")
+        else:
+            name = ast.Name(self.word())
+        if self.peek() == ":":
+            self.next()
+        field_type = self.data_type()
+        is_optional = True
+        if (self.peek() or "").upper() == "NOT":
+            self.next()
+            if self.word().upper() != "NULL":
+                raise UnsupportedTypeString("Expected `NULL`")
+            is_optional = False
+        if self.peek() not in (",", ">"):
+            raise UnsupportedTypeString("Unsupported struct field")
+        return ct.NestedField(name, field_type, is_optional)
+
+    def interval_type(self) -> ct.ColumnType:
+        """
+        A day-time interval between two units.
+        """
+        from_ = self.word().upper()
+        if (self.peek() or "").upper() != "TO":
+            raise UnsupportedTypeString("Interval without an end unit")
+        self.next()
+        to_ = self.word().upper()
+        if from_ in DAY_TIME_UNITS and to_ in DAY_TIME_UNITS[1:]:
+            return ct.DayTimeIntervalType(from_, to_)  # type: ignore
+        raise UnsupportedTypeString(f"Unsupported interval {from_} TO {to_}")
+
+    def primitive_type(self, name: str) -> ct.ColumnType:
+        """
+        ``primitiveDataType``: a type name, with optional integer parameters.
+        """
+        type_string = name
+        if self.peek() == "(":
+            self.next()
+            parameters = [self.word()]
+            while self.peek() == ",":
+                self.next()
+                parameters.append(self.word())
+            self.expect(")")
+            if not all(parameter.isdigit() for parameter in parameters):
+                raise UnsupportedTypeString("Non-integer type parameters")
+            type_string += f"({','.join(parameters)})"
+        column_type = ct.primitive_type(type_string)
+        if column_type is None:
+            raise UnsupportedTypeString(type_string)
+        return column_type
+
+
+def parse_column_type(type_string: str) -> ct.ColumnType:
+    """
+    Parse a column type string into a ``ColumnType``, like the ``dataType`` rule of
+    the ANTLR parser would. Types without structs are memoized.
+    """
+    if STRUCT_REGEX.search(type_string):
+        return _parse_column_type(type_string)
+    return _parse_shared_column_type(type_string)
+
+
+@lru_cache(maxsize=TYPE_CACHE_SIZE)
+def _parse_shared_column_type(type_string: str) -> ct.ColumnType:
+    return _parse_column_type(type_string)
+
+
+def _parse_column_type(type_string: str) -> ct.ColumnType:
+    try:
+        return TypeStringParser(type_string).parse()
+    except UnsupportedTypeString:
+        from datajunction_server.sql.parsing.backends.antlr4 import (  # pylint: disable=import-outside-toplevel
+            parse_rule,
+        )
+
+        return cast(ct.ColumnType, parse_rule(type_string, "dataType"))
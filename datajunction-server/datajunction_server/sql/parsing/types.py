@@ -14,7 +14,7 @@ field_type=IntegerType(), is_optional=True, doc='an optional field'))
 
 import re
 from enum import Enum
-from typing import TYPE_CHECKING, Any, ClassVar, Dict, Generator, Optional, Tuple, cast
+from typing import TYPE_CHECKING, Any, ClassVar, Dict, Generator, Optional, Tuple
 
 from pydantic import BaseModel, Extra
 from pydantic.class_validators import AnyCallable
@@ -40,6 +40,13 @@ class Singleton:  # pylint: disable=too-few-public-methods
             cls._instance = super(Singleton, cls).__new__(cls)
         return cls._instance
 
+    @classmethod
+    def shared_instance(cls):
+        """
+        The shared instance of the type, creating it if there isn't one yet.
+        """
+        return cls._instance if isinstance(cls._instance, cls) else cls()
+
 
 class ColumnType(BaseModel):
     """
@@ -91,11 +98,11 @@ class ColumnType(BaseModel):
         """
         Parses the column type
         """
-        from datajunction_server.sql.parsing.backends.antlr4 import (  # pylint: disable=import-outside-toplevel
-            parse_rule,
+        from datajunction_server.sql.parsing.type_parser import (  # pylint: disable=import-outside-toplevel,cyclic-import
+            parse_column_type,
         )
 
-        return cast(ColumnType, parse_rule(str(v), "dataType"))
+        return parse_column_type(str(v))
 
     def __eq__(self, other: "ColumnType"):  # type: ignore
         """
@@ -927,3 +934,27 @@ PRIMITIVE_TYPES: Dict[str, PrimitiveType] = {
     "none": NullType(),
     "null": NullType(),
 }
+
+
+def primitive_type(type_string: str) -> Optional[ColumnType]:
+    """
+    The primitive type for a type name and its parameters, without whitespace (e.g.,
+    ``decimal(10,2)``), or ``None`` when the name isn't a known type.
+    """
+    decimal_match = DECIMAL_REGEX.match(type_string)
+    if decimal_match:
+        precision = int(decimal_match.group("precision"))
+        scale = int(decimal_match.group("scale"))
+        return DecimalType(precision, scale)
+
+    fixed_match = FIXED_PARSER.match(type_string)
+    if fixed_match:
+        length = int(fixed_match.group("length"))
+        return FixedType(length)
+
+    varchar_match = VARCHAR_PARSER.match(type_string)
+    if varchar_match:
+        varchar_length = varchar_match.group("length")
+        return VarcharType(int(varchar_length)) if varchar_length else VarcharType()
+
+    return PRIMITIVE_TYPES.get(type_string.lower().strip("()"))
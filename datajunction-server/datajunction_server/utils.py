@@ -54,12 +54,19 @@ def get_settings() -> Settings:
 
 def get_engine() -> Engine:
     """
-    Create the metadata engine.
+    Return the metadata engine.
     """
     settings = get_settings()
-    engine = create_engine(settings.index)
+    return _get_engine(settings.index)
 
-    return engine
+
+@lru_cache
+def _get_engine(index: str) -> Engine:
+    """
+    Create the metadata engine, shared across requests so that they share its
+    connection pool and the DAG snapshot that's kept for it.
+    """
+    return create_engine(index)
 
 
 def get_session() -> Iterator[Session]:
@@ -79,7 +86,46 @@ def get_query_service_client() -> Optional[QueryServiceClient]:
     settings = get_settings()
     if not settings.query_service:  # pragma: no cover
         return None
-    return QueryServiceClient(settings.query_service)
+    return _get_query_service_client(
+        settings.query_service,
+        settings.query_service_timeout,
+        settings.query_service_query_timeout,
+        settings.query_service_max_connections,
+    )
+
+
+_query_service_clients: List[QueryServiceClient] = []
+
+
+@lru_cache
+def _get_query_service_client(
+    uri: str,
+    timeout: float,
+    query_timeout: float,
+    max_connections: int,
+) -> QueryServiceClient:
+    """
+    Return a query service client that's shared across requests, so that they share
+    its connection pool.
+    """
+    client = QueryServiceClient(
+        uri,
+        timeout=timeout,
+        query_timeout=query_timeout,
+        max_connections=max_connections,
+    )
+    _query_service_clients.append(client)
+    return client
+
+
+def close_query_service_clients() -> None:
+    """
+    Close the query service clients shared across requests, when the server shuts
+    down.
+    """
+    _get_query_service_client.cache_clear()
+    while _query_service_clients:
+        _query_service_clients.pop().close()
 
 
 def get_issue_url(
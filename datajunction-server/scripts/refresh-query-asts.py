@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# pylint: skip-file
+
+import argparse
+
+from sqlmodel import Session
+
+from datajunction_server.internal.nodes import refresh_query_asts
+from datajunction_server.utils import get_engine
+
+
+def refresh(batch_size: int):
+    with Session(get_engine()) as session:
+        refreshed = refresh_query_asts(session, batch_size=batch_size)
+    print(f"Refreshed the parsed queries of {refreshed} node revisions")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=(
+            "Store the parsed queries of node revisions whose stored ASTs are missing "
+            "or were produced by another DJ version"
+        ),
+    )
+    parser.add_argument(
+        "-b",
+        "--batch-size",
+        dest="batch_size",
+        type=int,
+        default=100,
+        metavar="N",
+    )
+    args = vars(parser.parse_args())
+    refresh(batch_size=args["batch_size"])
@@ -8,7 +8,11 @@ from unittest import mock
 import pytest
 import requests
 from fastapi.testclient import TestClient
+from sqlmodel import Session
 
+from datajunction_server.api.helpers import get_node_by_name
+from datajunction_server.internal.nodes import update_cube_node
+from datajunction_server.models.node import UpdateNode
 from datajunction_server.models.query import ColumnMetadata
 from datajunction_server.service_clients import QueryServiceClient
 from tests.sql.utils import compare_query_strings
@@ -1391,3 +1395,28 @@ def test_updating_cube_with_existing_materialization(
             "user": "dj",
         },
     ]
+
+
+def test_update_cube_node_without_commit(
+    session: Session,
+    client_with_repairs_cube: TestClient,  # pylint: disable=redefined-outer-name,unused-argument
+):
+    """
+    Verify that a cube can be updated without committing, e.g., while propagating
+    an update to an upstream node, which commits all of its changes at the end.
+    """
+    cube = get_node_by_name(session, "default.repairs_cube").current
+    with mock.patch.object(session, "commit") as commit:
+        new_revision = update_cube_node(
+            session,
+            cube,
+            UpdateNode(dimensions=["default.hard_hat.city"]),
+            query_service_client=None,
+            commit=False,
+        )
+    commit.assert_not_called()
+    assert new_revision.version == "v2.0"  # type: ignore
+    assert new_revision.id is not None  # type: ignore
+    assert get_node_by_name(session, "default.repairs_cube").current_version == "v2.0"
+    session.rollback()
+    assert get_node_by_name(session, "default.repairs_cube").current_version == "v1.0"
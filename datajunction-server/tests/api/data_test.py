@@ -8,9 +8,12 @@ from unittest import mock
 
 import pytest
 from fastapi.testclient import TestClient
+from pytest_mock import MockerFixture
 from sqlmodel import Session, select
 
+from datajunction_server.errors import DJQueryServiceClientException
 from datajunction_server.models.node import Node
+from datajunction_server.service_clients import ARROW_STREAM, QueryServiceClient
 
 
 class TestDataForNode:
@@ -290,6 +293,66 @@ class TestDataForNode:
             "links": None,
         }
 
+    def test_get_data_for_metrics_as_arrow(
+        self,
+        client_with_query_service_example_loader: TestClient,
+        query_service_client: QueryServiceClient,
+        mocker: MockerFixture,
+    ) -> None:
+        """
+        Test that Arrow streams from the query service are passed through with the
+        DJ column metadata, and that queries fall back to JSON if the query service
+        doesn't return Arrow.
+        """
+        pa = pytest.importorskip("pyarrow")  # pylint: disable=invalid-name
+        table = pa.table(
+            {"col0": [10, 20], "col1": [1.5, 2.5], "col2": ["Asphalts", "Pothole"]},
+        )
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+
+        custom_client = client_with_query_service_example_loader(["ROADS"])
+        url = (
+            "/data?metrics=default.num_repair_orders&metrics="
+            "default.avg_repair_price&dimensions=default.dispatcher.company_name&limit=10"
+        )
+        headers = {"Accept": f"{ARROW_STREAM}, application/json;q=0.9"}
+        submit_query_as_arrow = mocker.patch.object(
+            query_service_client,
+            "submit_query_as_arrow",
+            return_value=sink.getvalue().to_pybytes(),
+        )
+        response = custom_client.get(url, headers=headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"] == ARROW_STREAM
+        results = pa.ipc.open_stream(response.content).read_all()
+        assert results.to_pydict() == {
+            "default_DOT_num_repair_orders": [10, 20],
+            "default_DOT_avg_repair_price": [1.5, 2.5],
+            "default_DOT_dispatcher_DOT_company_name": ["Asphalts", "Pothole"],
+        }
+        assert results.schema.field(0).metadata == {b"dj.type": b"bigint"}
+        assert "LIMIT 10" in submit_query_as_arrow.call_args.args[0].submitted_query
+
+        # Streams whose fields don't match the columns are passed through as is
+        table = table.drop_columns(["col2"])
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        submit_query_as_arrow.return_value = sink.getvalue().to_pybytes()
+        response = custom_client.get(url, headers=headers)
+        assert response.content == submit_query_as_arrow.return_value
+
+        submit_query_as_arrow.side_effect = query_service_client.submit_query
+        response = custom_client.get(url, headers=headers)
+        assert response.status_code == 200
+        assert response.json()["id"] == "bd98d6be-e2d2-413e-94c7-96d9411ddee2"
+        assert response.json()["results"][0]["columns"][0] == {
+            "name": "default_DOT_num_repair_orders",
+            "type": "bigint",
+        }
+
     def test_stream_multiple_metrics_and_dimensions_data(
         self,
         client_with_query_service_example_loader: TestClient,
@@ -350,6 +413,7 @@ class TestAvailabilityState:  # pylint: disable=too-many-public-methods
         self,
         session: Session,
         client_with_query_service_example_loader: TestClient,
+        query_service_client: QueryServiceClient,
     ) -> None:
         """
         Test adding an availability state
@@ -370,6 +434,11 @@ class TestAvailabilityState:  # pylint: disable=too-many-public-methods
 
         assert response.status_code == 200
         assert data == {"message": "Availability state successfully posted"}
+        query_service_client.invalidate_cached_results.assert_called_once_with(  # type: ignore
+            "default",
+            "accounting",
+            "pmts",
+        )
 
         # Check that the history tracker has been updated
         response = custom_client.get(
@@ -423,6 +492,31 @@ class TestAvailabilityState:  # pylint: disable=too-many-public-methods
             "temporal_partitions": [],
         }
 
+    def test_availability_state_query_service_error(
+        self,
+        client_with_query_service_example_loader: TestClient,
+        query_service_client: QueryServiceClient,
+    ) -> None:
+        """
+        Test that availability states are added even if the query service's cached
+        results can't be invalidated
+        """
+        custom_client = client_with_query_service_example_loader(["ACCOUNT_REVENUE"])
+        query_service_client.invalidate_cached_results.side_effect = (  # type: ignore
+            DJQueryServiceClientException("Query service unavailable")
+        )
+        response = custom_client.post(
+            "/data/default.large_revenue_payments_and_business_only/availability/",
+            json={
+                "catalog": "default",
+                "schema_": "accounting",
+                "table": "pmts",
+                "valid_through_ts": 20230125,
+            },
+        )
+        assert response.status_code == 200
+        assert response.json() == {"message": "Availability state successfully posted"}
+
     def test_availability_catalog_mismatch(
         self,
         client_with_account_revenue: TestClient,
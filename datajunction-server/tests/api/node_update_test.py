@@ -1,10 +1,54 @@
 """Tests for node updates"""
+from typing import Dict
 from unittest import mock
 
 from fastapi.testclient import TestClient
 
+from datajunction_server.api.helpers import validate_node_data
 from datajunction_server.models.node import NodeStatus
 
+REPAIR_ORDER_DETAILS_COLUMNS = [
+    {"name": "repair_order_id", "type": "int"},
+    {"name": "repair_type_id", "type": "int"},
+    {"name": "price", "type": "float"},
+    {"name": "quantity", "type": "int"},
+    {"name": "discount", "type": "float"},
+]
+
+
+def create_transforms(client: TestClient, queries: Dict[str, str]) -> None:
+    """
+    Create transforms with the given names and queries.
+    """
+    for name, query in queries.items():
+        response = client.post(
+            "/nodes/transform/",
+            json={
+                "name": name,
+                "description": name,
+                "query": query,
+                "mode": "published",
+            },
+        )
+        assert response.ok, response.json()
+
+
+def update_column_type(client: TestClient, column: str, type_: str, **params):
+    """
+    Change the type of a column of `default.repair_order_details`.
+    """
+    response = client.patch(
+        "/nodes/default.repair_order_details/",
+        params=params,
+        json={
+            "columns": [
+                {**col, "type": type_} if col["name"] == column else col
+                for col in REPAIR_ORDER_DETAILS_COLUMNS
+            ],
+        },
+    )
+    assert response.ok, response.json()
+
 
 def test_update_source_node(
     client_with_roads: TestClient,
@@ -209,3 +253,182 @@ def test_update_source_node(
                     for event in response.json()
                     if event["activity_type"] == "status_change"
                 ] == node_history_events.get(affected)
+
+
+def test_update_propagates_in_topological_order(
+    client_with_roads: TestClient,
+) -> None:
+    """
+    Test that a node downstream from several updated nodes is revalidated after all of
+    them, even if it's reached through a shorter path first.
+    """
+    create_transforms(
+        client_with_roads,
+        {
+            "default.diamond_x": (
+                "SELECT repair_order_id, price FROM default.repair_order_details"
+            ),
+            "default.diamond_y": (
+                "SELECT repair_order_id, price FROM default.repair_order_details"
+            ),
+            "default.diamond_z": (
+                "SELECT repair_order_id, price FROM default.diamond_y"
+            ),
+            "default.diamond_d": (
+                "SELECT x.repair_order_id, z.price FROM default.diamond_x x "
+                "JOIN default.diamond_z z ON x.repair_order_id = z.repair_order_id"
+            ),
+        },
+    )
+    update_column_type(client_with_roads, "price", "string")
+
+    response = client_with_roads.get("/nodes/default.diamond_d/")
+    data = response.json()
+    assert data["version"] == "v2.0"
+    assert {col["name"]: col["type"] for col in data["columns"]} == {
+        "repair_order_id": "int",
+        "price": "string",
+    }
+    response = client_with_roads.get("/history?node=default.diamond_d")
+    [event] = [
+        event for event in response.json() if event["activity_type"] == "status_change"
+    ]
+    assert [upstream["name"] for upstream in event["details"]["upstreams"]] == [
+        "default.repair_order_details",
+        "default.diamond_x",
+        "default.diamond_d",
+    ]
+
+
+def test_update_propagates_to_children_with_several_paths(
+    client_with_roads: TestClient,
+) -> None:
+    """
+    Test that a direct child of the updated node that also depends on one of its other
+    children is only revalidated after that child.
+    """
+    create_transforms(
+        client_with_roads,
+        {
+            "default.diamond_zed": (
+                "SELECT repair_order_id, price FROM default.repair_order_details"
+            ),
+            "default.diamond_child": (
+                "SELECT details.repair_order_id, zed.price "
+                "FROM default.repair_order_details details "
+                "JOIN default.diamond_zed zed "
+                "ON details.repair_order_id = zed.repair_order_id"
+            ),
+        },
+    )
+    update_column_type(client_with_roads, "price", "string")
+
+    response = client_with_roads.get("/nodes/default.diamond_child/")
+    data = response.json()
+    assert data["version"] == "v2.0"
+    assert {col["name"]: col["type"] for col in data["columns"]} == {
+        "repair_order_id": "int",
+        "price": "string",
+    }
+
+    # It's only revalidated once
+    response = client_with_roads.get("/history?node=default.diamond_child")
+    assert [
+        event["activity_type"]
+        for event in response.json()
+        if event["activity_type"] == "status_change"
+    ] == ["status_change"]
+
+
+def test_update_propagates_past_stale_downstreams(
+    client_with_roads: TestClient,
+) -> None:
+    """
+    Test that a node that's only downstream through an older revision doesn't keep
+    its children from being revalidated.
+    """
+    create_transforms(
+        client_with_roads,
+        {
+            "default.stale_a": (
+                "SELECT repair_order_id, price FROM default.repair_order_details"
+            ),
+            "default.stale_b": "SELECT repair_order_id FROM default.stale_a",
+        },
+    )
+    response = client_with_roads.patch(
+        "/nodes/default.stale_b/",
+        json={"query": "SELECT repair_order_id FROM default.repair_orders"},
+    )
+    assert response.ok, response.json()
+    create_transforms(
+        client_with_roads,
+        {
+            "default.stale_c": (
+                "SELECT details.repair_order_id, details.price "
+                "FROM default.repair_order_details details "
+                "JOIN default.stale_b b ON details.repair_order_id = b.repair_order_id"
+            ),
+        },
+    )
+    update_column_type(client_with_roads, "price", "string")
+
+    for name in ("default.stale_a", "default.stale_c"):
+        data = client_with_roads.get(f"/nodes/{name}/").json()
+        assert data["version"] == "v2.0"
+        assert {col["name"]: col["type"] for col in data["columns"]} == {
+            "repair_order_id": "int",
+            "price": "string",
+        }
+    assert client_with_roads.get("/nodes/default.stale_b/").json()["version"] == "v2.0"
+
+
+def test_update_skips_unaffected_downstreams(
+    client_with_roads: TestClient,
+) -> None:
+    """
+    Test that only the downstream nodes that use a changed column are revalidated, and
+    that the update still reaches everything further downstream from them.
+    """
+    create_transforms(
+        client_with_roads,
+        {
+            "default.uses_discount": (
+                "SELECT repair_order_id, discount FROM default.repair_order_details"
+            ),
+            "default.uses_price": (
+                "SELECT repair_order_id, price FROM default.repair_order_details"
+            ),
+            "default.uses_uses_price": "SELECT price FROM default.uses_price",
+            "default.counts_discounts": (
+                "SELECT repair_order_id, COUNT(*) AS num_discounts "
+                "FROM default.uses_discount GROUP BY repair_order_id"
+            ),
+        },
+    )
+    progress = mock.MagicMock()
+    with mock.patch(
+        "datajunction_server.internal.nodes.validate_node_data",
+        wraps=validate_node_data,
+    ) as validate, mock.patch(
+        "datajunction_server.internal.nodes._log_propagation_progress",
+        progress,
+    ):
+        update_column_type(client_with_roads, "price", "string")
+    validated = {call.kwargs["data"].name for call in validate.call_args_list}
+    assert {"default.uses_price", "default.uses_uses_price"} <= validated
+    assert not {"default.uses_discount", "default.counts_discounts"} & validated
+
+    # every downstream node is reported, whether it was revalidated or not
+    total = progress.call_args_list[-1].args[2]
+    assert [call.args[1:] for call in progress.call_args_list] == [
+        (done, total) for done in range(1, total + 1)
+    ]
+
+    for name, version in [
+        ("default.uses_discount", "v1.0"),
+        ("default.uses_price", "v2.0"),
+        ("default.uses_uses_price", "v2.0"),
+        ("default.counts_discounts", "v1.0"),
+    ]:
+        assert client_with_roads.get(f"/nodes/{name}/").json()["version"] == version
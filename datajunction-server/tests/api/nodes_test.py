@@ -3,7 +3,7 @@
 Tests for the nodes API.
 """
 import re
-from typing import Any, Dict
+from typing import Any, Callable, ContextManager, Dict
 from unittest import mock
 
 import pytest
@@ -11,6 +11,7 @@ from fastapi.testclient import TestClient
 from sqlmodel import Session, select
 
 from datajunction_server.api.helpers import get_upstream_nodes
+from datajunction_server.instrumentation import QueryCounter
 from datajunction_server.internal.materializations import decompose_expression
 from datajunction_server.models import Database, Table
 from datajunction_server.models.column import Column
@@ -3247,6 +3248,60 @@ class TestValidateNodes:  # pylint: disable=too-many-public-methods
         assert data["missing_parents"] == []
         assert data["errors"] == []
 
+    def test_validating_a_node_joining_many_nodes(
+        self,
+        client_with_roads: TestClient,
+        max_queries: Callable[[int], ContextManager[QueryCounter]],
+    ) -> None:
+        """
+        Test that the nodes a query references are loaded together when validating it
+        """
+        query = """
+        SELECT
+          ro.repair_order_id,
+          rod.price,
+          rt.repair_type_name,
+          c.company_name,
+          hh.last_name,
+          hhs.state_id,
+          s.state_name,
+          d.company_name AS dispatcher,
+          m.local_region,
+          mt.municipality_type_desc
+        FROM default.repair_orders ro
+        JOIN default.repair_order_details rod
+          ON ro.repair_order_id = rod.repair_order_id
+        JOIN default.repair_type rt ON rod.repair_type_id = rt.repair_type_id
+        JOIN default.contractors c ON rt.contractor_id = c.contractor_id
+        JOIN default.hard_hats hh ON ro.hard_hat_id = hh.hard_hat_id
+        JOIN default.hard_hat_state hhs ON hh.hard_hat_id = hhs.hard_hat_id
+        JOIN default.us_states s ON hhs.state_id = s.state_id
+        JOIN default.dispatchers d ON ro.dispatcher_id = d.dispatcher_id
+        JOIN default.municipality m ON ro.municipality_id = m.municipality_id
+        JOIN default.municipality_municipality_type mmt
+          ON m.municipality_id = mmt.municipality_id
+        JOIN default.municipality_type mt
+          ON mmt.municipality_type_id = mt.municipality_type_id
+        """
+        with max_queries(40):
+            response = client_with_roads.post(
+                "/nodes/validate/",
+                json={
+                    "name": "default.wide_repair_orders",
+                    "description": "Repair orders with everything joined in",
+                    "query": query,
+                    "type": "transform",
+                },
+            )
+        data = response.json()
+        assert data["status"] == "valid"
+        assert len(data["dependencies"]) == 11
+        assert [column["name"] for column in data["columns"]][-3:] == [
+            "dispatcher",
+            "local_region",
+            "municipality_type_desc",
+        ]
+
     def test_validating_an_invalid_node(self, client: TestClient) -> None:
         """
         Test validating an invalid node
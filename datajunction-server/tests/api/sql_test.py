@@ -1,5 +1,5 @@
 """Tests for the /sql/ endpoint"""
-from typing import Callable, List, Optional
+from typing import Callable, ContextManager, List, Optional
 
 # pylint: disable=line-too-long,too-many-lines
 # pylint: disable=C0302
@@ -7,6 +7,7 @@ import pytest
 from sqlmodel import Session
 from starlette.testclient import TestClient
 
+from datajunction_server.instrumentation import QueryCounter
 from datajunction_server.models import Column, Database, Node
 from datajunction_server.models.node import NodeRevision, NodeType
 from datajunction_server.sql.parsing.types import StringType
@@ -766,32 +767,39 @@ def test_get_sql_for_metrics_failures(client_with_account_revenue: TestClient):
     }
 
 
-def test_get_sql_for_metrics(client_with_roads: TestClient):
+def test_get_sql_for_metrics(
+    client_with_roads: TestClient,
+    max_queries: Callable[[int], ContextManager[QueryCounter]],
+):
     """
     Test getting sql for multiple metrics.
     """
-    response = client_with_roads.get(
-        "/sql/",
-        params={
-            "metrics": ["default.discounted_orders_rate", "default.num_repair_orders"],
-            "dimensions": [
-                "default.hard_hat.country",
-                "default.hard_hat.postal_code",
-                "default.hard_hat.city",
-                "default.hard_hat.state",
-                "default.dispatcher.company_name",
-                "default.municipality_dim.local_region",
-            ],
-            "filters": [],
-            "orderby": [
-                "default.hard_hat.country",
-                "default.num_repair_orders",
-                "default.dispatcher.company_name",
-                "default.discounted_orders_rate",
-            ],
-            "limit": 100,
-        },
-    )
+    with max_queries(220):
+        response = client_with_roads.get(
+            "/sql/",
+            params={
+                "metrics": [
+                    "default.discounted_orders_rate",
+                    "default.num_repair_orders",
+                ],
+                "dimensions": [
+                    "default.hard_hat.country",
+                    "default.hard_hat.postal_code",
+                    "default.hard_hat.city",
+                    "default.hard_hat.state",
+                    "default.dispatcher.company_name",
+                    "default.municipality_dim.local_region",
+                ],
+                "filters": [],
+                "orderby": [
+                    "default.hard_hat.country",
+                    "default.num_repair_orders",
+                    "default.dispatcher.company_name",
+                    "default.discounted_orders_rate",
+                ],
+                "limit": 100,
+            },
+        )
     data = response.json()
     expected_sql = """
     WITH default_DOT_repair_order_details AS (
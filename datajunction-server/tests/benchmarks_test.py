@@ -0,0 +1,101 @@
+"""
+Tests for the benchmarks.
+"""
+import json
+
+import pytest
+
+from benchmarks.__main__ import main
+from benchmarks.dag import DAGShape
+from benchmarks.runner import Regression, compare
+
+
+def test_dag_shape() -> None:
+    """
+    Test naming the nodes of a synthetic DAG.
+    """
+    shape = DAGShape(sources=2, transforms=0, dimension_chains=2, metrics=1)
+    assert shape.fact(1) == "bench.source_1"
+    assert shape.metric_names == ["bench.metric_0_0", "bench.metric_1_0"]
+    assert shape.dimension_attributes == ["bench.dim_0_2.name", "bench.dim_1_2.name"]
+    assert sum(1 for _ in shape.requests()) == 4 + 2 * (3 * 2 + 2) + 2 * (1 + 2 + 1)
+
+
+def test_run_benchmarks(tmp_path, capsys) -> None:
+    """
+    Test running the benchmarks on a small DAG, storing the results and comparing
+    against them.
+    """
+    output = str(tmp_path / "results.json")
+    args = [
+        "--sources=2",
+        "--transforms=1",
+        "--dimension-chains=1",
+        "--dimension-depth=2",
+        "--metrics=1",
+        "--rounds=1",
+    ]
+    assert main(args + [f"--output={output}"]) == 0
+    with open(output, encoding="utf-8") as input_:
+        results = json.load(input_)
+    assert results["shape"] == {
+        "sources": 2,
+        "transforms": 1,
+        "dimension_chains": 1,
+        "dimension_depth": 2,
+        "metrics": 1,
+    }
+    assert sorted(results["stages"]) == [
+        "build_dj_query",
+        "build_metric_nodes",
+        "build_node",
+        "compile",
+        "get_dimensions",
+        "parse",
+        "parse_cached",
+        "parse_types",
+        "parse_types_antlr",
+        "parse_types_cached",
+        "render",
+    ]
+    assert all(stage["median"] > 0 for stage in results["stages"].values())
+    assert "build_metric_nodes" in capsys.readouterr().out
+
+    assert (
+        main(
+            args + ["--stage=render", f"--compare={output}", "--threshold=1000000"],
+        )
+        == 0
+    )
+
+
+def test_compare() -> None:
+    """
+    Test finding the stages that regressed against a baseline.
+    """
+    shape = DAGShape().__dict__
+    baseline = {
+        "shape": shape,
+        "stages": {
+            "parse": {"median": 1.0, "peak_memory": 100},
+            "render": {"median": 1.0, "peak_memory": 100},
+        },
+    }
+    current = {
+        "shape": shape,
+        "stages": {
+            "parse": {"median": 1.05, "peak_memory": 200},
+            "render": {"median": 1.5, "peak_memory": 100},
+            "compile": {"median": 1.0, "peak_memory": 100},
+        },
+    }
+    assert compare(baseline, current, threshold=0.1) == [
+        Regression("parse", "peak_memory", 100, 200),
+        Regression("render", "median", 1.0, 1.5),
+    ]
+    assert not compare(baseline, current, threshold=1.0)
+    assert Regression("parse", "median", 0.0, 1.0).ratio == float("inf")
+
+    with pytest.raises(ValueError) as excinfo:
+        compare({**baseline, "shape": {}}, current)
+    assert "Cannot compare benchmarks of different DAG shapes" in str(excinfo.value)
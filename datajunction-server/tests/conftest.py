@@ -4,8 +4,18 @@ Fixtures for testing.
 # pylint: disable=redefined-outer-name, invalid-name, W0611
 
 import re
+from collections import Counter
+from contextlib import contextmanager
 from http.client import HTTPException
-from typing import Callable, Collection, Generator, Iterator, List, Optional
+from typing import (
+    Callable,
+    Collection,
+    ContextManager,
+    Generator,
+    Iterator,
+    List,
+    Optional,
+)
 from unittest.mock import MagicMock, patch
 
 import pytest
@@ -18,6 +28,7 @@ from sqlmodel.pool import StaticPool
 from datajunction_server.api.main import app
 from datajunction_server.config import Settings
 from datajunction_server.errors import DJQueryServiceClientException
+from datajunction_server.instrumentation import QueryCounter, count_queries
 from datajunction_server.models import Column, Engine
 from datajunction_server.models.materialization import MaterializationInfo
 from datajunction_server.models.query import QueryCreate
@@ -133,6 +144,12 @@ def query_service_client(mocker: MockerFixture) -> Iterator[QueryServiceClient]:
         mock_get_query,
     )
 
+    mocker.patch.object(
+        qs_client,
+        "invalidate_cached_results",
+        MagicMock(return_value=0),
+    )
+
     mock_materialize = MagicMock()
     mock_materialize.return_value = MaterializationInfo(
         urls=["http://fake.url/job"],
@@ -375,6 +392,32 @@ def compare_query_strings_fixture():
     return compare_query_strings
 
 
+@pytest.fixture
+def max_queries() -> Callable[[int], ContextManager[QueryCounter]]:
+    """
+    Fixture that fails a test when a block runs more than a number of statements:
+
+        with max_queries(20):
+            client.get("/sql/", params=...)
+    """
+
+    @contextmanager
+    def assert_max_queries(limit: int) -> Iterator[QueryCounter]:
+        with count_queries() as counter:
+            yield counter
+        if counter.count > limit:
+            summary = "\n".join(
+                f"{count}x {shape}"
+                for shape, count in Counter(counter.statements).most_common()
+            )
+            raise AssertionError(
+                f"Expected at most {limit} statements, ran {counter.count}:\n"
+                f"{summary}",
+            )
+
+    return assert_max_queries
+
+
 @pytest.fixture
 def client_with_query_service_example_loader(  # pylint: disable=too-many-statements
     session: Session,
@@ -3,11 +3,15 @@
 from typing import Dict, Optional, Tuple
 
 import pytest
+from fastapi.testclient import TestClient
+from pytest_mock import MockerFixture
 from sqlalchemy import select
 from sqlmodel import Session
 
 import datajunction_server.sql.parsing.types as ct
 from datajunction_server.construction.build import build_node
+from datajunction_server.construction.join_planner import JoinPathPlanner
+from datajunction_server.errors import DJException
 from datajunction_server.models import (
     AttributeType,
     Column,
@@ -15,6 +19,7 @@ from datajunction_server.models import (
     NodeRevision,
 )
 from datajunction_server.models.node import Node, NodeType
+from datajunction_server.sql.dag_snapshot import DAGSnapshot
 from datajunction_server.utils import amenable_name
 
 from ..sql.utils import compare_query_strings
@@ -267,3 +272,155 @@ async def test_build_node_with_unnamed_column(request):
 def test_amenable_name():
     """testing for making an amenable name"""
     assert amenable_name("hello.名") == "hello_DOT__UNK"
+
+
+def test_join_path_planner(client_with_roads: TestClient, mocker: MockerFixture):
+    """
+    Join paths are planned once and reused until a dimension link changes.
+    """
+    search = mocker.spy(JoinPathPlanner, "_search")
+    params = {"dimensions": ["default.hard_hat.state", "default.us_state.state_name"]}
+    first = client_with_roads.get("/sql/default.num_repair_orders/", params=params)
+    assert first.ok
+    assert search.call_count == 2
+    second = client_with_roads.get("/sql/default.num_repair_orders/", params=params)
+    assert second.json() == first.json()
+    assert search.call_count == 2
+
+    response = client_with_roads.post(
+        "/nodes/default.repair_orders/columns/hard_hat_id/",
+        params={"dimension": "default.hard_hat", "dimension_column": "hard_hat_id"},
+    )
+    assert response.ok
+    assert client_with_roads.get("/sql/default.num_repair_orders/", params=params).ok
+    assert search.call_count == 4
+
+
+def test_join_path_planner_node_order(
+    client_with_roads: TestClient,  # pylint: disable=unused-argument
+    session: Session,
+    mocker: MockerFixture,
+):
+    """
+    The same nodes are planned once, whichever order they're given in.
+    """
+    search = mocker.spy(JoinPathPlanner, "_search")
+    nodes = [
+        session.exec(select(Node).where(Node.name == name)).scalar_one().current
+        for name in ("default.repair_orders", "default.repair_order_details")
+    ]
+    hard_hat = (
+        session.exec(select(Node).where(Node.name == "default.hard_hat"))
+        .scalar_one()
+        .current
+    )
+    planner = JoinPathPlanner(session)
+    first = planner.join_path(hard_hat, nodes)  # type: ignore
+    assert planner.join_path(hard_hat, nodes[::-1]) == first  # type: ignore
+    assert search.call_count == 1
+
+
+def test_join_path_planner_pruned_branches(
+    client_with_roads: TestClient,
+    mocker: MockerFixture,
+):
+    """
+    Join paths are planned again when a branch that was pruned because it didn't
+    lead to the dimension node may now lead to it.
+    """
+    for node, column, dimension, dimension_column in [
+        ("dispatcher", "dispatcher_id", "contractor", "contractor_id"),
+        ("local_hard_hats", "state", "us_state", "state_short"),
+    ]:
+        response = client_with_roads.post(
+            f"/nodes/default.{node}/columns/{column}/",
+            params={
+                "dimension": f"default.{dimension}",
+                "dimension_column": dimension_column,
+            },
+        )
+        assert response.ok
+    search = mocker.spy(JoinPathPlanner, "_search")
+    params = {"dimensions": ["default.us_state.state_name"]}
+    assert client_with_roads.get("/sql/default.num_repair_orders/", params=params).ok
+    assert client_with_roads.get("/sql/default.num_repair_orders/", params=params).ok
+    assert search.call_count == 1
+
+    # The contractors were only reached while pruning the dispatcher's branch,
+    # which now leads to the US states through the local hard hats
+    response = client_with_roads.post(
+        "/nodes/default.contractor/columns/contractor_id/",
+        params={
+            "dimension": "default.local_hard_hats",
+            "dimension_column": "hard_hat_id",
+        },
+    )
+    assert response.ok
+    assert client_with_roads.get("/sql/default.num_repair_orders/", params=params).ok
+    assert search.call_count == 2
+
+
+def test_join_path_planner_uncommitted_links(  # pylint: disable=too-many-locals
+    client_with_roads: TestClient,
+    session: Session,
+    mocker: MockerFixture,
+):
+    """
+    Dimension links that aren't committed yet are followed, and the paths planned
+    while there are uncommitted writes aren't kept.
+    """
+    for node, column, dimension, dimension_column in [
+        ("dispatcher", "dispatcher_id", "contractor", "contractor_id"),
+        ("local_hard_hats", "state", "us_state", "state_short"),
+    ]:
+        response = client_with_roads.post(
+            f"/nodes/default.{node}/columns/{column}/",
+            params={
+                "dimension": f"default.{dimension}",
+                "dimension_column": dimension_column,
+            },
+        )
+        assert response.ok
+
+    def get_node(name: str) -> Node:
+        return session.exec(select(Node).where(Node.name == name)).scalar_one()
+
+    # The contractors only lead to the US states through a link that's flushed
+    contractor_id = next(
+        col
+        for col in get_node("default.contractor").current.columns
+        if col.name == "contractor_id"
+    )
+    contractor_id.dimension = get_node("default.local_hard_hats")
+    contractor_id.dimension_column = "hard_hat_id"
+    session.add(contractor_id)
+    session.flush()
+
+    search = mocker.spy(JoinPathPlanner, "_search")
+    store = mocker.spy(DAGSnapshot, "join_path")
+    dispatcher = get_node("default.dispatcher").current
+    us_state = get_node("default.us_state").current
+    query = build_node(
+        session,
+        dispatcher,
+        dimensions=["default.us_state.state_name"],
+    )
+    assert "default_DOT_us_state" in str(query)
+    planner = JoinPathPlanner(session)
+    path = planner.join_path(us_state, {dispatcher})
+    assert [(start.name, end.name) for start, end in path] == [
+        ("default.dispatcher", "default.contractor"),
+        ("default.contractor", "default.local_hard_hats"),
+        ("default.local_hard_hats", "default.us_state"),
+    ]
+    assert search.call_count == 2
+    store.assert_not_called()
+
+    # Once the link is rolled back, there's no path, and none was kept
+    session.rollback()
+    with pytest.raises(DJException) as excinfo:
+        JoinPathPlanner(session).join_path(
+            get_node("default.us_state").current,
+            {get_node("default.dispatcher").current},
+        )
+    assert "No join path found for dimension default.us_state" in str(excinfo.value)
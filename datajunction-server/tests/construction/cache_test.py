@@ -0,0 +1,100 @@
+"""
+Tests for the SQL build cache
+"""
+from fastapi.testclient import TestClient
+
+from datajunction_server.construction.cache import (
+    BuiltSQL,
+    SQLBuildCache,
+    sql_build_cache,
+    sql_build_cache_key,
+)
+
+
+def built_sql(sql: str, nodes) -> BuiltSQL:
+    """
+    A cache entry for the given nodes.
+    """
+    return BuiltSQL(
+        sql=sql,
+        columns=[],
+        nodes=set(nodes),
+        version_vector=tuple((node, "v1.0") for node in sorted(nodes)),
+    )
+
+
+def test_sql_build_cache_version_vector_and_invalidation():
+    """
+    Entries are only served for a matching version vector, and are dropped when one
+    of the nodes they depend on is invalidated.
+    """
+    cache = SQLBuildCache(max_entries=2)
+    key_a = sql_build_cache_key(["a"], ["dim.x"], [], [], None)
+    key_b = sql_build_cache_key(["b"], ["dim.x"], [], [], 10)
+    entry_a = built_sql("SELECT a", ["a", "dim"])
+    cache.set(key_a, entry_a)
+    cache.set(key_b, built_sql("SELECT b", ["b", "dim"]))
+
+    assert cache.get(key_a, entry_a.version_vector).sql == "SELECT a"  # type: ignore
+    assert cache.get(key_a, (("a", "v2.0"), ("dim", "v1.0"))) is None
+    assert cache.stats().hits == 1
+    assert cache.stats().misses == 1
+
+    cache.invalidate(["b"])
+    assert len(cache) == 1
+    cache.invalidate(["dim"])
+    assert len(cache) == 0
+
+    # Least recently used entries are evicted
+    cache.set(key_a, entry_a)
+    cache.set(key_b, built_sql("SELECT b", ["b"]))
+    cache.get(key_a, entry_a.version_vector)
+    cache.set(("c",), built_sql("SELECT c", ["c"]))
+    assert len(cache) == 2
+    assert cache.get(key_a, entry_a.version_vector) is not None
+
+    cache.resize(0)
+    cache.set(key_a, entry_a)
+    assert len(cache) == 0
+
+
+def test_sql_build_cache_for_metrics_sql(client_with_roads: TestClient):
+    """
+    Repeated requests for the same metrics SQL are served from the cache until an
+    upstream node changes.
+    """
+    sql_build_cache.clear()
+    params = {
+        "metrics": ["default.num_repair_orders"],
+        "dimensions": ["default.hard_hat.state"],
+    }
+    first = client_with_roads.get("/sql/", params=params).json()
+    second = client_with_roads.get("/sql/", params=params).json()
+    assert first == second
+    assert sql_build_cache.stats().hits == 1
+    assert len(sql_build_cache) == 1
+
+    # Updating an upstream node drops the cached SQL
+    response = client_with_roads.patch(
+        "/nodes/default.num_repair_orders/",
+        json={
+            "query": "SELECT count(DISTINCT repair_order_id) FROM default.repair_orders"
+        },
+    )
+    assert response.ok
+    assert len(sql_build_cache) == 0
+    third = client_with_roads.get("/sql/", params=params).json()
+    assert "DISTINCT" in third["sql"]
+    assert sql_build_cache.stats().hits == 1
+
+    # Dimension links are changed without creating new revisions, but they're part
+    # of the version vector
+    response = client_with_roads.post(
+        "/nodes/default.repair_orders/columns/hard_hat_id/",
+        params={"dimension": "default.hard_hat", "dimension_column": "hard_hat_id"},
+    )
+    assert response.ok
+    fourth = client_with_roads.get("/sql/", params=params).json()
+    assert sql_build_cache.stats().hits == 1
+    assert client_with_roads.get("/sql/", params=params).json() == fourth
+    assert sql_build_cache.stats().hits == 2
@@ -3,12 +3,15 @@ Tests for building nodes and extracting dependencies
 """
 
 # pylint: disable=too-many-lines
+from typing import Dict, Optional
+
 import pytest
+from fastapi.testclient import TestClient
 from sqlmodel import Session
 
-from datajunction_server.construction.utils import get_dj_node
+from datajunction_server.construction.utils import get_dj_node, get_dj_nodes
 from datajunction_server.errors import DJErrorException
-from datajunction_server.models.node import NodeType
+from datajunction_server.models.node import Node, NodeType
 
 
 def test_get_dj_node_raise_unknown_node_exception(session: Session):
@@ -44,3 +47,42 @@ def test_get_dj_node_raise_unknown_node_exception(session: Session):
     assert "No node `event_type` exists of kind NodeType.TRANSFORM" in str(
         exc_info.value,
     )
+
+
+def test_get_dj_node_with_loaded_nodes(
+    session: Session,
+    client_with_roads: TestClient,  # pylint: disable=unused-argument
+):
+    """
+    Test looking up nodes that were loaded together
+    """
+    nodes = get_dj_nodes(session, ["default.repair_orders", "default.hard_hat"])
+    assert sorted(nodes) == ["default.hard_hat", "default.repair_orders"]
+    assert [col.name for col in nodes["default.repair_orders"].current.columns][:2] == [
+        "repair_order_id",
+        "municipality_id",
+    ]
+
+    loaded: Dict[str, Optional[Node]] = dict(nodes)
+    revision = get_dj_node(
+        session,
+        "default.hard_hat",
+        kinds={NodeType.DIMENSION},
+        nodes=loaded,
+    )
+    assert revision is nodes["default.hard_hat"].current
+
+    with pytest.raises(DJErrorException) as exc_info:
+        get_dj_node(session, "default.hard_hat", {NodeType.SOURCE}, nodes=loaded)
+    assert "No node `default.hard_hat` exists of kind NodeType.SOURCE" in str(
+        exc_info.value,
+    )
+
+    # nodes that aren't loaded yet are looked up and recorded, even when missing
+    with pytest.raises(DJErrorException):
+        get_dj_node(session, "foobar", nodes=loaded)
+    assert loaded["foobar"] is None
+    assert get_dj_node(session, "default.dispatcher", nodes=loaded).name == (
+        "default.dispatcher"
+    )
+    assert "default.dispatcher" in loaded
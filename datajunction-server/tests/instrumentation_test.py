@@ -0,0 +1,304 @@
+"""
+Tests for ``datajunction_server.instrumentation``.
+"""
+import json
+import logging
+from typing import Any, Callable, ContextManager, Dict
+
+import pytest
+from fastapi.testclient import TestClient
+from pytest_mock import MockerFixture
+
+from datajunction_server import instrumentation
+from datajunction_server.config import Settings
+from datajunction_server.instrumentation import (
+    REPEATED_STATEMENT_THRESHOLD,
+    Histogram,
+    MetricsRegistry,
+    QueryCounter,
+    RequestTimings,
+    _request_timings,
+    count_queries,
+    metrics_registry,
+    statement_shape,
+    timed,
+)
+
+
+def test_timed() -> None:
+    """
+    Test that stages are recorded for the current request, and only once when
+    they're entered again while running.
+    """
+    timings = RequestTimings()
+    token = _request_timings.set(timings)
+    try:
+        with timed("compile"):
+            with timed("compile"):
+                with timed("parse"):
+                    pass
+        with timed("parse"):
+            pass
+    finally:
+        _request_timings.reset(token)
+
+    assert {stage: count for stage, (_, count) in timings.stages.items()} == {
+        "parse": 2,
+        "compile": 1,
+    }
+    assert timings.server_timing().startswith("parse;dur=")
+    assert 'desc="2x"' in timings.server_timing()
+    assert timings.as_dict()["compile"]["count"] == 1
+
+
+def test_timed_decorator() -> None:
+    """
+    Test timing a function, outside of requests.
+    """
+
+    @timed("test_stage")
+    def add(left: int, right: int) -> int:
+        return left + right
+
+    metrics_registry.clear()
+    assert add(1, 2) == 3
+    assert metrics_registry.stages["test_stage"].count == 1
+
+
+def test_histogram() -> None:
+    """
+    Test rendering histograms in the Prometheus text format.
+    """
+    histogram = Histogram(buckets=(0.1, 1))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+    assert histogram.render("duration", 'stage="parse"') == [
+        'duration_bucket{stage="parse",le="0.1"} 1',
+        'duration_bucket{stage="parse",le="1"} 2',
+        'duration_bucket{stage="parse",le="+Inf"} 3',
+        'duration_sum{stage="parse"} 5.55',
+        'duration_count{stage="parse"} 3',
+    ]
+
+    registry = MetricsRegistry()
+    registry.observe_request("GET", "get_sql", 200, 0.2)
+    registry.observe_stage("parse", 0.1)
+    rendered = registry.render()
+    assert (
+        'dj_request_duration_seconds_count{method="GET",endpoint="get_sql",'
+        'status="200"} 1'
+    ) in rendered
+    assert 'dj_stage_duration_seconds_count{stage="parse"} 1' in rendered
+    registry.clear()
+    assert "dj_stage_duration_seconds_count" not in registry.render()
+
+
+SQL_PARAMS: Dict[str, Any] = {
+    "metrics": ["default.num_repair_orders"],
+    "dimensions": ["default.hard_hat.country"],
+}
+
+
+def test_server_timing(
+    client_with_roads: TestClient,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    """
+    Test that requests return and log the time spent in each stage, and that the
+    metrics endpoint exposes them.
+    """
+    with caplog.at_level(logging.INFO, logger="datajunction_server.instrumentation"):
+        response = client_with_roads.get("/sql/", params=SQL_PARAMS)
+    assert response.ok
+    stages = {
+        entry.split(";")[0].strip()
+        for entry in response.headers["Server-Timing"].split(",")
+    }
+    assert {
+        "build_sql",
+        "validate",
+        "build",
+        "join_paths",
+        "compile",
+        "parse",
+        "render",
+        "db",
+        "total",
+    } <= stages
+
+    log = json.loads(
+        next(
+            record.getMessage()
+            for record in caplog.records
+            if record.name == "datajunction_server.instrumentation"
+            and '"/sql/"' in record.getMessage()
+        ),
+    )
+    assert log["endpoint"] == "get_sql_for_metrics"
+    assert log["status"] == 200
+    assert log["stages"]["build_sql"]["count"] == 1
+
+    metrics = client_with_roads.get("/health/metrics/").text
+    assert (
+        'dj_request_duration_seconds_count{method="GET",'
+        'endpoint="get_sql_for_metrics",status="200"}'
+    ) in metrics
+    assert 'dj_stage_duration_seconds_count{stage="build_sql"}' in metrics
+
+
+def test_profile(
+    client_with_roads: TestClient,
+    settings: Settings,
+    mocker: MockerFixture,
+) -> None:
+    """
+    Test that ``?profile=true`` returns a profile of GET requests by authenticated
+    users, with the status of the original response, when profiling is enabled.
+    """
+    settings.profiling_enabled = True
+    mocker.patch.object(instrumentation, "get_settings", return_value=settings)
+    params: Dict[str, Any] = {**SQL_PARAMS, "profile": "true"}
+    response = client_with_roads.get("/sql/", params=params)
+    assert response.ok
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "Server-Timing" in response.headers
+    assert "cumulative" in response.text
+    assert "build_metric_nodes" in response.text
+
+    response = client_with_roads.get(
+        "/sql/",
+        params={**params, "metrics": ["default.missing"]},
+    )
+    assert response.status_code == 404
+    assert response.headers["content-type"].startswith("text/plain")
+
+    # Only GET requests by authenticated users are profiled
+    response = client_with_roads.post(
+        "/nodes/default.repair_orders/columns/hard_hat_id/",
+        params={
+            "dimension": "default.hard_hat",
+            "dimension_column": "hard_hat_id",
+            "profile": "true",
+        },
+    )
+    assert response.ok
+    assert response.headers["content-type"].startswith("application/json")
+    response = client_with_roads.get("/health/", params={"profile": "true"})
+    assert response.headers["content-type"].startswith("application/json")
+
+    settings.profiling_enabled = False
+    response = client_with_roads.get("/sql/", params=params)
+    assert response.ok
+    assert response.headers["content-type"].startswith("application/json")
+
+
+def test_profile_one_request_at_a_time(
+    client_with_roads: TestClient,
+    settings: Settings,
+    mocker: MockerFixture,
+) -> None:
+    """
+    Test that requests aren't profiled while another one is, or while another
+    profiler is active.
+    """
+    settings.profiling_enabled = True
+    mocker.patch.object(instrumentation, "get_settings", return_value=settings)
+    params: Dict[str, Any] = {**SQL_PARAMS, "profile": "true"}
+    with instrumentation._profiling_lock:  # pylint: disable=protected-access
+        response = client_with_roads.get("/sql/", params=params)
+    assert response.ok
+    assert response.headers["content-type"].startswith("application/json")
+
+    mocker.patch(
+        "cProfile.Profile.enable",
+        side_effect=ValueError("Another profiling tool is already active"),
+    )
+    response = client_with_roads.get("/sql/", params=params)
+    assert response.ok
+    assert response.headers["content-type"].startswith("application/json")
+
+
+def test_statement_shape() -> None:
+    """
+    Test that statements with different parameters have the same shape.
+    """
+    assert statement_shape(
+        "SELECT node.id FROM node\n  WHERE node.name IN (?, ?, ?) AND node.id = ?",
+    ) == statement_shape(
+        "SELECT node.id FROM node WHERE node.name IN (?) AND node.id = ?"
+    )
+    assert (
+        statement_shape("SELECT CAST(x AS TEXT)::text FROM t WHERE id = %(id_1)s")
+        == "SELECT CAST(x AS TEXT)::text FROM t WHERE id = ?"
+    )
+    assert statement_shape("SELECT 1 FROM t WHERE id = :id") == (
+        "SELECT 1 FROM t WHERE id = ?"
+    )
+
+
+def test_query_count(
+    client_with_roads: TestClient,
+    caplog: pytest.LogCaptureFixture,
+    max_queries: Callable[[int], ContextManager[QueryCounter]],
+) -> None:
+    """
+    Test that requests report the statements they run, and that statements run many
+    times in the same request are flagged.
+    """
+    metrics_registry.clear()
+    with caplog.at_level(logging.INFO, logger="datajunction_server.instrumentation"):
+        with count_queries() as counter:
+            response = client_with_roads.get("/sql/", params=SQL_PARAMS)
+    assert response.ok
+    assert counter.count > 0
+    assert int(response.headers["X-DJ-Query-Count"]) == counter.count
+    assert int(response.headers["X-DJ-Repeated-Queries"]) == len(counter.repeated())
+
+    log = json.loads(
+        next(
+            record.getMessage()
+            for record in caplog.records
+            if '"/sql/"' in record.getMessage()
+        ),
+    )
+    assert log["statements"] == counter.count
+    if counter.repeated():
+        assert any(
+            "Possible N+1 queries in GET /sql/" in record.getMessage()
+            for record in caplog.records
+        )
+
+    metrics = metrics_registry.render()
+    assert (
+        'dj_request_db_statements_count{method="GET",endpoint="get_sql_for_metrics"} 1'
+    ) in metrics
+
+    with pytest.raises(AssertionError) as excinfo:
+        with max_queries(1):
+            client_with_roads.get("/sql/", params=SQL_PARAMS)
+    assert "Expected at most 1 statements" in str(excinfo.value)
+
+
+def test_repeated_statements() -> None:
+    """
+    Test flagging statement shapes that run many times.
+    """
+    timings = RequestTimings()
+    for _ in range(REPEATED_STATEMENT_THRESHOLD + 1):
+        timings.add_statement(statement_shape("SELECT * FROM node WHERE id = :id"))
+    timings.add_statement("SELECT 1")
+    assert timings.repeated_statements() == {
+        "SELECT * FROM node WHERE id = ?": REPEATED_STATEMENT_THRESHOLD + 1,
+    }
+
+    registry = MetricsRegistry()
+    registry.observe_statements("GET", "get_sql", 23, 1)
+    rendered = registry.render()
+    assert (
+        'dj_request_db_statements_bucket{method="GET",endpoint="get_sql",le="25"} 1'
+        in rendered
+    )
+    assert (
+        'dj_repeated_db_statements_total{method="GET",endpoint="get_sql"} 1' in rendered
+    )
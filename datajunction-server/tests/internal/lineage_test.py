@@ -0,0 +1,128 @@
+"""
+Tests for ``datajunction_server.internal.lineage``.
+"""
+from unittest import mock
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from datajunction_server.api.helpers import get_node_by_name
+from datajunction_server.internal.lineage import LineageBuilder
+from datajunction_server.sql.parsing.ast import CompileContext
+
+
+def test_lineage_builder(
+    session: Session,
+    client_with_roads: TestClient,  # pylint: disable=unused-argument
+):
+    """
+    Test that lineage is the same whether it's computed from scratch or from the
+    lineage stored on upstream nodes, and that each node is only compiled once.
+    """
+    node_revision = get_node_by_name(
+        session,
+        "default.regional_repair_efficiency",
+    ).current
+    stored = node_revision.lineage
+    assert stored
+
+    with mock.patch(
+        "datajunction_server.internal.lineage.CompileContext",
+        wraps=CompileContext,
+    ) as compile_context:
+        builder = LineageBuilder(session)
+        lineage = builder.node_lineage(node_revision)
+        assert builder.node_lineage(node_revision) == lineage
+    assert [column.dict() for column in lineage] == stored
+    assert compile_context.call_count == 1
+
+    # without stored lineage upstream, every upstream node is compiled once
+    upstreams = {
+        upstream.current.name: upstream.current.lineage
+        for upstream in node_revision.parents
+    }
+    for upstream in node_revision.parents:
+        upstream.current.lineage = []
+    with mock.patch(
+        "datajunction_server.internal.lineage.CompileContext",
+        wraps=CompileContext,
+    ) as compile_context:
+        lineage = LineageBuilder(session).node_lineage(node_revision)
+    assert [column.dict() for column in lineage] == stored
+    assert compile_context.call_count == 1 + len(
+        [name for name, upstream in upstreams.items() if upstream],
+    )
+    session.rollback()
+
+
+def test_lineage_refreshed_downstream(client_with_roads: TestClient):
+    """
+    Test that updating a node recomputes the lineage of downstream nodes whose
+    lineage goes through it, even if their columns don't change.
+    """
+    for name, query in [
+        (
+            "default.order_prices",
+            "SELECT repair_order_id, price FROM default.repair_order_details",
+        ),
+        ("default.prices", "SELECT price FROM default.order_prices"),
+        ("default.order_ids", "SELECT repair_order_id FROM default.order_prices"),
+    ]:
+        response = client_with_roads.post(
+            "/nodes/transform/",
+            json={
+                "name": name,
+                "description": name,
+                "query": query,
+                "mode": "published",
+            },
+        )
+        assert response.ok, response.json()
+
+    response = client_with_roads.patch(
+        "/nodes/default.order_prices/",
+        json={
+            "query": (
+                "SELECT repair_order_id, discount AS price "
+                "FROM default.repair_order_details"
+            ),
+        },
+    )
+    assert response.ok, response.json()
+
+    for name in ("default.prices", "default.order_ids"):
+        response = client_with_roads.get(f"/nodes/{name}/")
+        assert response.json()["version"] == "v1.0"
+
+    [price] = client_with_roads.get("/nodes/default.prices/lineage/").json()
+    [order_prices] = price["lineage"]
+    assert order_prices["node_name"] == "default.order_prices"
+    assert [
+        (upstream["node_name"], upstream["column_name"])
+        for upstream in order_prices["lineage"]
+    ] == [("default.repair_order_details", "discount")]
+
+    [order_id] = client_with_roads.get("/nodes/default.order_ids/lineage/").json()
+    assert [
+        (upstream["node_name"], upstream["column_name"])
+        for upstream in order_id["lineage"][0]["lineage"]
+    ] == [("default.repair_order_details", "repair_order_id")]
+
+    # The refresh is recorded in the history of the node whose lineage changed
+    history = client_with_roads.get("/history/node/default.prices/").json()
+    assert [
+        (event["activity_type"], event["details"])
+        for event in history
+        if event["details"].get("lineage_columns")
+    ] == [
+        (
+            "update",
+            {
+                "version": "v1.0",
+                "lineage_columns": ["price"],
+                "reason": "Caused by update of `default.order_prices` to v2.0",
+            },
+        ),
+    ]
+    history = client_with_roads.get("/history/node/default.order_ids/").json()
+    assert not [event for event in history if "lineage_columns" in event["details"]]
@@ -0,0 +1,156 @@
+"""
+Tests for ``datajunction_server.internal.query_watcher``.
+"""
+import asyncio
+import json
+from collections import Counter
+from typing import Dict, List
+
+import pytest
+
+from datajunction_server.api.helpers import query_event_stream
+from datajunction_server.errors import DJQueryServiceClientException
+from datajunction_server.internal.query_watcher import QueryWatcher, get_query_watcher
+from datajunction_server.models.query import (
+    ColumnMetadata,
+    QueryResults,
+    QueryWithResults,
+    StatementResults,
+)
+from datajunction_server.service_clients import QueryServiceClient
+from datajunction_server.typing import QueryState
+
+
+class FakeQueryServiceClient(QueryServiceClient):
+    """
+    A query service client that replays a sequence of states for each query.
+    """
+
+    def __init__(self, states: Dict[str, List[QueryState]]):
+        super().__init__(uri="http://queryservice:8001")
+        self.states = states
+        self.calls: Counter = Counter()
+
+    async def get_query_async(self, query_id: str) -> QueryWithResults:
+        if query_id not in self.states:
+            raise DJQueryServiceClientException(f"Query {query_id} not found.")
+        states = self.states[query_id]
+        state = states[min(self.calls[query_id], len(states) - 1)]
+        self.calls[query_id] += 1
+        return QueryWithResults(
+            id=query_id,
+            submitted_query="SELECT 1",
+            state=state,
+            results=[],
+            errors=[],
+        )
+
+
+@pytest.mark.asyncio
+async def test_query_watcher_fans_out_changes():
+    """
+    Each query is checked once per interval however many streams watch it, and only
+    changes are sent to the subscribers.
+    """
+    client = FakeQueryServiceClient(
+        {
+            "a": [QueryState.RUNNING, QueryState.RUNNING, QueryState.FINISHED],
+            "b": [QueryState.FAILED],
+        },
+    )
+    watcher = QueryWatcher(client, poll_interval=0.01)
+    first, second = watcher.subscribe("a"), watcher.subscribe("a")
+    other = watcher.subscribe("b")
+
+    for updates in (first, second):
+        assert (await updates.get()).state == QueryState.RUNNING
+        assert (await updates.get()).state == QueryState.FINISHED
+    assert (await other.get()).state == QueryState.FAILED
+
+    # Completed queries aren't checked on again
+    await asyncio.sleep(0.05)
+    assert client.calls == {"a": 3, "b": 1}
+    assert first.empty() and second.empty() and other.empty()
+
+    # Late subscribers get the latest state straight away
+    late = watcher.subscribe("a")
+    assert late.get_nowait().state == QueryState.FINISHED
+
+    for query_id, updates in (("a", first), ("a", second), ("a", late), ("b", other)):
+        watcher.unsubscribe(query_id, updates)
+    await asyncio.sleep(0.05)
+    assert watcher._task.done()  # pylint: disable=protected-access
+
+
+@pytest.mark.asyncio
+async def test_query_watcher_errors():
+    """
+    Errors from checking on a query are sent to its subscribers.
+    """
+    client = FakeQueryServiceClient({})
+    watcher = get_query_watcher(client)
+    assert get_query_watcher(client) is watcher
+    updates = watcher.subscribe("missing")
+    assert isinstance(await updates.get(), DJQueryServiceClientException)
+    watcher.unsubscribe("missing", updates)
+
+
+@pytest.mark.asyncio
+async def test_query_event_stream_copies_shared_updates():
+    """
+    Streams set their own columns on a copy of the final state of the query, not on
+    the update that's shared with every other subscriber.
+    """
+
+    class FinishedQueryServiceClient(FakeQueryServiceClient):
+        """
+        A query service client that returns results for finished queries.
+        """
+
+        async def get_query_async(self, query_id: str) -> QueryWithResults:
+            query = await super().get_query_async(query_id)
+            query.results = QueryResults(
+                __root__=[
+                    StatementResults(
+                        sql="SELECT 1",
+                        columns=[ColumnMetadata(name="col0", type="int")],
+                        rows=[[1]],
+                    ),
+                ],
+            )
+            return query
+
+    class Request:  # pylint: disable=too-few-public-methods
+        """
+        A client request that stays connected.
+        """
+
+        async def is_disconnected(self) -> bool:
+            """
+            The client never disconnects.
+            """
+            return False
+
+    client = FinishedQueryServiceClient({"a": [QueryState.FINISHED]})
+    query = QueryWithResults(
+        id="a",
+        submitted_query="SELECT 1",
+        state=QueryState.RUNNING,
+        results=[],
+        errors=[],
+    )
+    watcher = get_query_watcher(client)
+    other = watcher.subscribe("a")
+    columns = [ColumnMetadata(name="num", type="int")]
+    events = [
+        json.loads(json.loads(event["data"]))
+        async for event in query_event_stream(query, client, columns, Request())
+    ]
+    assert events[-1]["results"][0]["columns"] == [{"name": "num", "type": "int"}]
+
+    # Other subscribers still get the query service's columns
+    shared = other.get_nowait()
+    assert shared.results.__root__[0].columns == [
+        ColumnMetadata(name="col0", type="int"),
+    ]
+    watcher.unsubscribe("a", other)
@@ -1,18 +1,26 @@
 """
 Tests for ``datajunction_server.service_clients``.
 """
+import asyncio
+import threading
 from unittest.mock import MagicMock
 
 import pytest
 from pytest_mock import MockerFixture
 from requests import Request
 
+from datajunction_server.config import (
+    QUERY_SERVICE_QUERY_TIMEOUT,
+    QUERY_SERVICE_TIMEOUT,
+    Settings,
+)
 from datajunction_server.errors import DJQueryServiceClientException
 from datajunction_server.models import Engine
 from datajunction_server.models.materialization import GenericMaterializationInput
 from datajunction_server.models.node import NodeType
 from datajunction_server.models.query import QueryCreate
 from datajunction_server.service_clients import (
+    ARROW_STREAM,
     QueryServiceClient,
     RequestsSessionWithEndpoint,
 )
@@ -97,6 +105,7 @@ class TestQueryServiceClient:  # pylint: disable=too-few-public-methods
             "http://queryservice:8001/table/hive.test.pies/columns/",
             params={},
             allow_redirects=True,
+            timeout=QUERY_SERVICE_TIMEOUT,
         )
 
         query_service_client.get_columns_for_table(
@@ -110,6 +119,7 @@ class TestQueryServiceClient:  # pylint: disable=too-few-public-methods
             "http://queryservice:8001/table/hive.test.pies/columns/",
             params={"engine": "spark", "engine_version": "2.4.4"},
             allow_redirects=True,
+            timeout=QUERY_SERVICE_TIMEOUT,
         )
 
     def test_query_service_client_submit_query(self, mocker: MockerFixture) -> None:
@@ -168,7 +178,111 @@ class TestQueryServiceClient:  # pylint: disable=too-few-public-methods
                 "submitted_query": "SELECT 1",
                 "async_": False,
             },
+            timeout=(QUERY_SERVICE_TIMEOUT, QUERY_SERVICE_QUERY_TIMEOUT),
+        )
+
+    def test_query_service_client_submit_query_as_arrow(
+        self,
+        mocker: MockerFixture,
+    ) -> None:
+        """
+        Test submitting a query and asking for the results as an Arrow stream.
+        """
+        mock_response = MagicMock()
+        mock_response.ok = True
+        mock_response.headers = {"Content-Type": ARROW_STREAM}
+        mock_response.content = b"arrow"
+        mock_request = mocker.patch(
+            "datajunction_server.service_clients.RequestsSessionWithEndpoint.post",
+            return_value=mock_response,
+        )
+
+        query_service_client = QueryServiceClient(uri=self.endpoint)
+        query_create = QueryCreate(
+            catalog_name="default",
+            engine_name="postgres",
+            engine_version="15.2",
+            submitted_query="SELECT 1",
+            async_=False,
+        )
+        assert query_service_client.submit_query_as_arrow(query_create) == b"arrow"
+        assert mock_request.call_args.kwargs["headers"] == {
+            "Accept": f"{ARROW_STREAM}, application/json;q=0.9",
+        }
+
+        # Query services without Arrow support return JSON
+        mock_response.headers = {"Content-Type": "application/json"}
+        mock_response.json.return_value = {
+            "id": "ef209eef-c31a-4089-aae6-833259a08e22",
+            "submitted_query": "SELECT 1",
+            "state": "FINISHED",
+            "results": [],
+            "errors": [],
+        }
+        result = query_service_client.submit_query_as_arrow(query_create)
+        assert result.id == "ef209eef-c31a-4089-aae6-833259a08e22"  # type: ignore
+
+        mock_response.ok = False
+        mock_response.text = "Unsupported engine"
+        with pytest.raises(DJQueryServiceClientException) as exc_info:
+            query_service_client.submit_query_as_arrow(query_create)
+        assert "Unsupported engine" in str(exc_info.value)
+
+    def test_query_service_client_timeouts(
+        self,
+        mocker: MockerFixture,
+    ) -> None:
+        """
+        Test that every request has a timeout, and that reading the results of
+        submitted queries, which may run for longer, has a timeout of its own.
+        """
+        mock_request = mocker.patch("requests.Session.request")
+        mock_request.return_value.json.return_value = {
+            "id": "ef209eef-c31a-4089-aae6-833259a08e22",
+            "submitted_query": "SELECT 1",
+            "results": [],
+            "errors": [],
+            "invalidated": 0,
+        }
+        query_service_client = QueryServiceClient(
+            uri=self.endpoint,
+            timeout=10,
+            query_timeout=60,
         )
+        query_create = QueryCreate(
+            catalog_name="default",
+            engine_name="postgres",
+            engine_version="15.2",
+            submitted_query="SELECT 1",
+            async_=False,
+        )
+        query_service_client.submit_query(query_create)
+        assert mock_request.call_args.kwargs["timeout"] == (10, 60)
+        query_service_client.submit_query_as_arrow(query_create)
+        assert mock_request.call_args.kwargs["timeout"] == (10, 60)
+
+        query_service_client.get_query("ef209eef-c31a-4089-aae6-833259a08e22")
+        assert mock_request.call_args.kwargs["timeout"] == 10
+        query_service_client.invalidate_cached_results("default", None, "orders")
+        assert mock_request.call_args.kwargs["timeout"] == 10
+
+        default_client = QueryServiceClient(uri=self.endpoint)
+        default_client.get_query("ef209eef-c31a-4089-aae6-833259a08e22")
+        assert mock_request.call_args.kwargs["timeout"] == QUERY_SERVICE_TIMEOUT
+
+    def test_query_service_client_close(self, mocker: MockerFixture) -> None:
+        """
+        Test that closing the client shuts down its worker pool.
+        """
+        mocker.patch("requests.Session.request")
+        query_service_client = QueryServiceClient(uri=self.endpoint)
+        query_service_client.close()
+        with pytest.raises(RuntimeError):
+            asyncio.run(
+                query_service_client.get_query_async(
+                    "ef209eef-c31a-4089-aae6-833259a08e22",
+                ),
+            )
 
     def test_query_service_client_get_query(self, mocker: MockerFixture) -> None:
         """
@@ -214,6 +328,32 @@ class TestQueryServiceClient:  # pylint: disable=too-few-public-methods
 
         mock_request.assert_called_with(
             "/queries/ef209eef-c31a-4089-aae6-833259a08e22/",
+            timeout=QUERY_SERVICE_TIMEOUT,
+        )
+
+    @pytest.mark.asyncio
+    async def test_query_service_client_async(self, mocker: MockerFixture) -> None:
+        """
+        Test that the async methods make requests on the client's worker pool.
+        """
+        threads = []
+
+        def get_query(query_id: str):
+            threads.append(threading.current_thread().name)
+            return query_id
+
+        query_service_client = QueryServiceClient(uri=self.endpoint)
+        mocker.patch.object(query_service_client, "get_query", get_query)
+        mocker.patch.object(query_service_client, "submit_query", get_query)
+        assert await query_service_client.get_query_async("abc") == "abc"
+        assert await query_service_client.submit_query_async("def") == "def"  # type: ignore
+        assert all(thread.startswith("query-service-client") for thread in threads)
+        assert len(threads) == 2
+
+        # The pool defaults to the configured size
+        assert (
+            query_service_client.max_connections
+            == Settings().query_service_max_connections
         )
 
     def test_query_service_client_materialize(self, mocker: MockerFixture) -> None:
@@ -262,6 +402,7 @@ class TestQueryServiceClient:  # pylint: disable=too-few-public-methods
                 "upstream_tables": ["default.hard_hats"],
                 "columns": [],
             },
+            timeout=QUERY_SERVICE_TIMEOUT,
         )
 
     def test_query_service_client_deactivate_materialization(
@@ -295,8 +436,40 @@ class TestQueryServiceClient:  # pylint: disable=too-few-public-methods
                 "node_name": "default.hard_hat",
                 "materialization_name": "default",
             },
+            timeout=QUERY_SERVICE_TIMEOUT,
         )
 
+    def test_query_service_client_invalidate_cached_results(
+        self,
+        mocker: MockerFixture,
+    ) -> None:
+        """
+        Test invalidating the query service's cached results for a table.
+        """
+        mock_response = MagicMock()
+        mock_response.ok = True
+        mock_response.json.return_value = {"invalidated": 2}
+        mock_request = mocker.patch(
+            "datajunction_server.service_clients.RequestsSessionWithEndpoint.delete",
+            return_value=mock_response,
+        )
+
+        query_service_client = QueryServiceClient(uri=self.endpoint)
+        assert (
+            query_service_client.invalidate_cached_results("default", "sales", "orders")
+            == 2
+        )
+        mock_request.assert_called_with(
+            "/queries/cache/",
+            params={"catalog": "default", "schema": "sales", "table": "orders"},
+            timeout=QUERY_SERVICE_TIMEOUT,
+        )
+
+        mock_response.ok = False
+        mock_response.text = "Not found"
+        with pytest.raises(DJQueryServiceClientException):
+            query_service_client.invalidate_cached_results("default", "sales", "orders")
+
     def test_query_service_client_raising_error(self, mocker: MockerFixture) -> None:
         """
         Test handling an error response from the query service client
@@ -377,6 +550,7 @@ class TestQueryServiceClient:  # pylint: disable=too-few-public-methods
                 "partitions": [],
                 "columns": [],
             },
+            timeout=QUERY_SERVICE_TIMEOUT,
         )
         assert response == {
             "urls": ["http://fake.url/job"],
@@ -0,0 +1,261 @@
+"""
+Tests for ``datajunction_server.sql.dag_snapshot``.
+"""
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+from pytest_mock import MockerFixture
+from sqlalchemy.pool import QueuePool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from datajunction_server.config import Settings
+from datajunction_server.models.node import Node, NodeRevision, NodeType
+from datajunction_server.sql.dag_snapshot import (
+    DAGSnapshot,
+    get_dag_snapshot,
+    has_uncommitted_writes,
+)
+from datajunction_server.utils import get_session
+
+
+def test_dag_snapshot_traversal(
+    client_with_roads: TestClient,  # pylint: disable=unused-argument
+    session: Session,
+):
+    """
+    The snapshot finds the same dimensions as walking the ORM relationships.
+    """
+    snapshot = get_dag_snapshot(session)
+    assert get_dag_snapshot(session) is snapshot
+
+    metric = session.exec(
+        select(Node).where(Node.name == "default.num_repair_orders"),
+    ).one()
+    orm_snapshot = DAGSnapshot.from_nodes([metric])
+    assert snapshot.dimension_attributes(metric.name) == (
+        orm_snapshot.dimension_attributes(metric.name)
+    )
+    assert "default.repair_orders" in snapshot.nodes_with_dimension("default.hard_hat")
+    assert "default.num_repair_orders" in snapshot.nodes_with_dimension(
+        "default.hard_hat",
+    )
+    assert not {
+        snapshot.nodes[name].type
+        for name in snapshot.nodes_with_dimension("default.hard_hat")
+    } & {NodeType.DIMENSION}
+
+
+def test_dag_snapshot_incremental_refresh(
+    client_with_roads: TestClient,
+    session: Session,
+    mocker: MockerFixture,
+):
+    """
+    Writes are picked up from the history table and only reload the nodes involved.
+    """
+    snapshot = get_dag_snapshot(session)
+    assert snapshot.nodes["default.repair_order_details"].columns
+    load = mocker.spy(snapshot, "_load")
+
+    assert (
+        "default.repair_order_details" in snapshot.linked_nodes["default.repair_order"]
+    )
+    response = client_with_roads.delete(
+        "/nodes/default.repair_order_details/columns/repair_order_id/",
+        params={
+            "dimension": "default.repair_order",
+            "dimension_column": "repair_order_id",
+        },
+    )
+    assert response.ok
+    get_dag_snapshot(session)
+    load.assert_called_once()
+    assert load.call_args.args[2] == {"default.repair_order_details"}
+    assert not any(
+        column.dimension
+        for column in snapshot.nodes["default.repair_order_details"].columns
+    )
+    assert (
+        "default.repair_order_details"
+        not in snapshot.linked_nodes["default.repair_order"]
+    )
+
+    # Nothing changed, so nothing is reloaded
+    get_dag_snapshot(session)
+    load.assert_called_once()
+
+    # Writes that bypass the history table cause a full reload
+    session.add(Node(name="default.unrecorded", type=NodeType.SOURCE))
+    session.commit()
+    get_dag_snapshot(session)
+    assert load.call_count == 2
+    assert len(load.call_args.args) == 2
+
+
+def test_dag_snapshot_reachability_index(
+    client_with_roads: TestClient,
+    session: Session,
+):
+    """
+    Traversals are indexed, and the index entries that depend on a node are dropped
+    when it changes.
+    """
+    snapshot = get_dag_snapshot(session)
+    found = snapshot.dimension_attributes("default.num_repair_orders")
+    assert found
+    _, dimension_nodes = found
+    assert "default.us_state" in dimension_nodes
+    assert "default.us_state" in snapshot.joinable_nodes("default.repair_orders")
+    assert "default.repair_orders" in snapshot.nodes_with_dimension("default.us_state")
+
+    # Served from the index
+    assert snapshot.dimension_attributes("default.num_repair_orders") is found
+    unrelated = snapshot.dimension_attributes("default.dispatcher")
+
+    response = client_with_roads.delete(
+        "/nodes/default.hard_hat/columns/state/",
+        params={"dimension": "default.us_state", "dimension_column": "state_short"},
+    )
+    assert response.ok
+    get_dag_snapshot(session)
+    found = snapshot.dimension_attributes("default.num_repair_orders")
+    assert found
+    assert "default.us_state" not in found[1]
+    assert "default.us_state" not in snapshot.joinable_nodes("default.repair_orders")
+    assert "default.repair_orders" not in snapshot.nodes_with_dimension(
+        "default.us_state",
+    )
+    assert snapshot.dimension_attributes("default.dispatcher") is unrelated
+
+
+def test_dag_snapshot_join_path(
+    client_with_roads: TestClient,  # pylint: disable=unused-argument
+    session: Session,
+):
+    """
+    Join path searches run without holding the snapshot's lock, and their paths are
+    only indexed if no node changed in the meantime.
+    """
+    snapshot = get_dag_snapshot(session)
+    searches = []
+
+    def lock_is_free() -> bool:
+        acquired = []
+
+        def try_lock():
+            lock = snapshot._lock  # pylint: disable=protected-access
+            acquired.append(lock.acquire(blocking=False))
+            if acquired[0]:
+                lock.release()
+
+        thread = threading.Thread(target=try_lock)
+        thread.start()
+        thread.join()
+        return acquired[0]
+
+    def search(start):
+        assert lock_is_free()
+        searches.append(start)
+        if len(searches) == 1:
+            snapshot.index.invalidate(["default.hard_hat"])
+        visited: set = set()
+        snapshot.joinable_nodes("default.repair_orders", visited)
+        return "path", visited
+
+    assert snapshot.join_path("start", search) == "path"
+    assert snapshot.join_path("start", search) == "path"
+    assert snapshot.join_path("start", search) == "path"
+    assert searches == ["start", "start"]
+
+    # Entries that depend on the joinable nodes are dropped when any node the
+    # joinable nodes were found through changes
+    snapshot.index.invalidate(["default.us_state"])
+    assert snapshot.join_path("start", search) == "path"
+    assert len(searches) == 3
+
+
+def test_dag_snapshot_missing_nodes(
+    client_with_roads: TestClient,  # pylint: disable=unused-argument
+    session: Session,
+    max_queries,
+):
+    """
+    Lookups of nodes that aren't in the snapshot find nothing, and snapshots of
+    nodes with uncommitted writes are built from their relationships with a query
+    per relationship and hop rather than per node.
+    """
+    snapshot = get_dag_snapshot(session)
+    assert snapshot.dimension_attributes("default.missing") is None
+    assert snapshot.nodes_with_dimension("default.missing") == frozenset()
+
+    metric = session.exec(
+        select(Node).where(Node.name == "default.num_repair_orders"),
+    ).one()
+    session.expunge_all()
+    session.add(metric)
+    with max_queries(25):
+        orm_snapshot = DAGSnapshot.from_nodes([metric])
+    assert orm_snapshot.dimension_attributes(metric.name) == (
+        snapshot.dimension_attributes(metric.name)
+    )
+
+
+def test_dag_snapshot_reads_committed_data(tmp_path: Path):
+    """
+    The snapshot is refreshed through a connection of its own, so it never picks up
+    writes that aren't committed, e.g., ones that are later rolled back, and never
+    needs a connection from the pool that the session's connection came from.
+    """
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'dj.db'}",
+        poolclass=QueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.1,
+    )
+    SQLModel.metadata.create_all(engine)
+
+    def add_node(session: Session, name: str):
+        node = Node(name=name, type=NodeType.SOURCE, current_version="v1.0")
+        session.add(NodeRevision(name=name, node=node, version="v1.0"))
+
+    with Session(engine, autoflush=False) as session:
+        assert not has_uncommitted_writes(session)
+        add_node(session, "default.rolled_back")
+        assert has_uncommitted_writes(session)
+        session.flush()
+        assert has_uncommitted_writes(session)
+        snapshot = get_dag_snapshot(session)
+        assert "default.rolled_back" not in snapshot.nodes
+        session.rollback()
+        assert not has_uncommitted_writes(session)
+
+        add_node(session, "default.committed")
+        session.commit()
+        assert not has_uncommitted_writes(session)
+        assert set(get_dag_snapshot(session).nodes) == {"default.committed"}
+    engine.dispose()
+
+
+def test_dag_snapshot_shared_across_requests(
+    tmp_path: Path,
+    settings: Settings,
+    mocker: MockerFixture,
+):
+    """
+    Per-request sessions share the engine, and so the snapshot, which is only
+    refreshed incrementally between them.
+    """
+    settings.index = f"sqlite:///{tmp_path / 'dj.db'}"
+    mocker.patch("datajunction_server.utils.get_settings", return_value=settings)
+
+    with contextmanager(get_session)() as session:
+        SQLModel.metadata.create_all(session.get_bind())
+        snapshot = get_dag_snapshot(session)
+
+    load = mocker.spy(snapshot, "_load")
+    with contextmanager(get_session)() as session:
+        assert get_dag_snapshot(session) is snapshot
+    load.assert_not_called()
@@ -0,0 +1,110 @@
+"""
+Tests for the parse cache
+"""
+import pytest
+
+from datajunction_server.sql.parsing import types as ct
+from datajunction_server.sql.parsing.backends.antlr4 import parse, parse_rule
+from datajunction_server.sql.parsing.backends.exceptions import DJParseException
+from datajunction_server.sql.parsing.cache import (
+    ParseCache,
+    parse_cache,
+    restore,
+    snapshot,
+)
+
+
+def test_parse_cache_hits_and_misses():
+    """
+    Repeated parses of the same query should be served from the cache.
+    """
+    parse_cache.clear()
+    query = "SELECT a, b FROM t WHERE a > 1"
+    first = parse(query)
+    second = parse(query)
+    assert parse_cache.stats().misses == 1
+    assert parse_cache.stats().hits == 1
+    assert parse_cache.stats().entries == 1
+    assert str(first) == str(second)
+    assert first.compare(second)
+
+    # The same text under a different rule is a different entry
+    parse_rule("int", "dataType")
+    assert parse_cache.stats().misses == 2
+
+
+def test_parse_cache_returns_independent_copies():
+    """
+    Mutating a parsed tree should not affect later parses of the same query.
+    """
+    parse_cache.clear()
+    query = "SELECT a, SUM(b) FROM t"
+    first = parse(query)
+    first.select.projection[1].args[0].name.name = "c"
+    first.select.projection = []
+    second = parse(query)
+    assert first is not second
+    assert len(second.select.projection) == 2
+    assert str(second.select.projection[1]) == "SUM(b)"
+
+
+def test_parse_cache_copies_struct_types():
+    """
+    Column types with structs in them are copied along with the tree, since their
+    fields hold mutable names, while other column types are shared.
+    """
+    struct_type = parse_rule("struct<a:int>", "dataType")
+    list_type = parse_rule("array<struct<a:int>>", "dataType")
+    payload, refs = snapshot([struct_type, list_type, ct.IntegerType()])
+    struct_copy, list_copy, int_type = restore(payload, refs)
+    assert struct_copy is not struct_type
+    assert list_copy is not list_type
+    assert str(struct_copy) == str(struct_type)
+    assert str(list_copy) == str(list_type)
+    assert int_type is ct.IntegerType()
+    assert all(not isinstance(ref, (ct.StructType, ct.ListType)) for ref in refs)
+
+    struct_copy.fields[0].name.name = "b"
+    assert struct_type.fields[0].name.name == "a"
+
+
+def test_parse_cache_does_not_cache_errors():
+    """
+    Parse errors are raised every time and never stored.
+    """
+    parse_cache.clear()
+    for _ in range(2):
+        with pytest.raises(DJParseException):
+            parse("")
+        with pytest.raises(Exception):
+            parse("SELEC a FRO t")
+    assert parse_cache.stats().entries == 0
+
+
+def test_parse_cache_lru_eviction():
+    """
+    Least recently used entries are evicted once the byte cap is exceeded.
+    """
+    cache = ParseCache(max_bytes=0)
+    assert cache.get_or_parse("x", "rule", lambda: "value") == "value"
+    assert len(cache) == 0
+
+    cache.resize(200)
+    cache.get_or_parse("a", "rule", lambda: "a" * 60)
+    cache.get_or_parse("b", "rule", lambda: "b" * 60)
+    assert len(cache) == 2
+
+    # Touch "a" so that "b" becomes the least recently used entry
+    cache.get_or_parse("a", "rule", lambda: "unused")
+    cache.get_or_parse("c", "rule", lambda: "c" * 60)
+    assert cache.stats().size_bytes <= 200
+    assert cache.get_or_parse("a", "rule", lambda: "reparsed") == "a" * 60
+    assert cache.get_or_parse("b", "rule", lambda: "reparsed") == "reparsed"
+
+    # Entries larger than the whole cache are never stored
+    cache.get_or_parse("huge", "rule", lambda: "h" * 1000)
+    assert cache.get_or_parse("huge", "rule", lambda: "reparsed") == "reparsed"
+
+    cache.resize(0)
+    assert len(cache) == 0
+    assert cache.stats().size_bytes == 0
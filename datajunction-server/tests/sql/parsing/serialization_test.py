@@ -0,0 +1,230 @@
+"""
+Tests for serializing parsed ASTs
+"""
+import io
+import pickle
+import zlib
+from pathlib import Path
+
+import pytest
+from pytest_mock import MockerFixture
+from sqlalchemy import update
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from datajunction_server.internal.nodes import refresh_query_asts
+from datajunction_server.models.node import Node, NodeRevision, NodeType
+from datajunction_server.sql.parsing import serialization
+from datajunction_server.sql.parsing.backends.antlr4 import parse
+from datajunction_server.sql.parsing.serialization import (
+    PersistedASTUnpickler,
+    deserialize_query_ast,
+    serialize_query_ast,
+)
+
+QUERY = """
+SELECT
+  a.id,
+  CAST(a.amount AS DECIMAL(10, 2)) AS amount,
+  SUM(b.price) OVER (PARTITION BY a.id) total,
+  TRANSFORM(a.items, x -> x + 1) AS items
+FROM default.orders a
+LEFT JOIN default.products b ON a.product_id = b.id
+WHERE a.ts > INTERVAL 3 DAYS AND b.name LIKE 'x%'
+"""
+
+
+def test_serialize_and_deserialize_query_ast():
+    """
+    A serialized AST should load back into an identical tree.
+    """
+    payload = serialize_query_ast(QUERY, parse(QUERY))
+    tree = deserialize_query_ast(QUERY, payload)
+    assert tree is not None
+    assert tree.compare(parse(QUERY))
+    assert str(tree) == str(parse(QUERY))
+    for node in tree.flatten():
+        for child in node.children:
+            assert child.parent is node
+
+
+def test_deserialize_stale_query_ast(mocker: MockerFixture):
+    """
+    Payloads for different query text or produced by another AST schema version
+    are ignored.
+    """
+    payload = serialize_query_ast(QUERY, parse(QUERY))
+    assert payload
+    assert deserialize_query_ast(QUERY + " LIMIT 10", payload) is None
+    assert deserialize_query_ast(QUERY, None) is None
+    assert deserialize_query_ast(QUERY, b"DJAST") is None
+    assert deserialize_query_ast(QUERY, b"garbage") is None
+    assert deserialize_query_ast(QUERY, payload[:-10]) is None
+
+    mocker.patch.object(serialization, "AST_SCHEMA_VERSION", b"0.0.0+0")
+    assert deserialize_query_ast(QUERY, payload) is None
+
+
+def test_unpickler_rejects_foreign_classes():
+    """
+    Only classes from the parsing package can be loaded.
+    """
+    with pytest.raises(pickle.UnpicklingError):
+        PersistedASTUnpickler(io.BytesIO(pickle.dumps(io.BytesIO))).load()
+
+
+def test_deserialize_unsigned_query_ast(mocker: MockerFixture):
+    """
+    Payloads are only unpickled if they were signed with the DJ secret, and nothing
+    is serialized or loaded without one.
+    """
+    payload = serialize_query_ast(QUERY, parse(QUERY))
+    assert payload
+    unpickler = mocker.spy(serialization, "PersistedASTUnpickler")
+
+    # payloads whose body was replaced or altered
+    signed = (
+        len(serialization.MAGIC)
+        + 1
+        + len(serialization.AST_SCHEMA_VERSION)
+        + serialization.QUERY_DIGEST_SIZE
+        + serialization.SIGNATURE_SIZE
+    )
+    forged = payload[:signed] + zlib.compress(pickle.dumps(parse("SELECT 1")))
+    altered = payload[:-1] + bytes([payload[-1] ^ 1])
+    for bad in (forged, altered):
+        assert deserialize_query_ast(QUERY, bad) is None
+    unpickler.assert_not_called()
+
+    # a payload signed with another secret
+    settings = mocker.patch.object(serialization, "get_settings")
+    settings.return_value.secret = "another-secret"
+    assert deserialize_query_ast(QUERY, payload) is None
+    unpickler.assert_not_called()
+
+    settings.return_value.secret = None
+    assert serialize_query_ast(QUERY, parse(QUERY)) is None
+    assert deserialize_query_ast(QUERY, payload) is None
+
+
+def test_node_revision_parse_query(mocker: MockerFixture):
+    """
+    Node revisions load their persisted AST instead of parsing when it's current.
+    """
+    node_revision = NodeRevision(
+        name="default.orders_transform",
+        type=NodeType.TRANSFORM,
+        query=QUERY,
+    )
+    node_revision.refresh_query_ast()
+    assert node_revision.query_ast
+
+    parse_mock = mocker.patch(
+        "datajunction_server.sql.parsing.backends.antlr4.parse",
+        side_effect=parse,
+    )
+    assert node_revision.parse_query().compare(parse(QUERY))
+    assert parse_mock.call_count == 0
+
+    # Changing the query makes the persisted AST stale
+    node_revision.query = "SELECT 1 AS one"
+    assert str(node_revision.parse_query()) == str(parse("SELECT 1 AS one"))
+    assert parse_mock.call_count == 1
+
+    # Queries that don't parse are not persisted
+    node_revision.query = "SELEC 1"
+    node_revision.refresh_query_ast()
+    assert node_revision.query_ast is None
+
+
+def test_node_revision_refresh_query_ast_errors(mocker: MockerFixture):
+    """
+    ASTs that fail to serialize are not persisted, and the failure is logged.
+    """
+    node_revision = NodeRevision(
+        name="default.orders_transform",
+        type=NodeType.TRANSFORM,
+        query=QUERY,
+    )
+    mocker.patch(
+        "datajunction_server.sql.parsing.serialization.serialize_query_ast",
+        side_effect=RecursionError("maximum recursion depth exceeded"),
+    )
+    logger = mocker.patch("datajunction_server.models.node._logger")
+    node_revision.refresh_query_ast()
+    assert node_revision.query_ast is None
+    logger.warning.assert_called_once()
+
+    # errors other than parse or serialization errors aren't swallowed
+    mocker.patch(
+        "datajunction_server.sql.parsing.serialization.serialize_query_ast",
+        side_effect=KeyError("boom"),
+    )
+    with pytest.raises(KeyError):
+        node_revision.refresh_query_ast()
+
+
+def test_refresh_query_asts(tmp_path: Path):
+    """
+    Parsing a query never writes its AST back, and missing or stale ASTs are
+    replaced by the maintenance job instead.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'dj.db'}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine, autoflush=False) as session:
+        for name, query in [
+            ("default.missing", QUERY),
+            ("default.stale", QUERY),
+            ("default.current", "SELECT 1 AS one"),
+            ("default.unparseable", "SELEC 1"),
+            ("default.source", None),
+        ]:
+            node = Node(name=name, type=NodeType.TRANSFORM)
+            revision = NodeRevision(name=name, node=node, query=query)
+            revision.refresh_query_ast()
+            session.add(revision)
+        session.commit()
+        stale = serialize_query_ast(QUERY, parse(QUERY))
+        assert stale
+        session.execute(
+            update(NodeRevision)
+            .where(NodeRevision.name == "default.stale")
+            .values(
+                query_ast=stale.replace(
+                    serialization.AST_SCHEMA_VERSION,
+                    b"0" * len(serialization.AST_SCHEMA_VERSION),
+                ),
+            ),
+        )
+        session.execute(
+            update(NodeRevision)
+            .where(NodeRevision.name == "default.missing")
+            .values(query_ast=None),
+        )
+        session.commit()
+
+    def stored_asts():
+        with Session(engine) as reader:
+            return dict(
+                reader.exec(select(NodeRevision.name, NodeRevision.query_ast)).all(),
+            )
+
+    before = stored_asts()
+    with Session(engine, autoflush=False) as session:
+        for revision in session.exec(select(NodeRevision)).unique().all():
+            if revision.name in ("default.missing", "default.stale"):
+                assert revision.parse_query().compare(parse(QUERY))
+        assert not session.dirty
+        assert not session.new
+    assert stored_asts() == before
+
+    with Session(engine, autoflush=False) as session:
+        assert refresh_query_asts(session, batch_size=2) == 2
+    after = stored_asts()
+    for name in ("default.missing", "default.stale"):
+        assert deserialize_query_ast(QUERY, after[name])
+    for name in ("default.current", "default.unparseable", "default.source"):
+        assert after[name] == before[name]
+
+    with Session(engine, autoflush=False) as session:
+        assert refresh_query_asts(session) == 0
+    engine.dispose()
@@ -892,3 +892,61 @@ def test_ast_compile_lateral_view_explode8(session: Session):
         quote_style="",
         namespace=None,
     )
+
+
+def test_ast_scope_tables():
+    """
+    Test finding the table expressions in the FROM clause of a query, without those
+    of nested queries.
+    """
+    query = parse(
+        "SELECT a.x FROM (SELECT x FROM t1) a JOIN t2 b ON a.x = b.x "
+        "WHERE a.x IN (SELECT y FROM t3)",
+    )
+    assert list(query.scope_tables()) == [
+        table
+        for table in query.find_all(ast.TableExpression)
+        if table.in_from_or_lateral()
+        and table.get_nearest_parent_of_type(ast.Query) is query
+    ]
+    subquery = query.select.from_.relations[0].primary  # type: ignore
+    assert [str(table.alias_or_name) for table in subquery.scope_tables()] == ["t1"]
+
+
+def test_ast_compile_wide_query(session: Session):
+    """
+    Test that the scope index resolves the columns of a wide query like scanning
+    the AST does, and is dropped after compiling.
+    """
+    columns = ", ".join(f"{i} AS c{i}" for i in range(100))
+    sql = (
+        f"SELECT {', '.join(f't.c{i}' for i in range(100))}, c0 + c1 AS c, c2 "
+        f"FROM (SELECT {columns}) t, (SELECT 1 AS c2) u"
+    )
+    query = parse(sql)
+    exc = DJException()
+    ctx = ast.CompileContext(session=session, exception=exc)
+    query.compile(ctx)
+    assert ctx.scopes is None
+    assert [error.message for error in exc.errors] == [
+        "Column `c2` found in multiple tables. Consider using fully qualified name.",
+    ]
+    tables = [
+        col.table.alias_or_name.name
+        for col in query.columns[:100]
+        if isinstance(col, ast.Column) and col.table
+    ]
+    assert tables == ["t"] * 100
+    projected = query.select.projection[100]
+    assert isinstance(projected, ast.Alias)
+    assert isinstance(projected.type, types.IntegerType)
+
+    # without the index
+    unindexed = parse(sql)
+    unindexed_exc = DJException()
+    for node in unindexed.find_all(ast.Column):
+        node.compile(ast.CompileContext(session=session, exception=unindexed_exc))
+    assert [error.message for error in unindexed_exc.errors] == [
+        error.message for error in exc.errors
+    ]
+    assert str(unindexed) == str(query)
@@ -0,0 +1,103 @@
+"""
+Tests for the column type parser
+"""
+import pytest
+
+import datajunction_server.sql.parsing.types as ct
+from datajunction_server.sql.parsing.backends.antlr4 import _parse_rule
+from datajunction_server.sql.parsing.backends.exceptions import DJParseException
+from datajunction_server.sql.parsing.type_parser import (
+    TypeStringParser,
+    UnsupportedTypeString,
+    _parse_shared_column_type,
+    parse_column_type,
+)
+
+
+@pytest.mark.parametrize(
+    "type_string",
+    [
+        "int",
+        "BIGINT",
+        "  double ",
+        "Timestamp",
+        "timestamptz",
+        "long",
+        "null",
+        "uuid",
+        "varchar",
+        "varchar(10)",
+        "decimal(10, 2)",
+        "DECIMAL(38,18)",
+        "fixed(3)",
+        "array<int>",
+        "array < array<string> >",
+        "map<string,array<int>>",
+        "struct<>",
+        "struct< >",
+        "struct<a:int,b:array<string>>",
+        "struct<a int not null, `b c`: string>",
+        "struct<date: date, from: int>",
+        "struct<a:struct<b:map<int,array<decimal(1,0)>>>>",
+        "interval day to second",
+        "INTERVAL hour TO minute",
+    ],
+)
+def test_parse_column_type(type_string: str):
+    """
+    The type parser should return the same types as the ANTLR parser.
+    """
+    expected = _parse_rule(type_string, "dataType")
+    column_type = TypeStringParser(type_string).parse()
+    assert type(column_type) is type(expected)
+    assert repr(column_type) == repr(expected)
+    assert str(column_type) == str(expected)
+    assert parse_column_type(type_string) == expected
+
+
+@pytest.mark.parametrize(
+    "type_string",
+    [
+        "struct<a int comment 'x'>",
+        "struct<`a``b`:int>",
+        "array<int>>",
+        "interval years to month",
+        "foo",
+        "array<foo>",
+        "map<int>",
+        "decimal(10)",
+        "int()",
+    ],
+)
+def test_parse_column_type_fallback(type_string: str):
+    """
+    Type strings outside of what the type parser handles should be parsed, or
+    rejected, by the ANTLR parser.
+    """
+    with pytest.raises(UnsupportedTypeString):
+        TypeStringParser(type_string).parse()
+    try:
+        expected = _parse_rule(type_string, "dataType")
+    except Exception as exc:  # pylint: disable=broad-except
+        with pytest.raises(type(exc)):
+            parse_column_type(type_string)
+    else:
+        assert repr(parse_column_type(type_string)) == repr(expected)
+
+
+def test_parse_column_type_is_cached():
+    """
+    Column types are interned, so the same type string gives the same object. Types
+    with structs, whose fields hold mutable AST names, aren't memoized.
+    """
+    type_string = "map<string,array<decimal(10,2)>>"
+    assert parse_column_type(type_string) is parse_column_type(type_string)
+    assert ct.ColumnType.validate(type_string) is parse_column_type(type_string)
+
+    cached = _parse_shared_column_type.cache_info().currsize
+    type_string = "array<STRUCT <a:int,b:array<string>>>"
+    assert parse_column_type(type_string) == parse_column_type(type_string)
+    assert _parse_shared_column_type.cache_info().currsize == cached
+    with pytest.raises(DJParseException) as excinfo:
+        ct.ColumnType.validate("foo")
+    assert "DJ does not recognize the type `foo`" in str(excinfo.value)
@@ -13,6 +13,7 @@ from datajunction_server.config import Settings
 from datajunction_server.errors import DJException
 from datajunction_server.utils import (
     Version,
+    close_query_service_clients,
     get_engine,
     get_issue_url,
     get_query_service_client,
@@ -88,6 +89,9 @@ def test_get_engine(mocker: MockerFixture, settings: Settings) -> None:
     engine = get_engine()
     assert engine.url == make_url("sqlite://")
 
+    # The engine is shared across requests
+    assert get_engine() is engine
+
 
 def test_get_query_service_client(mocker: MockerFixture, settings: Settings) -> None:
     """
@@ -98,6 +102,14 @@ def test_get_query_service_client(mocker: MockerFixture, settings: Settings) ->
     query_service_client = get_query_service_client()
     assert query_service_client.uri == "http://query_service:8001"  # type: ignore
 
+    # The client is shared, along with its connection pool, until the server shuts
+    # down
+    assert get_query_service_client() is query_service_client
+    close = mocker.spy(query_service_client, "close")
+    close_query_service_clients()
+    close.assert_called_once()
+    assert get_query_service_client() is not query_service_client
+
 
 def test_version_parse() -> None:
     """